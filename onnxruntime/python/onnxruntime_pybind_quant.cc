@@ -53,6 +53,8 @@ void QuantizeMatMul4BitsBlockwise(
   py::buffer_info scale_buf = scale.request();
   py::buffer_info zp_buf = zero_points.request();
 
+  // Let other Python threads run, e.g. the ones quantizing other weights.
+  py::gil_scoped_release release;
   MlasQuantizeBlockwise<T, 4>(
       reinterpret_cast<uint8_t*>(dst_buf.ptr),
       reinterpret_cast<T*>(scale_buf.ptr),
@@ -3,10 +3,20 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
+import csv
+import dataclasses
+import json
 import logging
+import math
+import os
+import platform
+import sys
 import time
 from abc import ABC, abstractmethod
 from argparse import ArgumentParser
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
 
 import numpy
 import torch
@@ -55,6 +65,66 @@ def add_arguments(parser: ArgumentParser):
         default=False,
         help="If enable profiling",
     )
+    parser.add_argument(
+        "--warmup_iters",
+        required=False,
+        type=int,
+        default=10,
+        help="Number of iterations to run before measuring",
+    )
+    parser.add_argument(
+        "--min_iters",
+        required=False,
+        type=int,
+        default=100,
+        help="Minimum number of measured iterations. Exactly this number of iterations is measured if --target_ci is 0",
+    )
+    parser.add_argument(
+        "--max_iters",
+        required=False,
+        type=int,
+        default=10000,
+        help="Maximum number of measured iterations when --target_ci is set",
+    )
+    parser.add_argument(
+        "--target_ci",
+        required=False,
+        type=float,
+        default=0.0,
+        help=(
+            "Keep measuring until the half width of the 95%% confidence interval of the mean latency is within this "
+            "fraction of the mean, like 0.01 for 1%%, or until --max_iters or --max_seconds is reached"
+        ),
+    )
+    parser.add_argument(
+        "--max_seconds",
+        required=False,
+        type=float,
+        default=10.0,
+        help="Maximum time in seconds to measure a case when --target_ci is set",
+    )
+    parser.add_argument(
+        "--intra_op_num_threads",
+        required=False,
+        type=int,
+        nargs="+",
+        default=None,
+        help="Thread counts to sweep, each case is measured with each of them. By default, ORT decides",
+    )
+    parser.add_argument(
+        "--output_json",
+        required=False,
+        type=str,
+        default=None,
+        help="Path of a JSON file to write results and environment metadata to",
+    )
+    parser.add_argument(
+        "--output_csv",
+        required=False,
+        type=str,
+        default=None,
+        help="Path of a CSV file to write results and environment metadata to, one row per case and thread count",
+    )
 
 
 def provider_name(name):
@@ -74,11 +144,74 @@ def get_default_provider():
     return "CPUExecutionProvider"
 
 
+def get_environment(provider):
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "onnxruntime_version": ort.__version__,
+        "onnxruntime_build_info": ort.get_build_info(),
+        "provider": provider,
+        "python_version": platform.python_version(),
+        "numpy_version": numpy.__version__,
+        "torch_version": torch.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "hostname": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "argv": " ".join(sys.argv),
+    }
+
+
+@dataclass
+class BenchmarkResult:
+    # All times are in milliseconds.
+    mean: float
+    std: float
+    ci: float  # half width of the 95% confidence interval of the mean
+    min: float
+    max: float
+    p50: float
+    p90: float
+    p99: float
+    iters: int
+    intra_op_num_threads: Optional[int] = None
+
+    @classmethod
+    def from_iteration_times(cls, times_ns: List[int], intra_op_num_threads=None):
+        times = numpy.array(times_ns, dtype=numpy.float64) / 1e6
+        std = float(times.std(ddof=1)) if len(times) > 1 else 0.0
+        p50, p90, p99 = (float(p) for p in numpy.percentile(times, [50, 90, 99]))
+        return cls(
+            mean=float(times.mean()),
+            std=std,
+            ci=1.96 * std / math.sqrt(len(times)),
+            min=float(times.min()),
+            max=float(times.max()),
+            p50=p50,
+            p90=p90,
+            p99=p99,
+            iters=len(times),
+            intra_op_num_threads=intra_op_num_threads,
+        )
+
+    def __str__(self):
+        threads = "default" if self.intra_op_num_threads is None else self.intra_op_num_threads
+        return (
+            f"mean {self.mean:7.4f} ms +- {self.ci:.4f}, p50 {self.p50:7.4f} ms, p90 {self.p90:7.4f} ms, "
+            f"p99 {self.p99:7.4f} ms, {self.iters} iters, {threads} threads"
+        )
+
+
 class Benchmark:
     def __init__(self, model, inputs, outputs, args):
         self.provider = get_default_provider() if args.provider is None else provider_name(args.provider)
         logger.info(f"Execution provider: {self.provider}")
         self.profiling = args.profiling
+        self.warmup_iters = args.warmup_iters
+        self.min_iters = args.min_iters
+        self.max_iters = max(args.max_iters, args.min_iters)
+        self.target_ci = args.target_ci
+        self.max_seconds = args.max_seconds
         self.model = model
         logger.info(f"Model: {self.model}")
         self.inputs = inputs
@@ -114,30 +247,55 @@ class Benchmark:
             )
         return io_binding
 
-    def create_session(self):
+    def create_session(self, intra_op_num_threads=None):
         sess_opt = ort.SessionOptions()
         sess_opt.enable_profiling = self.profiling
+        if intra_op_num_threads is not None:
+            sess_opt.intra_op_num_threads = intra_op_num_threads
         sess = ort.InferenceSession(self.model, sess_options=sess_opt, providers=[self.provider])
         return sess
 
-    def benchmark(self):
-        sess = self.create_session()
+    def is_converged(self, count, mean, m2):
+        # The relative half width of the 95% confidence interval, with running mean and sum of squared differences.
+        if count < 2 or mean <= 0:
+            return False
+        return 1.96 * math.sqrt(m2 / (count - 1) / count) <= self.target_ci * mean
+
+    def measure(self, intra_op_num_threads=None) -> BenchmarkResult:
+        sess = self.create_session(intra_op_num_threads)
         input_tensors, output_tensors = self.create_input_output_tensors()
         io_binding = self.create_io_binding(sess, input_tensors, output_tensors)
 
         # warm up
-        for _iter in range(10):
+        for _iter in range(self.warmup_iters):
             sess.run_with_iobinding(io_binding)
 
-        # measure
-        max_iters = 100
-        start_time = time.time()
-        for _iter in range(max_iters):
+        # measure each iteration, until the confidence interval is narrow enough if a target is given
+        max_iters = self.max_iters if self.target_ci > 0 else self.min_iters
+        deadline = time.perf_counter_ns() + int(self.max_seconds * 1e9)
+        times_ns = []
+        mean, m2 = 0.0, 0.0
+        while len(times_ns) < max_iters:
+            start_time = time.perf_counter_ns()
             sess.run_with_iobinding(io_binding)
+            end_time = time.perf_counter_ns()
+            times_ns.append(end_time - start_time)
+
+            if self.target_ci > 0:
+                # Welford's online algorithm, so that checking convergence is O(1) per iteration
+                delta = times_ns[-1] - mean
+                mean += delta / len(times_ns)
+                m2 += delta * (times_ns[-1] - mean)
+                if len(times_ns) >= self.min_iters and (
+                    self.is_converged(len(times_ns), mean, m2) or end_time > deadline
+                ):
+                    break
+
+        return BenchmarkResult.from_iteration_times(times_ns, intra_op_num_threads)
 
+    def benchmark(self):
         # time is in milliseconds
-        elapsed_time = (time.time() - start_time) * 1000 / max_iters
-        return elapsed_time
+        return self.measure().mean
 
 
 class BenchmarkOp(ABC):
@@ -162,10 +320,53 @@ class BenchmarkOp(ABC):
     def case_profile(cls, op_param, time):
         ...
 
+    @classmethod
+    def case_params(cls, op_param):
+        params = dataclasses.asdict(op_param) if dataclasses.is_dataclass(op_param) else {"op_param": op_param}
+        return {name: value.__name__ if isinstance(value, type) else value for name, value in params.items()}
+
     def benchmark(self):
         self.create_cases()
+        records = []
+        provider = None
         for op_param, model in self.cases:
             inputs, outputs = self.create_inputs_outputs(op_param)
             bm = Benchmark(model, inputs, outputs, self.args)
-            time = bm.benchmark()
-            print(self.case_profile(op_param, time))
+            provider = bm.provider
+            for intra_op_num_threads in self.args.intra_op_num_threads or [None]:
+                result = bm.measure(intra_op_num_threads)
+                print(f"{self.case_profile(op_param, result.mean)}, {result}")
+                records.append(
+                    {
+                        "benchmark": type(self).__name__,
+                        "model": model,
+                        "params": self.case_params(op_param),
+                        **dataclasses.asdict(result),
+                    }
+                )
+
+        self.write_results(records, get_environment(provider))
+        return records
+
+    def write_results(self, records, environment):
+        if self.args.output_json:
+            with open(self.args.output_json, "w") as f:
+                json.dump({"environment": environment, "results": records}, f, indent=2)
+            logger.info(f"Results are written to {self.args.output_json}")
+
+        if self.args.output_csv:
+            # Flatten params and environment into columns, so that rows of different runs can be compared directly.
+            rows = [
+                {
+                    **{key: value for key, value in record.items() if key != "params"},
+                    **record["params"],
+                    **{key: value for key, value in environment.items() if key != "onnxruntime_build_info"},
+                }
+                for record in records
+            ]
+            fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+            with open(self.args.output_csv, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(rows)
+            logger.info(f"Results are written to {self.args.output_csv}")
@@ -3,11 +3,20 @@
 import argparse
 import fnmatch
 import json
+import os
 import subprocess as sp
+import sys
 from collections import defaultdict
 
 import pandas as pd
 
+transformers_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "transformers"))
+if transformers_dir not in sys.path:
+    sys.path.append(transformers_dir)
+
+# pylint: disable=wrong-import-position
+from profile_summary import ProfileDiff, count_model_runs, is_summary_file, load_profile_summary  # noqa: E402
+
 
 def _demangle(name, demangler="c++filt"):
     try:
@@ -20,7 +29,11 @@ def _demangle(name, demangler="c++filt"):
 
 def _get_args():
     parser = argparse.ArgumentParser(description="onnxruntime bench tool")
-    parser.add_argument("input", type=str, help="Trace input file, formatted as JSON")
+    parser.add_argument(
+        "input",
+        type=str,
+        help="Trace input file, formatted as JSON, or a summary saved by --save-summary which is reloaded instantly",
+    )
     parser.add_argument(
         "--demangler",
         required=False,
@@ -48,6 +61,11 @@ def _get_args():
         help="Restrict analysis to the specified identifiers, i.e., specify a filter list. Also supports UNIX-style wildcards.",
     )
     parser.add_argument("--csv", help="Save data to csv")
+    parser.add_argument(
+        "--save-summary",
+        type=str,
+        help="Save a compact summary of the selected model runs to a .npz file, which can be used as input later",
+    )
     parser.add_argument("-c", "--count", type=int, default=40, help="List top N items")
 
     parser.add_argument(
@@ -72,85 +90,67 @@ def _get_args():
         action="store_true",
         help="Whether dump op-kernel correlation",
     )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="Trace or summary file of a baseline profile. When specified, latency per model run of the input profile "
+        "is compared with the baseline, and the exit code is 1 if there are regressions.",
+    )
+    parser.add_argument(
+        "--regression-threshold",
+        type=float,
+        default=0.1,
+        help="Relative increase of latency of the total, an operator or a node, to be reported as a regression",
+    )
+    parser.add_argument(
+        "--regression-min-delta",
+        type=float,
+        default=0.0,
+        help="Minimum increase of latency in microseconds to be reported as a regression, which ignores noise",
+    )
+    parser.add_argument("--diff-report", type=str, default=None, help="Save the comparison with --baseline to JSON")
 
     args = parser.parse_args()
     return args
 
 
-def _shape_to_string(shape):
-    res = ""
-    for dict_obj in shape:
-        if len(dict_obj) > 1:
-            raise ValueError("Unhandled type in _shape_to_string()")
-        key = next(iter(dict_obj.keys()))
-        value = next(iter(dict_obj.values()))
-        if len(res) != 0:
-            res += ","
-        res += f'{key}({"x".join(str(v) for v in value)})'
-    return res
-
-
-def _json_to_df(data, filter_matcher):
+def _summary_to_df(summary, filter_matcher):
     cpu_entries = []
     gpu_entries = []
 
-    most_recent_kernel_launch_event = None
     num_missing_kernel_launch_events = 0
     total_kernel_events = 0
 
-    for item in data:
-        cat = item.get("cat")
-        if cat is None:
-            continue
-        dur = item.get("dur")
-        if dur is None:
-            continue
-        arg = item.get("args")
-        if arg is None:
-            continue
-        op_name = arg.get("op_name")
-
-        name = item["name"]
+    for row in summary.rows():
+        name = row.name
+        op_name = row.op_name
 
         if not filter_matcher(name) and op_name is not None and not filter_matcher(op_name):
             continue
 
-        if cat != "Kernel" and not name.endswith("kernel_time"):
-            continue
-        if name.endswith("kernel_time"):
-            most_recent_kernel_launch_event = item
-
-        block_x = arg.get("block_x", -1)
-        block_y = arg.get("block_y", -1)
-        block_z = arg.get("block_z", -1)
-        grid_x = arg.get("grid_x", -1)
-        grid_y = arg.get("grid_y", -1)
-        grid_z = arg.get("grid_z", -1)
-
-        if cat == "Kernel":
+        if row.cat == "Kernel":
             gpu_entries.append(
                 {
                     "name": name,
-                    "duration": dur,
-                    "dimensions": f"b{block_x}x{block_y}x{block_z},g{grid_x}x{grid_y}x{grid_z}",
+                    "duration": row.duration,
+                    "dimensions": row.dimensions,
                     "op_name": op_name,
-                    "input_type_shape": (
-                        _shape_to_string(most_recent_kernel_launch_event["args"]["input_type_shape"])
-                        if most_recent_kernel_launch_event is not None
-                        else "unknown"
-                    ),
+                    "input_type_shape": row.input_type_shape,
+                    "count": row.count,
                 }
             )
-            total_kernel_events += 1
-            if gpu_entries[-1]["input_type_shape"] == "unknown" and "hipMem" not in gpu_entries[-1]["name"]:
-                num_missing_kernel_launch_events += 1
-        else:
+            total_kernel_events += row.count
+            if row.input_type_shape == "unknown" and "hipMem" not in name:
+                num_missing_kernel_launch_events += row.count
+        elif name.endswith("kernel_time"):
             cpu_entries.append(
                 {
-                    "name": item["args"]["op_name"],
-                    "duration": dur,
-                    "input_type_shape": _shape_to_string(item["args"]["input_type_shape"]),
-                    "output_type_shape": _shape_to_string(item["args"]["output_type_shape"]),
+                    "name": op_name,
+                    "duration": row.duration,
+                    "input_type_shape": row.input_type_shape,
+                    "output_type_shape": row.output_type_shape,
+                    "count": row.count,
                 }
             )
 
@@ -159,10 +159,10 @@ def _json_to_df(data, filter_matcher):
             f"WARNING: Could not resolve shapes for {num_missing_kernel_launch_events} of {total_kernel_events} kernels."
         )
 
-    cpu_df = pd.DataFrame(cpu_entries)
-    gpu_df = pd.DataFrame(gpu_entries)
-    cpu_df["count"] = 1
-    gpu_df["count"] = 1
+    cpu_df = pd.DataFrame(cpu_entries, columns=["name", "duration", "input_type_shape", "output_type_shape", "count"])
+    gpu_df = pd.DataFrame(
+        gpu_entries, columns=["name", "duration", "dimensions", "op_name", "input_type_shape", "count"]
+    )
     return cpu_df, gpu_df
 
 
@@ -201,7 +201,7 @@ def _print_op_kernel_mapping_info(cpu_df, gpu_df, num_runs, csv=None):
     op_counts = defaultdict(int)
     for op in cpu_df.T.to_dict().values():
         identifiers = tuple([op["name"], op["input_type_shape"]])
-        op_counts[identifiers] += 1
+        op_counts[identifiers] += op["count"]
 
     # Collect kernel stats: count/duration
     stat_dict = defaultdict(lambda: defaultdict(float))
@@ -213,7 +213,7 @@ def _print_op_kernel_mapping_info(cpu_df, gpu_df, num_runs, csv=None):
         kernel_name = kernel["name"]
         dimensions = kernel["dimensions"]
         identifiers = tuple([op_name, input_type_shape, kernel_name, dimensions])
-        stat_dict[identifiers]["count"] += 1
+        stat_dict[identifiers]["count"] += kernel["count"]
         stat_dict[identifiers]["duration"] += kernel["duration"]
 
     # Create the DataFrame for kernel entries with op correlation info
@@ -271,52 +271,80 @@ def _construct_filter_matcher(args):
     return _match_item
 
 
-def _split_data_across_runs(data, start=1, end=None):
+def _load_summary(profile_path, start=1, end=None):
     """
-    Splits the traces according to model runs they belong to.
+    Summarizes the traces of the model runs in [start, end), streaming the profile so that memory is bounded.
     By default, we skip the first model run (run 0) and consider all subsequent runs.
     """
-    # Here we assume that the traces are properly ordered, so we can simplify the splitting logic.
-    model_run_splits = [i for i, item in enumerate(data) if item.get("name") == "model_run"]
-    if not model_run_splits:
+    if is_summary_file(profile_path):
+        summary = load_profile_summary(profile_path)
+        metadata = summary.metadata
+        print(f"Loaded summary of {metadata['num_runs']} model run(s) starting from {metadata['start_run']}.")
+        return summary, metadata["num_runs"]
+
+    # Negative indices are resolved with the number of model runs, which requires an extra pass over the profile.
+    total_num_runs = None
+    if start < 0 or (end is not None and end < 0):
+        total_num_runs = count_model_runs(profile_path)
+        if start < 0:
+            start += total_num_runs
+        if end is not None and end < 0:
+            end += total_num_runs
+
+    summary = load_profile_summary(profile_path, start, end)
+    if summary.metadata["total_runs"] == 0:
         print('WARNING: Could not find "model_run" event in trace. Using entire traces.')
-        return data
-    total_num_runs = len(model_run_splits)
+        return summary, 1
+
+    total_num_runs = summary.metadata["total_runs"]
     print(f"Found {total_num_runs} model_run events in trace.")
 
-    assert -total_num_runs <= start < total_num_runs, f"Invalid start index {start}."
-    if start < 0:
-        start += total_num_runs
+    assert 0 <= start < total_num_runs, f"Invalid start index {start}."
     if end is None:
         end = total_num_runs
     else:
-        assert -total_num_runs <= end < total_num_runs, f"Invalid end index {end}."
-        if end < 0:
-            end += total_num_runs
+        assert 0 <= end < total_num_runs, f"Invalid end index {end}."
     num_runs = end - start
     assert num_runs > 0, "No valid model runs are included in the split."
     print(f"Analyzing {num_runs} model run(s): {start}-{end - 1}.")
 
-    # Add index 0 in case user wants to include the first model run.
-    model_run_splits = [0, *model_run_splits]
-    return data[model_run_splits[start] : model_run_splits[end]], num_runs
+    return summary, num_runs
 
 
-def _load_json(profile_path):
-    with open(profile_path, encoding="utf-8") as file_obj:
-        data = json.load(file_obj)
-    if isinstance(data, dict):
-        data = data["traceEvents"]
-    return data
+def _print_diff(baseline, summary, args):
+    diff = ProfileDiff(baseline, summary, args.regression_threshold, args.regression_min_delta)
+    print("\n".join(diff.format(args.count)))
+
+    if args.diff_report:
+        with open(args.diff_report, "w") as f:
+            json.dump(diff.to_dict(), f, indent=2)
+    if args.csv:
+        rows = [
+            [*delta.key, delta.baseline, delta.target, delta.delta, delta.ratio, delta.regression]
+            for delta in diff.node_deltas
+        ]
+        columns = ["name", "op_name", "input_type_shape", "baseline", "target", "delta", "ratio", "regression"]
+        pd.DataFrame(rows, columns=columns).to_csv(f"{args.csv}_node_diff.csv", index=False)
+
+    return diff.regressions
 
 
 def main():
     args = _get_args()
     filter_matcher = _construct_filter_matcher(args)
 
-    data = _load_json(args.input)
-    data, num_runs = _split_data_across_runs(data, args.start, args.end)
-    cpu_df, gpu_df = _json_to_df(data, filter_matcher)
+    summary, num_runs = _load_summary(args.input, args.start, args.end)
+    if args.save_summary:
+        summary.save(args.save_summary)
+        print(f"Saved summary to {args.save_summary}.")
+
+    if args.baseline:
+        baseline, _ = _load_summary(args.baseline, args.start, args.end)
+        if _print_diff(baseline, summary, args):
+            sys.exit(1)
+        return
+
+    cpu_df, gpu_df = _summary_to_df(summary, filter_matcher)
 
     pd.set_option("display.max_colwidth", 120)
     _print_top_hitters(cpu_df, args, target="cpu")
@@ -6,20 +6,26 @@
 # --------------------------------------------------------------------------
 import abc
 import copy
+import hashlib
 import itertools
+import json
+import multiprocessing
 import os
+import queue
+import traceback
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from enum import Enum
 from pathlib import Path
 from typing import Dict, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import onnx
-from onnx import ModelProto, TensorProto, helper, numpy_helper
+from onnx import ModelProto, TensorProto, external_data_helper, helper, numpy_helper
 
 import onnxruntime
 
-from .quant_utils import apply_plot, load_model_with_shape_infer, smooth_distribution
+from .quant_utils import apply_plot, load_model_with_shape_infer
 
 
 def rel_entr(pk: np.ndarray, qk: np.ndarray) -> np.ndarray:
@@ -164,6 +170,7 @@ class CalibraterBase:
         augmented_model_path="augmented_model.onnx",
         symmetric=False,
         use_external_data_format=False,
+        num_processes=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It should be a model file path
@@ -171,13 +178,16 @@ class CalibraterBase:
         :param augmented_model_path: save augmented model to this path.
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param use_external_data_format: use external data format to store model which size is >= 2Gb
+        :param num_processes: number of processes running the calibration data in parallel in collect_data.
+            By default, the data is run by a single inference session in the current process.
         """
         if isinstance(model_path, str):
-            self.model = load_model_with_shape_infer(Path(model_path))
+            self.model_path = Path(model_path)
         elif isinstance(model_path, Path):
-            self.model = load_model_with_shape_infer(model_path)
+            self.model_path = model_path
         else:
             raise ValueError("model_path should be model path.")
+        self.model = load_model_with_shape_infer(self.model_path)
 
         self.op_types_to_calibrate = op_types_to_calibrate
         self.augmented_model_path = augmented_model_path
@@ -187,6 +197,9 @@ class CalibraterBase:
         self.augment_model = None
         self.infer_session = None
         self.execution_providers = ["CPUExecutionProvider"]
+        self.calibration_cache = None
+        self.collected_inputs_digests = []
+        self.num_processes = num_processes
 
     def set_execution_providers(self, execution_providers=["CPUExecutionProvider"]):  # noqa: B006
         """
@@ -195,12 +208,13 @@ class CalibraterBase:
         self.execution_providers = execution_providers
         self.create_inference_session()
 
-    def create_inference_session(self):
+    def create_inference_session(self, intra_op_num_threads=0):
         """
         create an OnnxRuntime InferenceSession.
         """
         sess_options = onnxruntime.SessionOptions()
         sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        sess_options.intra_op_num_threads = intra_op_num_threads
         self.infer_session = onnxruntime.InferenceSession(
             self.augmented_model_path,
             sess_options=sess_options,
@@ -262,6 +276,141 @@ class CalibraterBase:
         """
         raise NotImplementedError
 
+    def get_collected_state(self) -> Dict[str, Tuple]:
+        """
+        abstract method: return the data collected so far as a dictionary {tensor name: tuple of numpy arrays}.
+        """
+        raise NotImplementedError
+
+    def merge_collected_state(self, state: Dict[str, Tuple]):
+        """
+        abstract method: merge data returned by get_collected_state, possibly by another calibrater, into this one.
+        """
+        raise NotImplementedError
+
+    def set_calibration_cache(self, calibration_cache: "CalibrationCache"):
+        """
+        Stores the collected data in calibration_cache every time it is merged, and reuses the data
+        cached by a previous collection on the same model with the same inputs.
+        The inference session is only created if some inputs are not in the cache.
+        """
+        self.calibration_cache = calibration_cache
+
+    def read_calibration_data(self, data_reader: CalibrationDataReader, create_session=True):
+        """
+        Yields the inputs of data_reader which must be run by the inference session.
+        If the calibration cache contains the data collected on the first inputs of data_reader,
+        this data is merged into the calibrater and these inputs are skipped.
+        The inference session is created before the first input is yielded if create_session is True.
+        """
+        cached_digests, cached_state = [], None
+        if self.calibration_cache is not None and not self.collected_inputs_digests:
+            cached_digests, cached_state = self.calibration_cache.load(self)
+
+        # inputs read while comparing them with the cached ones, they must be run if the comparison fails
+        pending = []
+        while True:
+            inputs = data_reader.get_next()
+            if not inputs:
+                break
+            digest = CalibrationCache.hash_inputs(inputs) if self.calibration_cache is not None else None
+            if cached_state is not None:
+                pending.append((inputs, digest))
+                if digest == cached_digests[len(pending) - 1]:
+                    if len(pending) == len(cached_digests):
+                        self.merge_collected_state(cached_state)
+                        self.collected_inputs_digests.extend(cached_digests)
+                        cached_state, pending = None, []
+                    continue
+                cached_state = None
+            else:
+                pending.append((inputs, digest))
+
+            if create_session and self.infer_session is None:
+                self.create_inference_session()
+            for pending_inputs, pending_digest in pending:
+                self.collected_inputs_digests.append(pending_digest)
+                yield pending_inputs
+            pending = []
+
+        # the cache contains more inputs than data_reader
+        if pending:
+            if create_session and self.infer_session is None:
+                self.create_inference_session()
+            for pending_inputs, pending_digest in pending:
+                self.collected_inputs_digests.append(pending_digest)
+                yield pending_inputs
+
+    def copy_for_process(self) -> "CalibraterBase":
+        """
+        Returns a copy of this calibrater without any collected data, to be sent to another process.
+        The augmented model is saved on disk, the copy does not hold it.
+        """
+        calibrater = copy.copy(self)
+        calibrater.model = None
+        calibrater.augment_model = None
+        calibrater.infer_session = None
+        calibrater.calibration_cache = None
+        calibrater.collected_inputs_digests = []
+        calibrater.num_processes = None
+        calibrater.clear_collected_data()
+        return calibrater
+
+    def collect_data_in_processes(self, data_reader: CalibrationDataReader):
+        """
+        Splits the calibration data across num_processes processes, each one running its own inference session
+        on the augmented model, and merges the data they collected into this calibrater
+        (see merge_collected_state). data_reader is only read by the current process, which sends
+        the inputs in turn to every process. The processes are started with the "spawn" method,
+        the main script must be protected by ``if __name__ == "__main__":``.
+        Merging histograms may change their bins but not the number of values counted.
+        If there is a calibration cache, it is saved once all processes are finished.
+        """
+        context = multiprocessing.get_context("spawn")
+        results_queue = context.Queue()
+        calibrater = self.copy_for_process()
+        intra_op_num_threads = max(1, (os.cpu_count() or 1) // self.num_processes)
+        processes, inputs_queues = [], []
+        states = {}
+        try:
+            for i, inputs in enumerate(self.read_calibration_data(data_reader, create_session=False)):
+                if len(processes) < self.num_processes:
+                    # a process is started only when there is some data for it
+                    inputs_queues.append(context.Queue(maxsize=2))
+                    processes.append(
+                        context.Process(
+                            target=_collect_data_in_process,
+                            args=(calibrater, len(processes), intra_op_num_threads, inputs_queues[-1], results_queue),
+                            daemon=True,
+                        )
+                    )
+                    processes[-1].start()
+                index = i % self.num_processes
+                _put_in_process(processes[index], inputs_queues[index], inputs, results_queue)
+            for process, inputs_queue in zip(processes, inputs_queues):
+                _put_in_process(process, inputs_queue, None, results_queue)
+            while len(states) < len(processes):
+                index, state = _get_from_processes(processes, results_queue)
+                states[index] = state
+        finally:
+            for process in processes:
+                if process.is_alive() and len(states) < len(processes):
+                    process.terminate()
+                process.join()
+
+        if not processes and not self.get_collected_state():
+            raise ValueError("No data is collected.")
+        for index in range(len(processes)):
+            self.merge_collected_state(states[index])
+        self.save_calibration_cache()
+
+    def save_calibration_cache(self):
+        """
+        Saves the data collected so far into the calibration cache if any.
+        """
+        if self.calibration_cache is not None:
+            self.calibration_cache.save(self, self.collected_inputs_digests, self.get_collected_state())
+
 
 class MinMaxCalibrater(CalibraterBase):
     def __init__(
@@ -274,6 +423,7 @@ class MinMaxCalibrater(CalibraterBase):
         moving_average=False,
         averaging_constant=0.01,
         max_intermediate_outputs=None,
+        num_processes=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -284,6 +434,8 @@ class MinMaxCalibrater(CalibraterBase):
         :param moving_average: compute the moving average of the minimum and maximum values instead of the global minimum and maximum.
         :param averaging_constant: constant smoothing factor to use when computing the moving average.
         :param max_intermediate_outputs: maximum number of intermediate outputs before an intermediate range is computed.
+        :param num_processes: number of processes running the calibration data in parallel,
+            see :meth:`CalibraterBase.collect_data_in_processes`.
         """
         super().__init__(
             model_path,
@@ -291,6 +443,7 @@ class MinMaxCalibrater(CalibraterBase):
             augmented_model_path=augmented_model_path,
             symmetric=symmetric,
             use_external_data_format=use_external_data_format,
+            num_processes=num_processes,
         )
         self.intermediate_outputs = []
         self.calibrate_tensors_range = None
@@ -308,7 +461,7 @@ class MinMaxCalibrater(CalibraterBase):
         model and ensures their outputs are stored as part of the graph output
         :return: augmented ONNX model
         """
-        tensors, _ = self.select_tensors_to_calibrate(self.model)
+        tensors, value_infos = self.select_tensors_to_calibrate(self.model)
         reshape_shape_name = str(uuid.uuid4())
         reshape_shape = numpy_helper.from_array(np.array([1], dtype=np.int64), reshape_shape_name)
         self.model.graph.initializer.append(reshape_shape)
@@ -333,9 +486,6 @@ class MinMaxCalibrater(CalibraterBase):
             )
 
             self.model.graph.node.extend([reduce_node, reshape_node])
-            value_infos = {vi.name: vi for vi in self.model.graph.value_info}
-            value_infos.update({o.name: o for o in self.model.graph.output})
-            value_infos.update({i.name: i for i in self.model.graph.input})
             if tensor_name in value_infos:
                 onnx_type = value_infos[tensor_name].type.tensor_type.elem_type
             else:
@@ -359,17 +509,19 @@ class MinMaxCalibrater(CalibraterBase):
         self.intermediate_outputs = []
 
     def collect_data(self, data_reader: CalibrationDataReader):
-        while True:
-            inputs = data_reader.get_next()
-            if not inputs:
-                break
+        if self.num_processes is not None and self.num_processes > 1:
+            self.collect_data_in_processes(data_reader)
+            return
+
+        for inputs in self.read_calibration_data(data_reader):
             self.intermediate_outputs.append(self.infer_session.run(None, inputs))
             if (
                 self.max_intermediate_outputs is not None
                 and len(self.intermediate_outputs) == self.max_intermediate_outputs
             ):
-                self.compute_range()
+                self.compute_data()
                 self.clear_collected_data()
+                self.save_calibration_cache()
 
         if len(self.intermediate_outputs) == 0 and self.calibrate_tensors_range is None:
             raise ValueError("No data is collected.")
@@ -378,22 +530,42 @@ class MinMaxCalibrater(CalibraterBase):
         if not isinstance(t, TensorsData):
             raise TypeError(f"compute_data must return a TensorsData not {type(t)}.")
         self.clear_collected_data()
+        self.save_calibration_cache()
 
-    def merge_range(self, old_range, new_range):
+    def merge_range(self, old_range: TensorsData, new_range: TensorsData) -> TensorsData:
         if not old_range:
             return new_range
 
-        for key, value in old_range.items():
+        for key, value in old_range.data.items():
+            old_min, old_max = value.range_value
+            new_min, new_max = new_range[key].range_value
             if self.moving_average:
-                min_value = value[0] + self.averaging_constant * (new_range[key][0] - value[0])
-                max_value = value[1] + self.averaging_constant * (new_range[key][1] - value[1])
+                min_value = old_min + self.averaging_constant * (new_min - old_min)
+                max_value = old_max + self.averaging_constant * (new_max - old_max)
             else:
-                min_value = min(value[0], new_range[key][0])
-                max_value = max(value[1], new_range[key][1])
-            new_range[key] = (min_value, max_value)
+                min_value = min(old_min, new_min)
+                max_value = max(old_max, new_max)
+            new_range[key] = TensorData(lowest=min_value, highest=max_value)
 
         return new_range
 
+    def copy_for_process(self) -> "MinMaxCalibrater":
+        calibrater = super().copy_for_process()
+        calibrater.calibrate_tensors_range = None
+        return calibrater
+
+    def get_collected_state(self) -> Dict[str, Tuple]:
+        if self.calibrate_tensors_range is None:
+            return {}
+        return {name: value.range_value for name, value in self.calibrate_tensors_range.data.items()}
+
+    def merge_collected_state(self, state: Dict[str, Tuple]):
+        new_range = TensorsData(CalibrationMethod.MinMax, state)
+        if self.calibrate_tensors_range:
+            self.calibrate_tensors_range = self.merge_range(self.calibrate_tensors_range, new_range)
+        else:
+            self.calibrate_tensors_range = new_range
+
     def compute_data(self) -> TensorsData:
         """
         Compute the min-max range of tensor
@@ -458,6 +630,10 @@ class HistogramCalibrater(CalibraterBase):
         num_quantized_bins=2048,
         percentile=99.999,
         scenario="same",
+        max_intermediate_outputs=None,
+        num_workers=None,
+        use_processes=False,
+        num_processes=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path.
@@ -470,6 +646,13 @@ class HistogramCalibrater(CalibraterBase):
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
         :param scenario: see :class:`DistributionCalibrater`
+        :param max_intermediate_outputs: maximum number of intermediate outputs kept in memory before they are
+            merged into the histograms. By default, all outputs are kept until the data reader is exhausted.
+        :param num_workers: number of workers computing the thresholds of the tensors in parallel,
+            see :class:`HistogramCollector`.
+        :param use_processes: use processes instead of threads when num_workers > 1.
+        :param num_processes: number of processes running the calibration data in parallel,
+            see :meth:`CalibraterBase.collect_data_in_processes`.
         """
         super().__init__(
             model_path,
@@ -477,6 +660,7 @@ class HistogramCalibrater(CalibraterBase):
             augmented_model_path=augmented_model_path,
             symmetric=symmetric,
             use_external_data_format=use_external_data_format,
+            num_processes=num_processes,
         )
         self.intermediate_outputs = []
         self.calibrate_tensors_range = None
@@ -489,6 +673,9 @@ class HistogramCalibrater(CalibraterBase):
         self.percentile = percentile
         self.tensors_to_calibrate = None
         self.scenario = scenario
+        self.max_intermediate_outputs = max_intermediate_outputs
+        self.num_workers = num_workers
+        self.use_processes = use_processes
 
     def augment_graph(self):
         """
@@ -513,15 +700,59 @@ class HistogramCalibrater(CalibraterBase):
         """
         Entropy Calibrator collects operators' tensors as well as generates tensor histogram for each operator.
         """
-        while True:
-            inputs = data_reader.get_next()
-            if not inputs:
-                break
+        if self.num_processes is not None and self.num_processes > 1:
+            self.collect_data_in_processes(data_reader)
+            return
+
+        for inputs in self.read_calibration_data(data_reader):
             self.intermediate_outputs.append(self.infer_session.run(None, inputs))
+            if (
+                self.max_intermediate_outputs is not None
+                and len(self.intermediate_outputs) == self.max_intermediate_outputs
+            ):
+                self.collect_histogram()
+                self.clear_collected_data()
+                self.save_calibration_cache()
 
-        if len(self.intermediate_outputs) == 0:
+        if len(self.intermediate_outputs) == 0 and self.collector is None:
             raise ValueError("No data is collected.")
 
+        if len(self.intermediate_outputs) > 0:
+            self.collect_histogram()
+        self.clear_collected_data()
+        self.save_calibration_cache()
+
+    def create_collector(self):
+        return HistogramCollector(
+            method=self.method,
+            symmetric=self.symmetric,
+            num_bins=self.num_bins,
+            num_quantized_bins=self.num_quantized_bins,
+            percentile=self.percentile,
+            scenario=self.scenario,
+            num_workers=self.num_workers,
+            use_processes=self.use_processes,
+        )
+
+    def copy_for_process(self) -> "HistogramCalibrater":
+        calibrater = super().copy_for_process()
+        calibrater.collector = None
+        return calibrater
+
+    def get_collected_state(self) -> Dict[str, Tuple]:
+        if not self.collector:
+            return {}
+        return self.collector.get_histogram_dict()
+
+    def merge_collected_state(self, state: Dict[str, Tuple]):
+        if not self.collector:
+            self.collector = self.create_collector()
+        self.collector.merge_histogram_dict(state)
+
+    def collect_histogram(self):
+        """
+        Merge the intermediate outputs collected so far into the histogram of every tensor to calibrate.
+        """
         output_names = [self.infer_session.get_outputs()[i].name for i in range(len(self.intermediate_outputs[0]))]
         output_dicts_list = [
             dict(zip(output_names, intermediate_output)) for intermediate_output in self.intermediate_outputs
@@ -535,18 +766,9 @@ class HistogramCalibrater(CalibraterBase):
         clean_merged_dict = {i: merged_dict[i] for i in merged_dict if i in self.tensors_to_calibrate}
 
         if not self.collector:
-            self.collector = HistogramCollector(
-                method=self.method,
-                symmetric=self.symmetric,
-                num_bins=self.num_bins,
-                num_quantized_bins=self.num_quantized_bins,
-                percentile=self.percentile,
-                scenario=self.scenario,
-            )
+            self.collector = self.create_collector()
         self.collector.collect(clean_merged_dict)
 
-        self.clear_collected_data()
-
     def compute_data(self) -> TensorsData:
         """
         Compute the min-max range of tensor
@@ -577,6 +799,10 @@ class EntropyCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=128,
         num_quantized_bins=128,
+        max_intermediate_outputs=None,
+        num_workers=None,
+        use_processes=False,
+        num_processes=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -587,6 +813,11 @@ class EntropyCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_bins: number of bins to create a new histogram for collecting tensor values.
         :param num_quantized_bins: number of quantized bins. Default 128.
+        :param max_intermediate_outputs: maximum number of intermediate outputs before they are merged into histograms.
+        :param num_workers: number of workers computing the thresholds of the tensors in parallel.
+        :param use_processes: use processes instead of threads when num_workers > 1.
+        :param num_processes: number of processes running the calibration data in parallel,
+            see :meth:`CalibraterBase.collect_data_in_processes`.
         """
         super().__init__(
             model_path,
@@ -597,6 +828,10 @@ class EntropyCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
+            use_processes=use_processes,
+            num_processes=num_processes,
         )
 
 
@@ -611,6 +846,10 @@ class PercentileCalibrater(HistogramCalibrater):
         symmetric=False,
         num_bins=2048,
         percentile=99.999,
+        max_intermediate_outputs=None,
+        num_workers=None,
+        use_processes=False,
+        num_processes=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -621,6 +860,11 @@ class PercentileCalibrater(HistogramCalibrater):
         :param symmetric: make range of tensor symmetric (central point is 0).
         :param num_quantized_bins: number of quantized bins. Default 128.
         :param percentile: A float number between [0, 100]. Default 99.99.
+        :param max_intermediate_outputs: maximum number of intermediate outputs before they are merged into histograms.
+        :param num_workers: number of workers computing the thresholds of the tensors in parallel.
+        :param use_processes: use processes instead of threads when num_workers > 1.
+        :param num_processes: number of processes running the calibration data in parallel,
+            see :meth:`CalibraterBase.collect_data_in_processes`.
         """
         super().__init__(
             model_path,
@@ -631,6 +875,10 @@ class PercentileCalibrater(HistogramCalibrater):
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
+            use_processes=use_processes,
+            num_processes=num_processes,
         )
 
 
@@ -644,6 +892,10 @@ class DistributionCalibrater(HistogramCalibrater):
         method="distribution",
         num_bins=128,
         scenario="same",
+        max_intermediate_outputs=None,
+        num_workers=None,
+        use_processes=False,
+        num_processes=None,
     ):
         """
         :param model_path: ONNX model to calibrate. It is a model path
@@ -657,6 +909,11 @@ class DistributionCalibrater(HistogramCalibrater):
             the algorithm weights and float 8 follow the same distribution,
             if `scenario="p3"`, it assumes the weights follow
             a gaussian law and float 8 ~ X^3 where X is a gaussian law
+        :param max_intermediate_outputs: maximum number of intermediate outputs before they are merged into histograms.
+        :param num_workers: number of workers computing the thresholds of the tensors in parallel.
+        :param use_processes: use processes instead of threads when num_workers > 1.
+        :param num_processes: number of processes running the calibration data in parallel,
+            see :meth:`CalibraterBase.collect_data_in_processes`.
         """
         super().__init__(
             model_path,
@@ -666,6 +923,10 @@ class DistributionCalibrater(HistogramCalibrater):
             method=method,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
+            use_processes=use_processes,
+            num_processes=num_processes,
         )
 
 
@@ -700,7 +961,25 @@ class HistogramCollector(CalibrationDataCollector):
                  pytorch_quantization/calib/histogram.html
     """
 
-    def __init__(self, method, symmetric, num_bins, num_quantized_bins, percentile, scenario):
+    # maximum number of histogram bins concatenated at once by get_entropy_threshold
+    _entropy_chunk_elements = 2**22
+
+    def __init__(
+        self,
+        method,
+        symmetric,
+        num_bins,
+        num_quantized_bins,
+        percentile,
+        scenario,
+        num_workers=None,
+        use_processes=False,
+    ):
+        """
+        :param num_workers: number of workers computing the thresholds of the tensors in parallel.
+            By default, the tensors are processed one after another in the current thread.
+        :param use_processes: use a pool of processes instead of a pool of threads when num_workers > 1.
+        """
         self.histogram_dict = {}
         self.method = method
         self.symmetric = symmetric
@@ -708,6 +987,8 @@ class HistogramCollector(CalibrationDataCollector):
         self.num_quantized_bins = num_quantized_bins
         self.percentile = percentile
         self.scenario = scenario
+        self.num_workers = num_workers
+        self.use_processes = use_processes
 
     def get_histogram_dict(self):
         return self.histogram_dict
@@ -758,7 +1039,13 @@ class HistogramCollector(CalibrationDataCollector):
 
             if tensor not in self.histogram_dict:
                 # first time it uses num_bins to compute histogram.
-                hist, hist_edges = np.histogram(data_arr_np, bins=self.num_bins)
+                # The histogram starts at 0, otherwise values smaller than the smallest absolute value
+                # of this first batch would be dropped when the next batches are merged.
+                hist, hist_edges = np.histogram(
+                    data_arr_np,
+                    bins=self.num_bins,
+                    range=(0, np.max(data_arr_np)) if data_arr_np.size > 0 else None,
+                )
                 hist_edges = hist_edges.astype(data_arr_np.dtype)
                 assert (
                     data_arr_np.dtype != np.float64
@@ -772,13 +1059,7 @@ class HistogramCollector(CalibrationDataCollector):
                 assert hasattr(old_max, "dtype"), f"old_min should be a numpy array but is {type(old_max)}"
                 old_hist = old_histogram[0]
                 old_hist_edges = old_histogram[1]
-                temp_amax = np.max(data_arr_np)
-                if temp_amax > old_hist_edges[-1]:
-                    # increase the number of bins
-                    width = old_hist_edges[1] - old_hist_edges[0]
-                    # NOTE: np.arange may create an extra bin after the one containing temp_amax
-                    new_bin_edges = np.arange(old_hist_edges[-1] + width, temp_amax + width, width)
-                    old_hist_edges = np.hstack((old_hist_edges, new_bin_edges))
+                old_hist_edges = self.extend_absolute_bins(old_hist_edges, np.max(data_arr_np))
                 hist, hist_edges = np.histogram(data_arr_np, bins=old_hist_edges)
                 hist_edges = hist_edges.astype(data_arr_np.dtype)
                 hist[: len(old_hist)] += old_hist
@@ -787,6 +1068,24 @@ class HistogramCollector(CalibrationDataCollector):
                 ), "only float32 or float16 is supported, every constant must be explicetly typed"
                 self.histogram_dict[tensor] = (hist, hist_edges, min(old_min, min_value), max(old_max, max_value))
 
+    @staticmethod
+    def extend_absolute_bins(hist_edges, amax):
+        """
+        Appends bins of the same width to hist_edges until amax is included.
+        """
+        if amax <= hist_edges[-1]:
+            return hist_edges
+        width = hist_edges[1] - hist_edges[0]
+        # NOTE: np.arange may create an extra bin after the one containing amax
+        new_bin_edges = np.arange(hist_edges[-1] + width, amax + width, width)
+        if new_bin_edges.size == 0:
+            # rounding errors may create no bin when amax is a few ulps above the last edge
+            new_bin_edges = np.array([amax], dtype=new_bin_edges.dtype)
+        elif new_bin_edges[-1] < amax:
+            # rounding errors in np.arange may leave amax out of the last bin
+            new_bin_edges[-1] = amax
+        return np.hstack((hist_edges, new_bin_edges))
+
     def collect_value(self, name_to_arr):
         """
         Collect histogram on real value
@@ -819,11 +1118,15 @@ class HistogramCollector(CalibrationDataCollector):
                     threshold,
                 )
 
-    def merge_histogram(self, old_histogram, data_arr, new_min, new_max, new_threshold):
+    def merge_histogram(self, old_histogram, data_arr, new_min, new_max, new_threshold, weights=None):
+        """
+        Merges data_arr into old_histogram. The bins of old_histogram are extended if needed.
+        weights is given to np.histogram, it is used to merge another histogram through its bin centers.
+        """
         (old_hist, old_hist_edges, old_min, old_max, old_threshold) = old_histogram
 
         if new_threshold <= old_threshold:
-            new_hist, _ = np.histogram(data_arr, len(old_hist), range=(-old_threshold, old_threshold))
+            new_hist, _ = np.histogram(data_arr, len(old_hist), range=(-old_threshold, old_threshold), weights=weights)
             return (
                 new_hist + old_hist,
                 old_hist_edges,
@@ -833,7 +1136,9 @@ class HistogramCollector(CalibrationDataCollector):
             )
         else:
             if old_threshold == 0:
-                hist, hist_edges = np.histogram(data_arr, len(old_hist), range=(-new_threshold, new_threshold))
+                hist, hist_edges = np.histogram(
+                    data_arr, len(old_hist), range=(-new_threshold, new_threshold), weights=weights
+                )
                 hist += old_hist
             else:
                 old_num_bins = len(old_hist)
@@ -841,7 +1146,9 @@ class HistogramCollector(CalibrationDataCollector):
                 half_increased_bins = int((new_threshold - old_threshold) // old_stride + 1)
                 new_num_bins = old_num_bins + 2 * half_increased_bins
                 new_threshold = half_increased_bins * old_stride + old_threshold
-                hist, hist_edges = np.histogram(data_arr, new_num_bins, range=(-new_threshold, new_threshold))
+                hist, hist_edges = np.histogram(
+                    data_arr, new_num_bins, range=(-new_threshold, new_threshold), weights=weights
+                )
                 hist[half_increased_bins : new_num_bins - half_increased_bins] += old_hist
             return (
                 hist,
@@ -851,6 +1158,39 @@ class HistogramCollector(CalibrationDataCollector):
                 new_threshold,
             )
 
+    def merge_histogram_dict(self, histogram_dict):
+        """
+        Merges histograms collected by another HistogramCollector with the same method,
+        for example on another machine or loaded from a CalibrationCache.
+        When the bins differ, the counts of the other histogram are assigned to the bins
+        containing the centers of its own bins.
+        """
+        for tensor, other in histogram_dict.items():
+            if tensor not in self.histogram_dict:
+                self.histogram_dict[tensor] = tuple(np.array(v) for v in other)
+                continue
+            current = self.histogram_dict[tensor]
+            if len(current) != len(other):
+                raise ValueError(f"Histograms of tensor {tensor!r} were not collected by the same method.")
+            other_hist, other_edges = other[0], other[1]
+            new_min = min(current[2], other[2])
+            new_max = max(current[3], other[3])
+            if current[1].shape == other_edges.shape and np.array_equal(current[1], other_edges):
+                self.histogram_dict[tensor] = (current[0] + other_hist, current[1], new_min, new_max, *current[4:])
+                continue
+            centers = ((other_edges[:-1] + other_edges[1:]) / 2).astype(other_edges.dtype)
+            if len(current) == 5:
+                hist, hist_edges, _, _, threshold = self.merge_histogram(
+                    current, centers, other[2], other[3], max(current[4], other[4]), weights=other_hist
+                )
+                self.histogram_dict[tensor] = (hist.astype(current[0].dtype), hist_edges, new_min, new_max, threshold)
+            else:
+                hist_edges = self.extend_absolute_bins(current[1], other_edges[-1])
+                hist, hist_edges = np.histogram(centers, bins=hist_edges, weights=other_hist)
+                hist = hist.astype(current[0].dtype)
+                hist[: len(current[0])] += current[0]
+                self.histogram_dict[tensor] = (hist, hist_edges.astype(current[1].dtype), new_min, new_max)
+
     def compute_collection_result(self):
         if not self.histogram_dict or len(self.histogram_dict) == 0:
             raise ValueError("Histogram has not been collected. Please run collect() first.")
@@ -865,6 +1205,34 @@ class HistogramCollector(CalibrationDataCollector):
         else:
             raise ValueError("Only 'entropy', 'percentile' or 'distribution' methods are supported")
 
+    def compute_thresholds(self, get_tensor_data):
+        """
+        Applies `get_tensor_data` on the histogram of every tensor. The histograms are independent,
+        they are processed by a pool of `num_workers` threads or processes if `num_workers > 1`.
+        :return: dictionary mapping: {tensor name: result of get_tensor_data}
+        """
+        tensors = list(self.histogram_dict)
+        histograms = [self.histogram_dict[tensor] for tensor in tensors]
+        if not self.num_workers or self.num_workers <= 1 or len(histograms) <= 1:
+            results = list(map(get_tensor_data, histograms))
+        elif self.use_processes:
+            # The workers only need the collector settings, not every histogram.
+            worker = copy.copy(self)
+            worker.histogram_dict = {}
+            chunksize = max(1, len(histograms) // (4 * self.num_workers))
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                results = list(executor.map(getattr(worker, get_tensor_data.__name__), histograms, chunksize=chunksize))
+        else:
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                results = list(executor.map(get_tensor_data, histograms))
+
+        # Plot histogram for debug only
+        if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
+            for histogram in histograms:
+                apply_plot(histogram[0], histogram[1])
+
+        return dict(zip(tensors, results))
+
     def compute_percentile(self):
         if self.percentile < 0 or self.percentile > 100:
             raise ValueError("Invalid percentile. Must be in range 0 <= percentile <= 100.")
@@ -872,50 +1240,43 @@ class HistogramCollector(CalibrationDataCollector):
         histogram_dict = self.histogram_dict
         percentile = self.percentile
 
-        thresholds_dict = {}  # per tensor thresholds
-
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins}")
         print(f"Percentile : ({100.0 - percentile},{percentile})")
 
-        for tensor, histogram in histogram_dict.items():
-            hist = histogram[0]
-            hist_edges = histogram[1]
-            total = hist.sum()
-            cdf = np.cumsum(hist / total)
-            if self.symmetric:
-                idx_right = np.searchsorted(cdf, percentile / 100.0)
+        return self.compute_thresholds(self._get_percentile_tensor_data)
 
-                thresholds_dict[tensor] = (
-                    -np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                    np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                )
-            else:
-                percent_to_cut_one_side = (100.0 - percentile) / 200.0
-                idx_right = np.searchsorted(cdf, 1.0 - percent_to_cut_one_side)
-                idx_left = np.searchsorted(cdf, percent_to_cut_one_side)
-                thresholds_dict[tensor] = (
-                    np.array(hist_edges[idx_left], dtype=hist_edges.dtype),
-                    np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
-                )
-            min_value = histogram[2]
-            max_value = histogram[3]
-            if thresholds_dict[tensor][0] < min_value:
-                thresholds_dict[tensor] = (min_value, thresholds_dict[tensor][1])
-            if thresholds_dict[tensor][1] > max_value:
-                thresholds_dict[tensor] = (thresholds_dict[tensor][0], max_value)
-            thresholds_dict[tensor] = (*thresholds_dict[tensor], *hist[:2])
-            # Plot histogram for debug only
-            if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
-                apply_plot(hist, hist_edges)
-
-        return thresholds_dict
+    def _get_percentile_tensor_data(self, histogram):
+        hist = histogram[0]
+        hist_edges = histogram[1]
+        percentile = self.percentile
+        total = hist.sum()
+        cdf = np.cumsum(hist / total)
+        if self.symmetric:
+            idx_right = np.searchsorted(cdf, percentile / 100.0)
+
+            threshold = (
+                -np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+                np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+            )
+        else:
+            percent_to_cut_one_side = (100.0 - percentile) / 200.0
+            idx_right = np.searchsorted(cdf, 1.0 - percent_to_cut_one_side)
+            idx_left = np.searchsorted(cdf, percent_to_cut_one_side)
+            threshold = (
+                np.array(hist_edges[idx_left], dtype=hist_edges.dtype),
+                np.array(hist_edges[idx_right], dtype=hist_edges.dtype),
+            )
+        min_value = histogram[2]
+        max_value = histogram[3]
+        if threshold[0] < min_value:
+            threshold = (min_value, threshold[1])
+        if threshold[1] > max_value:
+            threshold = (threshold[0], max_value)
+        return (*threshold, *hist[:2])
 
     def compute_entropy(self):
         histogram_dict = self.histogram_dict
-        num_quantized_bins = self.num_quantized_bins
-
-        thresholds_dict = {}  # per tensor thresholds
 
         print(f"Number of tensors : {len(histogram_dict)}")
         print(
@@ -925,16 +1286,11 @@ class HistogramCollector(CalibrationDataCollector):
         )
         print(f"Number of quantized bins : {self.num_quantized_bins}")
 
-        for tensor, histogram in histogram_dict.items():
-            optimal_threshold = self.get_entropy_threshold(histogram, num_quantized_bins)
-            thresholds_dict[tensor] = optimal_threshold
-            thresholds_dict[tensor] = (*optimal_threshold, *histogram[:2])
-
-            # Plot histogram for debug only
-            if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
-                apply_plot(histogram[0], histogram[1])
+        return self.compute_thresholds(self._get_entropy_tensor_data)
 
-        return thresholds_dict
+    def _get_entropy_tensor_data(self, histogram):
+        optimal_threshold = self.get_entropy_threshold(histogram, self.num_quantized_bins)
+        return (*optimal_threshold, *histogram[:2])
 
     @staticmethod
     def _avg_std(hist, hist_edges, power=1):
@@ -963,40 +1319,35 @@ class HistogramCollector(CalibrationDataCollector):
             raise ValueError("Invalid num_bins. Must be in range 512 <= num_bins.")
 
         histogram_dict = self.histogram_dict
-        thresholds_dict = {}  # per tensor thresholds
 
         print(f"Number of tensors : {len(histogram_dict)}")
         print(f"Number of histogram bins : {self.num_bins}")
         print(f"Scenario : {self.scenario!r})")
 
-        for tensor, histogram in histogram_dict.items():
-            hist = histogram[0]
-            hist_edges = histogram[1]
-
-            assert hist_edges.dtype != np.float64
-            if self.scenario == "same":
-                avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1)
-            elif self.scenario == "p3":
-                avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1.0 / 3.0)
-            else:
-                raise ValueError("Invalid scenario. Must be in {'same', 'p3'}.")
-            assert avg_coef.dtype != np.float64
-            assert std_coef.dtype != np.float64
-            assert hist_edges.dtype != np.float64
-            thresholds_dict[tensor] = TensorData(
-                avg=avg_coef,
-                std=std_coef,
-                hist=hist,
-                hist_edges=hist_edges,
-                lowest=hist_edges.min(),
-                highest=hist_edges.max(),
-            )
+        return self.compute_thresholds(self._get_distribution_tensor_data)
 
-            # Plot histogram for debug only
-            if os.environ.get("QUANTIZATION_DEBUG", 0) in (1, "1"):
-                apply_plot(hist, hist_edges)
+    def _get_distribution_tensor_data(self, histogram):
+        hist = histogram[0]
+        hist_edges = histogram[1]
 
-        return thresholds_dict
+        assert hist_edges.dtype != np.float64
+        if self.scenario == "same":
+            avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1)
+        elif self.scenario == "p3":
+            avg_coef, std_coef = self._avg_std(hist, hist_edges, power=1.0 / 3.0)
+        else:
+            raise ValueError("Invalid scenario. Must be in {'same', 'p3'}.")
+        assert avg_coef.dtype != np.float64
+        assert std_coef.dtype != np.float64
+        assert hist_edges.dtype != np.float64
+        return TensorData(
+            avg=avg_coef,
+            std=std_coef,
+            hist=hist,
+            hist_edges=hist_edges,
+            lowest=hist_edges.min(),
+            highest=hist_edges.max(),
+        )
 
     def get_entropy_threshold(self, histogram, num_quantized_bins):
         """Given a dataset, find the optimal threshold for quantizing it.
@@ -1012,7 +1363,6 @@ class HistogramCollector(CalibrationDataCollector):
 
         dtype = histogram[1].dtype
         kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
-        thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
 
         # <------------ num bins ---------------->
         #        <--- quantized bins ---->
@@ -1028,56 +1378,34 @@ class HistogramCollector(CalibrationDataCollector):
         # |                                      |
         # start index                    end index       (end of iteration)
 
-        for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
-            start_index = zero_bin_index - i
-            end_index = zero_bin_index + i + 1 if (zero_bin_index + i + 1) <= num_bins else num_bins
-
-            thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
-
-            sliced_distribution = copy.deepcopy(hist[start_index:end_index])
-
-            # reference distribution p
-            p = sliced_distribution.copy()  # a copy of np array
-            left_outliers_count = sum(hist[:start_index])
-            right_outliers_count = sum(hist[end_index:])
-            p[0] += left_outliers_count
-            p[-1] += right_outliers_count
-
-            # nonzeros[i] incidates whether p[i] is non-zero
-            nonzeros = (p != 0).astype(np.int64)
-
-            # quantize p.size bins into quantized bins (default 128 bins)
-            quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
-            num_merged_bins = sliced_distribution.size // num_quantized_bins
-
-            # merge bins into quantized bins
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-                quantized_bins[index] = sum(sliced_distribution[start:end])
-            quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
-
-            # in order to compare p and q, we need to make length of q equals to length of p
-            # expand quantized bins into p.size bins
-            q = np.zeros(p.size, dtype=np.int64)
-            for index in range(num_quantized_bins):
-                start = index * num_merged_bins
-                end = start + num_merged_bins
-
-                norm = sum(nonzeros[start:end])
-                if norm != 0:
-                    q[start:end] = quantized_bins[index] / norm
-
-            p = smooth_distribution(p)
-            q = smooth_distribution(q)
-            if p is None or q is None:
-                div = np.array(np.inf, dtype=dtype)
-            else:
-                div = np.array(entropy(p, q), dtype=dtype)
-            kl_divergence[i - num_half_quantized_bin] = div
+        half_widths = np.arange(num_half_quantized_bin, zero_bin_index + 1, dtype=np.int64)
+        start_indices = zero_bin_index - half_widths
+        end_indices = np.minimum(zero_bin_index + half_widths + 1, num_bins)
+
+        # All candidate thresholds are evaluated with array operations. Candidates are split into chunks
+        # to bound the memory used by the concatenated slices, their total size grows with num_bins**2.
+        cumulative_lengths = np.cumsum(end_indices - start_indices)
+        chunk_start = 0
+        while chunk_start < kl_divergence.size:
+            offset = cumulative_lengths[chunk_start - 1] if chunk_start > 0 else 0
+            chunk_end = max(
+                chunk_start + 1,
+                np.searchsorted(cumulative_lengths, offset + self._entropy_chunk_elements, side="right"),
+            )
+            kl_divergence[chunk_start:chunk_end] = self._kl_divergence(
+                hist,
+                start_indices[chunk_start:chunk_end],
+                end_indices[chunk_start:chunk_end],
+                num_quantized_bins,
+                dtype,
+            )
+            chunk_start = chunk_end
 
         min_kl_divergence_idx = np.argmin(kl_divergence)
-        optimal_threshold = thresholds[min_kl_divergence_idx]
+        optimal_threshold = (
+            hist_edges[start_indices[min_kl_divergence_idx]],
+            hist_edges[end_indices[min_kl_divergence_idx]],
+        )
         min_value = histogram[2]
         max_value = histogram[3]
         if optimal_threshold[0] < min_value:
@@ -1088,6 +1416,279 @@ class HistogramCollector(CalibrationDataCollector):
         assert hasattr(optimal_threshold[1], "dtype")
         return optimal_threshold
 
+    @staticmethod
+    def _kl_divergence(hist, start_indices, end_indices, num_quantized_bins, dtype, eps=0.0001):
+        """
+        Computes the KL divergence between the reference distribution `p` and its quantized version `q`
+        for every candidate slice `hist[start_indices[i]:end_indices[i]]`. The slices are concatenated
+        into one array and every step of get_entropy_threshold is done on all of them at once.
+        Only the floating point sums are computed per slice, so that the summation order
+        and therefore the divergences are the same as with smooth_distribution and entropy.
+        """
+        num_candidates = start_indices.size
+        lengths = end_indices - start_indices
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        row = np.repeat(np.arange(num_candidates), lengths)
+
+        sliced_distribution = hist[np.arange(offsets[-1]) + np.repeat(start_indices - offsets[:-1], lengths)]
+        sliced_cumsum = np.concatenate([[0], np.cumsum(sliced_distribution)])
+        hist_cumsum = np.concatenate([[0], np.cumsum(hist)])
+
+        # reference distribution p
+        p = sliced_distribution
+        p[offsets[:-1]] += hist_cumsum[start_indices]
+        p[offsets[1:] - 1] += hist_cumsum[-1] - hist_cumsum[end_indices]
+        is_nonzeros_p = p != 0
+
+        # quantize p.size bins into quantized bins (default 128 bins)
+        num_merged_bins = lengths // num_quantized_bins
+        bounds = offsets[:-1, None] + num_merged_bins[:, None] * np.arange(num_quantized_bins + 1)
+        quantized_bins = np.diff(sliced_cumsum[bounds], axis=1)
+        quantized_bins[:, -1] += sliced_cumsum[offsets[1:]] - sliced_cumsum[bounds[:, -1]]
+
+        # in order to compare p and q, we need to make length of q equals to length of p
+        # expand quantized bins into p.size bins, the remaining bins of every slice are 0
+        nonzeros_cumsum = np.concatenate([[0], np.cumsum(is_nonzeros_p)])
+        norm = np.diff(nonzeros_cumsum[bounds], axis=1)
+        quantized_values = np.zeros((num_candidates, num_quantized_bins + 1), dtype=np.float64)
+        np.divide(quantized_bins, norm, out=quantized_values[:, :-1], where=norm != 0)
+        repeats = np.empty(quantized_values.shape, dtype=np.int64)
+        repeats[:, :-1] = num_merged_bins[:, None]
+        repeats[:, -1] = lengths - num_quantized_bins * num_merged_bins
+        q = np.repeat(quantized_values.astype(np.int64).ravel(), repeats.ravel())
+        is_nonzeros_q = q != 0
+
+        def smooth_distribution(distribution, is_nonzeros):
+            n_nonzeros = np.diff(np.concatenate([[0], np.cumsum(is_nonzeros)])[offsets])
+            eps1 = eps * (lengths - n_nonzeros) / np.maximum(n_nonzeros, 1)
+            assert (eps1[n_nonzeros > 0] < 1.0).all(), f"eps1={eps1.max()} must be < 1"
+            # eps * is_zeros + (-eps1) * is_nonzeros
+            smoothed = distribution.astype(np.float32)
+            smoothed += np.where(is_nonzeros, (-eps1).astype(np.float32)[row], np.float32(eps))
+            return smoothed, n_nonzeros > 0
+
+        p, p_valid = smooth_distribution(p, is_nonzeros_p)
+        q, q_valid = smooth_distribution(q, is_nonzeros_q)
+
+        def row_sums(values):
+            return np.array(
+                [values[offsets[i] : offsets[i + 1]].sum() for i in range(num_candidates)], dtype=values.dtype
+            )
+
+        # entropy(p, q) is infinite when p or q only contains zeros, smooth_distribution returns None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p /= row_sums(p)[row]
+            q /= row_sums(q)[row]
+            p *= np.log(p / q)
+            div = row_sums(p).astype(dtype)
+        div[~(p_valid & q_valid)] = np.inf
+        return div
+
+
+class _QueueDataReader(CalibrationDataReader):
+    """
+    Reads the calibration data sent by CalibraterBase.collect_data_in_processes, None ends it.
+    """
+
+    def __init__(self, inputs_queue):
+        self.inputs_queue = inputs_queue
+
+    def get_next(self) -> dict:
+        return self.inputs_queue.get()
+
+
+def _collect_data_in_process(calibrater, index, intra_op_num_threads, inputs_queue, results_queue):
+    try:
+        calibrater.create_inference_session(intra_op_num_threads=intra_op_num_threads)
+        calibrater.collect_data(_QueueDataReader(inputs_queue))
+        results_queue.put((index, calibrater.get_collected_state(), None))
+    except Exception:
+        results_queue.put((index, None, traceback.format_exc()))
+
+
+def _get_from_processes(processes, results_queue, timeout=1):
+    """
+    Returns the next result sent by one of the processes, raises an exception if one of them failed.
+    """
+    while True:
+        try:
+            index, state, error = results_queue.get(timeout=timeout)
+        except queue.Empty:
+            for process in processes:
+                if process.exitcode not in (None, 0):
+                    raise RuntimeError(f"A calibration process exited with code {process.exitcode}.") from None
+            continue
+        if error is not None:
+            raise RuntimeError(f"Calibration process {index} failed:\n{error}")
+        return index, state
+
+
+def _put_in_process(process, inputs_queue, inputs, results_queue, timeout=1):
+    """
+    Sends inputs to a process, raises an exception if it failed instead of waiting for it forever.
+    """
+    while True:
+        try:
+            inputs_queue.put(inputs, timeout=timeout)
+            return
+        except queue.Full:
+            # a process only sends its result after reading all its inputs, anything else is an error
+            if process.exitcode is not None or not results_queue.empty():
+                _get_from_processes([process], results_queue, timeout=timeout)
+                raise RuntimeError("A calibration process stopped before the end of the calibration data.") from None
+
+
+class CalibrationCache:
+    """
+    Stores on disk the data collected by a calibrater, so that the calibration can be resumed
+    after an interruption or skipped if the same model is calibrated again with the same data.
+    The cache files produced on several machines can be merged with method merge.
+
+    Every cache file is named after a key computed from the content of the model (including its
+    external data) and the settings of the calibrater which impact the collected data.
+    It stores the digests of the calibration inputs in the order they were run.
+    """
+
+    version = 1
+
+    # attributes of the calibraters which change the collected data
+    _settings = (
+        "op_types_to_calibrate",
+        "symmetric",
+        "moving_average",
+        "averaging_constant",
+        "method",
+        "num_bins",
+        "max_intermediate_outputs",
+    )
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        """
+        :param cache_dir: directory containing the cache files, it is created if it does not exist.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._model_digests = {}
+
+    @staticmethod
+    def hash_inputs(inputs: Dict[str, np.ndarray]) -> str:
+        """
+        Returns a digest of the inputs returned by CalibrationDataReader.get_next.
+        """
+        sha = hashlib.sha256()
+        for name in sorted(inputs):
+            value = np.ascontiguousarray(inputs[name])
+            sha.update(f"{name}:{value.dtype.str}:{value.shape}".encode())
+            sha.update(value.tobytes())
+        return sha.hexdigest()
+
+    @staticmethod
+    def _hash_file(sha, file_path: Path):
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+
+    def _hash_model(self, model_path: Path) -> str:
+        stat = model_path.stat()
+        memo_key = (str(model_path.resolve()), stat.st_size, stat.st_mtime_ns)
+        if memo_key in self._model_digests:
+            return self._model_digests[memo_key]
+
+        sha = hashlib.sha256()
+        self._hash_file(sha, model_path)
+        model = onnx.load(model_path.as_posix(), load_external_data=False)
+        external_files = set()
+        for initializer in model.graph.initializer:
+            if external_data_helper.uses_external_data(initializer):
+                external_files.add(external_data_helper.ExternalDataInfo(initializer).location)
+        for location in sorted(external_files):
+            sha.update(location.encode())
+            self._hash_file(sha, model_path.parent / location)
+
+        self._model_digests[memo_key] = sha.hexdigest()
+        return self._model_digests[memo_key]
+
+    def get_key(self, calibrater: CalibraterBase) -> str:
+        """
+        Returns the key identifying the data collected by calibrater.
+        """
+        settings = {"calibrater": type(calibrater).__name__, "model": self._hash_model(calibrater.model_path)}
+        for name in self._settings:
+            if hasattr(calibrater, name):
+                value = getattr(calibrater, name)
+                settings[name] = sorted(value) if name == "op_types_to_calibrate" and value else value
+        return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get_path(self, calibrater: CalibraterBase) -> Path:
+        return self.cache_dir / f"{self.get_key(calibrater)}.npz"
+
+    @staticmethod
+    def read(cache_file: Union[str, Path]):
+        """
+        Reads a cache file.
+        :return: the metadata (key, digests of the inputs) and the collected state {tensor name: tuple of arrays}
+        """
+        with np.load(cache_file, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            if metadata["version"] != CalibrationCache.version:
+                raise ValueError(f"Unsupported version {metadata['version']} for calibration cache {cache_file!r}.")
+            state = {
+                name: tuple(data[f"t{i}_{j}"] for j in range(size))
+                for i, (name, size) in enumerate(metadata["tensors"])
+            }
+        return metadata, state
+
+    def load(self, calibrater: CalibraterBase):
+        """
+        Loads the data cached for calibrater.
+        :return: the digests of the inputs and the collected state, ([], None) if nothing is cached.
+        """
+        cache_file = self.get_path(calibrater)
+        if not cache_file.exists():
+            return [], None
+        metadata, state = self.read(cache_file)
+        if not metadata["digests"]:
+            return [], None
+        return metadata["digests"], state
+
+    def save(self, calibrater: CalibraterBase, digests: Sequence[str], state: Dict[str, Tuple]):
+        """
+        Saves the data collected by calibrater on the inputs identified by digests.
+        The file is replaced atomically so that an interruption never leaves a truncated cache.
+        """
+        cache_file = self.get_path(calibrater)
+        metadata = {
+            "version": self.version,
+            "key": cache_file.stem,
+            "digests": list(digests),
+            "tensors": [(name, len(value)) for name, value in state.items()],
+        }
+        arrays = {"metadata": np.array(json.dumps(metadata))}
+        for i, value in enumerate(state.values()):
+            for j, v in enumerate(value):
+                arrays[f"t{i}_{j}"] = np.asarray(v)
+        tmp_file = cache_file.with_name(cache_file.name + f".{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file, cache_file)
+
+    def merge(self, calibrater: CalibraterBase, cache_files: Sequence[Union[str, Path]]):
+        """
+        Merges into calibrater the data cached in cache_files, for example by calibraters running
+        on several machines on different parts of the calibration data. The result is saved in this cache.
+        calibrater.compute_data() then returns the calibration on all the data.
+        """
+        key = self.get_key(calibrater)
+        for cache_file in cache_files:
+            metadata, state = self.read(cache_file)
+            if metadata["key"] != key:
+                raise ValueError(
+                    f"Calibration cache {str(cache_file)!r} was not produced by the same model and settings."
+                )
+            calibrater.merge_collected_state(state)
+            calibrater.collected_inputs_digests.extend(metadata["digests"])
+        calibrater.save_calibration_cache()
+
 
 def create_calibrator(
     model: Union[str, Path],
@@ -1098,14 +1699,17 @@ def create_calibrator(
     extra_options={},  # noqa: B006
 ):
     calibrator = None
+    max_intermediate_outputs = (
+        None if "max_intermediate_outputs" not in extra_options else extra_options["max_intermediate_outputs"]
+    )
+    num_workers = None if "num_workers" not in extra_options else extra_options["num_workers"]
+    num_processes = None if "num_processes" not in extra_options else extra_options["num_processes"]
+    use_processes = False if "use_processes" not in extra_options else extra_options["use_processes"]
     if calibrate_method == CalibrationMethod.MinMax:
         # default settings for min-max algorithm
         symmetric = False if "symmetric" not in extra_options else extra_options["symmetric"]
         moving_average = False if "moving_average" not in extra_options else extra_options["moving_average"]
         averaging_constant = 0.01 if "averaging_constant" not in extra_options else extra_options["averaging_constant"]
-        max_intermediate_outputs = (
-            None if "max_intermediate_outputs" not in extra_options else extra_options["max_intermediate_outputs"]
-        )
         calibrator = MinMaxCalibrater(
             model,
             op_types_to_calibrate,
@@ -1115,6 +1719,7 @@ def create_calibrator(
             moving_average=moving_average,
             averaging_constant=averaging_constant,
             max_intermediate_outputs=max_intermediate_outputs,
+            num_processes=num_processes,
         )
     elif calibrate_method == CalibrationMethod.Entropy:
         # default settings for entropy algorithm
@@ -1129,6 +1734,10 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             num_quantized_bins=num_quantized_bins,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
+            use_processes=use_processes,
+            num_processes=num_processes,
         )
     elif calibrate_method == CalibrationMethod.Percentile:
         # default settings for percentile algorithm
@@ -1143,6 +1752,10 @@ def create_calibrator(
             symmetric=symmetric,
             num_bins=num_bins,
             percentile=percentile,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
+            use_processes=use_processes,
+            num_processes=num_processes,
         )
 
     elif calibrate_method == CalibrationMethod.Distribution:
@@ -1157,11 +1770,20 @@ def create_calibrator(
             use_external_data_format=use_external_data_format,
             num_bins=num_bins,
             scenario=scenario,
+            max_intermediate_outputs=max_intermediate_outputs,
+            num_workers=num_workers,
+            use_processes=use_processes,
+            num_processes=num_processes,
         )
 
     if calibrator:
         calibrator.augment_graph()
-        calibrator.create_inference_session()
+        if "cache_dir" in extra_options and extra_options["cache_dir"]:
+            # the inference session is only created if some data is not cached
+            calibrator.set_calibration_cache(CalibrationCache(extra_options["cache_dir"]))
+        elif num_processes is None or num_processes <= 1:
+            # otherwise every process creates its own inference session
+            calibrator.create_inference_session()
         return calibrator
 
     raise ValueError(f"Unsupported calibration method {calibrate_method}")
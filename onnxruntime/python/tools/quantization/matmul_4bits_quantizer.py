@@ -11,10 +11,14 @@ import copy
 import importlib
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterable
 
 import numpy as np
 import numpy.typing as npt
 import onnx
+from onnx.external_data_helper import ExternalDataInfo, load_external_data_for_model, uses_external_data
 from onnx.onnx_pb import GraphProto, ModelProto, NodeProto, TensorProto
 from packaging import version
 
@@ -27,6 +31,40 @@ from .quant_utils import attribute_to_kwarg
 logging.basicConfig(format="%(asctime)s %(name)s [%(levelname)s] - %(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tensors smaller than this number of bytes stay in the model file when quantizing out of core.
+EXTERNAL_DATA_SIZE_THRESHOLD = 1024
+# Tensors at least this large are aligned in the external data file so that they can be memory-mapped.
+EXTERNAL_DATA_ALIGN_THRESHOLD = 1024 * 1024
+EXTERNAL_DATA_ALIGNMENT = 64 * 1024
+# Size of the chunks of external data copied from the input file to the output file.
+EXTERNAL_DATA_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _get_all_tensors(graph: GraphProto) -> Iterable[TensorProto]:
+    """Yield the initializers and the tensor attributes of a graph and its subgraphs"""
+    yield from graph.initializer
+    for node in graph.node:
+        for attr in node.attribute:
+            if attr.type == onnx.AttributeProto.TENSOR:
+                yield attr.t
+            elif attr.type == onnx.AttributeProto.TENSORS:
+                yield from attr.tensors
+            elif attr.type == onnx.AttributeProto.GRAPH:
+                yield from _get_all_tensors(attr.g)
+            elif attr.type == onnx.AttributeProto.GRAPHS:
+                for subgraph in attr.graphs:
+                    yield from _get_all_tensors(subgraph)
+
+
+def _read_chunks(data_file: BinaryIO, length: int) -> Iterable[bytes]:
+    """Yield the next length bytes of a file in chunks of at most EXTERNAL_DATA_CHUNK_SIZE bytes"""
+    while length > 0:
+        chunk = data_file.read(min(EXTERNAL_DATA_CHUNK_SIZE, length))
+        if not chunk:
+            raise ValueError("External data file is shorter than the length of a tensor.")
+        length -= len(chunk)
+        yield chunk
+
 
 class WeightOnlyQuantConfig:
     def __init__(self, algorithm):
@@ -110,16 +148,27 @@ class MatMul4BitsQuantizer:
         accuracy_level: int | None = None,
         nodes_to_exclude=None,
         algo_config: WeightOnlyQuantConfig = None,
+        num_workers: int | None = None,
     ):
         if nodes_to_exclude is None:
             nodes_to_exclude = []
-        self.model = ONNXModel(onnx.load(model)) if isinstance(model, str) else ONNXModel(model)
+        # External data is loaded by process(), or memory-mapped by process_out_of_core().
+        self.model = (
+            ONNXModel(onnx.load(model, load_external_data=False)) if isinstance(model, str) else ONNXModel(model)
+        )
         self.model_path = model if isinstance(model, str) else None
         self.block_size = block_size
         self.is_symmetric = is_symmetric
         self.accuracy_level = accuracy_level
         self.nodes_to_exclude = set(nodes_to_exclude)
         self.algo_config = algo_config
+        self.num_workers = num_workers
+        # Quantized weights of the main graph computed by _prequantize_weights, keyed by initializer name
+        self.prequantized_weights = {}
+        # External data file the quantized weights are written to by process_out_of_core()
+        self.external_data_file: BinaryIO | None = None
+        self.external_data_location = None
+        self.external_data_tensor_names = set()
 
     @staticmethod
     def __get_initializer(name, graph_path: list[GraphProto]) -> tuple[TensorProto, GraphProto]:
@@ -170,12 +219,14 @@ class MatMul4BitsQuantizer:
             logger.info("MatMul doesn't have const weight. Skip to quantize")
             return node  # only care about constant weight
 
-        B_array = onnx.numpy_helper.to_array(B)  # noqa: N806
-        if len(B_array.shape) != 2:
+        if len(B.dims) != 2:
             logger.info("MatMul weight is not 2D. Skip to quantize")
             return node  # can only process 2-D matrix
 
-        packed, scales, zero_points = self.int4_block_quant(B_array)
+        if Bs_graph is graph_stack[0] and inputB in self.prequantized_weights:
+            packed, scales, zero_points = self.prequantized_weights[inputB]
+        else:
+            packed, scales, zero_points = self.int4_block_quant(self._get_weight_array(B))
         B_quant = onnx.numpy_helper.from_array(packed)  # noqa: N806
         B_quant.name = B.name + "_Q4"
         for input in Bs_graph.input:
@@ -185,17 +236,23 @@ class MatMul4BitsQuantizer:
 
         scales_tensor = onnx.numpy_helper.from_array(scales)
         scales_tensor.name = B.name + "_scales"
-        Bs_graph.initializer.extend([B_quant, scales_tensor])
+        new_initializers = [B_quant, scales_tensor]
 
         input_names = [node.input[0], B_quant.name, scales_tensor.name]
         if not self.is_symmetric:
             zp_tensor = onnx.numpy_helper.from_array(zero_points)
             zp_tensor.name = B.name + "_zero_points"
-            Bs_graph.initializer.extend([zp_tensor])
+            new_initializers.append(zp_tensor)
             input_names.append(zp_tensor.name)
 
+        if self.external_data_file is not None:
+            for tensor in new_initializers:
+                if len(tensor.raw_data) >= EXTERNAL_DATA_SIZE_THRESHOLD:
+                    self._write_external_data(tensor, [tensor.raw_data], len(tensor.raw_data))
+        Bs_graph.initializer.extend(new_initializers)
+
         kwargs = {}
-        rows, cols = B_array.shape
+        rows, cols = B.dims
         kwargs["K"] = rows
         kwargs["N"] = cols
         kwargs["bits"] = 4
@@ -216,6 +273,62 @@ class MatMul4BitsQuantizer:
 
         return matmul_q4_node
 
+    def _get_weight_array(self, weight: TensorProto) -> np.ndarray:
+        """Return the data of a weight, memory-mapped from its file if it is stored as external data"""
+        if not uses_external_data(weight):
+            return onnx.numpy_helper.to_array(weight)
+
+        info = ExternalDataInfo(weight)
+        dtype = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(weight.data_type)).newbyteorder("<")
+        external_data_file_path = os.path.join(os.path.dirname(self.model_path), info.location)
+        return np.memmap(
+            external_data_file_path, dtype=dtype, mode="r", offset=info.offset or 0, shape=tuple(weight.dims)
+        )
+
+    def _write_external_data(self, tensor: TensorProto, chunks: Iterable[bytes], length: int):
+        """Append the data of a tensor to the external data file, and make the tensor refer to it"""
+        offset = self.external_data_file.tell()
+        if offset % EXTERNAL_DATA_ALIGNMENT and length >= EXTERNAL_DATA_ALIGN_THRESHOLD:
+            padding = EXTERNAL_DATA_ALIGNMENT - offset % EXTERNAL_DATA_ALIGNMENT
+            self.external_data_file.write(b"\0" * padding)
+            offset += padding
+
+        for chunk in chunks:
+            self.external_data_file.write(chunk)
+
+        del tensor.external_data[:]
+        for key, value in (("location", self.external_data_location), ("offset", offset), ("length", length)):
+            entry = tensor.external_data.add()
+            entry.key = key
+            entry.value = str(value)
+        tensor.data_location = TensorProto.EXTERNAL
+        tensor.ClearField("raw_data")
+        self.external_data_tensor_names.add(tensor.name)
+
+    def _prequantize_weights(self):
+        """
+        Quantize the constant weights of the MatMul nodes in the main graph in parallel with `num_workers` threads,
+        before the nodes are replaced. The nodes in subgraphs are quantized one after another.
+        """
+        if not self.num_workers or self.num_workers <= 1:
+            return
+
+        graph = self.model.graph()
+        initializers = {tensor.name: tensor for tensor in graph.initializer}
+        weights = {}
+        for node in graph.node:
+            if node.op_type != "MatMul" or node.name in self.nodes_to_exclude:
+                continue
+            B = initializers.get(node.input[1])  # noqa: N806
+            if B is not None and len(B.dims) == 2:
+                weights[B.name] = B
+
+        def quantize(weight):
+            return self.int4_block_quant(onnx.numpy_helper.to_array(weight))
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            self.prequantized_weights = dict(zip(weights, executor.map(quantize, weights.values())))
+
     def _process_subgraph(self, graph_stack: list[GraphProto]):
         new_nodes = []
         graph = graph_stack[-1]
@@ -315,20 +428,43 @@ class MatMul4BitsQuantizer:
             )
         logger.info(f"complete quantization of model with {algorithm} algorithm.")
 
+    def _add_ms_opset(self):
+        opset_import = self.model.opset_import()
+
+        has_ms_domain = False
+        for opset in opset_import:
+            if opset.domain == "com.microsoft":
+                has_ms_domain = True
+        if not has_ms_domain:
+            opset_import.extend([onnx.helper.make_opsetid("com.microsoft", 1)])
+
+    def _copy_external_data(self):
+        """Copy the external data of the tensors which are not quantized to the external data file, chunk by chunk"""
+        base_dir = os.path.dirname(self.model_path)
+        for tensor in _get_all_tensors(self.model.graph()):
+            if not uses_external_data(tensor) or tensor.name in self.external_data_tensor_names:
+                continue
+            info = ExternalDataInfo(tensor)
+            offset = info.offset or 0
+            with open(os.path.join(base_dir, info.location), "rb") as data_file:
+                data_file.seek(offset)
+                length = info.length
+                if length is None:
+                    length = os.fstat(data_file.fileno()).st_size - offset
+                self._write_external_data(tensor, _read_chunks(data_file, length), length)
+
     def process(self):
+        if self.model_path is not None:
+            load_external_data_for_model(self.model.model, os.path.dirname(self.model_path))
+
         if self.algo_config is None:
+            self._add_ms_opset()
+
             # use a stack to keep track of sub-graphs
             graph_stack = [self.model.graph()]
-            opset_import = self.model.opset_import()
-
-            has_ms_domain = False
-            for opset in opset_import:
-                if opset.domain == "com.microsoft":
-                    has_ms_domain = True
-            if not has_ms_domain:
-                opset_import.extend([onnx.helper.make_opsetid("com.microsoft", 1)])
-
+            self._prequantize_weights()
             self._process_subgraph(graph_stack)
+            self.prequantized_weights = {}
             self.model.clean_initializers()
         else:
             # use Intel® Neural Compressor for RTN or GPTQ weight-only quantize algorithm
@@ -348,6 +484,52 @@ class MatMul4BitsQuantizer:
 
             self.int4_quant_algo()
 
+    def process_out_of_core(self, output_model_path: str, external_data_location: str | None = None):
+        """
+        Quantize a model given as a path and save it to output_model_path, without loading its external data.
+        The weights are memory-mapped from their files and quantized one after another. The quantized weights are
+        written to the external data file of the quantized model as soon as they are computed, and the external
+        data of the other tensors is copied to it, so that the memory used is bounded by the largest weight instead
+        of the size of the model.
+
+        Args:
+            output_model_path:
+                path of the quantized model.
+            external_data_location:
+                file name of the external data of the quantized model, relative to the directory of
+                output_model_path. Defaults to the file name of the quantized model followed by ".data".
+        """
+        if self.model_path is None:
+            raise ValueError("The model must be given as a path to be quantized out of core.")
+        if self.algo_config is not None:
+            raise ValueError(f"The {self.algo_config.algorithm} algorithm does not support out of core quantization.")
+
+        if external_data_location is None:
+            external_data_location = Path(output_model_path).name + ".data"
+        external_data_path = os.path.join(os.path.dirname(output_model_path), external_data_location)
+        base_dir = os.path.dirname(self.model_path)
+        input_data_paths = {
+            os.path.realpath(os.path.join(base_dir, ExternalDataInfo(tensor).location))
+            for tensor in _get_all_tensors(self.model.graph())
+            if uses_external_data(tensor)
+        }
+        if os.path.realpath(external_data_path) in input_data_paths:
+            raise ValueError(f"{external_data_path} is an external data file of the input model.")
+
+        self._add_ms_opset()
+        with open(external_data_path, "wb") as external_data_file:
+            self.external_data_file = external_data_file
+            self.external_data_location = external_data_location
+            try:
+                self._process_subgraph([self.model.graph()])
+                self.model.clean_initializers()
+                self._copy_external_data()
+            finally:
+                self.external_data_file = None
+                self.external_data_tensor_names = set()
+
+        self.model.save_model_to_file(output_model_path)
+
 
 def ort_convert_str_to_bool(value):
     return value.lower() in ("true", "1")
@@ -394,6 +576,19 @@ set of 4b integers with a scaling factor and an optional offset.
         default=[],
         help="Specify the nodes to be excluded from quantization with node names",
     )
+    parser.add_argument(
+        "--num_workers",
+        required=False,
+        type=int,
+        help="Number of threads quantizing the weights in parallel",
+    )
+    parser.add_argument(
+        "--out_of_core",
+        required=False,
+        action="store_true",
+        help="Quantize the weights one after another without loading the external data of the model, and save "
+        "the quantized model with its weights in an external data file",
+    )
 
     return parser.parse_args()
 
@@ -410,13 +605,16 @@ if __name__ == "__main__":
         logger.error(f"file {output_model_path} already exists")
         raise Exception(f"file {output_model_path} already exists")
 
-    model = onnx.load(input_model_path)
     quant = MatMul4BitsQuantizer(
-        model=model,
+        model=input_model_path,
         block_size=args.block_size,
         is_symmetric=args.symmetric,
         accuracy_level=args.accuracy_level,
         nodes_to_exclude=args.nodes_to_exclude,
+        num_workers=args.num_workers,
     )
-    quant.process()
-    quant.model.save_model_to_file(output_model_path, True)
+    if args.out_of_core:
+        quant.process_out_of_core(output_model_path)
+    else:
+        quant.process()
+        quant.model.save_model_to_file(output_model_path, True)
@@ -63,36 +63,140 @@ def _clean_initializers_helper(graph, model):
 
     requesting_tensor_names.difference_update(output for node in graph.node for output in node.output)
 
-    unused_initializer = []
-    for initializer in graph.initializer:
+    unused_initializer_indices = []
+    for index, initializer in enumerate(graph.initializer):
         if initializer.name in requesting_tensor_names:
             requesting_tensor_names.remove(initializer.name)
         else:
             # mark it to remove, remove here directly will cause mis-behavier
-            unused_initializer.append(initializer)
-
-    name_to_input = {input.name: input for input in graph.input}
-    for initializer in unused_initializer:
-        graph.initializer.remove(initializer)
-        if initializer.name in name_to_input:
-            try:
-                graph.input.remove(name_to_input[initializer.name])
-            except StopIteration:
-                if model.ir_version < 4:
-                    print(
-                        "Warning: invalid weight name {} found in the graph (not a graph input)".format(
-                            initializer.name
-                        )
-                    )
+            unused_initializer_indices.append(index)
+
+    # Remove by position, RepeatedCompositeContainer.remove compares whole tensors with every item.
+    name_to_input_index = {input.name: index for index, input in enumerate(graph.input)}
+    unused_input_indices = set()
+    for index in unused_initializer_indices:
+        input_index = name_to_input_index.get(graph.initializer[index].name)
+        if input_index is not None:
+            unused_input_indices.add(input_index)
+    for index in reversed(unused_initializer_indices):
+        del graph.initializer[index]
+    for index in sorted(unused_input_indices, reverse=True):
+        del graph.input[index]
 
     requesting_tensor_names.difference_update(input.name for input in graph.input)
 
     return graph, requesting_tensor_names
 
 
+def _index_by_name(items):
+    """Map the names of protobuf messages to the first message with each name"""
+    name_to_item = {}
+    for item in items:
+        name_to_item.setdefault(item.name, item)
+    return name_to_item
+
+
+def _find_item(items, item):
+    """Return the position of an item in a list or repeated protobuf field, comparing identities before values"""
+    for position, other in enumerate(items):
+        if other is item:
+            return position
+    for position, other in enumerate(items):
+        if other == item:
+            return position
+    return None
+
+
+def _remove_item(items, item):
+    """Remove the first occurrence of an item from a list or repeated protobuf field"""
+    position = _find_item(items, item)
+    if position is not None:
+        del items[position]
+
+
 class ONNXModel:
     def __init__(self, model: ModelProto):
         self.model = model
+        # Indexes of the initializers, graph inputs, graph outputs and nodes of the main graph by name. They are built
+        # on first use and kept up to date by the methods of this class. An index is built again when the number of
+        # items it indexes changes. Inputs and outputs of nodes shall be changed with set_node_input, set_node_output
+        # or replace_input_of_node, other changes made to the graph directly must be followed by reset_indexes().
+        self._name_to_initializer = None
+        self._name_to_graph_input = None
+        self._name_to_graph_output = None
+        self._output_name_to_node = None
+        self._input_name_to_nodes = None
+        self._name_to_node = None
+        self._num_indexed_initializers = 0
+        self._num_indexed_graph_inputs = 0
+        self._num_indexed_graph_outputs = 0
+        self._num_indexed_nodes = 0
+
+    def reset_indexes(self):
+        """Drop the indexes of the graph, after it is modified without the methods of this class"""
+        self._name_to_initializer = None
+        self._name_to_graph_input = None
+        self._name_to_graph_output = None
+        self._output_name_to_node = None
+        self._input_name_to_nodes = None
+        self._name_to_node = None
+
+    def _initializer_index(self):
+        initializers = self.model.graph.initializer
+        if self._name_to_initializer is None or self._num_indexed_initializers != len(initializers):
+            self._name_to_initializer = _index_by_name(initializers)
+            self._num_indexed_initializers = len(initializers)
+        return self._name_to_initializer
+
+    def _graph_input_index(self):
+        inputs = self.model.graph.input
+        if self._name_to_graph_input is None or self._num_indexed_graph_inputs != len(inputs):
+            self._name_to_graph_input = _index_by_name(inputs)
+            self._num_indexed_graph_inputs = len(inputs)
+        return self._name_to_graph_input
+
+    def _graph_output_index(self):
+        outputs = self.model.graph.output
+        if self._name_to_graph_output is None or self._num_indexed_graph_outputs != len(outputs):
+            self._name_to_graph_output = _index_by_name(outputs)
+            self._num_indexed_graph_outputs = len(outputs)
+        return self._name_to_graph_output
+
+    def _node_indexes(self):
+        if not self._node_indexes_are_current():
+            self._output_name_to_node = {}
+            self._input_name_to_nodes = {}
+            self._name_to_node = {}
+            for node in self.model.graph.node:
+                self._index_node(node)
+            self._num_indexed_nodes = len(self.model.graph.node)
+        return self._output_name_to_node, self._input_name_to_nodes
+
+    def _node_indexes_are_current(self):
+        return self._output_name_to_node is not None and self._num_indexed_nodes == len(self.model.graph.node)
+
+    def _index_node(self, node):
+        if node.name:
+            self._name_to_node.setdefault(node.name, node)
+        for input_name in node.input:
+            if input_name:  # Could be empty when it is optional
+                self._input_name_to_nodes.setdefault(input_name, []).append(node)
+        for output_name in node.output:
+            if output_name:  # Could be empty when it is optional
+                self._output_name_to_node[output_name] = node
+
+    def _unindex_node(self, node):
+        if node.name and self._name_to_node.get(node.name) is node:
+            del self._name_to_node[node.name]
+        for input_name in node.input:
+            consumers = self._input_name_to_nodes.get(input_name)
+            if consumers:
+                _remove_item(consumers, node)
+                if not consumers:
+                    del self._input_name_to_nodes[input_name]
+        for output_name in node.output:
+            if self._output_name_to_node.get(output_name) is node:
+                del self._output_name_to_node[output_name]
 
     def nodes(self):
         return self.model.graph.node
@@ -103,11 +207,8 @@ class ONNXModel:
     def initializer_extend(self, inits):
         if len(inits) == 0:
             raise ValueError("Can add an empty list.")
-        for init in self.initializer():
-            self._check_init(init, "gain")
         for init in inits:
-            self._check_init(init)
-            self.model.graph.initializer.append(init)
+            self._append_initializer(init)
 
     def graph(self):
         return self.model.graph
@@ -127,42 +228,78 @@ class ONNXModel:
         self.model.opset_import.extend([onnx_helper.make_opsetid(domain, version)])
 
     def remove_node(self, node):
-        if node in self.model.graph.node:
-            self.model.graph.node.remove(node)
+        nodes = self.model.graph.node
+        position = _find_item(nodes, node)
+        if position is None:
+            return
+        if self._node_indexes_are_current():
+            self._unindex_node(nodes[position])
+            self._num_indexed_nodes -= 1
+        del nodes[position]
 
     def remove_nodes(self, nodes_to_remove):
+        nodes = self.model.graph.node
+        ids_to_remove = {id(node) for node in nodes_to_remove}
+        positions = [position for position, node in enumerate(nodes) if id(node) in ids_to_remove]
+        removed_ids = {id(nodes[position]) for position in positions}
+        indexes_are_current = self._node_indexes_are_current()
+        for position in reversed(positions):
+            if indexes_are_current:
+                self._unindex_node(nodes[position])
+                self._num_indexed_nodes -= 1
+            del nodes[position]
+
+        # Nodes which are not the messages of the graph, such as copies, are found by value.
         for node in nodes_to_remove:
-            self.remove_node(node)
+            if id(node) not in removed_ids:
+                self.remove_node(node)
 
     def add_node(self, node):
-        self.model.graph.node.extend([self._check_node(node)])
+        nodes = self.model.graph.node
+        indexes_are_current = self._node_indexes_are_current()
+        nodes.extend([self._check_node(node)])
+        if indexes_are_current:
+            self._index_node(nodes[-1])
+            self._num_indexed_nodes += 1
 
     def add_nodes(self, nodes_to_add):
         for node in nodes_to_add:
             self.add_node(node)
 
     def add_initializer(self, tensor):
-        if find_by_name(tensor.name, self.model.graph.initializer) is None:
-            self._check_init(tensor)
-            self.model.graph.initializer.extend([tensor])
+        if tensor.name not in self._initializer_index():
+            self._append_initializer(tensor)
+
+    def _append_initializer(self, tensor):
+        name_to_initializer = self._initializer_index()
+        initializers = self.model.graph.initializer
+        initializers.extend([self._check_init(tensor)])
+        name_to_initializer.setdefault(tensor.name, initializers[-1])
+        self._num_indexed_initializers += 1
 
     def get_initializer(self, name):
-        for tensor in self.model.graph.initializer:
-            if tensor.name == name:
-                return tensor
-        return None
+        return self._initializer_index().get(name)
 
     def find_graph_input(self, input_name):
-        for input in self.model.graph.input:
-            if input.name == input_name:
-                return input
-        return None
+        return self._graph_input_index().get(input_name)
 
     def find_graph_output(self, output_name):
-        for output in self.model.graph.output:
-            if output.name == output_name:
-                return output
-        return None
+        return self._graph_output_index().get(output_name)
+
+    def get_producer(self, tensor_name):
+        """Return the node of the main graph producing a tensor, or None"""
+        output_name_to_node, _ = self._node_indexes()
+        return output_name_to_node.get(tensor_name)
+
+    def get_node_by_name(self, node_name):
+        """Return the node of the main graph with a given name, or None"""
+        self._node_indexes()
+        return self._name_to_node.get(node_name)
+
+    def get_consumers(self, tensor_name):
+        """Return the nodes of the main graph consuming a tensor, once per input the tensor is given to"""
+        _, input_name_to_nodes = self._node_indexes()
+        return list(input_name_to_nodes.get(tensor_name, []))
 
     def get_tensor_type(self, tensor_name: str):
         tensor_type_map = {obj.name: obj.type for obj in self.model.graph.value_info}
@@ -181,12 +318,11 @@ class ONNXModel:
         return None
 
     def get_constant_value(self, output_name):
-        for node in self.model.graph.node:
-            if node.op_type == "Constant":
-                if node.output[0] == output_name:
-                    for attr in node.attribute:
-                        if attr.name == "value":
-                            return onnx_numpy_helper.to_array(attr.t)
+        node = self.get_producer(output_name)
+        if node is not None and node.op_type == "Constant":
+            for attr in node.attribute:
+                if attr.name == "value":
+                    return onnx_numpy_helper.to_array(attr.t)
 
         # Fallback to initializer since constant folding may have been applied.
         initializer = self.get_initializer(output_name)
@@ -196,15 +332,22 @@ class ONNXModel:
         return None
 
     def get_initializer_name_set(self):
-        return {initializer.name for initializer in self.model.graph.initializer}
+        return set(self._initializer_index())
 
     def remove_initializer(self, tensor):
-        if tensor in self.model.graph.initializer:
-            self.model.graph.initializer.remove(tensor)
-            for input in self.model.graph.input:
-                if input.name == tensor.name:
-                    self.model.graph.input.remove(input)
-                    break
+        name_to_initializer = self._initializer_index()
+        initializer = name_to_initializer.get(tensor.name)
+        if initializer is None or (initializer is not tensor and initializer != tensor):
+            return
+        _remove_item(self.model.graph.initializer, initializer)
+        del name_to_initializer[tensor.name]
+        self._num_indexed_initializers -= 1
+
+        name_to_graph_input = self._graph_input_index()
+        graph_input = name_to_graph_input.pop(tensor.name, None)
+        if graph_input is not None:
+            _remove_item(self.model.graph.input, graph_input)
+            self._num_indexed_graph_inputs -= 1
 
     def remove_initializers(self, init_to_remove):
         for initializer in init_to_remove:
@@ -250,7 +393,7 @@ class ONNXModel:
 
     def get_parents(self, node, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node, _ = self._node_indexes()
 
         parents = []
         for input in node.input:
@@ -260,7 +403,7 @@ class ONNXModel:
 
     def get_parent(self, node, idx, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            output_name_to_node, _ = self._node_indexes()
 
         if len(node.input) <= idx:
             return None
@@ -278,9 +421,9 @@ class ONNXModel:
         Returns:
             The node found or None.
         """
-        graph_nodes_list = list(graph.node)  # deep copy
-        graph_nodes_list.extend(new_nodes_list)
-        node = find_by_name(node_name, graph_nodes_list)
+        node = find_by_name(node_name, graph.node)
+        if node is None:
+            node = find_by_name(node_name, new_nodes_list)
         return node
 
     def find_nodes_by_initializer(self, graph, initializer):
@@ -400,6 +543,7 @@ class ONNXModel:
     def replace_gemm_with_matmul(self):
         graph_path = [self.graph()]
         ONNXModel.__replace_gemm_with_matmul(graph_path)
+        self.reset_indexes()
 
     def save_model_to_file(self, output_path, use_external_data_format=False):
         """
@@ -424,9 +568,56 @@ class ONNXModel:
             if node.input[j] == old_input_name:
                 node.input[j] = new_input_name
 
+    def _is_indexed(self, node):
+        """Check that a node is in the indexes of the main graph, so that it can be indexed again after a change"""
+        for output_name in node.output:
+            if output_name:
+                return self._output_name_to_node.get(output_name) is node
+        return any(
+            consumer is node for input_name in node.input for consumer in self._input_name_to_nodes.get(input_name, [])
+        )
+
+    def _unindex_node_to_change(self, node):
+        """Remove a node from the indexes before its inputs or outputs are changed, and return whether it shall be
+        indexed again after the change"""
+        if self._node_indexes_are_current() and self._is_indexed(node):
+            self._unindex_node(node)
+            return True
+        return False
+
+    def replace_input_of_node(self, node, old_input_name, new_input_name):
+        """Replace an input of a node of the main graph, and update the indexes of the graph"""
+        indexed = self._unindex_node_to_change(node)
+        ONNXModel.replace_node_input(node, old_input_name, new_input_name)
+        if indexed:
+            self._index_node(node)
+
+    def set_node_input(self, node, index, input_name):
+        """Set an input of a node, which is appended when index is the number of inputs, and update the indexes of
+        the graph. Operators shall use it instead of changing node.input in place."""
+        indexed = self._unindex_node_to_change(node)
+        if index == len(node.input):
+            node.input.append(input_name)
+        else:
+            node.input[index] = input_name
+        if indexed:
+            self._index_node(node)
+
+    def set_node_output(self, node, index, output_name):
+        """Set an output of a node, and update the indexes of the graph. Operators shall use it instead of changing
+        node.output in place."""
+        indexed = self._unindex_node_to_change(node)
+        node.output[index] = output_name
+        if indexed:
+            self._index_node(node)
+
     def replace_input_of_all_nodes(self, old_input_name, new_input_name):
-        for node in self.model.graph.node:
+        _, input_name_to_nodes = self._node_indexes()
+        consumers = input_name_to_nodes.pop(old_input_name, [])
+        for node in consumers:
             ONNXModel.replace_node_input(node, old_input_name, new_input_name)
+        if consumers:
+            input_name_to_nodes.setdefault(new_input_name, []).extend(consumers)
 
     @staticmethod
     def replace_node_output(node, old_output_name, new_output_name):
@@ -436,8 +627,11 @@ class ONNXModel:
                 node.output[j] = new_output_name
 
     def replace_output_of_all_nodes(self, old_output_name, new_output_name):
-        for node in self.model.graph.node:
+        output_name_to_node, _ = self._node_indexes()
+        node = output_name_to_node.pop(old_output_name, None)
+        if node is not None:
             ONNXModel.replace_node_output(node, old_output_name, new_output_name)
+            output_name_to_node[new_output_name] = node
 
     def remove_unused_constant(self):
         input_name_to_nodes = self.input_name_to_nodes()
@@ -467,10 +661,10 @@ class ONNXModel:
         self.remove_initializers(ununsed_weights)
 
     def is_graph_output(self, output_name):
-        return any(output.name == output_name for output in self.model.graph.output)
+        return output_name in self._graph_output_index()
 
     def is_graph_input(self, tensor_name: str) -> bool:
-        return any(input.name == tensor_name for input in self.model.graph.input)
+        return tensor_name in self._graph_input_index()
 
     # TODO:use OnnxModel.graph_topological_sort(self.model.graph) from transformers.onnx_model
     # Currently it breaks Openvino/Linux training gpu pipeline so hold off for 1.8 release
@@ -525,9 +719,12 @@ class ONNXModel:
         assert end == len(self.graph().node), "Graph is not a DAG"
         self.graph().ClearField("node")
         self.graph().node.extend(sorted_nodes)
+        self.reset_indexes()
 
     def clean_initializers(self):
-        return _clean_initializers_helper(self.graph(), self.model)
+        result = _clean_initializers_helper(self.graph(), self.model)
+        self.reset_indexes()
+        return result
 
     def _check_init(self, init, test=None):
         if init.data_type == onnx.TensorProto.FLOAT8E4M3FN:
@@ -4,6 +4,7 @@
 # license information.
 # --------------------------------------------------------------------------
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict
 
 import numpy as np
@@ -20,6 +21,7 @@ except ImportError:
 from .calibrate import TensorData
 from .onnx_model import ONNXModel
 from .quant_utils import (
+    ONNX_INT_TYPE_RANGE,
     ONNX_TYPE_TO_NP_TYPE,
     TENSOR_NAME_QUANT_SUFFIX,
     QuantizationMode,
@@ -32,7 +34,7 @@ from .quant_utils import (
     attribute_to_kwarg,
     compute_scale_zp,
     compute_scale_zp_float8,
-    find_by_name,
+    compute_scale_zp_per_channel,
     get_qmin_qmax_for_qType,
     get_qrange_for_qType,
     model_has_infer_metadata,
@@ -122,6 +124,7 @@ class ONNXQuantizer:
             False if "ActivationSymmetric" not in self.extra_options else self.extra_options["ActivationSymmetric"]
         )
         self.min_real_range = self.extra_options.get("MinimumRealRange")
+        self.weight_quantization_num_workers = self.extra_options.get("WeightQuantizationNumWorkers")
 
         self.activation_qType = getattr(activation_qType, "tensor_type", activation_qType)
         self.weight_qType = getattr(weight_qType, "tensor_type", weight_qType)
@@ -145,6 +148,9 @@ class ONNXQuantizer:
         self.nodes_to_exclude = nodes_to_exclude  # specific nodes to exclude
         self.op_types_to_quantize = op_types_to_quantize
         self.new_nodes = []
+        # new_nodes is only appended to, nodes added since the last lookup are indexed by find_new_node_by_name
+        self._new_node_name_to_node = {}
+        self._num_indexed_new_nodes = 0
         self.parent = None
         self.graph_scope = "/"  # for human readable debug information
         self.tensor_names = {}  # in case the shape inference not totally working
@@ -177,6 +183,8 @@ class ONNXQuantizer:
         self.generated_value_names = self.model.get_non_initializer_inputs()
         # to store specified scale and zeropoint instead of calculated value, tensor_name->(scale, zeropoint)
         self.used_scale_zp_map = {}
+        # Initializers of the weights quantized by prequantize_weights, keyed by the arguments of the quantization
+        self.prequantized_weights = {}
 
     def _get_and_check_tensor_quant_overrides(self):
         """
@@ -374,12 +382,29 @@ class ONNXQuantizer:
         )
 
     def find_initializer_in_path(self, initializer_name):
-        if find_by_name(initializer_name, self.model.initializer()) is not None:
+        if self.model.get_initializer(initializer_name) is not None:
             return True
         if self.parent is not None:
             return self.parent.find_initializer_in_path(initializer_name)
         return False
 
+    def find_new_node_by_name(self, node_name):
+        """Find a node added to new_nodes by name, or None"""
+        if self._num_indexed_new_nodes > len(self.new_nodes):
+            self._new_node_name_to_node = {}
+            self._num_indexed_new_nodes = 0
+        for node in self.new_nodes[self._num_indexed_new_nodes :]:
+            self._new_node_name_to_node.setdefault(node.name, node)
+        self._num_indexed_new_nodes = len(self.new_nodes)
+        return self._new_node_name_to_node.get(node_name)
+
+    def find_node_by_name(self, node_name):
+        """Find a node of the graph or added to new_nodes by name, or None"""
+        node = self.model.get_node_by_name(node_name)
+        if node is None:
+            node = self.find_new_node_by_name(node_name)
+        return node
+
     def add_new_nodes(self, nodes):
         self.new_nodes.extend(nodes)
         for node in nodes:
@@ -393,6 +418,12 @@ class ONNXQuantizer:
                 "Note you don't need to quantize a QAT model. OnnxRuntime support to run QAT model directly."
             )
 
+        # CreateOpQuantizer filters the nodes as in the loop below: nodes_to_quantize, nodes_to_exclude,
+        # op_types_to_quantize and the checks of the operators, for example MatMulConstBOnly.
+        self.prequantize_weights(
+            weight for node in self.model.nodes() for weight in CreateOpQuantizer(self, node).weights_to_prequantize()
+        )
+
         for node in self.model.nodes():
             # quantize subgraphes if have
             if self.enable_subgraph_quantization:
@@ -404,6 +435,7 @@ class ONNXQuantizer:
             for i in range(number_of_existing_new_nodes, len(self.new_nodes)):
                 for output_name in self.new_nodes[i].output:
                     self.generated_value_names.add(output_name)
+        self.prequantized_weights.clear()
 
         self._dequantize_outputs()
 
@@ -411,6 +443,7 @@ class ONNXQuantizer:
         # https://developers.google.com/protocol-buffers/docs/reference/python-generated?csw=1#fields
         self.model.graph().ClearField("node")
         self.model.graph().node.extend(self.new_nodes)
+        self.model.reset_indexes()
 
         # Remove ununsed initializers from graph, starting from the top level graph.
         if self.parent is None:
@@ -432,14 +465,14 @@ class ONNXQuantizer:
         return self.model.model
 
     def is_input_a_initializer(self, input_name):
-        initializer = find_by_name(input_name, self.model.initializer())
+        initializer = self.model.get_initializer(input_name)
         return initializer is not None
 
     def is_per_channel(self):
         return self.per_channel
 
     def is_valid_quantize_weight(self, weight_name):
-        weight = find_by_name(weight_name, self.model.initializer())
+        weight = self.model.get_initializer(weight_name)
         if weight is not None:
             return weight.data_type in (onnx_proto.TensorProto.FLOAT, onnx_proto.TensorProto.FLOAT16)
         if (not self.enable_subgraph_quantization) or (self.parent is None):
@@ -464,7 +497,7 @@ class ONNXQuantizer:
         )
 
     def get_tensor_type(self, tensor_name, mandatory=False):
-        weight = find_by_name(tensor_name, self.model.initializer())
+        weight = self.model.get_initializer(tensor_name)
         if weight is not None:
             return weight.data_type
         if tensor_name in self.value_infos:
@@ -877,11 +910,11 @@ class ONNXQuantizer:
 
         # get scale for weight
         weight_scale_name = self.quantized_value_map[weight_name].scale_name
-        weight_initializer = find_by_name(weight_scale_name, self.model.initializer())
+        weight_initializer = self.model.get_initializer(weight_scale_name)
         weight_scale = tensor_proto_to_array(weight_initializer)
 
         # get bias
-        bias_initializer = find_by_name(bias_name, self.model.initializer())
+        bias_initializer = self.model.get_initializer(bias_name)
         bias_data = tensor_proto_to_array(bias_initializer)
         quantized_bias_name = bias_name + TENSOR_NAME_QUANT_SUFFIX
 
@@ -893,7 +926,7 @@ class ONNXQuantizer:
         else:
             raise ValueError(f"Expected {input_name} to be in quantized value map for static quantization")
 
-        inputscale_initializer = find_by_name(input_scale_name, self.model.initializer())
+        inputscale_initializer = self.model.get_initializer(input_scale_name)
         input_scale = tensor_proto_to_array(inputscale_initializer)
 
         # quantize bias
@@ -1049,7 +1082,7 @@ class ONNXQuantizer:
                 zero_point_names.append("")
                 continue
             # Quantize the input
-            initializer = find_by_name(node_input, self.model.initializer())
+            initializer = self.model.get_initializer(node_input)
             if initializer is not None:
                 if self.per_channel and op_level_per_channel:
                     (
@@ -1074,9 +1107,7 @@ class ONNXQuantizer:
                 scale_names.append(scale_name)
             elif self.contains_tensor(node_input):
                 # Add QuantizeLinear node.
-                qlinear_node = self.model.find_node_by_name(
-                    node_input + "_QuantizeLinear", self.new_nodes, self.model.graph()
-                )
+                qlinear_node = self.find_node_by_name(node_input + "_QuantizeLinear")
                 if qlinear_node is None:
                     quantize_input_nodes = self._get_quantize_input_nodes(node, input_index, self.activation_qType)
                     if quantize_input_nodes is None:
@@ -1119,6 +1150,41 @@ class ONNXQuantizer:
 
         return quantized_input_names, zero_point_names, scale_names, nodes
 
+    def prequantize_weights(self, weights_to_quantize):
+        """
+        Quantizes weights before the graph is rewritten, in parallel by a pool of `WeightQuantizationNumWorkers`
+        threads. quantize_initializer and quantize_weight_per_channel take the initializers computed here when they
+        are called with the same arguments, so the quantized model is the same as without workers.
+            parameter weights_to_quantize: tuples (weight name, quantization type, channel axis or None,
+                reduce_range, keep_float_weight) describing how the weights are quantized later.
+        """
+        if not self.weight_quantization_num_workers or self.weight_quantization_num_workers <= 1:
+            return
+
+        initializers = {initializer.name: initializer for initializer in self.model.initializer()}
+        weights = {}
+        for weight in weights_to_quantize:
+            weight_name = weight[0]
+            if weight_name in self.quantized_value_map or weight in self.prequantized_weights:
+                continue
+            initializer = initializers.get(weight_name)
+            if initializer is not None and initializer.data_type in (
+                onnx_proto.TensorProto.FLOAT,
+                onnx_proto.TensorProto.FLOAT16,
+            ):
+                weights[weight] = initializer
+        if not weights:
+            return
+
+        def quantize(weight):
+            _, qType, axis, reduce_range, keep_float_weight = weight  # noqa: N806
+            if axis is None:
+                return self._quantize_initializer_data(weights[weight], qType, reduce_range, keep_float_weight)
+            return self._quantize_weight_per_channel_data(weights[weight], qType, axis, reduce_range, keep_float_weight)
+
+        with ThreadPoolExecutor(max_workers=self.weight_quantization_num_workers) as executor:
+            self.prequantized_weights.update(zip(weights, executor.map(quantize, weights)))
+
     def quantize_initializer(self, weight, qType, reduce_range=False, keep_float_weight=False):
         """
         :param weight: TensorProto initializer
@@ -1140,6 +1206,34 @@ class ONNXQuantizer:
         zp_name = weight.name + "_zero_point"
         scale_name = weight.name + "_scale"
 
+        quantized_initializers = self.prequantized_weights.pop(
+            (weight.name, qType, None, reduce_range, keep_float_weight), None
+        )
+        if quantized_initializers is None:
+            quantized_initializers = self._quantize_initializer_data(weight, qType, reduce_range, keep_float_weight)
+        self.model.initializer_extend(quantized_initializers)
+
+        # Log entry for this quantized weight
+        quantized_value = QuantizedValue(
+            weight.name,
+            q_weight_name,
+            scale_name,
+            zp_name,
+            QuantizedValueType.Initializer,
+            None,
+        )
+        self.quantized_value_map[weight.name] = quantized_value
+        return q_weight_name, zp_name, scale_name
+
+    def _quantize_initializer_data(self, weight, qType, reduce_range, keep_float_weight):
+        """
+        Quantizes an initializer without changing the model, see quantize_initializer.
+        :return: scale, zero point and, unless keep_float_weight is True, quantized weight initializers
+        """
+        q_weight_name = weight.name + TENSOR_NAME_QUANT_SUFFIX
+        zp_name = weight.name + "_zero_point"
+        scale_name = weight.name + "_scale"
+
         # Quantize weight data. Use quantization overrides if provided by the user.
         weight_data = tensor_proto_to_array(weight)
         quant_overrides = self.get_per_tensor_quant_overrides(weight.name)
@@ -1176,7 +1270,7 @@ class ONNXQuantizer:
         scale_dtype = weight.data_type
         scale_initializer = onnx.helper.make_tensor(scale_name, scale_dtype, [], scale.reshape((-1,)).tolist())
         zero_initializer = onnx.helper.make_tensor(zp_name, qType, [], zero_point.reshape((-1,)).tolist())
-        self.model.initializer_extend([scale_initializer, zero_initializer])
+        quantized_initializers = [scale_initializer, zero_initializer]
 
         if not keep_float_weight:
             if self.weight_qType == onnx_proto.TensorProto.FLOAT8E4M3FN:
@@ -1201,19 +1295,8 @@ class ONNXQuantizer:
                     weight.dims
                 )
                 q_weight_initializer = onnx.numpy_helper.from_array(q_weight_data, q_weight_name)
-            self.model.initializer_extend([q_weight_initializer])
-
-        # Log entry for this quantized weight
-        quantized_value = QuantizedValue(
-            weight.name,
-            q_weight_name,
-            scale_name,
-            zp_name,
-            QuantizedValueType.Initializer,
-            None,
-        )
-        self.quantized_value_map[weight.name] = quantized_value
-        return q_weight_name, zp_name, scale_name
+            quantized_initializers.append(q_weight_initializer)
+        return quantized_initializers
 
     def quantize_weight_per_channel(
         self,
@@ -1232,10 +1315,45 @@ class ONNXQuantizer:
                 quantized_value.scale_name,
             )
 
-        initializer = find_by_name(weight_name, self.model.initializer())
+        initializer = self.model.get_initializer(weight_name)
         if initializer is None:
             raise ValueError("{} is not an initializer", weight_name)
 
+        q_weight_name = weight_name + TENSOR_NAME_QUANT_SUFFIX
+        zp_name = weight_name + "_zero_point"
+        scale_name = weight_name + "_scale"
+
+        quantized_initializers = self.prequantized_weights.pop(
+            (weight_name, weight_qType, channel_axis, reduce_range, keep_float_weight), None
+        )
+        if quantized_initializers is None:
+            quantized_initializers = self._quantize_weight_per_channel_data(
+                initializer, weight_qType, channel_axis, reduce_range, keep_float_weight
+            )
+
+        quantized_value = QuantizedValue(
+            weight_name,
+            q_weight_name,
+            scale_name,
+            zp_name,
+            QuantizedValueType.Initializer,
+            None,
+        )
+        self.quantized_value_map[weight_name] = quantized_value
+
+        # Update packed weight, zero point, and scale initializers
+        self.model.initializer_extend(quantized_initializers)
+
+        return q_weight_name, zp_name, scale_name
+
+    def _quantize_weight_per_channel_data(
+        self, initializer, weight_qType, channel_axis, reduce_range, keep_float_weight
+    ):
+        """
+        Quantizes an initializer per channel without changing the model, see quantize_weight_per_channel.
+        :return: scale, zero point and, unless keep_float_weight is True, quantized weight initializers
+        """
+        weight_name = initializer.name
         weights = tensor_proto_to_array(initializer)
         channel_count = weights.shape[channel_axis]
         quant_overrides_for_channels = self.get_per_channel_quant_overrides(weight_name, channel_count)
@@ -1245,6 +1363,111 @@ class ONNXQuantizer:
         if "quant_type" in quant_overrides_for_channels[0]:
             weight_qType = quant_overrides_for_channels[0]["quant_type"].tensor_type  # noqa: N806
 
+        if weight_qType in ONNX_INT_TYPE_RANGE:
+            zero_point, scale, quantized_weights = self._quantize_int_weight_per_channel(
+                weights, weight_qType, channel_axis, quant_overrides_for_channels, reduce_range
+            )
+        else:
+            zero_point, scale, quantized_weights = self._quantize_float8_weight_per_channel(
+                weights, weight_qType, channel_axis, quant_overrides_for_channels, reduce_range
+            )
+
+        q_weight_name = weight_name + TENSOR_NAME_QUANT_SUFFIX
+        zp_name = weight_name + "_zero_point"
+        scale_name = weight_name + "_scale"
+
+        scale_initializer = onnx.numpy_helper.from_array(
+            scale.astype(onnx.helper.tensor_dtype_to_np_dtype(initializer.data_type)), scale_name
+        )
+        if weight_qType in ONNX_INT_TYPE_RANGE:
+            zero_initializer = onnx.numpy_helper.from_array(zero_point, zp_name)
+        else:
+            # numpy_helper.from_array does not support float 8 types.
+            zero_initializer = onnx.helper.make_tensor(zp_name, weight_qType, zero_point.shape, zero_point.tolist())
+
+        quantized_initializers = [scale_initializer, zero_initializer]
+
+        if not keep_float_weight:
+            quantized_weights = np.asarray(
+                quantized_weights,
+                dtype=onnx.mapping.TENSOR_TYPE_TO_NP_TYPE[weight_qType],
+            ).reshape(initializer.dims)
+            q_weight_initializer = onnx.numpy_helper.from_array(quantized_weights, q_weight_name)
+            quantized_initializers.append(q_weight_initializer)
+
+        return quantized_initializers
+
+    def _quantize_int_weight_per_channel(
+        self, weights, weight_qType, channel_axis, quant_overrides_for_channels, reduce_range
+    ):
+        """
+        Quantizes all channels of weights to an integer type at once, instead of one channel after another.
+        :return: zero points and scales with one value per channel, and quantized weights
+        """
+        channel_count = weights.shape[channel_axis]
+        channel_data = np.moveaxis(weights, channel_axis, 0).reshape((channel_count, -1))
+        if channel_data.shape[1] > 0:
+            rmin = channel_data.min(axis=1)
+            rmax = channel_data.max(axis=1)
+        else:
+            rmin = np.zeros(channel_count, dtype=weights.dtype)
+            rmax = np.zeros(channel_count, dtype=weights.dtype)
+
+        symmetric = np.full(channel_count, self.is_weight_symmetric or weight_qType == onnx_proto.TensorProto.INT8)
+        reduce_range = np.full(channel_count, self.reduce_range and reduce_range)
+        # Channels with overrides of both scale and zero point
+        override_scale_zp = {}
+        for i, channel_quant_overrides in enumerate(quant_overrides_for_channels):
+            if not channel_quant_overrides:
+                continue
+            if "scale" in channel_quant_overrides and "zero_point" in channel_quant_overrides:
+                override_scale_zp[i] = (channel_quant_overrides["scale"], channel_quant_overrides["zero_point"])
+                continue
+            symmetric[i] = channel_quant_overrides.get("symmetric", symmetric[i])
+            reduce_range[i] = channel_quant_overrides.get("reduce_range", reduce_range[i])
+            if channel_quant_overrides.get("rmin") is not None:
+                rmin[i] = channel_quant_overrides["rmin"]
+            if channel_quant_overrides.get("rmax") is not None:
+                rmax[i] = channel_quant_overrides["rmax"]
+
+        # The range of quantized values depends on the symmetric and reduce_range options of each channel.
+        qtype = ONNX_TYPE_TO_NP_TYPE[weight_qType]
+        qmin = np.zeros(channel_count, dtype=qtype)
+        qmax = np.zeros(channel_count, dtype=qtype)
+        for channel_symmetric in (False, True):
+            for channel_reduce_range in (False, True):
+                mask = (symmetric == channel_symmetric) & (reduce_range == channel_reduce_range)
+                if mask.any():
+                    qmin[mask], qmax[mask] = get_qmin_qmax_for_qType(
+                        weight_qType, reduce_range=channel_reduce_range, symmetric=channel_symmetric
+                    )
+
+        zero_point, scale = compute_scale_zp_per_channel(rmin, rmax, qmin, qmax, symmetric, self.min_real_range)
+        if override_scale_zp:
+            # Overridden scales are not rounded to the type of weights before quantization.
+            scale = scale.astype(np.float64)
+            for i, (channel_scale, channel_zero_point) in override_scale_zp.items():
+                scale[i] = channel_scale
+                zero_point[i] = channel_zero_point
+
+        broadcast_shape = [1] * weights.ndim
+        broadcast_shape[channel_axis] = channel_count
+        quantized_weights = quantize_nparray(
+            weight_qType,
+            weights,
+            scale.astype(np.float32).reshape(broadcast_shape),
+            zero_point.reshape(broadcast_shape),
+        )
+        return zero_point, scale, quantized_weights
+
+    def _quantize_float8_weight_per_channel(
+        self, weights, weight_qType, channel_axis, quant_overrides_for_channels, reduce_range
+    ):
+        """
+        Quantizes weights to a float 8 type one channel after another.
+        :return: zero points and scales with one value per channel, and quantized weights
+        """
+        channel_count = weights.shape[channel_axis]
         zero_point_list = []
         scale_list = []
         quantized_per_channel_data_list = []
@@ -1299,47 +1522,11 @@ class ONNXQuantizer:
             quantized_per_channel_data_list.append(quantized_per_channel_data)
 
         # combine per_channel_data into one
-        reshape_dims = list(weights.shape)  # deep copy
-        reshape_dims[channel_axis] = 1  # only one per channel for reshape
-        quantized_weights = np.asarray(quantized_per_channel_data_list[0]).reshape(reshape_dims)
-        for i in range(1, len(quantized_per_channel_data_list)):
-            channel_weights = np.asarray(quantized_per_channel_data_list[i]).reshape(reshape_dims)
-            quantized_weights = np.concatenate((quantized_weights, channel_weights), channel_axis)
-
-        q_weight_name = weight_name + TENSOR_NAME_QUANT_SUFFIX
-        zp_name = weight_name + "_zero_point"
-        scale_name = weight_name + "_scale"
-
-        quantized_value = QuantizedValue(
-            weight_name,
-            q_weight_name,
-            scale_name,
-            zp_name,
-            QuantizedValueType.Initializer,
-            None,
-        )
-        self.quantized_value_map[weight_name] = quantized_value
-
-        # Update packed weight, zero point, and scale initializers
-        zero_scale_shape = [initializer.dims[channel_axis]]
-        scale_initializer = onnx.helper.make_tensor(
-            scale_name, initializer.data_type, zero_scale_shape, np.hstack(scale_list).tolist()
-        )
-        zero_initializer = onnx.helper.make_tensor(
-            zp_name, weight_qType, zero_scale_shape, np.hstack(zero_point_list).tolist()
+        channel_shape = np.delete(weights.shape, channel_axis)
+        quantized_weights = np.stack(
+            [np.asarray(data).reshape(channel_shape) for data in quantized_per_channel_data_list], axis=channel_axis
         )
-
-        self.model.initializer_extend([scale_initializer, zero_initializer])
-
-        if not keep_float_weight:
-            quantized_weights = np.asarray(
-                quantized_weights,
-                dtype=onnx.mapping.TENSOR_TYPE_TO_NP_TYPE[weight_qType],
-            ).reshape(initializer.dims)
-            q_weight_initializer = onnx.numpy_helper.from_array(quantized_weights, q_weight_name)
-            self.model.initializer_extend([q_weight_initializer])
-
-        return q_weight_name, zp_name, scale_name
+        return np.hstack(zero_point_list), np.hstack(scale_list), quantized_weights
 
     def _dequantize_value(self, value_name):
         """
@@ -1354,7 +1541,7 @@ class ONNXQuantizer:
             quantized_value = self.quantized_value_map[value_name]
             # Add DequantizeLinear Node for this input
 
-            scale_init = find_by_name(quantized_value.scale_name, self.model.initializer())
+            scale_init = self.model.get_initializer(quantized_value.scale_name)
 
             # In case we are working with subgraphs, the graph `producer_name` is set to `"onnx-quantizer"` in the `quantize_subgraph` method. In this case, the scale initializer may be on the top level graph, so the check below can not be done.
             if self.model.model.producer_name != "onnx-quantizer" or (
@@ -1364,7 +1551,7 @@ class ONNXQuantizer:
                 assert onnx.numpy_helper.to_array(scale_init).size == 1
 
             dqlinear_name = value_name + "_DequantizeLinear"
-            dqlinear_node = self.model.find_node_by_name(dqlinear_name, self.new_nodes, self.model.graph())
+            dqlinear_node = self.find_node_by_name(dqlinear_name)
             if dqlinear_node is None:
                 dqlinear_inputs = [
                     quantized_value.q_name,
@@ -1404,7 +1591,7 @@ class ONNXQuantizer:
                 continue
             if not self.should_quantize_node(node):
                 continue
-            if len(self.model.input_name_to_nodes()[node.input[0]]) != 1:
+            if len(self.model.get_consumers(node.input[0])) != 1:
                 continue
             if node.input[0] not in self.tensors_range or node.output[0] not in self.tensors_range:
                 continue
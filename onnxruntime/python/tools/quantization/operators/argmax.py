@@ -14,5 +14,5 @@ class QArgMax(QuantOperatorBase):
             self.quantizer.new_nodes += [node]
             return
 
-        node.input[0] = quantized_input_value.q_name
+        self.quantizer.model.set_node_input(node, 0, quantized_input_value.q_name)
         self.quantizer.new_nodes += [node]
@@ -16,6 +16,12 @@ class AttentionQuant(QuantOperatorBase):
     def should_quantize(self):
         return self.quantizer.should_quantize_node(self.node)
 
+    def weights_to_prequantize(self):
+        if any(attr.name == "qkv_hidden_sizes" for attr in self.node.attribute):
+            return []
+        axis = -1 if self.quantizer.is_per_channel() else None
+        return [(self.node.input[1], self.quantizer.weight_qType, axis, True, False)]
+
     def quantize(self):
         """
         parameter node: Attention node.
@@ -9,6 +9,14 @@ class QuantOperatorBase:
 
         return self.quantizer.is_float_tensor(self.node.input[0])
 
+    def weights_to_prequantize(self):
+        """
+        Lists the weights quantize() quantizes, so that they can be quantized in parallel before the graph is
+        rewritten, see ONNXQuantizer.prequantize_weights.
+            return: List of (weight name, quantization type, channel axis or None, reduce_range, keep_float_weight)
+        """
+        return []
+
     def quantize(self):
         """
         Given a node which does not support quantization, this method checks whether the input to
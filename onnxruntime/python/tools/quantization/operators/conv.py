@@ -7,7 +7,6 @@ from ..quant_utils import (
     QuantizedValue,
     QuantizedValueType,
     attribute_to_kwarg,
-    find_by_name,
     get_mul_node,
 )
 from .base_operator import QuantOperatorBase
@@ -18,6 +17,9 @@ class ConvInteger(QuantOperatorBase):
     def __init__(self, onnx_quantizer, onnx_node):
         super().__init__(onnx_quantizer, onnx_node)
 
+    def weights_to_prequantize(self):
+        return [(self.node.input[1], self.quantizer.weight_qType, None, self.quantizer.reduce_range, False)]
+
     def add_bias(self, nodes, scaled_output):
         """
         Given a node, this function handles bias add by adding a "reshape" node on bias and an "add" node
@@ -31,7 +33,7 @@ class ConvInteger(QuantOperatorBase):
         node = self.node
         model = self.quantizer.model
         # Add tensors for the shape to be reshaped to
-        weight = find_by_name(node.input[1], model.initializer())
+        weight = model.get_initializer(node.input[1])
         if weight is None:
             raise ValueError(f"Expected {node.input[1]} to be an initializer")
 
@@ -107,7 +109,7 @@ class ConvInteger(QuantOperatorBase):
         else:
             scales_mul_op = scale_names[0] + "_" + scale_names[1] + "_mul"
 
-        scales_mul_node = find_by_name(scales_mul_op, self.quantizer.new_nodes)
+        scales_mul_node = self.quantizer.find_new_node_by_name(scales_mul_op)
         if scales_mul_node is None:
             scales_mul_node = get_mul_node(scale_names, scales_mul_op + ":0", scales_mul_op)
             nodes.append(scales_mul_node)
@@ -138,6 +140,11 @@ class QLinearConv(QuantOperatorBase):
     def __init__(self, onnx_quantizer, onnx_node):
         super().__init__(onnx_quantizer, onnx_node)
 
+    def weights_to_prequantize(self):
+        if self.quantizer.is_input_a_initializer(self.node.input[1]) and self.quantizer.is_per_channel():
+            return [(self.node.input[1], onnx_proto.TensorProto.INT8, 0, True, False)]
+        return [(self.node.input[1], self.quantizer.weight_qType, None, self.quantizer.reduce_range, False)]
+
     def quantize(self):
         node = self.node
         assert node.op_type == "Conv"
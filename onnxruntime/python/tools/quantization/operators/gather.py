@@ -42,8 +42,8 @@ class GatherQuant(QuantOperatorBase):
         )
         self.quantizer.quantized_value_map[node.output[0]] = q_output
 
-        node.output[0] = gather_new_output
-        node.input[0] = quantized_input_names[0]
+        self.quantizer.model.set_node_output(node, 0, gather_new_output)
+        self.quantizer.model.set_node_input(node, 0, quantized_input_names[0])
         nodes.append(node)
 
         self.quantizer.new_nodes += nodes
@@ -39,6 +39,12 @@ class QLinearGemm(QOpMatMul):
     def __init__(self, onnx_quantizer, onnx_node):
         super().__init__(onnx_quantizer, onnx_node)
 
+    def weights_to_prequantize(self):
+        if self.quantizer.is_input_a_initializer(self.node.input[1]) and self.quantizer.is_per_channel():
+            axis = 0 if is_B_transposed(self.node) else 1
+            return [(self.node.input[1], self.quantizer.weight_qType, axis, True, False)]
+        return [(self.node.input[1], self.quantizer.weight_qType, None, self.quantizer.reduce_range, False)]
+
     def quantize(self):
         node = self.node
         assert node.op_type == "Gemm"
@@ -4,7 +4,7 @@ import logging
 import onnx
 from onnx import onnx_pb as onnx_proto
 
-from ..quant_utils import TENSOR_NAME_QUANT_SUFFIX, QuantizedValue, QuantizedValueType, find_by_name, get_mul_node
+from ..quant_utils import TENSOR_NAME_QUANT_SUFFIX, QuantizedValue, QuantizedValueType, get_mul_node
 from .base_operator import QuantOperatorBase
 from .qdq_base_operator import QDQOperatorBase
 
@@ -31,6 +31,10 @@ class QOpMatMul(QuantOperatorBase):
                 return False
         return True
 
+    def weights_to_prequantize(self):
+        axis = -1 if self.quantizer.is_per_channel() else None
+        return [(self.node.input[1], self.quantizer.weight_qType, axis, True, False)]
+
 
 """
     Used when quantize mode is QuantizationMode.IntegerOps.
@@ -93,7 +97,7 @@ class MatMulInteger(QOpMatMul):
             else scale_names[0] + "_" + scale_names[1] + "_mul"
         )
 
-        scales_mul_node = find_by_name(scales_mul_op, self.quantizer.new_nodes)
+        scales_mul_node = self.quantizer.find_new_node_by_name(scales_mul_op)
         if scales_mul_node is None:
             scales_mul_node = get_mul_node(scale_names, scales_mul_op + ":0", scales_mul_op)
             nodes.append(scales_mul_node)
@@ -220,7 +224,7 @@ class QDQMatMul(QDQOperatorBase):
 
         for tensor_name in nodes_to_iterate:
             # only support per-channel quantization on weight
-            if self.quantizer.is_per_channel() and find_by_name(tensor_name, self.quantizer.model.initializer()):
+            if self.quantizer.is_per_channel() and self.quantizer.model.get_initializer(tensor_name):
                 channel_axis = self.quantizer.qdq_op_type_per_channel_support_to_axis.get(node.op_type, 1)
                 self.quantizer.quantize_weight_tensor_per_channel(tensor_name, channel_axis)
             else:
@@ -59,7 +59,7 @@ class QPad(QuantOperatorBase):
                     # Suppose this padding constant initializer only used by the node
                     self.quantizer.model.remove_initializer(padding_constant_initializer)
                     self.quantizer.model.add_initializer(quantized_padding_constant_initializer)
-                    node.input[2] = quantized_padding_constant_name
+                    self.quantizer.model.set_node_input(node, 2, quantized_padding_constant_name)
                 else:
                     # TODO: check quantize_inputs after sub graph is supported
                     pad_value_qnodes = self.quantizer._get_quantize_input_nodes(
@@ -70,7 +70,7 @@ class QPad(QuantOperatorBase):
                         quantized_input_value.zp_name,
                     )
                     self.quantizer.new_nodes.extend(pad_value_qnodes)
-                    node.input[2] = pad_value_qnodes[0].output[0]
+                    self.quantizer.model.set_node_input(node, 2, pad_value_qnodes[0].output[0])
             else:
                 # In quantized format, the `zero` before quantization is mapped
                 # to quantized_input_value.zp_name. Thus, padding 0 to
@@ -78,11 +78,11 @@ class QPad(QuantOperatorBase):
                 # tensor.
                 if len(node.input) == 2:
                     # Feed quantization's zero point to padding node.
-                    node.input.append(quantized_input_value.zp_name)
+                    self.quantizer.model.set_node_input(node, 2, quantized_input_value.zp_name)
                 else:
                     # Assign quantization's zero point to padding node.
                     assert node.input[2] == ""
-                    node.input[2] = quantized_input_value.zp_name
+                    self.quantizer.model.set_node_input(node, 2, quantized_input_value.zp_name)
 
         # Create an entry for output quantized value
         quantized_output_value = QuantizedValue(
@@ -94,6 +94,6 @@ class QPad(QuantOperatorBase):
         )
         self.quantizer.quantized_value_map[node.output[0]] = quantized_output_value
 
-        node.input[0] = quantized_input_value.q_name
-        node.output[0] = quantized_output_value.q_name
+        self.quantizer.model.set_node_input(node, 0, quantized_input_value.q_name)
+        self.quantizer.model.set_node_output(node, 0, quantized_output_value.q_name)
         self.quantizer.new_nodes += [node]
@@ -24,7 +24,6 @@ from .quant_utils import (
     add_quant_input_suffix,
     add_quant_output_suffix,
     add_quant_suffix,
-    find_by_name,
     ms_domain,
 )
 from .registry import CreateQDQQuantizer
@@ -140,7 +139,7 @@ class QDQQuantizer(ONNXQuantizer):
         """
         Check if tensor can be quantized
         """
-        weight = find_by_name(tensor_name, self.model.initializer())
+        weight = self.model.get_initializer(tensor_name)
         if weight is not None:
             return weight.data_type
         elif tensor_name in self.value_infos:
@@ -153,7 +152,7 @@ class QDQQuantizer(ONNXQuantizer):
         """
         Check if tensor can be quantized
         """
-        weight = find_by_name(tensor_name, self.model.initializer())
+        weight = self.model.get_initializer(tensor_name)
         if weight is not None:
             if weight.data_type in (onnx_proto.TensorProto.FLOAT, onnx_proto.TensorProto.FLOAT16):
                 return True
@@ -214,7 +213,7 @@ class QDQQuantizer(ONNXQuantizer):
         return self.__quantize_tensor(tensor_name, quant_sharing_param, QDQQuantTensorType.WEIGHT)
 
     def quantize_weight_tensor_per_channel(self, tensor_name, axis):
-        weight = find_by_name(tensor_name, self.model.initializer())
+        weight = self.model.get_initializer(tensor_name)
         if weight:
             if weight.data_type in (onnx_proto.TensorProto.FLOAT, onnx_proto.TensorProto.FLOAT16):
                 self.tensors_to_quantize[tensor_name] = QDQTensorQuantInfo(
@@ -235,7 +234,7 @@ class QDQQuantizer(ONNXQuantizer):
                 self.quantize_weight_tensor(bias_name)
             return
 
-        weight = find_by_name(bias_name, self.model.initializer())
+        weight = self.model.get_initializer(bias_name)
         if weight is not None:
             if weight.data_type in (onnx_proto.TensorProto.FLOAT, onnx_proto.TensorProto.FLOAT16):
                 self.bias_to_quantize.append((bias_name, input_name, weight_name, beta))
@@ -278,7 +277,7 @@ class QDQQuantizer(ONNXQuantizer):
     def try_replacing_upstream_output(self, upstream_output_name, output_name):
         if (
             output_name in self.quantization_params
-            and len(self.model.input_name_to_nodes()[upstream_output_name]) == 1
+            and len(self.model.get_consumers(upstream_output_name)) == 1
             and not self.model.is_graph_output(upstream_output_name)
             and not self.model.is_graph_input(upstream_output_name)
         ):
@@ -309,31 +308,37 @@ class QDQQuantizer(ONNXQuantizer):
         )
         self.model.add_nodes([qlinear_node, dequant_node])
 
+    def _get_initializer_quant_args(self, weight_name, tensor_type, axis=None):
+        """
+        Returns the arguments the initializer is quantized with, as a tuple (weight name, quantization type,
+        channel axis or None, reduce_range, keep_float_weight).
+        """
+        if axis is not None:
+            qtype = self.activation_qType
+            if self.activation_qType == onnx.onnx_pb.TensorProto.UINT8:
+                qtype = onnx_proto.TensorProto.INT8
+            # Quantization type is forced to be TensorProto.INT8.
+            # when the expected value would be (see below)
+            # self.weight_qType if tensor_type is QDQQuantTensorType.WEIGHT else self.activation_qType.
+            # QLinearConv expects to have a unique value for all channels.
+            # This code does not enforce that but it is necessarily the case when the
+            # quantization is symmetric (as for INT8).
+            return weight_name, qtype, axis, True, self.add_qdq_pair_to_weight
+        qtype = self.weight_qType if tensor_type is QDQQuantTensorType.WEIGHT else self.activation_qType
+        return weight_name, qtype, None, False, self.add_qdq_pair_to_weight
+
     def _add_qdq_pair_for_initializer(self, weight_proto, tensor_type, axis=None):
         weight_name = weight_proto.name
+        _, qtype, _, reduce_range, keep_float_weight = self._get_initializer_quant_args(weight_name, tensor_type, axis)
         if axis is not None:
             if self.opset_version < 13:
                 raise ValueError("Per-Channel support with QDQ format requires onnx opset version 13 or above.")
-            qtype = self.activation_qType
-            if self.activation_qType == onnx.onnx_pb.TensorProto.UINT8:
-                qtype = onnx_proto.TensorProto.INT8
             q_weight_name, zp_name, scale_name = self.quantize_weight_per_channel(
-                weight_name,
-                # Quantization type is forced to be TensorProto.INT8.
-                # when the expected value would be (see below)
-                # self.weight_qType if tensor_type is QDQQuantTensorType.WEIGHT else self.activation_qType.
-                # QLinearConv expects to have a unique value for all channels.
-                # This code does not enforce that but it is necessarily the case when the
-                # quantization is symmetric (as for INT8).
-                qtype,
-                axis,
-                keep_float_weight=self.add_qdq_pair_to_weight,
+                weight_name, qtype, axis, reduce_range, keep_float_weight=keep_float_weight
             )
         else:
             q_weight_name, zp_name, scale_name = self.quantize_initializer(
-                weight_proto,
-                self.weight_qType if tensor_type is QDQQuantTensorType.WEIGHT else self.activation_qType,
-                keep_float_weight=self.add_qdq_pair_to_weight,
+                weight_proto, qtype, reduce_range, keep_float_weight=keep_float_weight
             )
 
         weight_dequant_output = add_dequant_output_suffix(weight_name)
@@ -388,7 +393,7 @@ class QDQQuantizer(ONNXQuantizer):
                 )
 
                 node = self.tensor_to_its_receiving_nodes[tensor_name][i]
-                self.model.replace_node_input(node, tensor_name, tensor_name_dequant_output_postfix)
+                self.model.replace_input_of_node(node, tensor_name, tensor_name_dequant_output_postfix)
                 if i == 0:
                     quantized_value = QuantizedValue(
                         tensor_name,
@@ -431,13 +436,19 @@ class QDQQuantizer(ONNXQuantizer):
             self.quantized_value_map[tensor_name] = quantized_value
 
     def _quantize_normal_tensors(self):
+        self.prequantize_weights(
+            self._get_initializer_quant_args(tensor_name, tensor_info.tensor_type, tensor_info.axis)
+            for tensor_name, tensor_info in self.tensors_to_quantize.items()
+            if not tensor_info.is_shared
+        )
+
         for tensor_name, tensor_info in self.tensors_to_quantize.copy().items():
             if tensor_name in self.quantized_value_map:
                 continue
 
             if not tensor_info.is_shared:
                 # Quantize the input
-                initializer = find_by_name(tensor_name, self.model.initializer())
+                initializer = self.model.get_initializer(tensor_name)
                 if initializer:
                     self._add_qdq_pair_for_initializer(initializer, tensor_info.tensor_type, tensor_info.axis)
                 else:
@@ -460,6 +471,8 @@ class QDQQuantizer(ONNXQuantizer):
 
                 del self.tensors_to_quantize[tensor_name]
 
+        self.prequantized_weights.clear()
+
     def _quantize_sharing_param_tensors(self):
         while self.tensors_to_quantize:
             for tensor_name, tensor_info in self.tensors_to_quantize.copy().items():
@@ -469,7 +482,7 @@ class QDQQuantizer(ONNXQuantizer):
 
                     quantized_value = self.quantized_value_map[tensor_provider_name]
                     # Quantize the input
-                    initializer = find_by_name(tensor_name, self.model.initializer())
+                    initializer = self.model.get_initializer(tensor_name)
                     if initializer is not None:
                         raise ValueError("Quantization parameter shared mode is not supported for weight yet")
                     self._add_qdq_pair_for_activation(tensor_name, quantized_value.scale_name, quantized_value.zp_name)
@@ -480,7 +493,7 @@ class QDQQuantizer(ONNXQuantizer):
                 continue
             # Quantize the input
             self.quantize_bias_static(bias_name, input_name, weight_name, beta)
-            init = find_by_name(bias_name, self.model.initializer())
+            init = self.model.get_initializer(bias_name)
             self.model.remove_initializer(init)
             quant_value = self.quantized_value_map[bias_name]
             if quant_value.node_type == "Cast":
@@ -8,15 +8,16 @@ import numpy
 import onnx
 from onnx import ModelProto, TensorProto, external_data_helper
 from onnx import onnx_pb as onnx_proto
-from onnx.helper import make_graph, make_model, make_node, make_tensor_value_info
-from onnx.reference import ReferenceEvaluator
 
 from onnxruntime import GraphOptimizationLevel, InferenceSession, SessionOptions
 
 try:
-    from onnx.reference.custom_element_types import float8e4m3fn
+    from onnx.reference.custom_element_types import float8e4m3fn, float8e4m3fnuz, float8e5m2, float8e5m2fnuz
 except ImportError:
     float8e4m3fn = None
+    float8e4m3fnuz = None
+    float8e5m2 = None
+    float8e5m2fnuz = None
 
 
 __producer__ = "onnx.quantize"
@@ -121,6 +122,17 @@ ONNX_TYPE_TO_NP_TYPE = {
     onnx_proto.TensorProto.INT16: numpy.dtype("int16"),
     onnx_proto.TensorProto.UINT16: numpy.dtype("uint16"),
     onnx_proto.TensorProto.FLOAT8E4M3FN: float8e4m3fn,
+    onnx_proto.TensorProto.FLOAT8E4M3FNUZ: float8e4m3fnuz,
+    onnx_proto.TensorProto.FLOAT8E5M2: float8e5m2,
+    onnx_proto.TensorProto.FLOAT8E5M2FNUZ: float8e5m2fnuz,
+}
+
+# Encodings of float 8 types: number of mantissa bits, exponent bias, and codes of the maximum value, NaN and infinity
+FLOAT8_ENCODINGS = {
+    onnx_proto.TensorProto.FLOAT8E4M3FN: (3, 7, 0x7E, 0x7F, None),
+    onnx_proto.TensorProto.FLOAT8E4M3FNUZ: (3, 8, 0x7F, 0x80, None),
+    onnx_proto.TensorProto.FLOAT8E5M2: (2, 15, 0x7B, 0x7F, 0x7C),
+    onnx_proto.TensorProto.FLOAT8E5M2FNUZ: (2, 16, 0x7F, 0x80, None),
 }
 
 ONNX_INT_TYPE_RANGE = {
@@ -159,42 +171,53 @@ def _check_type(*args, zero_point_index=-1):
     return tuple(new_args) if len(new_args) > 1 else new_args[0]
 
 
+def float32_to_float8(arr, qType, saturate=True):
+    """
+    Convert float values to float 8 with rounding to nearest even, like Cast does.
+
+    :param arr: values to convert, cast to float32 first
+    :param qType: onnx.TensorProto.FLOAT8E4M3FN, FLOAT8E4M3FNUZ, FLOAT8E5M2 or FLOAT8E5M2FNUZ
+    :param saturate: if True, values out of range (including infinities) become the maximum value with the
+        same sign, otherwise they become infinity for FLOAT8E5M2 or NaN for other types.
+    :return: float 8 values as uint8
+    """
+    mantissa_bits, exponent_bias, max_code, nan_code, inf_code = FLOAT8_ENCODINGS[qType]
+    bits = numpy.asarray(arr, dtype=numpy.float32).view(numpy.uint32)
+    sign = ((bits >> 24) & 0x80).astype(numpy.uint8)
+    abs_bits = bits & 0x7FFFFFFF
+    abs_arr = abs_bits.view(numpy.float32)
+
+    # Round the mantissa of normal numbers to nearest even on the bits, and then change the bias of the exponent.
+    shift = 23 - mantissa_bits
+    rounded = (abs_bits + ((1 << (shift - 1)) - 1) + ((abs_bits >> shift) & 1)) >> shift
+    codes = rounded.astype(numpy.int64) - ((127 - exponent_bias) << mantissa_bits)
+
+    # Subnormal numbers are multiples of the smallest one. Rounding may give the smallest normal number.
+    is_subnormal = abs_arr < numpy.float32(2.0 ** (1 - exponent_bias))
+    codes[is_subnormal] = numpy.rint(abs_arr[is_subnormal] * numpy.float32(2.0 ** (exponent_bias + mantissa_bits - 1)))
+
+    # Infinities are out of range too.
+    is_overflow = codes > max_code
+    codes[is_overflow] = max_code if saturate else (inf_code if inf_code is not None else nan_code)
+    codes[numpy.isnan(abs_arr)] = nan_code
+    codes = codes.astype(numpy.uint8)
+    if nan_code == 0x80:
+        # FNUZ types have neither negative zero nor signed NaN, since 0x80 is NaN.
+        return numpy.where((codes == 0) | (codes == 0x80), codes, codes | sign)
+    return codes | sign
+
+
 def quantize_nparray(qType, arr, scale, zero_point, low=None, high=None):
     assert (
         qType in ONNX_TYPE_TO_NP_TYPE
     ), f"Unexpected data type {qType} requested. Only INT8, UINT8, INT16, and UINT16 are supported."
-    if qType in (
-        onnx_proto.TensorProto.FLOAT8E4M3FN,
-        onnx_proto.TensorProto.FLOAT8E4M3FNUZ,
-        onnx_proto.TensorProto.FLOAT8E5M2,
-        onnx_proto.TensorProto.FLOAT8E5M2FNUZ,
-    ):
+    if qType in FLOAT8_ENCODINGS:
         if zero_point != 0:
             raise NotImplementedError(f"zero_point is expected to be null for float 8 not {zero_point!r}.")
-        if arr.dtype == numpy.float32:
-            onnx_type = TensorProto.FLOAT
-        elif arr.dtype == numpy.float16:
-            onnx_type = TensorProto.FLOAT16
-        else:
+        if arr.dtype not in (numpy.float32, numpy.float16):
             raise ValueError(f"Unexpected dtype {arr.dtype}.")
-        onnx_model = make_model(
-            make_graph(
-                [
-                    make_node(
-                        "Constant", [], ["zero_point"], value=onnx.helper.make_tensor("zero_point", qType, [], [0])
-                    ),
-                    make_node("QuantizeLinear", ["X", "scale", "zero_point"], ["Y"]),
-                ],
-                "qu",
-                [
-                    make_tensor_value_info("X", onnx_type, None),
-                    make_tensor_value_info("scale", onnx_type, None),
-                ],
-                [make_tensor_value_info("Y", qType, None)],
-            )
-        )
-        ref = ReferenceEvaluator(onnx_model)
-        return _check_type(ref.run(None, {"X": arr, "scale": scale})[0])
+        # Same as QuantizeLinear with saturate=1 in onnx.reference.ReferenceEvaluator, without running a model.
+        return _check_type(float32_to_float8(arr / scale, qType).view(ONNX_TYPE_TO_NP_TYPE[qType]))
     else:
         dtype = ONNX_TYPE_TO_NP_TYPE[qType]
         (qmin, qmax) = get_qmin_qmax_for_qType(qType, reduce_range=False, symmetric=True)
@@ -259,6 +282,55 @@ def compute_scale_zp(rmin, rmax, qmin, qmax, symmetric=False, min_real_range=Non
     return [zero_point, scale]
 
 
+def compute_scale_zp_per_channel(rmin, rmax, qmin, qmax, symmetric=False, min_real_range=None):
+    """Vectorized version of compute_scale_zp, which calculates the scale and zero point of every channel at once.
+
+    :parameter rmin: minimum value of r of every channel
+    :parameter rmax: maximum value of r of every channel
+    :parameter qmin: minimum value representable by the target quantization data type, per channel or for all channels
+    :parameter qmax: maximum value representable by the target quantization data type, per channel or for all channels
+    :parameter symmetric: True if the floating-point range should be made symmetric, per channel or for all channels
+    :parameter min_real_range: Minimum floating-point range (i.e., rmax - rmin) to enforce. Defaults to None.
+    :return: zero points and scales [z, s] of every channel
+    """
+    if numpy.any(qmin > 0) or numpy.any(qmax < 0):
+        raise ValueError(f"qmin and qmax must meet requirement: qmin <= 0 <= qmax while qmin:{qmin}, qmmax:{qmax}")
+
+    dtype = rmax.dtype
+    rmin = numpy.minimum(rmin, numpy.array(0, dtype=dtype))
+    rmax = numpy.maximum(rmax, numpy.array(0, dtype=dtype))
+
+    # Channels whose minimum range is enforced get the data type of rmin + min_real_range in compute_scale_zp, where
+    # rmin is a scalar.
+    is_enforced = numpy.zeros(rmax.shape, dtype=bool)
+    range_dtype = dtype
+    if min_real_range is not None:
+        range_dtype = (dtype.type(0) + min_real_range).dtype
+        enforced_rmax = rmin.astype(range_dtype) + range_dtype.type(min_real_range)
+        is_enforced = enforced_rmax > rmax
+        if is_enforced.any():
+            rmin = rmin.astype(range_dtype)
+            rmax = numpy.where(is_enforced, enforced_rmax, rmax)
+
+    absmax = numpy.maximum(numpy.abs(rmin), numpy.abs(rmax))
+    rmin = numpy.where(symmetric, -absmax, rmin)
+    rmax = numpy.where(symmetric, absmax, rmax)
+
+    dr = numpy.where(is_enforced, rmax - rmin, rmax.astype(dtype) - rmin.astype(dtype)).astype(numpy.float64)
+    dq = numpy.asarray(qmax, dtype=numpy.float64) - numpy.asarray(qmin, dtype=numpy.float64)
+    scale = dr / dq
+    assert numpy.all(scale >= 0), "scale issue"
+    is_tiny = scale < numpy.where(is_enforced, numpy.finfo(range_dtype).tiny, numpy.finfo(dtype).tiny)
+    scale = numpy.where(is_tiny, 1.0, scale)
+    zero_point = numpy.where(is_tiny, 0, numpy.round(qmin - rmin / scale)).astype(numpy.asarray(qmin).dtype)
+    if is_enforced.any():
+        scale = numpy.where(is_enforced, scale.astype(range_dtype), scale.astype(dtype))
+    else:
+        scale = scale.astype(dtype)
+
+    return [zero_point, scale]
+
+
 def compute_scale_zp_float8(element_type, std):
     """Calculate the scale s for a float8 type (E4M3FN).
     The function assumes the coefficient distribution and the float 8
@@ -347,7 +419,7 @@ def quantize_data(
         std = numpy.std(data)
         zero_point, scale = compute_scale_zp_float8(qType, std)
         quantized_data = quantize_nparray(qType, data, scale, zero_point)
-        if any((quantized_data.astype(numpy.uint8).ravel() & 127) == 127):
+        if ((quantized_data.astype(numpy.uint8).ravel() & 127) == 127).any():
             np_data = numpy.asarray(data)
             raise RuntimeError(
                 f"One of the quantized value is NaN data in [{np_data.min()}, {np_data.max()}], "
@@ -521,8 +593,7 @@ def find_by_name(item_name, item_list):
         parameter item_list: list of items.
         return: item if found. None otherwise.
     """
-    items = [item for item in item_list if item.name == item_name]
-    return items[0] if len(items) > 0 else None
+    return next((item for item in item_list if item.name == item_name), None)
 
 
 def get_elem_index(elem_name, elem_list):
@@ -382,6 +382,24 @@ def quantize_static(
                     Default is None. If set to an integer, during calculation of the min-max range of the tensors
                     it will load at max value number of outputs before computing and merging the range. This will
                     produce the same result as all computing with None, but is more memory efficient.
+                    For the Entropy, Percentile and Distribution methods, the outputs are merged into the
+                    histograms every time this number is reached, so that the peak memory is bounded by
+                    that number of outputs plus the histograms.
+                CalibNumWorkers = Optional[int] :
+                    Default is None. If set to an integer greater than 1, the thresholds of the tensors are
+                    computed in parallel by that number of threads when the calibration method selected is
+                    Entropy, Percentile or Distribution. The results are the same as with None.
+                CalibNumProcesses = Optional[int] :
+                    Default is None. If set to an integer greater than 1, the calibration data is split across
+                    that number of processes, each one running its own inference session, and the ranges or
+                    histograms they collect are merged. The processes are started with the "spawn" method,
+                    the main script must be protected by `if __name__ == "__main__":`.
+                CalibCacheDir = Optional[str] :
+                    Default is None. If set to a directory, the data collected during the calibration is saved
+                    there and reused when the same model is calibrated again with the same calibration data.
+                    An interrupted calibration resumes from the last data saved, which happens every
+                    CalibMaxIntermediateOutputs inputs. The inference session is only created if some
+                    calibration data is not cached.
                 SmoothQuant = True/False :
                     Default is False. If enabled, SmoothQuant algorithm will be applied before quantization to do
                     fake input channel quantization.
@@ -419,6 +437,10 @@ def quantize_static(
                                                    Invalid if also set `scale` or `zero_point`.
                         'rmin' = Float           : Override the minimum real tensor value in calibration data.
                                                    Invalid if also set `scale` or `zero_point`.
+                WeightQuantizationNumWorkers = Optional[int] :
+                    Default is None. If set to an integer greater than 1, the weights are quantized in parallel by
+                    that number of threads before the graph is rewritten. The quantized model is the same as with
+                    None.
     """
     if activation_type == QuantType.QFLOAT8E4M3FN or weight_type == QuantType.QFLOAT8E4M3FN:
         if calibrate_method != CalibrationMethod.Distribution:
@@ -450,6 +472,9 @@ def quantize_static(
         ("CalibMovingAverage", "moving_average"),
         ("CalibMovingAverageConstant", "averaging_constant"),
         ("CalibMaxIntermediateOutputs", "max_intermediate_outputs"),
+        ("CalibNumWorkers", "num_workers"),
+        ("CalibNumProcesses", "num_processes"),
+        ("CalibCacheDir", "cache_dir"),
     ]
     calib_extra_options = {
         key: extra_options.get(name) for (name, key) in calib_extra_options_keys if name in extra_options
@@ -600,6 +625,10 @@ def quantize_dynamic(
                     quantized output. Also the True behavior could be disabled per node using the nodes_to_exclude.
                 MatMulConstBOnly = True/False:
                     Default is True for dynamic mode. If enabled, only MatMul with const B will be quantized.
+                WeightQuantizationNumWorkers = Optional[int] :
+                    Default is None. If set to an integer greater than 1, the weights are quantized in parallel by
+                    that number of threads before the graph is rewritten. The quantized model is the same as with
+                    None.
     """
     extra_options = extra_options or {}
     nodes_to_exclude = nodes_to_exclude or []
@@ -3,7 +3,10 @@
 
 # -*- coding: UTF-8 -*-
 import argparse
+import itertools
 import logging
+import math
+from collections import deque
 
 import numpy as np
 import onnx
@@ -15,6 +18,9 @@ assert version.parse(onnx.__version__) >= version.parse("1.8.0")
 
 logger = logging.getLogger(__name__)
 
+# Initializers with more elements are not part of key of node cache in incremental inference.
+NODE_CACHE_MAX_INITIALIZER_SIZE = 1024
+
 
 def get_attribute(node, attr_name, default_value=None):
     found = [attr for attr in node.attribute if attr.name == attr_name]
@@ -252,6 +258,12 @@ class SymbolicShapeInference:
         self.int_max_ = int_max
         self.subgraph_id_ = 0
         self.prefix_ = prefix
+        # memo of onnx shape inference of single node, keyed by op_type, attributes and input types.
+        self.onnx_infer_cache_ = {}
+        # inference results of nodes keyed by node and its inputs. Set it to a dict to enable incremental inference,
+        # so that nodes not impacted by a change of the model reuse results of previous inference.
+        self.node_cache_ = None
+        self.node_index_ = {}
 
     def _add_suggested_merge(self, symbols, apply=False):
         assert all([(type(s) == str and s in self.symbolic_dims_) or is_literal(s) for s in symbols])  # noqa: E721
@@ -494,27 +506,45 @@ class SymbolicShapeInference:
                     if (name in self.initializers_ and name not in self.graph_inputs_)
                 ]
 
-            # run single node inference with self.known_vi_ shapes
-            tmp_graph = helper.make_graph(
-                [node],
-                "tmp",
-                [self.known_vi_[i] for i in node.input if i],
-                [make_named_value_info(i) for i in node.output],
-                initializers,
+            # The result of onnx shape inference only depends on the operator and types of inputs,
+            # so it is reused for nodes (like those in each layer of a transformer) with same key.
+            cache_key = (
+                node.op_type,
+                node.domain,
+                tuple(attr.SerializeToString() for attr in node.attribute),
+                tuple(self.known_vi_[i].type.SerializeToString() if i else None for i in node.input),
+                tuple(bool(o) for o in node.output),
+                tuple(i.SerializeToString() for i in initializers),
             )
+            inferred_outputs = self.onnx_infer_cache_.get(cache_key)
+            if inferred_outputs is None:
+                # run single node inference with self.known_vi_ shapes
+                tmp_graph = helper.make_graph(
+                    [node],
+                    "tmp",
+                    [self.known_vi_[i] for i in node.input if i],
+                    [make_named_value_info(i) for i in node.output],
+                    initializers,
+                )
 
-            self.tmp_mp_.graph.CopyFrom(tmp_graph)
+                self.tmp_mp_.graph.CopyFrom(tmp_graph)
 
-            self.tmp_mp_ = shape_inference.infer_shapes(self.tmp_mp_)
+                self.tmp_mp_ = shape_inference.infer_shapes(self.tmp_mp_)
+
+                # copy outputs since tmp_mp_ will be overwritten by inference of next node.
+                inferred_outputs = []
+                for output in self.tmp_mp_.graph.output:
+                    inferred_outputs.append(onnx.ValueInfoProto())
+                    inferred_outputs[-1].CopyFrom(output)
+                self.onnx_infer_cache_[cache_key] = inferred_outputs
 
         for i_o in range(len(node.output)):
             o = node.output[i_o]
             if o:  # skip optional output
                 vi = self.out_mp_.graph.value_info.add()
                 if not skip_infer:
-                    vi.CopyFrom(self.tmp_mp_.graph.output[i_o])
-                else:
-                    vi.name = o
+                    vi.CopyFrom(inferred_outputs[i_o])
+                vi.name = o
                 self.known_vi_[o] = vi
 
     def _onnx_infer_subgraph(self, node, subgraph, use_node_input=True, inc_subgraph_id=True):
@@ -546,6 +576,7 @@ class SymbolicShapeInference:
         if inc_subgraph_id:
             self.subgraph_id_ += 1
 
+        symbolic_shape_inference.onnx_infer_cache_ = self.onnx_infer_cache_
         symbolic_shape_inference._preprocess(self.tmp_mp_)
         symbolic_shape_inference.suggested_merge_ = self.suggested_merge_.copy()
         while symbolic_shape_inference.run_:
@@ -658,15 +689,13 @@ class SymbolicShapeInference:
         return new_symbolic_dim
 
     def _new_symbolic_dim_from_output(self, node, out_idx=0, dim=0):
-        return self._new_symbolic_dim(
-            "{}{}_{}_o{}_".format(
-                node.op_type,
-                self.prefix_,
-                list(self.out_mp_.graph.node).index(node),
-                out_idx,
-            ),
-            dim,
-        )
+        return self._new_symbolic_dim(f"{node.op_type}{self.prefix_}_{self._get_node_index(node)}_o{out_idx}_", dim)
+
+    def _get_node_index(self, node):
+        index = self.node_index_.get(id(node))
+        if index is None:
+            index = list(self.out_mp_.graph.node).index(node)
+        return index
 
     def _new_symbolic_shape(self, rank, node, out_idx=0):
         return [self._new_symbolic_dim_from_output(node, out_idx, i) for i in range(rank)]
@@ -2509,6 +2538,193 @@ class SymbolicShapeInference:
                 return out
         return None
 
+    @staticmethod
+    def _sort_nodes(nodes, prereqs, known_names, output_names):
+        """Topological sort of nodes in O(V+E), where prereqs[i] is the set of names that nodes[i] depends on.
+
+        The order is same as sweeping the nodes repeatedly, and appending every node that all its prerequisites
+        are known, until all graph outputs are known: a node is appended in the first sweep that its prerequisites
+        are known when it is visited, and nodes of a sweep are in the graph order. Dead nodes that are not reached
+        in the last sweep are excluded.
+        """
+        if not output_names:
+            return []
+
+        producers = {}
+        for index, node in enumerate(nodes):
+            if node.output[0] in known_names:
+                continue  # same as the sweep, a node is never appended when its first output is known.
+            for name in node.output:
+                if name in producers:
+                    # invalid model that a name is produced by multiple nodes, where order depends on the sweep.
+                    return SymbolicShapeInference._sort_nodes_by_sweeps(nodes, prereqs, known_names, output_names)
+                producers[name] = index
+
+        # number of unknown prerequisites, and nodes that depend on each node.
+        pending = [0] * len(nodes)
+        consumers = [[] for _ in nodes]
+        for index, names in enumerate(prereqs):
+            if nodes[index].output[0] in known_names:
+                pending[index] = 1  # never appended
+                continue
+            for name in names:
+                if name and name not in known_names:
+                    pending[index] += 1
+                    producer = producers.get(name)
+                    if producer is not None:
+                        consumers[producer].append(index)
+
+        # sweeps[i] is the index of the sweep that appends nodes[i]. When its prerequisite is appended in a sweep
+        # after visiting nodes[i] (the producer has larger index), nodes[i] is appended in the next sweep.
+        sweeps = [0] * len(nodes)
+        queue = deque(index for index in range(len(nodes)) if pending[index] == 0)
+        while queue:
+            producer = queue.popleft()
+            for index in consumers[producer]:
+                sweeps[index] = max(sweeps[index], sweeps[producer] + (1 if producer > index else 0))
+                pending[index] -= 1
+                if pending[index] == 0:
+                    queue.append(index)
+
+        last_sweep = 0
+        for name in output_names:
+            if name in known_names:
+                continue
+            producer = producers.get(name)
+            if producer is None or pending[producer] > 0:
+                raise Exception("Invalid model with cyclic graph")
+            last_sweep = max(last_sweep, sweeps[producer])
+
+        sorted_indices = [index for index in range(len(nodes)) if pending[index] == 0 and sweeps[index] <= last_sweep]
+        sorted_indices.sort(key=lambda index: (sweeps[index], index))
+        return [nodes[index] for index in sorted_indices]
+
+    @staticmethod
+    def _sort_nodes_by_sweeps(nodes, prereqs, known_names, output_names):
+        sorted_nodes = []
+        sorted_known_vi = set(known_names)
+        while not all([o in sorted_known_vi for o in output_names]):
+            old_sorted_nodes_len = len(sorted_nodes)
+            for node, prereq in zip(nodes, prereqs):
+                if (node.output[0] not in sorted_known_vi) and all([i in sorted_known_vi for i in prereq if i]):
+                    sorted_known_vi.update(node.output)
+                    sorted_nodes.append(node)
+            if old_sorted_nodes_len == len(sorted_nodes) and not all([o in sorted_known_vi for o in output_names]):
+                raise Exception("Invalid model with cyclic graph")
+        return sorted_nodes
+
+    def _infer_node(self, node):
+        """Run onnx and symbolic shape inference of a node. Returns True if the node is a known ATen operator."""
+        self._onnx_infer_single_node(node)
+        known_aten_op = False
+        if node.op_type in self.dispatcher_:
+            self.dispatcher_[node.op_type](node)
+        elif node.op_type in ["ConvTranspose"]:
+            # onnx shape inference ops like ConvTranspose may have empty shape for symbolic input
+            # before adding symbolic compute for them
+            # mark the output type as UNDEFINED to allow guessing of rank
+            vi = self.known_vi_[node.output[0]]
+            if len(vi.type.tensor_type.shape.dim) == 0:
+                vi.type.tensor_type.elem_type = onnx.TensorProto.UNDEFINED
+        elif node.op_type == "ATen" and node.domain == "org.pytorch.aten":
+            for attr in node.attribute:
+                # TODO: Is overload_name needed?
+                if attr.name == "operator":
+                    aten_op_name = attr.s.decode("utf-8") if isinstance(attr.s, bytes) else attr.s
+                    if aten_op_name in self.aten_op_dispatcher_:
+                        known_aten_op = True
+                        self.aten_op_dispatcher_[aten_op_name](node)
+                    break
+        return known_aten_op
+
+    def _get_sympy_data_key(self, value):
+        if isinstance(value, np.ndarray):
+            return (str(value.dtype), value.shape, value.tobytes())
+        if isinstance(value, (list, tuple)):
+            return (type(value), *(self._get_sympy_data_key(v) for v in value))
+        return (type(value), value)  # sympy expressions are immutable and hashable
+
+    def _copy_sympy_data(self, value):
+        if isinstance(value, np.ndarray):
+            return value.copy()
+        if isinstance(value, list):
+            return [self._copy_sympy_data(v) for v in value]
+        return value
+
+    def _get_node_cache_key(self, node):
+        """Key of inference result of a node, or None if the node could not be cached."""
+        if node.op_type in ["If", "Loop", "Scan"] or any(
+            attr.type in [onnx.AttributeProto.GRAPH, onnx.AttributeProto.GRAPHS] for attr in node.attribute
+        ):
+            return None  # inference of subgraph changes the subgraph and subgraph_id_.
+
+        inputs = []
+        for name in node.input:
+            vi = self.known_vi_.get(name) if name else None
+            initializer = self.initializers_.get(name) if name else None
+            # values of large initializers (like weights) are not used in shape inference
+            if initializer is not None and math.prod(initializer.dims) > NODE_CACHE_MAX_INITIALIZER_SIZE:
+                initializer = None
+            inputs.append(
+                (
+                    vi.type.SerializeToString() if vi is not None else None,
+                    self._get_sympy_data_key(self.sympy_data_[name]) if name in self.sympy_data_ else None,
+                    initializer.SerializeToString() if initializer is not None else None,
+                    name in self.graph_inputs_,
+                )
+            )
+
+        return (
+            node.SerializeToString(),
+            tuple(inputs),
+            tuple(sorted(self.suggested_merge_.items())),
+            tuple((opset.domain, opset.version) for opset in self.out_mp_.opset_import),
+            self.prefix_,
+            self.int_max_,
+            self.auto_merge_,
+            self.guess_output_rank_,
+        )
+
+    def _infer_node_with_cache(self, node):
+        """Same as _infer_node, but reuse the inference result of a node with same inputs in node_cache_."""
+        cache_key = self._get_node_cache_key(node)
+        if cache_key is None:
+            return self._infer_node(node)
+
+        cached = self.node_cache_.get(cache_key)
+        # result with new symbolic dims is not reused when node index is changed since name of dims has the index.
+        if cached is not None and (cached["node_index"] is None or cached["node_index"] == self._get_node_index(node)):
+            for name, vi in cached["outputs"].items():
+                new_vi = self.out_mp_.graph.value_info.add()
+                new_vi.CopyFrom(vi)
+                self.known_vi_[name] = new_vi
+            for name, value in cached["sympy_data"].items():
+                self.sympy_data_[name] = self._copy_sympy_data(value)
+            for dim, value in cached["symbolic_dims"].items():
+                self.symbolic_dims_.setdefault(dim, value)
+            return cached["known_aten_op"]
+
+        suggested_merge = dict(self.suggested_merge_)
+        num_symbolic_dims = len(self.symbolic_dims_)
+        known_aten_op = self._infer_node(node)
+        if self.suggested_merge_ != suggested_merge:
+            return known_aten_op  # do not cache a node that changes state of merge
+
+        outputs = {}
+        for name in node.output:
+            if name:
+                outputs[name] = onnx.ValueInfoProto()
+                outputs[name].CopyFrom(self.known_vi_[name])
+        symbolic_dims = dict(itertools.islice(self.symbolic_dims_.items(), num_symbolic_dims, None))
+        self.node_cache_[cache_key] = {
+            "known_aten_op": known_aten_op,
+            "outputs": outputs,
+            "sympy_data": {n: self._copy_sympy_data(self.sympy_data_[n]) for n in outputs if n in self.sympy_data_},
+            "symbolic_dims": symbolic_dims,
+            "node_index": self._get_node_index(node) if symbolic_dims else None,
+        }
+        return known_aten_op
+
     def _infer_impl(self, start_sympy_data=None):
         self.sympy_data_ = start_sympy_data or {}
         self.out_mp_.graph.ClearField("value_info")
@@ -2542,9 +2758,11 @@ class SymbolicShapeInference:
         # create a temporary ModelProto for single node inference
         # note that we remove initializer to have faster inference
         # for tensor ops like Reshape/Tile/Expand that read initializer, we need to do sympy computation based inference anyways
+        # the graph is not copied since it will be replaced by the graph of a single node or a subgraph
         self.tmp_mp_ = onnx.ModelProto()
-        self.tmp_mp_.CopyFrom(self.out_mp_)
-        self.tmp_mp_.graph.ClearField("initializer")
+        self.tmp_mp_.ir_version = self.out_mp_.ir_version
+        self.tmp_mp_.opset_import.extend(self.out_mp_.opset_import)
+        self.tmp_mp_.functions.extend(self.out_mp_.functions)
 
         # compute prerequesite for node for topological sort
         # node with subgraphs may have dependency on implicit inputs, which will affect topological sort
@@ -2574,51 +2792,31 @@ class SymbolicShapeInference:
                         names.remove(i.name)
             return names
 
-        for n in self.tmp_mp_.graph.node:
+        # keep wrappers of nodes alive, so that their ids in node_index_ are not reused
+        self.nodes_ = list(self.out_mp_.graph.node)
+        self.node_index_ = {id(node): index for index, node in enumerate(self.nodes_)}
+        for n in self.nodes_:
             prereq_for_node[n.output[0]] = get_prereq(n)
 
         # topological sort nodes, note there might be dead nodes so we check if all graph outputs are reached to terminate
-        sorted_nodes = []
         sorted_known_vi = {i.name for i in list(self.out_mp_.graph.input) + list(self.out_mp_.graph.initializer)}
         if any([o.name in sorted_known_vi for o in self.out_mp_.graph.output]):
             # Loop/Scan will have some graph output in graph inputs, so don't do topological sort
-            sorted_nodes = self.out_mp_.graph.node
+            sorted_nodes = self.nodes_
         else:
-            while not all([o.name in sorted_known_vi for o in self.out_mp_.graph.output]):
-                old_sorted_nodes_len = len(sorted_nodes)
-                for node in self.out_mp_.graph.node:
-                    if (node.output[0] not in sorted_known_vi) and all(
-                        [i in sorted_known_vi for i in prereq_for_node[node.output[0]] if i]
-                    ):
-                        sorted_known_vi.update(node.output)
-                        sorted_nodes.append(node)
-                if old_sorted_nodes_len == len(sorted_nodes) and not all(
-                    [o.name in sorted_known_vi for o in self.out_mp_.graph.output]
-                ):
-                    raise Exception("Invalid model with cyclic graph")
+            sorted_nodes = self._sort_nodes(
+                self.nodes_,
+                [prereq_for_node[node.output[0]] for node in self.nodes_],
+                sorted_known_vi,
+                [o.name for o in self.out_mp_.graph.output],
+            )
 
         for node in sorted_nodes:
             assert all([i in self.known_vi_ for i in node.input if i])
-            self._onnx_infer_single_node(node)
-            known_aten_op = False
-            if node.op_type in self.dispatcher_:
-                self.dispatcher_[node.op_type](node)
-            elif node.op_type in ["ConvTranspose"]:
-                # onnx shape inference ops like ConvTranspose may have empty shape for symbolic input
-                # before adding symbolic compute for them
-                # mark the output type as UNDEFINED to allow guessing of rank
-                vi = self.known_vi_[node.output[0]]
-                if len(vi.type.tensor_type.shape.dim) == 0:
-                    vi.type.tensor_type.elem_type = onnx.TensorProto.UNDEFINED
-            elif node.op_type == "ATen" and node.domain == "org.pytorch.aten":
-                for attr in node.attribute:
-                    # TODO: Is overload_name needed?
-                    if attr.name == "operator":
-                        aten_op_name = attr.s.decode("utf-8") if isinstance(attr.s, bytes) else attr.s
-                        if aten_op_name in self.aten_op_dispatcher_:
-                            known_aten_op = True
-                            self.aten_op_dispatcher_[aten_op_name](node)
-                        break
+            if self.node_cache_ is None:
+                known_aten_op = self._infer_node(node)
+            else:
+                known_aten_op = self._infer_node_with_cache(node)
 
             if self.verbose_ > 2:
                 logger.debug(node.op_type + ": " + node.name)
@@ -6,3 +6,12 @@ import os
 import sys
 
 sys.path.append(os.path.dirname(__file__))
+
+# The files of this folder import fusion_profiler and profile_summary as top-level modules. Users importing them from
+# this package get the same modules, so that a FusionProfiler created by them is the one the optimizer records to, and
+# a ProfileSummary loaded by them is recognized by the profiler.
+import fusion_profiler  # noqa: E402
+import profile_summary  # noqa: E402
+
+sys.modules[__name__ + ".fusion_profiler"] = fusion_profiler
+sys.modules[__name__ + ".profile_summary"] = profile_summary
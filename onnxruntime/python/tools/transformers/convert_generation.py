@@ -1334,9 +1334,7 @@ def replace_mha_with_gqa(
         name=model.create_node_name("Cast"),
         to=TensorProto.INT32,
     )
-    model.model.graph.node.extend(
-        [reduce_sum_node, sub_node, seqlen_k_cast_node, shape_node, gather_node, total_seqlen_cast_node]
-    )
+    model.add_nodes([reduce_sum_node, sub_node, seqlen_k_cast_node, shape_node, gather_node, total_seqlen_cast_node])
 
     # Replace MultiHeadAttention with GroupQueryAttention
     #
@@ -1433,10 +1431,8 @@ def replace_mha_with_gqa(
                 outputs=[f"{qkv_weight.name}_output"],
                 name=model.create_node_name("MatMul"),
             )
-            model.model.graph.node.extend([packed_matmul_node])
-            model.model.graph.node.remove(q_matmul)
-            model.model.graph.node.remove(k_matmul)
-            model.model.graph.node.remove(v_matmul)
+            model.add_node(packed_matmul_node)
+            model.remove_nodes([q_matmul, k_matmul, v_matmul])
             q_input_to_attention = packed_matmul_node.output[0]
 
             # Make PackedAdd node if possible
@@ -1454,10 +1450,8 @@ def replace_mha_with_gqa(
                     inputs=[packed_matmul_node.output[0], qkv_bias.name],
                     outputs=[f"{qkv_bias.name}_output"],
                 )
-                model.model.graph.node.extend([packed_add_node])
-                model.model.graph.node.remove(q_add)
-                model.model.graph.node.remove(k_add)
-                model.model.graph.node.remove(v_add)
+                model.add_node(packed_add_node)
+                model.remove_nodes([q_add, k_add, v_add])
                 q_input_to_attention = packed_add_node.output[0]
 
         else:
@@ -1488,13 +1482,13 @@ def replace_mha_with_gqa(
             do_rotary=int(q_rotary is not None and k_rotary is not None),
             rotary_interleaved=interleaved,
         )
-        model.model.graph.node.remove(node)
-        model.model.graph.node.extend([gqa_node])
+        model.remove_node(node)
+        model.add_node(gqa_node)
 
         if q_rotary is not None:
-            model.model.graph.node.remove(q_rotary)
+            model.remove_node(q_rotary)
         if k_rotary is not None:
-            model.model.graph.node.remove(k_rotary)
+            model.remove_node(k_rotary)
 
     return model
 
@@ -1725,7 +1719,7 @@ def pack_qkv_for_decoder_masked_mha(model_proto: ModelProto):
                 vals=qkv_weight.flatten().tolist(),
             )
 
-            model_proto.graph.initializer.extend([weight])
+            onnx_model.add_initializer(weight)
 
             matmul_node = onnx.helper.make_node(
                 "MatMul",
@@ -1734,9 +1728,9 @@ def pack_qkv_for_decoder_masked_mha(model_proto: ModelProto):
                 name=matmul_node_name,
             )
 
-            node.input[0] = matmul_node.output[0]
-            node.input[1] = ""
-            node.input[2] = ""
+            onnx_model.set_node_input(node, 0, matmul_node.output[0])
+            onnx_model.set_node_input(node, 1, "")
+            onnx_model.set_node_input(node, 2, "")
 
             nodes_to_add.extend([matmul_node])
             nodes_to_remove.extend([q_matmul, k_matmul, v_matmul])
@@ -2035,8 +2029,10 @@ def generate_gpt2_init_decoder(
     gpt2_init_decoder_model.add_node(slice_node_1)
 
     # Adjust the input(s) to the nodes consuming the outputs of the added Slice nodes
-    gpt2_init_decoder_model.replace_node_input(matmul_after_attention, attention.output[0], slice_0_output_name)
-    gpt2_init_decoder_model.replace_node_input(residual_add_node, add_before_residual_add_output, slice_1_output_name)
+    gpt2_init_decoder_model.replace_input_of_node(matmul_after_attention, attention.output[0], slice_0_output_name)
+    gpt2_init_decoder_model.replace_input_of_node(
+        residual_add_node, add_before_residual_add_output, slice_1_output_name
+    )
 
     # Topologically sort the updated graph
     gpt2_init_decoder_model.topological_sort()
@@ -300,7 +300,7 @@ class PackingMultiHeadAttention(PackingAttentionBase):
                     and rel_pos_bias_node.op_type == "GatedRelativePositionBias"
                     and len(rel_pos_bias_node.input) == 6
                 ):
-                    rel_pos_bias_node.input.append(token_offset)
+                    self.model.set_node_input(rel_pos_bias_node, 6, token_offset)
                     gated_relative_pos_bias_count += 1
 
         logger.info("Converted %d MultiHeadAttention nodes to PackedMultiHeadAttention.", len(self.attention_nodes))
@@ -11,22 +11,28 @@
 # (4) add force_fp16_initializers option
 # (5) handle Resize and GroupNorm with mixed float inputs
 # (6) allow convert_float_to_float16 to accept model path
+# (7) vectorize conversion of tensors, and allow converting initializers in a thread pool
 
 import itertools
 import logging
 import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
 
 import numpy as np
 import onnx
-from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, helper, numpy_helper
+from onnx import AttributeProto, GraphProto, ModelProto, NodeProto, TensorProto, helper
 from onnx.shape_inference import infer_shapes, infer_shapes_path
 from packaging import version
 
 logger = logging.getLogger(__name__)
 
 
+# Number of elements converted at once, so that temporary arrays of a large tensor stay small and in cache.
+CONVERT_CHUNK_SIZE = 1 << 20
+
+
 def _npfloat16_to_int(np_list):
     """
     Convert numpy float16 to python int.
@@ -34,41 +40,57 @@ def _npfloat16_to_int(np_list):
     :param np_list: numpy float16 list
     :return int_list: python int list
     """
-    return [int(bin(_.view("H"))[2:].zfill(16), 2) for _ in np_list]
-
-
-def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
-    """
-    Convert float32 numpy array to float16 without changing sign or finiteness.
-    Positive values less than min_positive_val are mapped to min_positive_val.
-    Positive finite values greater than max_finite_val are mapped to max_finite_val.
-    Similar for negative values. NaN, 0, inf, and -inf are unchanged.
-    """
+    return np.asarray(np_list, dtype=np.float16).view(np.uint16).tolist()
 
-    def between(a, b, c):
-        return np.logical_and(a < b, b < c)
 
-    if np_array[np.where(np_array > 0)].shape[0] > 0:
-        positive_max = np_array[np.where(np_array > 0)].max()
-        positive_min = np_array[np.where(np_array > 0)].min()
+def _log_truncated_values(np_array, min_positive_val, max_finite_val):
+    positive = np_array[np_array > 0]
+    if positive.shape[0] > 0:
+        positive_max = positive.max()
+        positive_min = positive.min()
         if positive_max >= max_finite_val:
             logger.debug(f"the float32 number {positive_max} will be truncated to {max_finite_val}")
         if positive_min <= min_positive_val:
             logger.debug(f"the float32 number {positive_min} will be truncated to {min_positive_val}")
 
-    if np_array[np.where(np_array < 0)].shape[0] > 0:
-        negative_max = np_array[np.where(np_array < 0)].max()
-        negative_min = np_array[np.where(np_array < 0)].min()
+    negative = np_array[np_array < 0]
+    if negative.shape[0] > 0:
+        negative_max = negative.max()
+        negative_min = negative.min()
         if negative_min <= -max_finite_val:
             logger.debug(f"the float32 number {negative_min} will be truncated to {-max_finite_val}")
         if negative_max >= -min_positive_val:
             logger.debug(f"the float32 number {negative_max} will be truncated to {-min_positive_val}")
 
-    np_array = np.where(between(0, np_array, min_positive_val), min_positive_val, np_array)
-    np_array = np.where(between(-min_positive_val, np_array, 0), -min_positive_val, np_array)
-    np_array = np.where(between(max_finite_val, np_array, float("inf")), max_finite_val, np_array)
-    np_array = np.where(between(float("-inf"), np_array, -max_finite_val), -max_finite_val, np_array)
-    return np.float16(np_array)
+
+def convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
+    """
+    Convert float32 numpy array to float16 without changing sign or finiteness.
+    Positive values less than min_positive_val are mapped to min_positive_val.
+    Positive finite values greater than max_finite_val are mapped to max_finite_val.
+    Similar for negative values. NaN, 0, inf, and -inf are unchanged.
+    """
+    np_array = np.asarray(np_array)
+    if logger.isEnabledFor(logging.DEBUG):
+        _log_truncated_values(np_array, min_positive_val, max_finite_val)
+
+    float16_array = np.empty(np_array.shape, dtype=np.float16)
+    source = np_array.reshape(-1)
+    target = float16_array.reshape(-1)
+    for start in range(0, source.shape[0], CONVERT_CHUNK_SIZE):
+        chunk = source[start : start + CONVERT_CHUNK_SIZE]
+        # Clamp finite values to [-max_finite_val, max_finite_val]. NaN is unchanged, and inf is restored after clip.
+        clamped = np.clip(chunk, -max_finite_val, max_finite_val)
+        infinite = np.isinf(chunk)
+        if infinite.any():
+            clamped[infinite] = chunk[infinite]
+        # Map non-zero values in (-min_positive_val, min_positive_val) to +/-min_positive_val.
+        tiny = np.abs(chunk) < min_positive_val
+        tiny &= chunk != 0
+        if tiny.any():
+            clamped[tiny] = np.copysign(min_positive_val, chunk[tiny])
+        target[start : start + CONVERT_CHUNK_SIZE] = clamped
+    return float16_array
 
 
 def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finite_val=65504.0):
@@ -94,8 +116,7 @@ def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finit
         # convert float_data (float type) to float16 and write to int32_data
         if tensor.float_data:
             float16_data = convert_np_to_float16(np.array(tensor.float_data), min_positive_val, max_finite_val)
-            int_list = _npfloat16_to_int(float16_data)
-            tensor.int32_data[:] = int_list
+            tensor.int32_data[:] = _npfloat16_to_int(float16_data)
             tensor.float_data[:] = []
         # convert raw_data (bytes type)
         if tensor.raw_data:
@@ -108,9 +129,22 @@ def convert_tensor_float_to_float16(tensor, min_positive_val=5.96e-08, max_finit
     return tensor
 
 
+def convert_tensors_float_to_float16(tensors, min_positive_val=5.96e-08, max_finite_val=65504.0, num_threads=1):
+    """Convert a list of float tensors to float16 in place, using a thread pool when num_threads > 1.
+
+    NumPy releases the GIL in the conversion, so large tensors are converted in parallel.
+    """
+    if num_threads > 1 and len(tensors) > 1:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            # list() waits for all tensors, and raises the first exception if any.
+            list(executor.map(lambda t: convert_tensor_float_to_float16(t, min_positive_val, max_finite_val), tensors))
+    else:
+        for tensor in tensors:
+            convert_tensor_float_to_float16(tensor, min_positive_val, max_finite_val)
+
+
 def make_value_info_from_tensor(tensor):
-    shape = numpy_helper.to_array(tensor).shape
-    return helper.make_tensor_value_info(tensor.name, tensor.data_type, shape)
+    return helper.make_tensor_value_info(tensor.name, tensor.data_type, tensor.dims)
 
 
 DEFAULT_OP_BLOCK_LIST = [
@@ -174,6 +208,7 @@ def convert_float_to_float16(
     node_block_list=None,
     force_fp16_initializers=False,
     force_fp16_inputs=None,
+    num_threads=1,
 ):
     """Convert tensor float type in the input ONNX model to tensor float16.
 
@@ -193,6 +228,8 @@ def convert_float_to_float16(
                                        Default to false, which will convert only the one needed to avoid precision loss.
         force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                  this script's preference it to keep them in float32.
+        num_threads (int, optional): number of threads to convert float initializers to float16 in parallel.
+                                     Defaults to 1.
     Raises:
         ValueError: input type is not ModelProto.
 
@@ -403,17 +440,19 @@ def convert_float_to_float16(
 
         queue = next_level
 
-    for value in fp32_initializers.values():
-        # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
-        if force_fp16_initializers or value.fp16_nodes:
-            value.initializer = convert_tensor_float_to_float16(value.initializer, min_positive_val, max_finite_val)
-            value_info_list.append(make_value_info_from_tensor(value.initializer))
-            if value.fp32_nodes and not force_fp16_initializers:
-                logger.info(
-                    "initializer is used by both fp32 and fp16 nodes. Consider add these nodes to block list:{}".format(
-                        value.fp16_nodes
-                    )
+    # By default, to avoid precision loss, do not convert an initializer to fp16 when it is used only by fp32 nodes.
+    fp16_initializers = [value for value in fp32_initializers.values() if force_fp16_initializers or value.fp16_nodes]
+    convert_tensors_float_to_float16(
+        [value.initializer for value in fp16_initializers], min_positive_val, max_finite_val, num_threads
+    )
+    for value in fp16_initializers:
+        value_info_list.append(make_value_info_from_tensor(value.initializer))
+        if value.fp32_nodes and not force_fp16_initializers:
+            logger.info(
+                "initializer is used by both fp32 and fp16 nodes. Consider add these nodes to block list:{}".format(
+                    value.fp16_nodes
                 )
+            )
 
     # Some operators have data type fixed as float for some input. Add a float16 to float cast for those inputs.
     for node in mixed_float_type_node_list:
@@ -588,21 +588,21 @@ class FusionAttention(Fusion):
             if q_add is not None:
                 initializer_input = 1 if self.model.get_initializer(q_add.input[1]) else 0
                 if np.any(NumpyHelper.to_array(self.model.get_initializer(q_add.input[initializer_input]))):
-                    q_add.input[1 - initializer_input] = q_slice_output
+                    self.model.set_node_input(q_add, 1 - initializer_input, q_slice_output)
                     q_output = q_add
                     qkv_nodes.append(q_add)
                     self.node_name_to_graph_name[q_add.name] = self.this_graph_name
             if k_add is not None:
                 initializer_input = 1 if self.model.get_initializer(k_add.input[1]) else 0
                 if np.any(NumpyHelper.to_array(self.model.get_initializer(k_add.input[initializer_input]))):
-                    k_add.input[1 - initializer_input] = k_slice_output
+                    self.model.set_node_input(k_add, 1 - initializer_input, k_slice_output)
                     k_output = k_add
                     qkv_nodes.append(k_add)
                     self.node_name_to_graph_name[k_add.name] = self.this_graph_name
             if v_add is not None:
                 initializer_input = 1 if self.model.get_initializer(v_add.input[1]) else 0
                 if np.any(NumpyHelper.to_array(self.model.get_initializer(v_add.input[initializer_input]))):
-                    v_add.input[1 - initializer_input] = v_slice_output
+                    self.model.set_node_input(v_add, 1 - initializer_input, v_slice_output)
                     v_output = v_add
                     qkv_nodes.append(v_add)
                     self.node_name_to_graph_name[v_add.name] = self.this_graph_name
@@ -1218,7 +1218,7 @@ class FusionAttention(Fusion):
                     ),
                     self.this_graph_name,
                 )
-                einsum_node.input[0] = new_edge
+                self.model.set_node_input(einsum_node, 0, new_edge)
 
             self.nodes_to_remove.extend([attention_last_node, transpose_qkv, matmul_qkv])
             self.nodes_to_remove.extend(qk_nodes)
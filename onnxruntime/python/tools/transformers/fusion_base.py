@@ -7,6 +7,7 @@ from logging import getLogger
 from typing import Any, Dict, List, Optional, Sequence, Union
 
 import numpy as np
+from fusion_profiler import get_active_profiler, profile_pass
 from onnx import NodeProto, helper
 from onnx_model import OnnxModel
 
@@ -57,13 +58,21 @@ class Fusion:
         Apply graph fusion on the whole model graph.
         It searched nodes of given operators, and start fusion on each of those nodes.
         """
+        with profile_pass(self.description, self.model):
+            self._apply()
+
+    def _apply(self):
         logger.debug(f"start {self.description} fusion...")
         input_name_to_nodes = self.model.input_name_to_nodes()
         output_name_to_node = self.model.output_name_to_node()
 
         # This assumes that two search ops will not be fused at same time!
         for search_op_type in self.search_op_types:
-            for node in self.model.get_nodes_by_op_type(search_op_type):
+            nodes = self.model.get_nodes_by_op_type(search_op_type)
+            profiler = get_active_profiler()
+            if profiler is not None:
+                profiler.add_nodes_visited(len(nodes))
+            for node in nodes:
                 graph = self.model.get_graph_by_node(node)
                 if graph is None:
                     raise Exception("Can not find node in any graph")
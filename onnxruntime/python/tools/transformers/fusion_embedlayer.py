@@ -607,7 +607,7 @@ class FusionEmbedLayerNoMask(Fusion):
         )
 
         if need_embedding_sum_output:
-            node_with_sum_output.output[sum_output_index] = "_no_use__to_be_removed_"
+            self.model.set_node_output(node_with_sum_output, sum_output_index, "_no_use__to_be_removed_")
             if not is_sum_graph_output:
                 self.model.replace_input_of_all_nodes(sum_output, embed_node.output[2])
 
@@ -764,9 +764,9 @@ class FusionEmbedLayerNormalization(FusionEmbedLayerNoMask):
         for attention_node in attention_nodes:
             logger.debug("update mask_index in %s", attention_node.name)
             if attention_node.op_type == "Attention":
-                attention_node.input[3] = embed_node.output[1]
+                self.model.set_node_input(attention_node, 3, embed_node.output[1])
             elif attention_node.op_type == "MultiHeadAttention":
-                attention_node.input[4] = embed_node.output[1]
+                self.model.set_node_input(attention_node, 4, embed_node.output[1])
 
     def fuse(self, node, input_name_to_nodes, output_name_to_node):
         # Reset attention and embed_node so that we know fusion is successful when they are not None.
@@ -0,0 +1,199 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+# Instrumentation of the graph optimizer: it records wall time, peak memory, nodes visited and matches attempted
+# of each optimization pass (like one Fusion.apply), and of each call site of OnnxModel.match_parent_path.
+#
+# Example:
+#     with FusionProfiler() as profiler:
+#         optimizer = optimize_model("model.onnx", model_type="gpt2", num_heads=12, hidden_size=768)
+#     profiler.save_json("fusion_profile.json")
+#     profiler.save_chrome_trace("fusion_trace.json")  # open it in chrome://tracing or https://ui.perfetto.dev
+#
+# When no profiler is active, the instrumentation only costs a global lookup per pass or match.
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = getLogger(__name__)
+
+_active_profiler: Optional["FusionProfiler"] = None
+
+
+def get_active_profiler() -> Optional["FusionProfiler"]:
+    return _active_profiler
+
+
+def profile_pass(name: str, model=None):
+    """Context manager recording an optimization pass in the active profiler. It does nothing without profiler."""
+    if _active_profiler is None:
+        return nullcontext()
+    return _active_profiler.profile_pass(name, model)
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the current process in MB, or None when it is not available."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes in macOS, and in kilobytes in Linux.
+        return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+
+        memory_info = psutil.Process(os.getpid()).memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss) / 1024**2
+    except ImportError:
+        return None
+
+
+class FusionProfiler:
+    def __init__(self):
+        self.passes: List[Dict[str, Any]] = []  # records of finished passes
+        self.match_call_sites: Dict[tuple, Dict[str, Any]] = {}  # key is (pass name, call site)
+        self._stack: List[Dict[str, Any]] = []  # records of running passes
+        self._start_ns = time.perf_counter_ns()
+        self._previous_profiler = None
+        # match_parent_path called by these files (like match_parent_paths) is reported at the caller.
+        self._skipped_files = {os.path.join(os.path.dirname(__file__), "onnx_model.py")}
+
+    def __enter__(self):
+        global _active_profiler  # noqa: PLW0603
+        self._previous_profiler = _active_profiler
+        _active_profiler = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active_profiler  # noqa: PLW0603
+        _active_profiler = self._previous_profiler
+        self._previous_profiler = None
+
+    def _elapsed_ms(self, timestamp_ns):
+        return (timestamp_ns - self._start_ns) / 1e6
+
+    @contextmanager
+    def profile_pass(self, name: str, model=None):
+        """Record wall time, peak RSS and number of nodes of the model (an OnnxModel) before and after a pass."""
+        record = {
+            "name": name,
+            "depth": len(self._stack),
+            "start_ms": 0.0,
+            "duration_ms": 0.0,
+            "nodes_before": len(model.nodes()) if model is not None else None,
+            "nodes_after": None,
+            "nodes_visited": 0,
+            "matches_attempted": 0,
+            "matches_found": 0,
+            "peak_rss_mb": None,
+            "peak_rss_increase_mb": None,
+        }
+        peak_rss_before = get_peak_rss_mb()
+        self._stack.append(record)
+        start_ns = time.perf_counter_ns()
+        try:
+            yield record
+        finally:
+            end_ns = time.perf_counter_ns()
+            self._stack.pop()
+            record["start_ms"] = self._elapsed_ms(start_ns)
+            record["duration_ms"] = (end_ns - start_ns) / 1e6
+            if model is not None:
+                record["nodes_after"] = len(model.nodes())
+            record["peak_rss_mb"] = get_peak_rss_mb()
+            if peak_rss_before is not None:
+                record["peak_rss_increase_mb"] = record["peak_rss_mb"] - peak_rss_before
+            if self._stack:
+                # matches of a nested pass are also counted in the outer passes.
+                for key in ("nodes_visited", "matches_attempted", "matches_found"):
+                    self._stack[-1][key] += record[key]
+            self.passes.append(record)
+
+    def add_nodes_visited(self, count: int):
+        if self._stack:
+            self._stack[-1]["nodes_visited"] += count
+
+    def _get_call_site(self):
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_code.co_filename in self._skipped_files:
+            frame = frame.f_back
+        if frame is None:
+            return "unknown"
+        return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+    def profile_match(self, match_function, *args, **kwargs):
+        """Call match_function (like OnnxModel.match_parent_path), and record it at its call site."""
+        call_site = self._get_call_site()
+        start_ns = time.perf_counter_ns()
+        result = match_function(*args, **kwargs)
+        duration_ns = time.perf_counter_ns() - start_ns
+
+        pass_name = self._stack[-1]["name"] if self._stack else None
+        key = (pass_name, call_site)
+        if key not in self.match_call_sites:
+            self.match_call_sites[key] = {"pass": pass_name, "call_site": call_site, "calls": 0, "matched": 0}
+            self.match_call_sites[key]["total_ms"] = 0.0
+        stats = self.match_call_sites[key]
+        stats["calls"] += 1
+        stats["matched"] += int(result is not None)
+        stats["total_ms"] += duration_ns / 1e6
+        if self._stack:
+            self._stack[-1]["matches_attempted"] += 1
+            self._stack[-1]["matches_found"] += int(result is not None)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Passes in the order they started, and call sites of match_parent_path sorted by total time."""
+        return {
+            "passes": sorted(self.passes, key=lambda record: record["start_ms"]),
+            "match_parent_path": sorted(self.match_call_sites.values(), key=lambda s: s["total_ms"], reverse=True),
+        }
+
+    def save_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info(f"Fusion profile is saved to {path}")
+
+    def to_chrome_trace(self) -> List[Dict[str, Any]]:
+        """Events of Trace Event Format, where every pass is a complete event, and peak RSS is a counter."""
+        pid = os.getpid()
+        events = []
+        for record in sorted(self.passes, key=lambda record: record["start_ms"]):
+            events.append(
+                {
+                    "name": record["name"],
+                    "cat": "fusion",
+                    "ph": "X",
+                    "ts": record["start_ms"] * 1000,
+                    "dur": record["duration_ms"] * 1000,
+                    "pid": pid,
+                    "tid": 0,
+                    "args": {k: v for k, v in record.items() if k not in ("name", "start_ms", "duration_ms")},
+                }
+            )
+            if record["peak_rss_mb"] is not None:
+                events.append(
+                    {
+                        "name": "peak_rss_mb",
+                        "ph": "C",
+                        "ts": (record["start_ms"] + record["duration_ms"]) * 1000,
+                        "pid": pid,
+                        "args": {"peak_rss_mb": record["peak_rss_mb"]},
+                    }
+                )
+        return events
+
+    def save_chrome_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.to_chrome_trace(), "displayTimeUnit": "ms"}, f)
+        logger.info(f"Fusion trace is saved to {path}")
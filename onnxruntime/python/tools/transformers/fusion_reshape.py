@@ -33,7 +33,7 @@ class FusionReshape(Fusion):
                 raw=True,
             ),
         )
-        reshape_node.input[1] = constant_shape_name
+        self.model.set_node_input(reshape_node, 1, constant_shape_name)
         reshape_node.name = self.model.create_node_name("Reshape", "Reshape_Fuse")
         self.nodes_to_remove.extend([concat_node])
         self.nodes_to_add.append(new_node)
@@ -159,8 +159,8 @@ class FusionInsertTranspose(Fusion):
                 raw=False,
             )
 
-        unsqueeze_3.input[1] = "ort_const_unsqueeze_axes_2"
-        unsqueeze_2.input[1] = "ort_const_unsqueeze_axes_1"
+        self.model.set_node_input(unsqueeze_3, 1, "ort_const_unsqueeze_axes_2")
+        self.model.set_node_input(unsqueeze_2, 1, "ort_const_unsqueeze_axes_1")
         transpose_output_name = self.model.create_node_name("Transpose") + "_NCHW"
         self.model.replace_input_of_all_nodes(unsqueeze_3.output[0], transpose_output_name)
         new_transpose = self.create_transpose_node(unsqueeze_3.output[0], [0, 3, 1, 2], transpose_output_name)
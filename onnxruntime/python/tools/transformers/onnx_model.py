@@ -3,6 +3,7 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
+import hashlib
 import itertools
 import logging
 import os
@@ -11,7 +12,9 @@ from collections import deque
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 from float16 import convert_float_to_float16
+from fusion_profiler import get_active_profiler
 from onnx import (
     AttributeProto,
     GraphProto,
@@ -23,7 +26,7 @@ from onnx import (
     numpy_helper,
     save_model,
 )
-from onnx.external_data_helper import load_external_data_for_tensor, uses_external_data
+from onnx.external_data_helper import ExternalDataInfo, uses_external_data
 from shape_infer_helper import SymbolicShapeInferenceHelper
 
 logger = logging.getLogger(__name__)
@@ -46,13 +49,42 @@ class OnnxModel:
         self._dtype_dict: Optional[Dict[str, int]] = None
         self._shape_dict: Optional[Dict[str, List]] = None
 
+        # Index of nodes and initializers of all graphs, to avoid scanning the whole model in get_nodes_by_op_type,
+        # get_graph_by_node, get_initializer, get_children, get_parent and remove_node. It is built on first use, and
+        # then updated by the methods that modify the graphs: add_node(s), remove_node(s), add_initializer,
+        # set_node_input/output, replace_input_of_node/replace_output_of_node and replace_input/output_of_all_nodes.
+        # Code that modifies the graphs in another way, like changing node.input in place or calling the static
+        # replace_node_input/output, shall call invalidate_index.
+        # Nodes are indexed by id, the index holds a reference to them so that their ids cannot be reused.
+        # Each node is indexed with (node, index of graph, order in graphs, op_type, inputs, outputs), so that it can be
+        # removed from the index after the node is changed.
+        self._is_index_built: bool = False
+        self._node_index: Dict[int, Tuple] = {}  # id of node -> indexed node
+        self._num_indexed_nodes: int = 0  # order of the next indexed node
+        self._op_type_index: List[Dict[str, Dict[int, NodeProto]]] = []  # for each graph: op_type -> nodes
+        self._input_name_index: Dict[str, Dict[int, NodeProto]] = {}  # input name -> nodes
+        self._output_name_index: Dict[str, Dict[int, NodeProto]] = {}  # output name -> nodes
+        self._initializer_index: Dict[str, Tuple[TensorProto, int]] = {}  # name -> (initializer, index of graph)
+
+    @property
+    def model(self) -> ModelProto:
+        return self._model
+
+    @model.setter
+    def model(self, model: ModelProto):
+        # The graphs and the index of the previous model are stale once the model is replaced.
+        self._model = model
+        self.all_graphs = None
+        self.invalidate_index()
+
     def disable_shape_inference(self):
         self.enable_shape_infer = False
 
     def infer_runtime_shape(self, dynamic_axis_mapping={}, update=False):  # noqa: B006
         if self.enable_shape_infer:
             if self.shape_infer_helper is None or update:
-                self.shape_infer_helper = SymbolicShapeInferenceHelper(self.model)
+                # inference results of nodes not changed since last inference are reused.
+                self.shape_infer_helper = SymbolicShapeInferenceHelper(self.model, previous=self.shape_infer_helper)
 
             try:
                 if self.shape_infer_helper.infer(dynamic_axis_mapping):
@@ -64,22 +96,17 @@ class OnnxModel:
         return None
 
     def input_name_to_nodes(self):
+        self._update_index()
         input_name_to_nodes = {}
-        for node in self.nodes():
-            for input_name in node.input:
-                if input_name:  # could be empty when it is optional
-                    if input_name not in input_name_to_nodes:
-                        input_name_to_nodes[input_name] = [node]
-                    else:
-                        input_name_to_nodes[input_name].append(node)
+        for input_name in self._input_name_index:
+            input_name_to_nodes[input_name] = self.get_consumers(input_name)
         return input_name_to_nodes
 
     def output_name_to_node(self):
+        self._update_index()
         output_name_to_node = {}
-        for node in self.nodes():
-            for output_name in node.output:
-                if output_name:  # could be empty when it is optional
-                    output_name_to_node[output_name] = node
+        for output_name in self._output_name_index:
+            output_name_to_node[output_name] = self.get_producer(output_name)
         return output_name_to_node
 
     def nodes(self):
@@ -125,7 +152,97 @@ class OnnxModel:
                 output_names.append(output.name)
         return output_names
 
+    def _index_node(self, node, graph_index, order):
+        node_id = id(node)
+        inputs = tuple(node.input)
+        outputs = tuple(node.output)
+        self._node_index[node_id] = (node, graph_index, order, node.op_type, inputs, outputs)
+        self._op_type_index[graph_index].setdefault(node.op_type, {})[node_id] = node
+        for input_name in inputs:
+            if input_name:  # could be empty when it is optional
+                self._input_name_index.setdefault(input_name, {})[node_id] = node
+        for output_name in outputs:
+            if output_name:
+                self._output_name_index.setdefault(output_name, {})[node_id] = node
+
+    def _index_new_node(self, node, graph_index):
+        self._index_node(node, graph_index, self._num_indexed_nodes)
+        self._num_indexed_nodes += 1
+
+    def _unindex_node(self, node):
+        """Remove a node from the index, and return its entry. The inputs and outputs in the entry are removed, so
+        the node could be changed before."""
+        node_id = id(node)
+        entry = self._node_index.pop(node_id)
+        _, graph_index, _, op_type, inputs, outputs = entry
+        op_type_to_nodes = self._op_type_index[graph_index]
+        del op_type_to_nodes[op_type][node_id]
+        if not op_type_to_nodes[op_type]:
+            del op_type_to_nodes[op_type]
+        for names, name_to_nodes in ((inputs, self._input_name_index), (outputs, self._output_name_index)):
+            for name in names:
+                nodes = name_to_nodes.get(name)
+                if nodes is not None and node_id in nodes:
+                    del nodes[node_id]
+                    if not nodes:
+                        del name_to_nodes[name]
+        return entry
+
+    def _is_indexed(self, node):
+        entry = self._node_index.get(id(node))
+        return entry is not None and entry[0] is node
+
+    def _index_graph_nodes(self, graph_index):
+        """(Re)index the nodes of a graph in their current order."""
+        for node in self.graphs()[graph_index].node:
+            if self._is_indexed(node):
+                self._unindex_node(node)
+            self._index_new_node(node, graph_index)
+
+    def _index_initializer(self, tensor, graph_index):
+        # Like a scan of all graphs, the first initializer with the name is returned by get_initializer.
+        if tensor.name not in self._initializer_index or self._initializer_index[tensor.name][1] > graph_index:
+            self._initializer_index[tensor.name] = (tensor, graph_index)
+
+    def _update_index(self):
+        """Build the index if it has not been built since the last call of invalidate_index."""
+        if self._is_index_built:
+            return
+        graphs = self.graphs()
+        self._node_index = {}
+        self._num_indexed_nodes = 0
+        self._op_type_index = [{} for _ in graphs]
+        self._input_name_index = {}
+        self._output_name_index = {}
+        self._initializer_index = {}
+        for graph_index, graph in enumerate(graphs):
+            self._index_graph_nodes(graph_index)
+            for tensor in graph.initializer:
+                self._index_initializer(tensor, graph_index)
+        self._is_index_built = True
+
+    def _reindex_node(self, node):
+        """Update the index after the op_type, inputs or outputs of a node are changed in place."""
+        if self._is_index_built and self._is_indexed(node):
+            _, graph_index, order, _, _, _ = self._unindex_node(node)
+            self._index_node(node, graph_index, order)
+
+    def invalidate_index(self):
+        """Shall be called after modifying graphs without the methods of this class, like renaming initializers,
+        changing the op_type, inputs or outputs of nodes in place, or adding or removing nodes in graph.node."""
+        self._is_index_built = False
+        self._node_index = {}
+        self._op_type_index = []
+        self._input_name_index = {}
+        self._output_name_index = {}
+        self._initializer_index = {}
+
     def get_graph_by_node(self, node):
+        self._update_index()
+        if self._is_indexed(node):
+            return self.graphs()[self._node_index[id(node)][1]]
+
+        # The node might be a copy of a node in the graph.
         for graph in self.graphs():
             if node in graph.node:
                 return graph
@@ -145,27 +262,59 @@ class OnnxModel:
         return len(graph.node)
 
     def remove_node(self, node):
-        for graph in self.graphs():
-            if node in graph.node:
-                graph.node.remove(node)
-                return
-        logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
+        self.remove_nodes([node])
 
     def remove_nodes(self, nodes_to_remove):
+        self._update_index()
+
+        # Nodes of the graphs are removed in one pass over each graph.
+        graph_index_to_node_ids = {}
+        not_indexed = []
         for node in nodes_to_remove:
-            self.remove_node(node)
+            if self._is_indexed(node):
+                graph_index_to_node_ids.setdefault(self._node_index[id(node)][1], set()).add(id(node))
+            else:
+                not_indexed.append(node)
+
+        graphs = self.graphs()
+        for graph_index, node_ids in graph_index_to_node_ids.items():
+            graph = graphs[graph_index]
+            positions = [i for i, node in enumerate(graph.node) if id(node) in node_ids]
+            for i in reversed(positions):
+                del graph.node[i]
+            for node_id in node_ids:
+                self._unindex_node(self._node_index[node_id][0])
+
+        # The node might be a copy of a node in the graph.
+        for node in not_indexed:
+            for graph in graphs:
+                position = next((i for i, graph_node in enumerate(graph.node) if graph_node == node), None)
+                if position is not None:
+                    self._unindex_node(graph.node[position])
+                    del graph.node[position]
+                    break
+            else:
+                logger.warning("Failed to remove node %s", node)  # It might be a bug to hit this line.
 
     def add_node(self, node, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
-            self.model.graph.node.extend([node])
+            self.add_nodes([node])
         else:
             graph = self.get_graph_by_name(graph_name)
             insert_idx = self.get_topological_insert_id(graph, node.output)
             graph.node.insert(insert_idx, node)
+            if self._is_index_built:
+                # The nodes after the inserted one are reindexed to keep the order of nodes in the index.
+                self._index_graph_nodes(next(i for i, g in enumerate(self.graphs()) if g is graph))
 
     def add_nodes(self, nodes_to_add, node_name_to_graph_name=None):
         if node_name_to_graph_name is None:
-            self.model.graph.node.extend(nodes_to_add)
+            graph = self.model.graph
+            graph.node.extend(nodes_to_add)
+            if self._is_index_built:
+                # Nodes of the graph are copies of the given nodes.
+                for node in graph.node[len(graph.node) - len(nodes_to_add) :]:
+                    self._index_new_node(node, 0)
         else:
             for node in nodes_to_add:
                 graph_name = node_name_to_graph_name[node.name]
@@ -173,10 +322,13 @@ class OnnxModel:
 
     def add_initializer(self, tensor, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
-            self.model.graph.initializer.extend([tensor])
+            graph = self.model.graph
         else:
             graph = self.get_graph_by_name(graph_name)
-            graph.initializer.extend([tensor])
+        graph.initializer.extend([tensor])
+        if self._is_index_built:
+            graph_index = next(i for i, g in enumerate(self.graphs()) if g is graph)
+            self._index_initializer(graph.initializer[-1], graph_index)
 
     def add_input(self, input, graph_name=None):
         if graph_name is None or graph_name == self.model.graph.name:
@@ -192,9 +344,25 @@ class OnnxModel:
             if node.input[j] == old_input_name:
                 node.input[j] = new_input_name
 
+    def replace_input_of_node(self, node, old_input_name, new_input_name):
+        """Replace an input of a node, and update the index."""
+        OnnxModel.replace_node_input(node, old_input_name, new_input_name)
+        self._reindex_node(node)
+
+    def set_node_input(self, node, i, new_input_name):
+        """Set the i-th input of a node, and update the index. The input is appended when i is the number of inputs."""
+        assert isinstance(new_input_name, str)
+        if i == len(node.input):
+            node.input.append(new_input_name)
+        else:
+            node.input[i] = new_input_name
+        self._reindex_node(node)
+
     def replace_input_of_all_nodes(self, old_input_name, new_input_name):
-        for node in self.model.graph.node:
-            OnnxModel.replace_node_input(node, old_input_name, new_input_name)
+        self._update_index()
+        for node in list(self._input_name_index.get(old_input_name, {}).values()):
+            if self._node_index[id(node)][1] == 0:  # Only nodes of the main graph
+                self.replace_input_of_node(node, old_input_name, new_input_name)
 
     @staticmethod
     def replace_node_output(node, old_output_name, new_output_name):
@@ -203,6 +371,17 @@ class OnnxModel:
             if node.output[j] == old_output_name:
                 node.output[j] = new_output_name
 
+    def replace_output_of_node(self, node, old_output_name, new_output_name):
+        """Replace an output of a node, and update the index."""
+        OnnxModel.replace_node_output(node, old_output_name, new_output_name)
+        self._reindex_node(node)
+
+    def set_node_output(self, node, i, new_output_name):
+        """Set the i-th output of a node, and update the index."""
+        assert isinstance(new_output_name, str)
+        node.output[i] = new_output_name
+        self._reindex_node(node)
+
     def replace_output_of_all_nodes(self, old_output_name, new_output_name):
         # This function shall be used carefully. For example:
         #       Add --[old_name]--> Cast ---> [new_name]
@@ -210,37 +389,64 @@ class OnnxModel:
         #        +----[old_name]--> Transpose -->
         # If we want to remove the Cast node: replace output of Add to new_name is not enough;
         # The input of Transpose shall also be updated to new_name.
-        for node in self.model.graph.node:
-            OnnxModel.replace_node_output(node, old_output_name, new_output_name)
+        self._update_index()
+        for node in list(self._output_name_index.get(old_output_name, {}).values()):
+            if self._node_index[id(node)][1] == 0:  # Only nodes of the main graph
+                self.replace_output_of_node(node, old_output_name, new_output_name)
 
     def get_initializer(self, name):
-        for graph in self.graphs():
-            for tensor in graph.initializer:
-                if tensor.name == name:
-                    return tensor
-        return None
+        self._update_index()
+        entry = self._initializer_index.get(name)
+        return entry[0] if entry is not None else None
 
     def get_nodes_by_op_type(self, op_type):
+        self._update_index()
         nodes = []
-        for node in self.nodes():
-            if node.op_type == op_type:
-                nodes.append(node)
+        for op_type_to_nodes in self._op_type_index:
+            if op_type in op_type_to_nodes:
+                # Nodes changed in place are moved to the end of the dictionary, so they are sorted in graph order.
+                node_ids = sorted(op_type_to_nodes[op_type], key=lambda node_id: self._node_index[node_id][2])
+                nodes.extend(self._node_index[node_id][0] for node_id in node_ids)
         return nodes
 
+    def get_consumers(self, input_name):
+        """Return the nodes that use an input name, like input_name_to_nodes()[input_name] but without scanning the
+        graphs. A node is listed once for each of its inputs with the name."""
+        self._update_index()
+        if input_name not in self._input_name_index:
+            return []
+        entries = [self._node_index[node_id] for node_id in self._input_name_index[input_name]]
+        entries.sort(key=lambda entry: (entry[1], entry[2]))  # in the order of nodes()
+        return [entry[0] for entry in entries for name in entry[4] if name == input_name]
+
+    def get_producer(self, output_name):
+        """Return the node that outputs a name, like output_name_to_node().get(output_name) but without scanning the
+        graphs."""
+        self._update_index()
+        if output_name not in self._output_name_index:
+            return None
+        # When there are multiple nodes, the last one in the order of nodes() is returned like output_name_to_node().
+        entries = [self._node_index[node_id] for node_id in self._output_name_index[output_name]]
+        return max(entries, key=lambda entry: (entry[1], entry[2]))[0]
+
     def get_children(self, node, input_name_to_nodes=None):
         if input_name_to_nodes is None:
-            input_name_to_nodes = self.input_name_to_nodes()
+            children = []
+            for output in node.output:
+                children.extend(self.get_consumers(output))
+            return children
 
         children = []
         for output in node.output:
             if output in input_name_to_nodes:
                 for node in input_name_to_nodes[output]:
-                    children.append(node)  # noqa: PERF402
+                    children.append(node)
         return children
 
     def get_parents(self, node, output_name_to_node=None):
         if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
+            parents = [self.get_producer(input) for input in node.input]
+            return [parent for parent in parents if parent is not None]
 
         parents = []
         for input in node.input:
@@ -249,12 +455,12 @@ class OnnxModel:
         return parents
 
     def get_parent(self, node, i, output_name_to_node=None):
-        if output_name_to_node is None:
-            output_name_to_node = self.output_name_to_node()
-
         if len(node.input) <= i:
             return None
 
+        if output_name_to_node is None:
+            return self.get_producer(node.input[i])
+
         input = node.input[i]
         if input not in output_name_to_node:
             return None
@@ -379,6 +585,14 @@ class OnnxModel:
         Returns:
             parents: a list of matched parent node.
         """
+        profiler = get_active_profiler()
+        if profiler is not None:
+            return profiler.profile_match(
+                self._match_parent_path, node, parent_op_types, parent_input_index, output_name_to_node, return_indice
+            )
+        return self._match_parent_path(node, parent_op_types, parent_input_index, output_name_to_node, return_indice)
+
+    def _match_parent_path(self, node, parent_op_types, parent_input_index, output_name_to_node, return_indice):
         if parent_input_index is not None:
             assert len(parent_input_index) == len(parent_op_types)
 
@@ -650,7 +864,7 @@ class OnnxModel:
             if node.op_type == "Cast":
                 parent = self.get_parent(node, 0, output_name_to_node=output_name_to_node)
                 if parent and parent.op_type == "Cast":
-                    node.input[0] = parent.input[0]
+                    self.set_node_input(node, 0, parent.input[0])
                     removed_count += 1
 
         if removed_count > 0:
@@ -676,9 +890,7 @@ class OnnxModel:
             graph_output_names = set(self.get_graphs_output_names())
             for node in nodes_to_remove:
                 if bool(set(node.output) & graph_output_names):
-                    if (not bool(set(node.input) & graph_input_names)) and len(
-                        self.input_name_to_nodes()[node.input[0]]
-                    ) == 1:
+                    if (not bool(set(node.input) & graph_input_names)) and len(self.get_consumers(node.input[0])) == 1:
                         self.replace_output_of_all_nodes(node.input[0], node.output[0])
                     else:
                         continue
@@ -730,6 +942,7 @@ class OnnxModel:
             max_finite_val (float, optional): maximal finite value. Defaults to 1e4.
             force_fp16_inputs(Dict[str, List[int]]): Force the conversion of the inputs of some operators to float16, even if
                                                      this script's preference it to keep them in float32.
+            num_threads (int, optional): number of threads to convert float initializers to float16. Defaults to 1.
         """
         if "keep_io_types" not in kwargs:
             kwargs["keep_io_types"] = True
@@ -781,6 +994,7 @@ class OnnxModel:
                     "node_block_list",
                     "force_fp16_initializers",
                     "force_fp16_inputs",
+                    "num_threads",
                 ]
                 if key in kwargs
             }
@@ -961,6 +1175,7 @@ class OnnxModel:
                 num_nodes_removed += 1
         self.model.graph.ClearField("node")
         self.model.graph.node.extend(nodes_to_keep)
+        self.invalidate_index()
 
         # Remove graph outputs not in list
         output_to_remove = []
@@ -994,18 +1209,17 @@ class OnnxModel:
     def update_graph(self, verbose=False, allow_remove_graph_inputs=False):
         graph = self.model.graph
 
-        remaining_input_names = []
+        # dict keeps the order of input names for logging, and lookups are O(1)
+        remaining_input_names = {}
         for node in graph.node:
             if node.op_type in ["Loop", "Scan", "If"]:
                 # TODO: handle inner graph
                 logger.debug(f"Skip update_graph since graph has operator: {node.op_type}")
                 return
             if node.op_type != "Constant":
-                for input_name in node.input:
-                    if input_name not in remaining_input_names:
-                        remaining_input_names.append(input_name)
+                remaining_input_names.update(dict.fromkeys(node.input))
         if verbose:
-            logger.debug(f"remaining input names: {remaining_input_names}")
+            logger.debug(f"remaining input names: {list(remaining_input_names)}")
 
         # remove graph input that is not used
         inputs_to_remove = []
@@ -1020,15 +1234,21 @@ class OnnxModel:
         logger.debug(f"remove {len(inputs_to_remove)} unused inputs: {names_to_remove}")
 
         # remove weights that are not used
+        graph_output_names = {output.name for output in graph.output}
         weights_to_remove = []
         weights_to_keep = []
-        for initializer in graph.initializer:
-            if initializer.name not in remaining_input_names and not self.find_graph_output(initializer.name):
+        positions_to_remove = []
+        for i, initializer in enumerate(graph.initializer):
+            if initializer.name not in remaining_input_names and initializer.name not in graph_output_names:
                 weights_to_remove.append(initializer)
+                positions_to_remove.append(i)
             else:
                 weights_to_keep.append(initializer.name)
+        for i in reversed(positions_to_remove):
+            del graph.initializer[i]
         for initializer in weights_to_remove:
-            graph.initializer.remove(initializer)
+            if self._initializer_index.get(initializer.name, (None,))[0] is initializer:
+                del self._initializer_index[initializer.name]
 
         names_to_remove = [initializer.name for initializer in weights_to_remove]
         logger.debug(f"remove {len(weights_to_remove)} unused initializers: {names_to_remove}")
@@ -1116,6 +1336,7 @@ class OnnxModel:
         # for graph in self.graphs():
         #    self.graph_topological_sort(graph)
         OnnxModel.graph_topological_sort(self.model.graph, is_deterministic)
+        self.invalidate_index()
 
     @staticmethod
     def save(
@@ -1220,11 +1441,36 @@ class OnnxModel:
         return op_count
 
     @staticmethod
-    def to_data_hash(tensor: TensorProto, base_dir: str = "") -> int:
+    def get_data_buffer(tensor: TensorProto, base_dir: str = ""):
+        """Returns data of a tensor as a buffer of bytes, or a tuple of bytes for string tensor.
+        External data is memory-mapped from its file instead of being loaded into the tensor.
+        Args:
+            tensor: a TensorProto object.
+            base_dir: if external tensor exists, base_dir can help to find the path to it
+        Returns:
+            buffer: bytes, a memory-mapped numpy array of uint8, or a tuple of bytes.
+        """
+        if tensor.data_type == TensorProto.STRING:
+            return tuple(tensor.string_data)
+        if uses_external_data(tensor):
+            info = ExternalDataInfo(tensor)
+            external_data_file_path = os.path.join(base_dir, info.location)
+            offset = info.offset or 0
+            length = info.length if info.length is not None else os.path.getsize(external_data_file_path) - offset
+            if length == 0:
+                return b""
+            return np.memmap(external_data_file_path, dtype=np.uint8, mode="r", offset=offset, shape=(length,))
+        if tensor.HasField("raw_data"):
+            return tensor.raw_data
+        return numpy_helper.to_array(tensor).tobytes()
+
+    @staticmethod
+    def to_data_hash(tensor: TensorProto, base_dir: str = "", data_buffer=None) -> int:
         """Converts a tensor def object to a hash for data comparison purposes.
         Args:
             tensor: a TensorProto object.
             base_dir: if external tensor exists, base_dir can help to find the path to it
+            data_buffer: data of the tensor from get_data_buffer, if it is already available.
         Returns:
             hash: a hash of the data.
         """
@@ -1232,20 +1478,24 @@ class OnnxModel:
             raise ValueError("Currently not supporting loading segments.")
         if tensor.data_type == TensorProto.UNDEFINED:
             raise TypeError("The element type in the input tensor is not defined.")
-        tensor_dtype = tensor.data_type
-        storage_field = helper.tensor_dtype_to_field(tensor_dtype)
 
+        if data_buffer is None:
+            data_buffer = OnnxModel.get_data_buffer(tensor, base_dir)
+        hasher = hashlib.blake2b(digest_size=8)
         if tensor.data_type == TensorProto.STRING:
-            utf8_strings = getattr(tensor, storage_field)
-            return hash(tuple(s.decode("utf-8") for s in utf8_strings))
-        # Load raw data from external tensor if it exists
-        if uses_external_data(tensor):
-            load_external_data_for_tensor(tensor, base_dir)
-        if tensor.HasField("raw_data"):
-            return hash(tensor.raw_data)
+            for s in data_buffer:
+                hasher.update(len(s).to_bytes(8, "little"))
+                hasher.update(s)
         else:
-            np_data = numpy_helper.to_array(tensor)
-            return hash(np_data.tobytes())
+            hasher.update(data_buffer)
+        return int.from_bytes(hasher.digest(), "little")
+
+    @staticmethod
+    def has_same_data_buffer(buffer1, buffer2) -> bool:
+        """Returns True when two buffers from get_data_buffer have same bytes."""
+        if isinstance(buffer1, tuple) or isinstance(buffer2, tuple):
+            return buffer1 == buffer2
+        return np.array_equal(np.frombuffer(buffer1, dtype=np.uint8), np.frombuffer(buffer2, dtype=np.uint8))
 
     @staticmethod
     def has_same_value(
@@ -1285,42 +1535,88 @@ class OnnxModel:
 
         return False
 
-    def remove_duplicated_initializer(self, cache: Optional[dict] = None):
+    def remove_duplicated_initializer(self, cache: Optional[dict] = None, base_dir: str = ""):
         """Remove initializers with duplicated values, and only keep the first one.
         It could help reduce size of models (like ALBert) with shared weights.
-        If require_raw_data passed, method will only compare raw_data initializers to speed runtime
-        Note: this function does not process subgraph.
+        Initializers are bucketed by data type, shape and hash of data, so only initializers in the same bucket
+        are compared byte by byte. An initializer of a subgraph could be replaced by one in the same graph
+        or in an outer graph. Data of external tensors is memory-mapped from files in base_dir.
+
+        Args:
+            cache (dict): Optional dictionary to store data signatures of initializers by name.
+            base_dir (str): directory of external data files, if initializers use external data that is not loaded.
         """
-        if len(self.graphs()) > 1:
-            logger.warning("remove_duplicated_initializer does not process subgraphs.")
+        # Graphs in breadth-first order so that outer graphs come first, and index of parent graph of each graph.
+        graphs = [self.model.graph]
+        parents = [-1]
+        for graph_index, graph in enumerate(graphs):
+            for node in graph.node:
+                for attr in node.attribute:
+                    if attr.type == AttributeProto.AttributeType.GRAPH:
+                        graphs.append(attr.g)
+                        parents.append(graph_index)
+                    elif attr.type == AttributeProto.AttributeType.GRAPHS:
+                        graphs.extend(attr.graphs)
+                        parents.extend([graph_index] * len(attr.graphs))
+
+        def is_visible(outer_graph_index, graph_index):
+            while graph_index >= 0:
+                if graph_index == outer_graph_index:
+                    return True
+                graph_index = parents[graph_index]
+            return False
 
-        initializer_count = len(self.model.graph.initializer)
+        buckets = {}  # (data_type, dims, hash) => list of (initializer, graph_index) to keep
+        replacements = [{} for _ in graphs]  # replacements[graph_index]: duplicated name => name to keep
+        positions_to_remove = [[] for _ in graphs]
+        for graph_index, graph in enumerate(graphs):
+            output_names = {output.name for output in graph.output}
+            for position, initializer in enumerate(graph.initializer):
+                data_buffer = None
+                if cache is not None and initializer.name in cache:
+                    signature = cache[initializer.name]
+                else:
+                    data_buffer = OnnxModel.get_data_buffer(initializer, base_dir)
+                    signature = OnnxModel.to_data_hash(initializer, data_buffer=data_buffer)
+                    if cache is not None:
+                        cache[initializer.name] = signature
+
+                kept = buckets.setdefault((initializer.data_type, tuple(initializer.dims), signature), [])
+                for kept_initializer, kept_graph_index in kept:
+                    if not is_visible(kept_graph_index, graph_index):
+                        continue
+                    if data_buffer is None:
+                        data_buffer = OnnxModel.get_data_buffer(initializer, base_dir)
+                    if OnnxModel.has_same_data_buffer(
+                        OnnxModel.get_data_buffer(kept_initializer, base_dir), data_buffer
+                    ):
+                        replacements[graph_index][initializer.name] = kept_initializer.name
+                        if initializer.name not in output_names:
+                            positions_to_remove[graph_index].append(position)
+                        break
+                else:
+                    kept.append((initializer, graph_index))
 
-        same = [-1] * initializer_count
-        for i in range(initializer_count - 1):
-            if same[i] >= 0:
-                continue
-            for j in range(i + 1, initializer_count):
-                if OnnxModel.has_same_value(
-                    self.model.graph.initializer[i],
-                    self.model.graph.initializer[j],
-                    cache,
-                    cache,
-                ):
-                    same[j] = i
-
-        count = 0
-        for i in range(initializer_count):
-            if same[i] >= 0:
-                count += 1
-                self.replace_input_of_all_nodes(
-                    self.model.graph.initializer[i].name,
-                    self.model.graph.initializer[same[i]].name,
-                )
+        count = sum(len(replacement) for replacement in replacements)
+        if count == 0:
+            return
 
-        if count > 0:
-            self.update_graph()
-            print(f"Removed {count} initializers with duplicated value")
+        for graph_index, graph in enumerate(graphs):
+            # Names of initializers in this graph and in outer graphs could be replaced.
+            if parents[graph_index] >= 0:
+                replacements[graph_index] = {**replacements[parents[graph_index]], **replacements[graph_index]}
+            replacement = replacements[graph_index]
+            if replacement:
+                for node in graph.node:
+                    for j, input_name in enumerate(node.input):
+                        if input_name in replacement:
+                            node.input[j] = replacement[input_name]
+            for position in reversed(positions_to_remove[graph_index]):
+                del graph.initializer[position]
+
+        self.invalidate_index()
+        self.update_graph()
+        print(f"Removed {count} initializers with duplicated value")
 
     def add_prefix_to_names(self, prefix: str):
         """Add prefix to initializer or intermediate outputs in graph. Main graph inputs and outputs are excluded.
@@ -1356,6 +1652,8 @@ class OnnxModel:
             if value_info.name not in excluded:
                 value_info.name = prefix + value_info.name
 
+        self.invalidate_index()
+
     def clean_shape_infer(self):
         self.model.graph.ClearField("value_info")
 
@@ -1448,10 +1746,10 @@ class OnnxModel:
                     to=int(graph_input.type.tensor_type.elem_type),
                     name=node_name,
                 )
-                graph.node.extend([new_cast_node])
+                self.add_node(new_cast_node)
 
                 for node in nodes_not_cast:
-                    OnnxModel.replace_node_input(node, graph_input.name, output_name)
+                    self.replace_input_of_node(node, graph_input.name, output_name)
 
             # For children that is Cast node, no need to insert Cast.
             # When the children is Cast to int32, we can remove that Cast node since input type is int32 now.
@@ -1504,7 +1802,7 @@ class OnnxModel:
             to=int(new_type),
             name=node_name,
         )
-        graph.node.extend([cast_node])
+        self.add_node(cast_node)
         graph_output.type.tensor_type.elem_type = int(new_type)
         return cast_node
 
@@ -244,7 +244,7 @@ class BertOnnxModel(OnnxModel):
                         and len(shape_value) == 1
                         and expand_shape_value[1] == shape_value[0]
                     ):
-                        node.input[0] = slice_node.output[0]
+                        self.set_node_input(node, 0, slice_node.output[0])
 
         if nodes_to_remove:
             self.remove_nodes(nodes_to_remove)
@@ -288,7 +288,7 @@ class BertOnnxModel(OnnxModel):
                         shape,
                     ) = parent_nodes
                     if shape.input[0] == self.graph().input[0].name:
-                        constantOfShape.input[0] = shape.output[0]
+                        self.set_node_input(constantOfShape, 0, shape.output[0])
                         output_name_to_node = self.output_name_to_node()
 
             if node.op_type == "Attention":
@@ -737,7 +737,7 @@ class T5OnnxModel(BertOnnxModel):
                     continue
 
                 rpb_node = rpb_nodes[0]
-                rpb_node.output[0] = node.output[0]
+                self.set_node_output(rpb_node, 0, node.output[0])
 
                 nodes_to_remove.extend(extended_mask_nodes)
                 nodes_to_remove.append(node)
@@ -773,7 +773,7 @@ class T5OnnxModel(BertOnnxModel):
                     continue
 
                 rpb_node = rpb_nodes[0]
-                rpb_node.output[0] = node.output[0]
+                self.set_node_output(rpb_node, 0, node.output[0])
 
                 nodes_to_remove.extend(extended_mask_nodes)
                 nodes_to_remove.append(node)
@@ -21,10 +21,12 @@ import argparse
 import logging
 import os
 import tempfile
+from contextlib import nullcontext
 from typing import Dict, List, Optional
 
 import coloredlogs
 from fusion_options import FusionOptions
+from fusion_profiler import FusionProfiler, profile_pass
 from onnx import ModelProto, TensorProto, load_model
 from onnx_model import OnnxModel
 from onnx_model_bart import BartOnnxModel
@@ -226,9 +228,11 @@ def optimize_by_fusion(
 
     optimizer = optimizer_class(model, num_heads, hidden_size)
 
-    optimizer.optimize(optimization_options)
+    with profile_pass("optimize", optimizer):
+        optimizer.optimize(optimization_options)
 
-    optimizer.topological_sort()
+    with profile_pass("topological_sort", optimizer):
+        optimizer.topological_sort()
 
     optimizer.model.producer_name = "onnxruntime.transformers"
     from onnxruntime import __version__ as onnxruntime_version
@@ -334,31 +338,33 @@ def optimize_model(
                 "BiasSoftmaxFusion",
             ]
         )
-        temp_model_path = optimize_by_onnxruntime(
-            input,
-            use_gpu=use_gpu,
-            provider=provider,
-            optimized_model_path=optimized_model_path,
-            opt_level=opt_level,
-            disabled_optimizers=disabled_optimizers,
-            verbose=verbose,
-            save_as_external_data=has_external_data_file,
-        )
+        with profile_pass("optimize_by_onnxruntime"):
+            temp_model_path = optimize_by_onnxruntime(
+                input,
+                use_gpu=use_gpu,
+                provider=provider,
+                optimized_model_path=optimized_model_path,
+                opt_level=opt_level,
+                disabled_optimizers=disabled_optimizers,
+                verbose=verbose,
+                save_as_external_data=has_external_data_file,
+            )
     elif opt_level == 1:
         # basic optimizations (like constant folding and cast elimination) are not specified to execution provider.
         # Note that use_gpu=False might cause extra Cast nodes for float16 model since most operators does not support float16 in CPU.
         # Sometime, use_gpu=True might cause extra memory copy nodes when some operators are supported only in CPU.
         # We might need remove GPU memory copy nodes as preprocess of optimize_by_fusion if they cause no matching in fusion.
-        temp_model_path = optimize_by_onnxruntime(
-            input,
-            use_gpu=use_gpu,
-            provider=provider,
-            optimized_model_path=optimized_model_path,
-            opt_level=1,
-            disabled_optimizers=disabled_optimizers,
-            verbose=verbose,
-            save_as_external_data=has_external_data_file,
-        )
+        with profile_pass("optimize_by_onnxruntime"):
+            temp_model_path = optimize_by_onnxruntime(
+                input,
+                use_gpu=use_gpu,
+                provider=provider,
+                optimized_model_path=optimized_model_path,
+                opt_level=1,
+                disabled_optimizers=disabled_optimizers,
+                verbose=verbose,
+                save_as_external_data=has_external_data_file,
+            )
 
     if only_onnxruntime and not temp_model_path:
         logger.warning("Please specify a positive value for opt_level when only_onnxruntime is True")
@@ -511,6 +517,23 @@ def _parse_arguments():
     )
     parser.set_defaults(convert_to_packing_mode=False)
 
+    parser.add_argument(
+        "--fusion_profile_json",
+        required=False,
+        type=str,
+        default=None,
+        help="save wall time, peak memory, nodes visited and matches attempted of each optimization pass and "
+        "match_parent_path call site to a json file",
+    )
+
+    parser.add_argument(
+        "--fusion_profile_trace",
+        required=False,
+        type=str,
+        default=None,
+        help="save optimization passes to a json file in Chrome trace event format",
+    )
+
     args = parser.parse_args()
 
     return args
@@ -538,17 +561,25 @@ def main():
 
     optimization_options = FusionOptions.parse(args)
 
-    optimizer = optimize_model(
-        args.input,
-        args.model_type,
-        args.num_heads,
-        args.hidden_size,
-        opt_level=args.opt_level,
-        optimization_options=optimization_options,
-        use_gpu=args.use_gpu,
-        provider=args.provider,
-        only_onnxruntime=args.only_onnxruntime,
-    )
+    profiler = FusionProfiler() if args.fusion_profile_json or args.fusion_profile_trace else None
+    with profiler or nullcontext():
+        optimizer = optimize_model(
+            args.input,
+            args.model_type,
+            args.num_heads,
+            args.hidden_size,
+            opt_level=args.opt_level,
+            optimization_options=optimization_options,
+            use_gpu=args.use_gpu,
+            provider=args.provider,
+            only_onnxruntime=args.only_onnxruntime,
+        )
+
+    if args.fusion_profile_json:
+        profiler.save_json(args.fusion_profile_json)
+
+    if args.fusion_profile_trace:
+        profiler.save_chrome_trace(args.fusion_profile_trace)
 
     if args.float16:
         optimizer.convert_float_to_float16(keep_io_types=True)
@@ -0,0 +1,441 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Streaming loader of profiling JSON files generated by ONNX Runtime.
+
+Profiles of long runs can be many GB, so events are parsed one at a time and aggregated into a ProfileSummary. The
+summary has one row per distinct event (like a node with an input shape, or a kernel with launch dimensions), so its
+size depends on the model instead of the number of runs. It can be saved to a compact NumPy .npz file, which
+profiler.py and profile_explorer.py reload instead of parsing the JSON file again.
+"""
+
+import json
+from collections import namedtuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy
+
+SUMMARY_FILE_SUFFIX = ".npz"
+
+# Columns identifying a row. Events with the same values are aggregated into one row.
+KEY_COLUMNS = [
+    "cat",
+    "name",
+    "op_name",  # None when the event has no op_name
+    "provider",
+    "input_type_shape",
+    "output_type_shape",
+    "dimensions",  # launch dimensions of GPU kernels
+    "initialization",  # whether the event is before the end of session initialization
+]
+
+ProfileRow = namedtuple("ProfileRow", [*KEY_COLUMNS, "duration", "count", "first_index"])
+
+
+def is_summary_file(path: str) -> bool:
+    return str(path).endswith(SUMMARY_FILE_SUFFIX)
+
+
+def shape_to_string(shape) -> str:
+    res = ""
+    for dict_obj in shape:
+        if len(dict_obj) > 1:
+            raise ValueError("Unhandled type in shape_to_string()")
+        key = next(iter(dict_obj.keys()))
+        value = next(iter(dict_obj.values()))
+        if len(res) != 0:
+            res += ","
+        res += f'{key}({"x".join(str(v) for v in value)})'
+    return res
+
+
+def iter_profile_events(profile_path: str, chunk_size: int = 1 << 22) -> Iterator[Dict[str, Any]]:
+    """Yields events of a profiling JSON file one at a time, reading at most a few chunks into memory.
+
+    The file is either a list of events, or a dictionary with the list of events in "traceEvents".
+    """
+    decoder = json.JSONDecoder()
+    with open(profile_path, encoding="utf-8") as file_obj:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def read_more():
+            nonlocal buffer, pos, eof
+            chunk = file_obj.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip(chars):
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in chars:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                read_more()
+
+        skip(" \t\r\n")
+        if buffer.startswith("{", pos):
+            while True:
+                start = buffer.find('"traceEvents"', pos)
+                if start >= 0:
+                    pos = start + len('"traceEvents"')
+                    break
+                if eof:
+                    raise ValueError(f"No traceEvents found in {profile_path}")
+                # Keep the tail in case the key is split across chunks.
+                pos = max(pos, len(buffer) - len('"traceEvents"'))
+                read_more()
+            skip(" \t\r\n:")
+
+        if not buffer.startswith("[", pos):
+            raise ValueError(f"Expect a list of events in {profile_path}")
+        pos += 1
+
+        while True:
+            skip(" \t\r\n,")
+            if pos >= len(buffer) or buffer[pos] == "]":
+                # A profile of a process that did not end profiling may miss the closing bracket.
+                return
+            try:
+                event, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            pos = end
+            yield event
+
+
+class ProfileSummary:
+    """Aggregated duration and count of profiling events, with one row per distinct event."""
+
+    def __init__(self, metadata: Optional[Dict[str, Any]] = None):
+        # Maps the key of a row to [total duration, count, index of the first event].
+        self._rows: Dict[tuple, List[int]] = {}
+        self.metadata = metadata or {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, key: tuple, duration: int, index: int):
+        row = self._rows.get(key)
+        if row is None:
+            self._rows[key] = [duration, 1, index]
+        else:
+            row[0] += duration
+            row[1] += 1
+
+    def merge(self, other: "ProfileSummary"):
+        for key, (duration, count, index) in other._rows.items():
+            row = self._rows.get(key)
+            if row is None:
+                self._rows[key] = [duration, count, index]
+            else:
+                row[0] += duration
+                row[1] += count
+                row[2] = min(row[2], index)
+
+    def rows(self) -> List[ProfileRow]:
+        """Returns rows in the order of their first events."""
+        return [ProfileRow(*key, *values) for key, values in sorted(self._rows.items(), key=lambda item: item[1][2])]
+
+    def save(self, path: str):
+        rows = self.rows()
+        columns = {}
+        for column in KEY_COLUMNS:
+            values = [getattr(row, column) for row in rows]
+            if column == "op_name":
+                columns["has_op_name"] = numpy.array([value is not None for value in values], dtype=bool)
+                values = [value or "" for value in values]
+            columns[column] = numpy.array(values, dtype=bool if column == "initialization" else str)
+        for column in ["duration", "count", "first_index"]:
+            columns[column] = numpy.array([getattr(row, column) for row in rows], dtype=numpy.int64)
+        numpy.savez_compressed(path, metadata=numpy.array(json.dumps(self.metadata)), **columns)
+
+    @classmethod
+    def load(cls, path: str) -> "ProfileSummary":
+        with numpy.load(path, allow_pickle=False) as data:
+            summary = cls(json.loads(str(data["metadata"])))
+            columns = {column: data[column].tolist() for column in [*KEY_COLUMNS, "has_op_name"]}
+            columns["op_name"] = [
+                op_name if has_op_name else None
+                for op_name, has_op_name in zip(columns["op_name"], columns.pop("has_op_name"))
+            ]
+            keys = zip(*(columns[column] for column in KEY_COLUMNS))
+            values = zip(data["duration"].tolist(), data["count"].tolist(), data["first_index"].tolist())
+            summary._rows = {key: list(value) for key, value in zip(keys, values)}
+        return summary
+
+
+def summarize_profile_events(
+    events: Iterable[Dict[str, Any]], start_run: Optional[int] = None, end_run: Optional[int] = None
+) -> ProfileSummary:
+    """Aggregates profiling events into a summary.
+
+    Args:
+        events: profiling events, like the ones yielded by iter_profile_events.
+        start_run: if given, only the events of model runs in [start_run, end_run) are aggregated. Events of a model
+            run end with its model_run event, so the events after the last model_run event are not aggregated. If
+            there is no model_run event, all events are aggregated as one run.
+        end_run: index of the model run after the last one to aggregate. None means the last model run.
+
+    Returns:
+        The summary, whose metadata has the number of model runs found and aggregated.
+    """
+    summary = ProfileSummary()
+    run_summary = ProfileSummary() if start_run is not None else summary
+    total_runs = 0
+    num_runs = 0
+    initialization = True
+    # GPU kernels have the input shape of the most recent node launching kernels in the aggregated model runs.
+    kernel_launch_shape = None
+
+    for index, event in enumerate(events):
+        name = event.get("name")
+        cat = event.get("cat")
+        if cat == "Session" and name == "session_initialization":
+            initialization = False
+
+        if name == "model_run":
+            if start_run is not None:
+                if total_runs >= start_run and (end_run is None or total_runs < end_run):
+                    summary.merge(run_summary)
+                    num_runs += 1
+                run_summary = ProfileSummary()
+            total_runs += 1
+            if total_runs == start_run:
+                kernel_launch_shape = None
+
+        duration = event.get("dur")
+        args = event.get("args")
+        if cat is None or duration is None or args is None:
+            continue
+
+        input_type_shape = shape_to_string(args["input_type_shape"]) if "input_type_shape" in args else ""
+        dimensions = ""
+        if cat == "Kernel":
+            dimensions = "b{}x{}x{},g{}x{}x{}".format(
+                *(args.get(dim, -1) for dim in ["block_x", "block_y", "block_z", "grid_x", "grid_y", "grid_z"])
+            )
+            input_type_shape = kernel_launch_shape if kernel_launch_shape is not None else "unknown"
+        elif name.endswith("kernel_time"):
+            kernel_launch_shape = input_type_shape
+
+        key = (
+            cat,
+            name,
+            args.get("op_name"),
+            args.get("provider", ""),
+            input_type_shape,
+            shape_to_string(args["output_type_shape"]) if "output_type_shape" in args else "",
+            dimensions,
+            initialization,
+        )
+        run_summary.add(key, duration, index)
+
+    if start_run is None:
+        num_runs = total_runs
+    elif total_runs == 0:
+        summary = run_summary
+
+    summary.metadata = {
+        "total_runs": total_runs,
+        "num_runs": max(num_runs, 1),
+        "start_run": start_run,
+        "end_run": end_run,
+    }
+    return summary
+
+
+def count_model_runs(profile_path: str) -> int:
+    return sum(1 for event in iter_profile_events(profile_path) if event.get("name") == "model_run")
+
+
+def load_profile_summary(
+    profile_path: str, start_run: Optional[int] = None, end_run: Optional[int] = None
+) -> ProfileSummary:
+    """Loads a summary saved by ProfileSummary.save, or summarizes a profiling JSON file with bounded memory."""
+    if is_summary_file(profile_path):
+        return ProfileSummary.load(profile_path)
+
+    summary = summarize_profile_events(iter_profile_events(profile_path), start_run, end_run)
+    summary.metadata["source"] = str(profile_path)
+    return summary
+
+
+def _get_node_times(summary: ProfileSummary) -> Dict[tuple, List[float]]:
+    # Maps (node name, op type, input shape) to [duration, calls] per model run of kernel time of nodes.
+    num_runs = summary.metadata.get("num_runs", 1)
+    node_times = {}
+    for row in summary.rows():
+        if row.cat == "Node" and row.op_name is not None and row.name.endswith("_kernel_time"):
+            key = (row.name[: -len("_kernel_time")], row.op_name, row.input_type_shape)
+            node_time = node_times.setdefault(key, [0.0, 0.0])
+            node_time[0] += row.duration / num_runs
+            node_time[1] += row.count / num_runs
+    return node_times
+
+
+def _get_kernel_times(summary: ProfileSummary) -> Dict[tuple, List[float]]:
+    # Maps (kernel name, op type, input shape) to [duration, calls] per model run of GPU kernels.
+    num_runs = summary.metadata.get("num_runs", 1)
+    kernel_times = {}
+    for row in summary.rows():
+        if row.cat == "Kernel" and not row.initialization:
+            key = (row.name, row.op_name or "", row.input_type_shape)
+            kernel_time = kernel_times.setdefault(key, [0.0, 0.0])
+            kernel_time[0] += row.duration / num_runs
+            kernel_time[1] += row.count / num_runs
+    return kernel_times
+
+
+def _group_times(times: Dict[tuple, List[float]], key_index: int) -> Dict[str, float]:
+    grouped = {}
+    for key, (duration, _) in times.items():
+        grouped[key[key_index]] = grouped.get(key[key_index], 0.0) + duration
+    return grouped
+
+
+ProfileDelta = namedtuple("ProfileDelta", ["key", "baseline", "target", "delta", "ratio", "regression"])
+
+
+class ProfileDiff:
+    """Differences of latency per model run between a baseline profile and a target profile.
+
+    Nodes are aligned by node name, op type and input shape, and GPU kernels by kernel name, op type and input shape.
+    A regression is an increase of latency of the total, an op type, an aligned node or an aligned kernel, which is
+    larger than `threshold` times the baseline latency and `min_delta` microseconds. Op types, nodes and kernels that
+    exist in only one of the profiles are reported as added or removed, not as regressions, since they are expected
+    when fusions change.
+    """
+
+    def __init__(self, baseline: ProfileSummary, target: ProfileSummary, threshold: float = 0.1, min_delta: float = 0):
+        self.threshold = threshold
+        self.min_delta = min_delta
+
+        baseline_nodes, target_nodes = _get_node_times(baseline), _get_node_times(target)
+        baseline_kernels, target_kernels = _get_kernel_times(baseline), _get_kernel_times(target)
+
+        self.total = self._compare(
+            "total",
+            sum(duration for duration, _ in baseline_nodes.values()),
+            sum(duration for duration, _ in target_nodes.values()),
+        )
+        self.op_deltas = self._compare_all(_group_times(baseline_nodes, 1), _group_times(target_nodes, 1))
+        self.node_deltas = self._compare_all(
+            {key: duration for key, (duration, _) in baseline_nodes.items()},
+            {key: duration for key, (duration, _) in target_nodes.items()},
+        )
+        self.kernel_deltas = self._compare_all(
+            {key: duration for key, (duration, _) in baseline_kernels.items()},
+            {key: duration for key, (duration, _) in target_kernels.items()},
+        )
+
+        baseline_ops, target_ops = set(_group_times(baseline_nodes, 1)), set(_group_times(target_nodes, 1))
+        self.added_ops = sorted(target_ops - baseline_ops)
+        self.removed_ops = sorted(baseline_ops - target_ops)
+        self.added_kernels = sorted(key for key in target_kernels if key not in baseline_kernels)
+        self.removed_kernels = sorted(key for key in baseline_kernels if key not in target_kernels)
+
+        # Nodes in both profiles, but with different input shapes.
+        baseline_shapes, target_shapes = {}, {}
+        for shapes, nodes in [(baseline_shapes, baseline_nodes), (target_shapes, target_nodes)]:
+            for node_name, op_name, input_type_shape in nodes:
+                shapes.setdefault((node_name, op_name), set()).add(input_type_shape)
+        self.shape_changes = {
+            node: (sorted(baseline_shapes[node]), sorted(target_shapes[node]))
+            for node in baseline_shapes
+            if node in target_shapes and baseline_shapes[node] != target_shapes[node]
+        }
+        self.added_nodes = sorted(node for node in target_shapes if node not in baseline_shapes)
+        self.removed_nodes = sorted(node for node in baseline_shapes if node not in target_shapes)
+
+    def _compare(self, key, baseline: float, target: float) -> ProfileDelta:
+        delta = target - baseline
+        ratio = delta / baseline if baseline > 0 else None
+        regression = ratio is not None and ratio > self.threshold and delta > self.min_delta
+        return ProfileDelta(key, baseline, target, delta, ratio, regression)
+
+    def _compare_all(self, baseline: Dict[Any, float], target: Dict[Any, float]) -> List[ProfileDelta]:
+        """Compares items in both profiles, sorted by the absolute latency delta in descending order."""
+        deltas = [self._compare(key, baseline[key], target[key]) for key in baseline if key in target]
+        return sorted(deltas, key=lambda delta: abs(delta.delta), reverse=True)
+
+    @property
+    def regressions(self) -> List[ProfileDelta]:
+        deltas = [self.total, *self.op_deltas, *self.node_deltas, *self.kernel_deltas]
+        return [delta for delta in deltas if delta.regression]
+
+    def to_dict(self) -> Dict[str, Any]:
+        def delta_to_dict(delta: ProfileDelta):
+            return {**delta._asdict(), "key": list(delta.key) if isinstance(delta.key, tuple) else delta.key}
+
+        return {
+            "threshold": self.threshold,
+            "min_delta": self.min_delta,
+            "total": delta_to_dict(self.total),
+            "regressions": [delta_to_dict(delta) for delta in self.regressions],
+            "ops": [delta_to_dict(delta) for delta in self.op_deltas],
+            "nodes": [delta_to_dict(delta) for delta in self.node_deltas],
+            "kernels": [delta_to_dict(delta) for delta in self.kernel_deltas],
+            "added_ops": self.added_ops,
+            "removed_ops": self.removed_ops,
+            "added_nodes": [list(node) for node in self.added_nodes],
+            "removed_nodes": [list(node) for node in self.removed_nodes],
+            "shape_changes": [
+                {"node": list(node), "baseline": baseline_shapes, "target": target_shapes}
+                for node, (baseline_shapes, target_shapes) in self.shape_changes.items()
+            ],
+            "added_kernels": [list(kernel) for kernel in self.added_kernels],
+            "removed_kernels": [list(kernel) for kernel in self.removed_kernels],
+        }
+
+    def format(self, top: int = 40) -> List[str]:
+        """Returns lines of the report, with at most `top` items in each section."""
+
+        def delta_line(delta: ProfileDelta, name: str):
+            ratio = f"{delta.ratio * 100.0:+8.2f}" if delta.ratio is not None else "     n/a"
+            flag = "REGRESSION" if delta.regression else ""
+            return f"{delta.baseline:12.1f}\t{delta.target:12.1f}\t{delta.delta:+12.1f}\t{ratio}\t{flag:10s}\t{name}"
+
+        header = "Baseline(μs)\tTarget(μs)\tDelta(μs)\tDelta%\tFlag\tName"
+        lines = [
+            f"\nLatency per model run (regression: increase > {self.threshold * 100:.2f}% and > {self.min_delta} μs):",
+            "-" * 64,
+            header,
+            delta_line(self.total, "Total"),
+        ]
+        for title, deltas in [("operator", self.op_deltas), ("node", self.node_deltas), ("kernel", self.kernel_deltas)]:
+            if not deltas:
+                continue
+            lines += [f"\nTop latency changes by {title}:", "-" * 64, header]
+            for delta in deltas[:top]:
+                name = " ".join(delta.key) if isinstance(delta.key, tuple) else delta.key
+                lines.append(delta_line(delta, name))
+
+        for title, items in [
+            ("Added operators", self.added_ops),
+            ("Removed operators", self.removed_ops),
+            ("Added nodes", [" ".join(node) for node in self.added_nodes]),
+            ("Removed nodes", [" ".join(node) for node in self.removed_nodes]),
+            ("Added kernels", [" ".join(kernel) for kernel in self.added_kernels]),
+            ("Removed kernels", [" ".join(kernel) for kernel in self.removed_kernels]),
+        ]:
+            if items:
+                lines += [f"\n{title} ({len(items)}):", "-" * 64, *items[:top]]
+
+        if self.shape_changes:
+            lines += [f"\nNodes with changed input shapes ({len(self.shape_changes)}):", "-" * 64]
+            for (node_name, op_name), (baseline_shapes, target_shapes) in list(self.shape_changes.items())[:top]:
+                lines.append(f"{node_name} {op_name}: {';'.join(baseline_shapes)} -> {';'.join(target_shapes)}")
+
+        regressions = self.regressions
+        lines.append(f"\n{len(regressions)} regression(s) found.")
+        return lines
@@ -5,6 +5,7 @@ import os
 import numpy
 import psutil
 from onnx import TensorProto
+from profile_summary import ProfileDiff, ProfileSummary, load_profile_summary, summarize_profile_events
 
 """
 This profiler tool could run a transformer model and print out the kernel time spent on each Node of the model.
@@ -16,6 +17,12 @@ Example of importing profile result file from onnxruntime_perf_test:
 
 NODES_TYPE_CONTAINING_SUBGRAPH = ["Scan", "Loop", "If"]
 
+PROVIDER_SHORT_NAMES = {
+    "CPUExecutionProvider": "CPU",
+    "CUDAExecutionProvider": "CUDA",
+    "DmlExecutionProvider": "DML",
+}
+
 
 def parse_arguments(argv=None):
     parser = argparse.ArgumentParser()
@@ -25,7 +32,32 @@ def parse_arguments(argv=None):
         "--input",
         required=False,
         type=str,
-        help="Set the input file for reading the profile results",
+        help="Set the input file for reading the profile results. It could be a profiling JSON file, or a summary "
+        "saved by --save_summary which is reloaded instantly",
+    )
+
+    parser.add_argument(
+        "--save_summary",
+        required=False,
+        type=str,
+        default=None,
+        help="Save a compact summary of the profile results to a .npz file, which can be used as --input later",
+    )
+
+    parser.add_argument(
+        "--baseline",
+        required=False,
+        type=str,
+        default=None,
+        help="Profiling JSON file or summary of a baseline. When specified, latency changes against it are reported",
+    )
+
+    parser.add_argument(
+        "--regression_threshold",
+        required=False,
+        type=float,
+        default=0.1,
+        help="Relative increase of latency of the total, an operator or a node, to be reported as a regression",
     )
 
     parser.add_argument(
@@ -186,11 +218,16 @@ def load_profile_json(profile_file):
     return sess_time
 
 
+def _get_summary(sess_time):
+    # Profile data could be a list of events loaded by load_profile_json, or a summary loaded by load_profile_summary.
+    return sess_time if isinstance(sess_time, ProfileSummary) else summarize_profile_events(sess_time)
+
+
 def parse_kernel_results(sess_time, threshold=0):
     """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
 
     Args:
-        sess_time (List[Dict]): profile data
+        sess_time (Union[List[Dict], ProfileSummary]): profile data
         kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
         threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
 
@@ -201,18 +238,15 @@ def parse_kernel_results(sess_time, threshold=0):
     kernel_time = {}
     kernel_freq = {}
     total = 0
-    session_init = False
-    for item in sess_time:
+    for row in _get_summary(sess_time).rows():
         # Skip all MemcpyHostToDevice before session_initialization
-        if item["cat"] == "Session" and item["name"] == "session_initialization":
-            session_init = True
-        if not session_init:
+        if row.initialization:
             continue
 
-        if item["cat"] == "Kernel" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            kernel_name = item["name"]
+        if row.cat == "Kernel" and row.op_name is not None:
+            kernel_name = row.name
 
-            op_name = item["args"]["op_name"]
+            op_name = row.op_name
             if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
                 continue
 
@@ -221,14 +255,14 @@ def parse_kernel_results(sess_time, threshold=0):
                 op_name = f"({kernel_name})"
 
             if kernel_name in kernel_time:
-                kernel_time[kernel_name] += item["dur"]
-                kernel_freq[kernel_name] += 1
+                kernel_time[kernel_name] += row.duration
+                kernel_freq[kernel_name] += row.count
             else:
-                kernel_time[kernel_name] = item["dur"]
-                kernel_freq[kernel_name] = 1
+                kernel_time[kernel_name] = row.duration
+                kernel_freq[kernel_name] = row.count
                 kernel_name_to_op_name[kernel_name] = op_name
 
-            total += item["dur"]
+            total += row.duration
 
     if not kernel_time:
         return ["No kernel record found!"]
@@ -270,7 +304,7 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
     """Parse profile data and output nodes in two sections - nodes in the original order, and top expensive nodes.
 
     Args:
-        sess_time (List[Dict]): profile data
+        sess_time (Union[List[Dict], ProfileSummary]): profile data
         kernel_time_only (bool, optional): Only include items for kernel time. Defaults to False.
         threshold (int, optional): Minimum ratio of duration among all. Defaults to 0.
 
@@ -282,20 +316,12 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
     node_freq = {}
     node_provider = {}
     total = 0
-    for item in sess_time:
-        if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            node_name = (
-                item["name"].replace("_kernel_time", "").replace("_fence_before", "").replace("_fence_after", "")
-            )
-
-            if "provider" in item["args"]:
-                if item["args"]["provider"] == "CPUExecutionProvider":
-                    device = "CPU"
-                elif item["args"]["provider"] == "CUDAExecutionProvider":
-                    device = "CUDA"
-                elif item["args"]["provider"] == "DmlExecutionProvider":
-                    device = "DML"
+    for row in _get_summary(sess_time).rows():
+        if row.cat == "Node" and row.op_name is not None:
+            node_name = row.name.replace("_kernel_time", "").replace("_fence_before", "").replace("_fence_after", "")
 
+            if row.provider:
+                device = PROVIDER_SHORT_NAMES.get(row.provider, row.provider.replace("ExecutionProvider", ""))
                 if node_name not in node_provider:
                     node_provider[node_name] = device
                 else:
@@ -303,19 +329,19 @@ def parse_node_results(sess_time, kernel_time_only=False, threshold=0):
             elif kernel_time_only:
                 continue
 
-            op_name = item["args"]["op_name"]
+            op_name = row.op_name
             if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
                 continue
 
             if node_name in node_time:
-                node_time[node_name] += item["dur"]
-                node_freq[node_name] += 1
+                node_time[node_name] += row.duration
+                node_freq[node_name] += row.count
             else:
-                node_time[node_name] = item["dur"]
-                node_freq[node_name] = 1
+                node_time[node_name] = row.duration
+                node_freq[node_name] = row.count
                 node_name_list.append(node_name)
 
-            total += item["dur"]
+            total += row.duration
 
     # Output items in the original order.
     lines = [
@@ -357,7 +383,7 @@ def group_node_results(sess_time, kernel_time_only, use_gpu):
     """Group results by operator name.
 
     Args:
-        sess_time (List[Dict]): profile data
+        sess_time (Union[List[Dict], ProfileSummary]): profile data
         kernel_time_only (bool): Only include items for kernel time.
         use_gpu (bool): GPU is used in profiling or not.
 
@@ -376,50 +402,50 @@ def group_node_results(sess_time, kernel_time_only, use_gpu):
     total_fence_time = 0
 
     provider_counter = {}
-    for item in sess_time:
-        if item["cat"] == "Node" and "dur" in item and "args" in item and "op_name" in item["args"]:
-            op_name = item["args"]["op_name"]
+    for row in _get_summary(sess_time).rows():
+        if row.cat == "Node" and row.op_name is not None:
+            op_name = row.op_name
 
             # TODO: shall we have a separated group for nodes with subgraph?
             if op_name in NODES_TYPE_CONTAINING_SUBGRAPH:
                 continue
 
-            if "provider" not in item["args"]:
-                if "fence" in item["name"]:
+            if not row.provider:
+                if "fence" in row.name:
                     if op_name in op_fence_time:
-                        op_fence_time[op_name] += item["dur"]
+                        op_fence_time[op_name] += row.duration
                     else:
-                        op_fence_time[op_name] = item["dur"]
-                    total_fence_time += item["dur"]
+                        op_fence_time[op_name] = row.duration
+                    total_fence_time += row.duration
                 continue
 
-            provider = item["args"]["provider"] if "provider" in item["args"] else ""
+            provider = row.provider
             if provider in provider_counter:
-                provider_counter[provider] += 1
+                provider_counter[provider] += row.count
             else:
-                provider_counter[provider] = 1
+                provider_counter[provider] = row.count
 
             key = f"{provider}:{op_name}"
             if key in provider_op_kernel_time:
-                provider_op_kernel_time[key] += item["dur"]
-                provider_op_kernel_records[key] += 1
+                provider_op_kernel_time[key] += row.duration
+                provider_op_kernel_records[key] += row.count
             else:
-                provider_op_kernel_time[key] = item["dur"]
-                provider_op_kernel_records[key] = 1
+                provider_op_kernel_time[key] = row.duration
+                provider_op_kernel_records[key] = row.count
 
             if provider in provider_kernel_time:
-                provider_kernel_time[provider] += item["dur"]
+                provider_kernel_time[provider] += row.duration
             else:
-                provider_kernel_time[provider] = item["dur"]
+                provider_kernel_time[provider] = row.duration
 
             if op_name in op_kernel_time:
-                op_kernel_time[op_name] += item["dur"]
-                op_kernel_records[op_name] += 1
+                op_kernel_time[op_name] += row.duration
+                op_kernel_records[op_name] += row.count
             else:
-                op_kernel_time[op_name] = item["dur"]
-                op_kernel_records[op_name] = 1
+                op_kernel_time[op_name] = row.duration
+                op_kernel_records[op_name] = row.count
 
-            total_kernel_time += item["dur"]
+            total_kernel_time += row.duration
 
     lines = ["", "Grouped by operator"]
     lines.append("-" * 64)
@@ -640,7 +666,11 @@ def create_longformer_inputs(onnx_model, batch_size, sequence_length, global_len
 
 
 def process_results(profile_file, args):
-    profile_records = load_profile_json(profile_file)
+    print(f"loading profile output {profile_file} ...")
+    profile_records = load_profile_summary(profile_file)
+    if getattr(args, "save_summary", None):
+        profile_records.save(args.save_summary)
+        print(f"saved profile summary to {args.save_summary}")
 
     lines = parse_kernel_results(profile_records, args.threshold)
 
@@ -648,6 +678,11 @@ def process_results(profile_file, args):
 
     lines += group_node_results(profile_records, args.kernel_time_only, args.use_gpu)
 
+    if getattr(args, "baseline", None):
+        print(f"loading baseline profile {args.baseline} ...")
+        baseline_records = load_profile_summary(args.baseline)
+        lines += ProfileDiff(baseline_records, profile_records, args.regression_threshold).format()
+
     return lines
 
 
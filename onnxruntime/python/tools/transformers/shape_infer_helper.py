@@ -6,7 +6,7 @@
 import logging
 import os
 import sys
-from typing import Dict
+from typing import Dict, Optional
 
 # In ORT Package the symbolic_shape_infer.py is in ../tools
 file_path = os.path.dirname(__file__)
@@ -21,12 +21,31 @@ logger = logging.getLogger(__name__)
 
 
 class SymbolicShapeInferenceHelper(SymbolicShapeInference):
-    def __init__(self, model, verbose=0, int_max=2**31 - 1, auto_merge=True, guess_output_rank=False):
+    def __init__(
+        self,
+        model,
+        verbose=0,
+        int_max=2**31 - 1,
+        auto_merge=True,
+        guess_output_rank=False,
+        previous: Optional["SymbolicShapeInferenceHelper"] = None,
+    ):
+        """
+        Args:
+            previous (SymbolicShapeInferenceHelper, optional): helper of the model before a change. Its inference
+                results are reused for nodes not impacted by the change, so only nodes downstream are inferred again.
+        """
         super().__init__(int_max, auto_merge, guess_output_rank, verbose)
         self.model_ = model
         self.all_shapes_inferred_: bool = False
         self.is_inferred_: bool = False
         self.dynamic_axis_mapping_: Dict[str, int] = {}
+        # enable incremental inference
+        if previous is not None and previous.node_cache_ is not None:
+            self.node_cache_ = previous.node_cache_
+            self.onnx_infer_cache_ = previous.onnx_infer_cache_
+        else:
+            self.node_cache_ = {}
 
     def infer(self, dynamic_axis_mapping: Dict[str, int], max_runs: int = 200):
         """Run shape inference, and try replace dynamic axis from string to integer when mapping is provided.
@@ -77,6 +96,13 @@ class SymbolicShapeInferenceHelper(SymbolicShapeInference):
                     sympy_shape.append(dim)
         return sympy_shape
 
+    def _get_node_cache_key(self, node):
+        """Override it since the result depends on the actual value of dynamic axis."""
+        cache_key = super()._get_node_cache_key(node)
+        if cache_key is None:
+            return None
+        return (*cache_key, tuple(sorted(self.dynamic_axis_mapping_.items())))
+
     def get_edge_shape(self, edge):
         """Get shape of an edge.
 
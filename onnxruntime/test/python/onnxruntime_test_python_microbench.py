@@ -0,0 +1,186 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import csv
+import json
+import os
+import sys
+import tempfile
+import types
+import unittest
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from unittest import mock
+
+import numpy
+
+microbench_dir = os.path.join(os.path.dirname(__file__), "..", "..", "python", "tools", "microbench")
+if not os.path.exists(os.path.join(microbench_dir, "benchmark.py")):
+    # The microbenchmarks are not installed with the onnxruntime package.
+    raise unittest.SkipTest("onnxruntime/python/tools/microbench is not found")
+
+sys.path.append(microbench_dir)
+import benchmark  # noqa: E402
+
+
+class FakeClock:
+    """A stub of time.perf_counter_ns, which advances only when a fake session runs."""
+
+    def __init__(self):
+        self.now_ns = 0
+
+    def perf_counter_ns(self):
+        return self.now_ns
+
+
+class FakeSession:
+    """Runs an iteration by advancing the fake clock by the next duration in milliseconds, cycling through them."""
+
+    def __init__(self, clock, durations_ms):
+        self.clock = clock
+        self.durations_ms = durations_ms
+        self.runs = 0
+
+    def run_with_iobinding(self, io_binding):
+        self.clock.now_ns += int(self.durations_ms[self.runs % len(self.durations_ms)] * 1e6)
+        self.runs += 1
+
+
+def parse_args(arguments):
+    parser = ArgumentParser()
+    benchmark.add_arguments(parser)
+    return parser.parse_args(["--provider", "cpu", *arguments])
+
+
+@dataclass
+class FakeParam:
+    batch_size: int
+    dtype: type = numpy.float16
+
+
+class FakeBenchmarkOp(benchmark.BenchmarkOp):
+    @classmethod
+    def create_inputs_outputs(cls, op_param):
+        return {}, {}
+
+    def create_cases(self):
+        for batch_size in [1, 8]:
+            self.add_case(FakeParam(batch_size), f"model_{batch_size}.onnx")
+
+    @classmethod
+    def case_profile(cls, op_param, time):
+        return f"batch_size {op_param.batch_size}: {time:.4f} ms"
+
+
+class TestMicrobenchmark(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.durations_ms = [1.0]
+        self.sessions = []
+
+        def create_session(bm, intra_op_num_threads=None):
+            self.sessions.append(FakeSession(self.clock, self.durations_ms))
+            return self.sessions[-1]
+
+        patches = [
+            mock.patch.object(benchmark, "time", types.SimpleNamespace(perf_counter_ns=self.clock.perf_counter_ns)),
+            mock.patch.object(benchmark.Benchmark, "create_session", create_session),
+            mock.patch.object(benchmark.Benchmark, "create_input_output_tensors", lambda bm: ({}, {})),
+            mock.patch.object(benchmark.Benchmark, "create_io_binding", lambda bm, sess, inputs, outputs: None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def measure(self, arguments):
+        return benchmark.Benchmark("model.onnx", {}, {}, parse_args(arguments)).measure()
+
+    def test_benchmark_result(self):
+        result = benchmark.BenchmarkResult.from_iteration_times([4000000, 1000000, 3000000, 2000000], 2)
+        std = numpy.std([1.0, 2.0, 3.0, 4.0], ddof=1)
+        self.assertEqual((result.mean, result.min, result.max, result.iters), (2.5, 1.0, 4.0, 4))
+        self.assertAlmostEqual(result.std, std)
+        self.assertAlmostEqual(result.ci, 1.96 * std / 2)
+        self.assertAlmostEqual(result.p50, 2.5)
+        self.assertAlmostEqual(result.p90, 3.7)
+        self.assertAlmostEqual(result.p99, 3.97)
+        self.assertEqual(
+            str(result),
+            "mean  2.5000 ms +- 1.2652, p50  2.5000 ms, p90  3.7000 ms, p99  3.9700 ms, 4 iters, 2 threads",
+        )
+
+        result = benchmark.BenchmarkResult.from_iteration_times([1500000])
+        self.assertEqual((result.mean, result.std, result.ci, result.iters), (1.5, 0.0, 0.0, 1))
+        self.assertIn("1 iters, default threads", str(result))
+
+    def test_fixed_iterations(self):
+        self.durations_ms[:] = [1.0, 3.0]
+        result = self.measure(["--warmup_iters", "3", "--min_iters", "10"])
+
+        # Warm up iterations are not measured. Without --target_ci, exactly --min_iters iterations are measured.
+        self.assertEqual(self.sessions[0].runs, 13)
+        self.assertEqual(result.iters, 10)
+        self.assertEqual((result.min, result.max), (1.0, 3.0))
+        self.assertAlmostEqual(result.mean, 2.0)
+
+    def test_adaptive_iterations(self):
+        # Stable iterations converge once --min_iters iterations are measured.
+        result = self.measure(["--warmup_iters", "0", "--min_iters", "5", "--target_ci", "0.01"])
+        self.assertEqual(result.iters, 5)
+        self.assertEqual(result.ci, 0.0)
+
+        # Noisy iterations are measured until the confidence interval is within 10% of the mean.
+        self.durations_ms[:] = [1.0, 3.0]
+        result = self.measure(["--warmup_iters", "0", "--min_iters", "5", "--target_ci", "0.1"])
+        self.assertLessEqual(result.ci, 0.1 * result.mean)
+        times_ns = [int(duration * 1e6) for duration in [1.0, 3.0] * result.iters][: result.iters - 1]
+        previous = benchmark.BenchmarkResult.from_iteration_times(times_ns)
+        self.assertGreater(previous.ci, 0.1 * previous.mean)
+
+        # Or until --max_iters iterations are measured.
+        result = self.measure(["--warmup_iters", "0", "--min_iters", "5", "--target_ci", "0.01", "--max_iters", "50"])
+        self.assertEqual(result.iters, 50)
+
+        # Or until --max_seconds elapsed, which does not stop before --min_iters iterations.
+        arguments = ["--warmup_iters", "0", "--target_ci", "0.01", "--max_seconds", "0.1"]
+        self.assertEqual(self.measure([*arguments, "--min_iters", "5"]).iters, 51)
+        self.assertEqual(self.measure([*arguments, "--min_iters", "60"]).iters, 60)
+
+    def test_write_results(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_path = os.path.join(temp_dir, "results.json")
+            csv_path = os.path.join(temp_dir, "results.csv")
+            arguments = ["--warmup_iters", "0", "--min_iters", "4", "--intra_op_num_threads", "1", "2"]
+            arguments += ["--output_json", json_path, "--output_csv", csv_path]
+            records = FakeBenchmarkOp(parse_args(arguments)).benchmark()
+
+            # One record per case and thread count.
+            self.assertEqual(
+                [(record["model"], record["intra_op_num_threads"]) for record in records],
+                [("model_1.onnx", 1), ("model_1.onnx", 2), ("model_8.onnx", 1), ("model_8.onnx", 2)],
+            )
+            self.assertEqual(records[0]["params"], {"batch_size": 1, "dtype": "float16"})
+            self.assertEqual(
+                (records[0]["benchmark"], records[0]["iters"], records[0]["mean"]), ("FakeBenchmarkOp", 4, 1.0)
+            )
+
+            with open(json_path) as f:
+                results = json.load(f)
+            self.assertEqual(results["results"], records)
+            self.assertEqual(results["environment"]["provider"], "CPUExecutionProvider")
+            self.assertIn("onnxruntime_version", results["environment"])
+
+            # Params and environment are flattened into columns, except the build info.
+            with open(csv_path, newline="") as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(len(rows), 4)
+            self.assertEqual(
+                (rows[3]["model"], rows[3]["batch_size"], rows[3]["dtype"]), ("model_8.onnx", "8", "float16")
+            )
+            self.assertEqual((rows[3]["intra_op_num_threads"], rows[3]["provider"]), ("2", "CPUExecutionProvider"))
+            self.assertNotIn("params", rows[0])
+            self.assertNotIn("onnxruntime_build_info", rows[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
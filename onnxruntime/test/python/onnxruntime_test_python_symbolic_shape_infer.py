@@ -717,5 +717,82 @@ class TestSymbolicShapeInferenceForSlice(unittest.TestCase):
         self.assertEqual(output_dims[0].dim_param, "N")
 
 
+class TestSymbolicShapeInferenceIncremental(unittest.TestCase):
+    class CountingInference(SymbolicShapeInference):
+        def _infer_node(self, node):
+            self.inferred_nodes_.append(node.name)
+            return super()._infer_node(node)
+
+    def create_model(self, num_layers):
+        #  (input) -> [Shape -> Reshape -> Relu] * num_layers -> (output), with nodes in reverse order
+        nodes = []
+        for i in range(num_layers):
+            layer_input = f"relu_{i - 1}" if i > 0 else "input"
+            nodes.append(helper.make_node("Shape", [layer_input], [f"shape_{i}"], name=f"shape_{i}"))
+            nodes.append(
+                helper.make_node("Reshape", [layer_input, f"shape_{i}"], [f"reshape_{i}"], name=f"reshape_{i}")
+            )
+            nodes.append(helper.make_node("Relu", [f"reshape_{i}"], [f"relu_{i}"], name=f"relu_{i}"))
+        graph = helper.make_graph(
+            list(reversed(nodes)),
+            "layers",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", 8])],
+            [helper.make_tensor_value_info(f"relu_{num_layers - 1}", TensorProto.FLOAT, None)],
+        )
+        return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+    def infer(self, model, node_cache=None, onnx_infer_cache=None):
+        inference = self.CountingInference(2**31 - 1, True, False, 0)
+        inference.inferred_nodes_ = []
+        inference.node_cache_ = node_cache
+        if onnx_infer_cache is not None:
+            inference.onnx_infer_cache_ = onnx_infer_cache
+        inference._preprocess(model)
+        while inference.run_:
+            self.assertTrue(inference._infer_impl())
+        inference._update_output_from_vi()
+        return inference
+
+    def test_sort_nodes(self):
+        model = self.create_model(3)
+        nodes = list(model.graph.node)
+        prereqs = [set(node.input) for node in nodes]
+        sorted_nodes = SymbolicShapeInference._sort_nodes(nodes, prereqs, {"input"}, ["relu_2"])
+        self.assertEqual([node.name for node in sorted_nodes], [node.name for node in reversed(nodes)])
+        self.assertEqual(
+            sorted_nodes, SymbolicShapeInference._sort_nodes_by_sweeps(nodes, prereqs, {"input"}, ["relu_2"])
+        )
+
+        # dead nodes are excluded, and a node depending on itself is cyclic.
+        self.assertEqual(SymbolicShapeInference._sort_nodes(nodes, prereqs, {"input"}, ["shape_0"]), [nodes[-1]])
+        prereqs[-1].add("relu_2")
+        with self.assertRaisesRegex(Exception, "cyclic"):
+            SymbolicShapeInference._sort_nodes(nodes, prereqs, {"input"}, ["relu_2"])
+
+    def test_onnx_infer_cache(self):
+        inference = self.infer(self.create_model(4))
+        # nodes of all layers have same op_type and input types, so onnx inference runs once for each op_type.
+        self.assertEqual(len(inference.onnx_infer_cache_), 3)
+
+    def test_incremental_inference(self):
+        model = self.create_model(4)
+        expected = SymbolicShapeInference.infer_shapes(model, auto_merge=True)
+        node_cache = {}
+        inference = self.infer(model, node_cache)
+        self.assertEqual(inference.out_mp_, expected)
+        self.assertEqual(len(inference.inferred_nodes_), 12)
+
+        inference = self.infer(model, node_cache, inference.onnx_infer_cache_)
+        self.assertEqual(inference.out_mp_, expected)
+        self.assertEqual(inference.inferred_nodes_, [])
+
+        # only nodes downstream of the change are inferred again.
+        relu = next(node for node in model.graph.node if node.name == "relu_2")
+        relu.op_type = "Sigmoid"
+        inference = self.infer(model, node_cache, inference.onnx_infer_cache_)
+        self.assertEqual(inference.out_mp_, SymbolicShapeInference.infer_shapes(model, auto_merge=True))
+        self.assertEqual(inference.inferred_nodes_, ["relu_2"])
+
+
 if __name__ == "__main__":
     unittest.main()
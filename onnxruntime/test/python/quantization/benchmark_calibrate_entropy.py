@@ -0,0 +1,137 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark the threshold search of entropy calibration, and compare it with the previous implementation looping over
+every candidate threshold:
+python benchmark_calibrate_entropy.py --num_bins 512 2048 8192 --num_quantized_bins 128
+"""
+
+import argparse
+import copy
+import time
+
+import numpy as np
+
+from onnxruntime.quantization.calibrate import HistogramCollector, entropy
+from onnxruntime.quantization.quant_utils import smooth_distribution
+
+
+def previous_entropy_threshold(histogram, num_quantized_bins):
+    # Implementation before vectorization, which evaluates every candidate threshold in a Python loop.
+    hist = histogram[0]
+    hist_edges = histogram[1]
+    num_bins = hist.size
+    zero_bin_index = num_bins // 2
+    num_half_quantized_bin = num_quantized_bins // 2
+
+    dtype = histogram[1].dtype
+    kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
+    thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
+
+    for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
+        start_index = zero_bin_index - i
+        end_index = zero_bin_index + i + 1 if (zero_bin_index + i + 1) <= num_bins else num_bins
+
+        thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
+
+        sliced_distribution = copy.deepcopy(hist[start_index:end_index])
+
+        # reference distribution p
+        p = sliced_distribution.copy()  # a copy of np array
+        left_outliers_count = sum(hist[:start_index])
+        right_outliers_count = sum(hist[end_index:])
+        p[0] += left_outliers_count
+        p[-1] += right_outliers_count
+
+        # nonzeros[i] incidates whether p[i] is non-zero
+        nonzeros = (p != 0).astype(np.int64)
+
+        # quantize p.size bins into quantized bins (default 128 bins)
+        quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
+        num_merged_bins = sliced_distribution.size // num_quantized_bins
+
+        # merge bins into quantized bins
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            end = start + num_merged_bins
+            quantized_bins[index] = sum(sliced_distribution[start:end])
+        quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
+
+        # in order to compare p and q, we need to make length of q equals to length of p
+        # expand quantized bins into p.size bins
+        q = np.zeros(p.size, dtype=np.int64)
+        for index in range(num_quantized_bins):
+            start = index * num_merged_bins
+            end = start + num_merged_bins
+
+            norm = sum(nonzeros[start:end])
+            if norm != 0:
+                q[start:end] = quantized_bins[index] / norm
+
+        p = smooth_distribution(p)
+        q = smooth_distribution(q)
+        if p is None or q is None:
+            div = np.array(np.inf, dtype=dtype)
+        else:
+            div = np.array(entropy(p, q), dtype=dtype)
+        kl_divergence[i - num_half_quantized_bin] = div
+
+    min_kl_divergence_idx = np.argmin(kl_divergence)
+    optimal_threshold = thresholds[min_kl_divergence_idx]
+    min_value = histogram[2]
+    max_value = histogram[3]
+    if optimal_threshold[0] < min_value:
+        optimal_threshold = (min_value, optimal_threshold[1])
+    if optimal_threshold[1] > max_value:
+        optimal_threshold = (optimal_threshold[0], max_value)
+    return optimal_threshold
+
+
+def measure(function, repeats: int):
+    latency_list = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latency_list.append(time.perf_counter() - start)
+    return min(latency_list)
+
+
+def run_benchmark(args):
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal(args.size).astype(np.float32)
+
+    for num_bins in args.num_bins:
+        collector = HistogramCollector("entropy", False, num_bins, args.num_quantized_bins, 99.999, "same")
+        collector.collect_value({"X": data})
+        histogram = collector.get_histogram_dict()["X"]
+        assert previous_entropy_threshold(histogram, args.num_quantized_bins) == collector.get_entropy_threshold(
+            histogram, args.num_quantized_bins
+        )
+        previous = measure(
+            lambda histogram=histogram: previous_entropy_threshold(histogram, args.num_quantized_bins), args.repeats
+        )
+        current = measure(
+            lambda collector=collector, histogram=histogram: collector.get_entropy_threshold(
+                histogram, args.num_quantized_bins
+            ),
+            args.repeats,
+        )
+        print(f"get_entropy_threshold of {num_bins} bins into {args.num_quantized_bins} quantized bins:")
+        print(f"\tprevious\t{previous * 1000:.2f} ms")
+        print(f"\tcurrent\t{current * 1000:.2f} ms\t{previous / current:.1f}x")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1 << 20)
+    parser.add_argument("--num_bins", type=int, nargs="+", default=[512, 2048, 8192])
+    parser.add_argument("--num_quantized_bins", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run_benchmark(parse_arguments())
@@ -0,0 +1,94 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark quantization to float 8, and compare it with the previous implementation running onnx.reference:
+python benchmark_float8.py --size 1048576 --num_channels 256
+"""
+
+import argparse
+import time
+
+import numpy as np
+from onnx import TensorProto, helper
+from onnx.reference import ReferenceEvaluator
+
+from onnxruntime.quantization.quant_utils import quantize_data, quantize_nparray
+
+FLOAT8_TYPES = {
+    "FLOAT8E4M3FN": TensorProto.FLOAT8E4M3FN,
+    "FLOAT8E4M3FNUZ": TensorProto.FLOAT8E4M3FNUZ,
+    "FLOAT8E5M2": TensorProto.FLOAT8E5M2,
+    "FLOAT8E5M2FNUZ": TensorProto.FLOAT8E5M2FNUZ,
+}
+
+
+def previous_quantize_nparray(qtype, arr, scale):
+    # Implementation before vectorization, which runs QuantizeLinear in a model.
+    onnx_type = helper.np_dtype_to_tensor_dtype(arr.dtype)
+    onnx_model = helper.make_model(
+        helper.make_graph(
+            [
+                helper.make_node(
+                    "Constant", [], ["zero_point"], value=helper.make_tensor("zero_point", qtype, [], [0])
+                ),
+                helper.make_node("QuantizeLinear", ["X", "scale", "zero_point"], ["Y"]),
+            ],
+            "qu",
+            [
+                helper.make_tensor_value_info("X", onnx_type, None),
+                helper.make_tensor_value_info("scale", onnx_type, None),
+            ],
+            [helper.make_tensor_value_info("Y", qtype, None)],
+        )
+    )
+    return ReferenceEvaluator(onnx_model).run(None, {"X": arr, "scale": scale})[0]
+
+
+def measure(function, repeats: int):
+    latency_list = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latency_list.append(time.perf_counter() - start)
+    return min(latency_list)
+
+
+def run_benchmark(args):
+    rng = np.random.default_rng(0)
+    array = rng.standard_normal(args.size).astype(np.float32)
+    scale = np.array(0.01, dtype=np.float32)
+
+    for name in args.types:
+        qtype = FLOAT8_TYPES[name]
+        assert np.array_equal(
+            quantize_nparray(qtype, array, scale, 0).view(np.uint8),
+            previous_quantize_nparray(qtype, array, scale).view(np.uint8),
+        )
+        previous = measure(lambda qtype=qtype: previous_quantize_nparray(qtype, array, scale), args.repeats)
+        current = measure(lambda qtype=qtype: quantize_nparray(qtype, array, scale, 0), args.repeats)
+        print(f"quantize_nparray to {name} of {args.size} elements:")
+        print(f"\tprevious\t{previous * 1000:.2f} ms")
+        print(f"\tcurrent\t{current * 1000:.2f} ms\t{previous / current:.1f}x")
+
+    # Per-channel quantization of a weight calls quantize_data once per channel.
+    weight = rng.standard_normal((args.num_channels, args.size // args.num_channels)).astype(np.float32)
+    latency = measure(
+        lambda: [quantize_data(channel, TensorProto.FLOAT8E4M3FN, True) for channel in weight], args.repeats
+    )
+    print(f"quantize_data to FLOAT8E4M3FN of {args.num_channels} channels: {latency * 1000:.2f} ms")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1 << 20)
+    parser.add_argument("--num_channels", type=int, default=256)
+    parser.add_argument("--types", nargs="+", choices=list(FLOAT8_TYPES), default=["FLOAT8E4M3FN", "FLOAT8E5M2"])
+    parser.add_argument("--repeats", type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run_benchmark(parse_arguments())
@@ -0,0 +1,212 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark the lookups of ONNXModel and the quantization of a transformer with more than ten thousand initializers:
+python benchmark_onnx_model.py --num_layers 1024 --hidden_size 16
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, quantize_dynamic, quantize_static
+from onnxruntime.quantization.onnx_model import ONNXModel
+from onnxruntime.quantization.quant_utils import find_by_name
+
+
+def previous_find_by_name(item_name, item_list):
+    # Implementation of quant_utils.find_by_name before indexing, which builds the list of all matching items.
+    """
+    Helper function to find item by name in a list.
+        parameter item_name: name of the item.
+        parameter item_list: list of items.
+        return: item if found. None otherwise.
+    """
+    items = [item for item in item_list if item.name == item_name]
+    return items[0] if len(items) > 0 else None
+
+
+def previous_get_initializer(self, name):
+    # Implementation of ONNXModel.get_initializer before indexing.
+    for tensor in self.model.graph.initializer:
+        if tensor.name == name:
+            return tensor
+    return None
+
+
+def previous_find_node_by_name(self, node_name, new_nodes_list, graph):
+    # Implementation of ONNXModel.find_node_by_name before indexing, which ONNXQuantizer called with its new nodes.
+    """Find out if a node exists in a graph or a node is in the
+    new set of nodes created during quantization.
+
+    Returns:
+        The node found or None.
+    """
+    graph_nodes_list = list(graph.node)  # deep copy
+    graph_nodes_list.extend(new_nodes_list)
+    node = previous_find_by_name(node_name, graph_nodes_list)
+    return node
+
+
+def previous_get_parent(self, node, idx, output_name_to_node=None):
+    # Implementation of ONNXModel.get_parent before indexing, which maps all outputs to their nodes on every call.
+    if output_name_to_node is None:
+        output_name_to_node = self.output_name_to_node()
+
+    if len(node.input) <= idx:
+        return None
+
+    input = node.input[idx]
+    if input not in output_name_to_node:
+        return None
+
+    return output_name_to_node[input]
+
+
+def make_transformer(num_layers: int, hidden_size: int) -> onnx.ModelProto:
+    # Each layer is a simplified attention block followed by a feed forward block, with 16 initializers.
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = []
+
+    def add_initializer(name, shape):
+        initializers.append(numpy_helper.from_array(rng.standard_normal(shape).astype(np.float32), name))
+        return name
+
+    def linear(prefix, input_name, in_features, out_features):
+        weight = add_initializer(f"{prefix}.weight", [in_features, out_features])
+        bias = add_initializer(f"{prefix}.bias", [out_features])
+        nodes.append(helper.make_node("MatMul", [input_name, weight], [f"{prefix}.matmul"], f"{prefix}.MatMul"))
+        nodes.append(helper.make_node("Add", [f"{prefix}.matmul", bias], [f"{prefix}.output"], f"{prefix}.Add"))
+        return f"{prefix}.output"
+
+    def layer_norm(prefix, input_name):
+        scale = add_initializer(f"{prefix}.scale", [hidden_size])
+        bias = add_initializer(f"{prefix}.bias", [hidden_size])
+        nodes.append(
+            helper.make_node("LayerNormalization", [input_name, scale, bias], [f"{prefix}.output"], f"{prefix}")
+        )
+        return f"{prefix}.output"
+
+    hidden = "input"
+    for i in range(num_layers):
+        prefix = f"layers.{i}"
+        normed = layer_norm(f"{prefix}.attention_norm", hidden)
+        query = linear(f"{prefix}.query", normed, hidden_size, hidden_size)
+        key = linear(f"{prefix}.key", normed, hidden_size, hidden_size)
+        value = linear(f"{prefix}.value", normed, hidden_size, hidden_size)
+        nodes.append(helper.make_node("Mul", [query, key], [f"{prefix}.scores"], f"{prefix}.Mul"))
+        nodes.append(helper.make_node("Add", [f"{prefix}.scores", value], [f"{prefix}.context"], f"{prefix}.Context"))
+        attention = linear(f"{prefix}.output", f"{prefix}.context", hidden_size, hidden_size)
+        nodes.append(helper.make_node("Add", [hidden, attention], [f"{prefix}.residual"], f"{prefix}.Residual"))
+
+        normed = layer_norm(f"{prefix}.ffn_norm", f"{prefix}.residual")
+        fc1 = linear(f"{prefix}.fc1", normed, hidden_size, 4 * hidden_size)
+        nodes.append(helper.make_node("Relu", [fc1], [f"{prefix}.relu"], f"{prefix}.Relu"))
+        fc2 = linear(f"{prefix}.fc2", f"{prefix}.relu", 4 * hidden_size, hidden_size)
+        hidden = f"{prefix}.hidden"
+        nodes.append(helper.make_node("Add", [f"{prefix}.residual", fc2], [hidden], f"{prefix}.FfnResidual"))
+
+    nodes.append(helper.make_node("Identity", [hidden], ["output"], "Output"))
+    graph = helper.make_graph(
+        nodes,
+        "transformer",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, hidden_size])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, hidden_size])],
+        initializer=initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    return model
+
+
+class RandomDataReader(CalibrationDataReader):
+    def __init__(self, hidden_size: int, num_samples: int):
+        rng = np.random.default_rng(0)
+        self.samples = iter(
+            [{"input": rng.standard_normal((1, hidden_size)).astype(np.float32)} for _ in range(num_samples)]
+        )
+
+    def get_next(self):
+        return next(self.samples, None)
+
+
+def measure(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run_benchmark(args):
+    model = make_transformer(args.num_layers, args.hidden_size)
+    num_initializers = len(model.graph.initializer)
+    print(f"{args.num_layers} layers, {len(model.graph.node)} nodes, {num_initializers} initializers")
+
+    # Lookups spread over the whole graph, as the quantizers do once or more per node input.
+    onnx_model = ONNXModel(model)
+    positions = np.linspace(0, num_initializers - 1, args.num_lookups, dtype=int)
+    initializer_names = [model.graph.initializer[i].name for i in positions]
+    positions = np.linspace(0, len(model.graph.node) - 1, args.num_lookups, dtype=int)
+    nodes = [model.graph.node[i] for i in positions]
+    lookups = {
+        "find_by_name": (
+            lambda: [previous_find_by_name(name, onnx_model.initializer()) for name in initializer_names],
+            lambda: [find_by_name(name, onnx_model.initializer()) for name in initializer_names],
+        ),
+        "get_initializer": (
+            lambda: [previous_get_initializer(onnx_model, name) for name in initializer_names],
+            lambda: [onnx_model.get_initializer(name) for name in initializer_names],
+        ),
+        "find_node_by_name": (
+            lambda: [previous_find_node_by_name(onnx_model, node.name, [], onnx_model.graph()) for node in nodes],
+            lambda: [onnx_model.get_node_by_name(node.name) for node in nodes],
+        ),
+        "get_parent": (
+            lambda: [previous_get_parent(onnx_model, node, 0) for node in nodes],
+            lambda: [onnx_model.get_parent(node, 0) for node in nodes],
+        ),
+    }
+    for name, (previous_lookup, current_lookup) in lookups.items():
+        assert all(
+            current_item is previous_item for current_item, previous_item in zip(current_lookup(), previous_lookup())
+        )
+        previous = measure(previous_lookup)
+        current = measure(current_lookup)
+        print(f"{args.num_lookups} lookups with {name}:")
+        print(f"\tprevious\t{previous * 1000:.2f} ms")
+        print(f"\tcurrent\t{current * 1000:.2f} ms\t{previous / current:.1f}x")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = os.path.join(tmp_dir, "transformer.onnx")
+        onnx.save(model, model_path)
+        latency = measure(lambda: quantize_dynamic(model_path, os.path.join(tmp_dir, "dynamic.onnx")))
+        print(f"quantize_dynamic: {latency:.2f} s")
+        latency = measure(
+            lambda: quantize_static(
+                model_path,
+                os.path.join(tmp_dir, "qdq.onnx"),
+                RandomDataReader(args.hidden_size, 2),
+                quant_format=QuantFormat.QDQ,
+            )
+        )
+        print(f"quantize_static with QDQ format: {latency:.2f} s")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_layers", type=int, default=1024)
+    parser.add_argument("--hidden_size", type=int, default=16)
+    parser.add_argument("--num_lookups", type=int, default=1000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run_benchmark(parse_arguments())
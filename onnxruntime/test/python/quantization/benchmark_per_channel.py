@@ -0,0 +1,262 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark per-channel quantization of a Conv weight, and compare it with the previous implementation:
+python benchmark_per_channel.py --num_channels 4096 --channel_size 1024
+"""
+
+import argparse
+import time
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+from onnx import onnx_pb as onnx_proto
+
+from onnxruntime.quantization.onnx_quantizer import ONNXQuantizer
+from onnxruntime.quantization.quant_utils import (
+    ONNX_TYPE_TO_NP_TYPE,
+    TENSOR_NAME_QUANT_SUFFIX,
+    QuantizationMode,
+    QuantizedValue,
+    QuantizedValueType,
+    QuantType,
+    find_by_name,
+    quantize_data,
+    quantize_nparray,
+    tensor_proto_to_array,
+)
+
+QUANT_TYPES = {
+    "QInt8": QuantType.QInt8,
+    "QUInt8": QuantType.QUInt8,
+    "QInt16": QuantType.QInt16,
+    "QUInt16": QuantType.QUInt16,
+}
+
+
+def previous_quantize_weight_per_channel(
+    self,
+    weight_name,
+    weight_qType,
+    channel_axis,
+    reduce_range=True,
+    keep_float_weight=False,
+):
+    # Implementation before vectorization, a method of ONNXQuantizer which quantizes one channel after another.
+    # Find if this input is already quantized
+    if weight_name in self.quantized_value_map:
+        quantized_value = self.quantized_value_map[weight_name]
+        return (
+            quantized_value.q_name,
+            quantized_value.zp_name,
+            quantized_value.scale_name,
+        )
+
+    initializer = find_by_name(weight_name, self.model.initializer())
+    if initializer is None:
+        raise ValueError("{} is not an initializer", weight_name)
+
+    weights = tensor_proto_to_array(initializer)
+    channel_count = weights.shape[channel_axis]
+    quant_overrides_for_channels = self.get_per_channel_quant_overrides(weight_name, channel_count)
+
+    # If user provides per-channel quantization overrides, all channels must use the same quantization type.
+    # So, just use the first channel's type.
+    if "quant_type" in quant_overrides_for_channels[0]:
+        weight_qType = quant_overrides_for_channels[0]["quant_type"].tensor_type  # noqa: N806
+
+    zero_point_list = []
+    scale_list = []
+    quantized_per_channel_data_list = []
+    for i in range(channel_count):
+        per_channel_data = weights.take(i, channel_axis)
+        channel_quant_overrides = quant_overrides_for_channels[i]
+
+        if "scale" in channel_quant_overrides and "zero_point" in channel_quant_overrides:
+            zero_point = np.array(channel_quant_overrides["zero_point"], dtype=ONNX_TYPE_TO_NP_TYPE[weight_qType])
+            scale = np.array(channel_quant_overrides["scale"])
+            quantized_per_channel_data = quantize_nparray(weight_qType, per_channel_data.flatten(), scale, zero_point)
+            assert isinstance(zero_point, np.ndarray), f"Unexpected type {type(zero_point)}"
+            assert (
+                zero_point.dtype != np.float32 and zero_point.dtype != np.float16
+            ), f"Unexpected dtype {zero_point.dtype}"
+            assert isinstance(scale, np.ndarray), f"Unexpected type {type(scale)}"
+            assert isinstance(
+                quantized_per_channel_data, np.ndarray
+            ), f"Unexpected type {type(quantized_per_channel_data)}"
+
+        else:
+            symmetric = channel_quant_overrides.get(
+                "symmetric",
+                (
+                    self.is_weight_symmetric
+                    or weight_qType in (onnx_proto.TensorProto.INT8, onnx_proto.TensorProto.FLOAT8E4M3FN)
+                ),
+            )
+            _, _, zero_point, scale, quantized_per_channel_data = quantize_data(
+                per_channel_data.flatten(),
+                weight_qType,
+                symmetric,
+                reduce_range=channel_quant_overrides.get("reduce_range", self.reduce_range and reduce_range),
+                min_real_range=self.min_real_range,
+                rmin_override=channel_quant_overrides.get("rmin"),
+                rmax_override=channel_quant_overrides.get("rmax"),
+            )
+
+            assert isinstance(zero_point, np.ndarray), f"Unexpected type {type(zero_point)}"
+            assert (
+                zero_point.dtype != np.float32 and zero_point.dtype != np.float16
+            ), f"Unexpected dtype {zero_point.dtype}"
+            assert isinstance(scale, np.ndarray), f"Unexpected type {type(scale)}"
+            assert isinstance(
+                quantized_per_channel_data, np.ndarray
+            ), f"Unexpected type {type(quantized_per_channel_data)}"
+
+        zero_point_list.append(zero_point)
+        scale_list.append(scale)
+        quantized_per_channel_data_list.append(quantized_per_channel_data)
+
+    # combine per_channel_data into one
+    reshape_dims = list(weights.shape)  # deep copy
+    reshape_dims[channel_axis] = 1  # only one per channel for reshape
+    quantized_weights = np.asarray(quantized_per_channel_data_list[0]).reshape(reshape_dims)
+    for i in range(1, len(quantized_per_channel_data_list)):
+        channel_weights = np.asarray(quantized_per_channel_data_list[i]).reshape(reshape_dims)
+        quantized_weights = np.concatenate((quantized_weights, channel_weights), channel_axis)
+
+    q_weight_name = weight_name + TENSOR_NAME_QUANT_SUFFIX
+    zp_name = weight_name + "_zero_point"
+    scale_name = weight_name + "_scale"
+
+    quantized_value = QuantizedValue(
+        weight_name,
+        q_weight_name,
+        scale_name,
+        zp_name,
+        QuantizedValueType.Initializer,
+        None,
+    )
+    self.quantized_value_map[weight_name] = quantized_value
+
+    # Update packed weight, zero point, and scale initializers
+    zero_scale_shape = [initializer.dims[channel_axis]]
+    scale_initializer = onnx.helper.make_tensor(
+        scale_name, initializer.data_type, zero_scale_shape, np.hstack(scale_list).tolist()
+    )
+    zero_initializer = onnx.helper.make_tensor(
+        zp_name, weight_qType, zero_scale_shape, np.hstack(zero_point_list).tolist()
+    )
+
+    self.model.initializer_extend([scale_initializer, zero_initializer])
+
+    if not keep_float_weight:
+        quantized_weights = np.asarray(
+            quantized_weights,
+            dtype=onnx.mapping.TENSOR_TYPE_TO_NP_TYPE[weight_qType],
+        ).reshape(initializer.dims)
+        q_weight_initializer = onnx.numpy_helper.from_array(quantized_weights, q_weight_name)
+        self.model.initializer_extend([q_weight_initializer])
+
+    return q_weight_name, zp_name, scale_name
+
+
+def make_quantizer(weight, weight_type=QuantType.QInt8, reduce_range=False, extra_options=None):
+    """
+    Creates a quantizer of a model with a single Conv whose weight is the initializer "W".
+    """
+    float_type = helper.np_dtype_to_tensor_dtype(weight.dtype)
+    graph = helper.make_graph(
+        [helper.make_node("Conv", ["X", "W"], ["Y"])],
+        "per_channel",
+        [helper.make_tensor_value_info("X", float_type, [1, *weight.shape[1:]])],
+        [helper.make_tensor_value_info("Y", float_type, None)],
+        initializer=[numpy_helper.from_array(weight, "W")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    return ONNXQuantizer(
+        model,
+        True,  # per_channel
+        reduce_range,
+        QuantizationMode.QLinearOps,
+        True,  # static
+        weight_type,
+        QuantType.QUInt8,
+        None,  # tensors_range
+        [],  # nodes_to_quantize
+        [],  # nodes_to_exclude
+        ["Conv"],  # op_types_to_quantize
+        extra_options or {},
+    )
+
+
+def quantize_weight(quantizer, function, weight_qtype, channel_axis, reduce_range=True, keep_float_weight=False):
+    """
+    Quantizes the weight "W" with function, an implementation of ONNXQuantizer.quantize_weight_per_channel, then
+    restores the quantizer to its previous state.
+    :return: the initializers added by function, keyed by name
+    """
+    num_initializers = len(quantizer.model.initializer())
+    function(quantizer, "W", weight_qtype, channel_axis, reduce_range, keep_float_weight)
+    initializers = list(quantizer.model.initializer()[num_initializers:])
+    for initializer in initializers:
+        quantizer.model.remove_initializer(initializer)
+    del quantizer.quantized_value_map["W"]
+    return {initializer.name: initializer for initializer in initializers}
+
+
+def measure(function, repeats: int):
+    latency_list = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latency_list.append(time.perf_counter() - start)
+    return min(latency_list)
+
+
+def run_benchmark(args):
+    rng = np.random.default_rng(0)
+    weight = rng.standard_normal((args.num_channels, args.channel_size, 1, 1)).astype(np.float32)
+
+    for name in args.types:
+        weight_qtype = QUANT_TYPES[name].tensor_type
+        quantizer = make_quantizer(weight, QUANT_TYPES[name])
+        previous_initializers = quantize_weight(quantizer, previous_quantize_weight_per_channel, weight_qtype, 0)
+        current_initializers = quantize_weight(quantizer, ONNXQuantizer.quantize_weight_per_channel, weight_qtype, 0)
+        assert previous_initializers.keys() == current_initializers.keys()
+        for initializer_name, initializer in current_initializers.items():
+            previous_initializer = previous_initializers[initializer_name]
+            assert initializer.data_type == previous_initializer.data_type
+            assert np.array_equal(numpy_helper.to_array(initializer), numpy_helper.to_array(previous_initializer))
+
+        previous = measure(
+            lambda quantizer=quantizer, weight_qtype=weight_qtype: quantize_weight(
+                quantizer, previous_quantize_weight_per_channel, weight_qtype, 0
+            ),
+            args.repeats,
+        )
+        current = measure(
+            lambda quantizer=quantizer, weight_qtype=weight_qtype: quantize_weight(
+                quantizer, ONNXQuantizer.quantize_weight_per_channel, weight_qtype, 0
+            ),
+            args.repeats,
+        )
+        print(f"quantize_weight_per_channel to {name} of {args.num_channels}x{args.channel_size} weight:")
+        print(f"\tprevious\t{previous * 1000:.2f} ms")
+        print(f"\tcurrent\t{current * 1000:.2f} ms\t{previous / current:.1f}x")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_channels", type=int, default=4096)
+    parser.add_argument("--channel_size", type=int, default=1024)
+    parser.add_argument("--types", nargs="+", choices=list(QUANT_TYPES), default=["QInt8", "QUInt8"])
+    parser.add_argument("--repeats", type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run_benchmark(parse_arguments())
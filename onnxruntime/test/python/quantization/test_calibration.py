@@ -5,6 +5,7 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import copy
 import tempfile
 import unittest
 from pathlib import Path
@@ -14,7 +15,15 @@ import onnx
 from onnx import TensorProto, helper, numpy_helper
 
 import onnxruntime
-from onnxruntime.quantization.calibrate import CalibrationDataReader, create_calibrator
+from onnxruntime.quantization.calibrate import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    HistogramCollector,
+    TensorsData,
+    create_calibrator,
+    entropy,
+)
+from onnxruntime.quantization.quant_utils import smooth_distribution
 
 
 def generate_input_initializer(tensor_shape, tensor_dtype, input_name):
@@ -357,6 +366,226 @@ class TestCalibrateMinMaxCalibrator(unittest.TestCase):
         for output_name in output_min_max_dict:
             self.assertEqual(output_min_max_dict[output_name], tensors_range[output_name].range_value)
 
+    def test_compute_data_histogram_max_intermediate_outputs(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_hist.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+
+        for calibrate_method in [CalibrationMethod.Entropy, CalibrationMethod.Percentile]:
+            with self.subTest(calibrate_method=calibrate_method):
+                data_reader = TestDataReader()
+                histograms = []
+                for max_intermediate_outputs in [None, 1, 3]:
+                    augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                        f"./augmented_test_model_hist_{calibrate_method.name}_{max_intermediate_outputs}.onnx"
+                    )
+                    calibrater = create_calibrator(
+                        test_model_path,
+                        augmented_model_path=augmented_model_path.as_posix(),
+                        calibrate_method=calibrate_method,
+                        extra_options={"max_intermediate_outputs": max_intermediate_outputs},
+                    )
+                    data_reader.rewind()
+                    calibrater.collect_data(data_reader)
+                    self.assertEqual(calibrater.intermediate_outputs, [])
+                    histograms.append(calibrater.collector.get_histogram_dict())
+                    tensors_range = calibrater.compute_data()
+                    self.assertEqual(set(tensors_range), {"input", "X1", "X2", "X3", "X4", "X5", "X6"})
+
+                # Every value must be counted once whatever the number of merges is.
+                for histogram_dict in histograms[1:]:
+                    self.assertEqual(set(histogram_dict), set(histograms[0]))
+                    for name, histogram in histogram_dict.items():
+                        self.assertEqual(histogram[0].sum(), histograms[0][name][0].sum())
+                        self.assertEqual(histogram[2], histograms[0][name][2])
+                        self.assertEqual(histogram[3], histograms[0][name][3])
+
+    def test_compute_data_max_intermediate_outputs(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_minmax.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+
+        data_reader = TestDataReader()
+        tensors_ranges = []
+        for max_intermediate_outputs in [None, 1, 3]:
+            augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                f"./augmented_test_model_minmax_{max_intermediate_outputs}.onnx"
+            )
+            calibrater = create_calibrator(
+                test_model_path,
+                augmented_model_path=augmented_model_path.as_posix(),
+                extra_options={"max_intermediate_outputs": max_intermediate_outputs},
+            )
+            data_reader.rewind()
+            calibrater.collect_data(data_reader)
+            tensors_ranges.append(calibrater.compute_data())
+
+        for tensors_range in tensors_ranges[1:]:
+            self.assertEqual(set(tensors_range), set(tensors_ranges[0]))
+            for name in tensors_range:
+                self.assertEqual(tensors_range[name].range_value, tensors_ranges[0][name].range_value)
+
+    def test_collect_data_num_processes(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_processes.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+
+        for calibrate_method in [CalibrationMethod.MinMax, CalibrationMethod.Entropy]:
+            with self.subTest(calibrate_method=calibrate_method):
+                data_reader = TestDataReader()
+                states = []
+                for num_processes in [None, 3]:
+                    augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+                        f"./augmented_test_model_processes_{calibrate_method.name}_{num_processes}.onnx"
+                    )
+                    calibrater = create_calibrator(
+                        test_model_path,
+                        augmented_model_path=augmented_model_path.as_posix(),
+                        calibrate_method=calibrate_method,
+                        extra_options={"num_processes": num_processes},
+                    )
+                    data_reader.rewind()
+                    calibrater.collect_data(data_reader)
+                    states.append(calibrater.get_collected_state())
+                    tensors_range = calibrater.compute_data()
+                    self.assertEqual(set(tensors_range), {"input", "X1", "X2", "X3", "X4", "X5", "X6"})
+
+                self.assertEqual(set(states[1]), set(states[0]))
+                for name, state in states[1].items():
+                    if calibrate_method == CalibrationMethod.MinMax:
+                        self.assertEqual(state, states[0][name])
+                    else:
+                        # Bins may differ but every value is counted once.
+                        self.assertEqual(state[0].sum(), states[0][name][0].sum())
+                        self.assertEqual(state[2], states[0][name][2])
+                        self.assertEqual(state[3], states[0][name][3])
+
+    def test_collect_data_num_processes_failure(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_processes_failure.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+        augmented_model_path = Path(self._tmp_model_dir.name).joinpath("./augmented_test_model_processes_failure.onnx")
+        calibrater = create_calibrator(
+            test_model_path,
+            augmented_model_path=augmented_model_path.as_posix(),
+            extra_options={"num_processes": 2},
+        )
+        data_reader = TestDataReader()
+        data_reader.input_data_list = [np.zeros((1, 2), dtype=np.float32)] * 6
+        with self.assertRaisesRegex(RuntimeError, "Calibration process"):
+            calibrater.collect_data(data_reader)
+
+    def get_cached_calibrater(self, test_model_path, calibrate_method, cache_dir, max_intermediate_outputs=None):
+        augmented_model_path = Path(self._tmp_model_dir.name).joinpath(
+            f"./augmented_test_model_cache_{calibrate_method.name}.onnx"
+        )
+        return create_calibrator(
+            test_model_path,
+            augmented_model_path=augmented_model_path.as_posix(),
+            calibrate_method=calibrate_method,
+            extra_options={"cache_dir": cache_dir, "max_intermediate_outputs": max_intermediate_outputs},
+        )
+
+    def assert_same_tensors_data(self, tensors_data, expected):
+        self.assertEqual(set(tensors_data), set(expected))
+        for name in expected:
+            self.assertEqual(tensors_data[name].range_value, expected[name].range_value)
+
+    def test_calibration_cache(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_cache.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+
+        for calibrate_method in [CalibrationMethod.MinMax, CalibrationMethod.Entropy]:
+            with self.subTest(calibrate_method=calibrate_method), tempfile.TemporaryDirectory() as cache_dir:
+                data_reader = TestDataReader()
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, cache_dir)
+                calibrater.collect_data(data_reader)
+                expected = calibrater.compute_data()
+                self.assertEqual(len(list(Path(cache_dir).glob("*.npz"))), 1)
+
+                # The same data is entirely read from the cache.
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, cache_dir)
+                data_reader.rewind()
+                calibrater.collect_data(data_reader)
+                self.assertIsNone(calibrater.infer_session)
+                self.assert_same_tensors_data(calibrater.compute_data(), expected)
+
+                # Different data ignores the cache.
+                other_reader = TestDataReader()
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, cache_dir)
+                calibrater.collect_data(other_reader)
+                self.assertIsNotNone(calibrater.infer_session)
+                self.assertEqual(len(calibrater.collected_inputs_digests), other_reader.count)
+
+                # Batches of intermediate outputs change moving averages and histogram bins, so the cache is not
+                # shared between calibraters with a different max_intermediate_outputs.
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, cache_dir, 1)
+                data_reader.rewind()
+                calibrater.collect_data(data_reader)
+                self.assertIsNotNone(calibrater.infer_session)
+                self.assertEqual(len(list(Path(cache_dir).glob("*.npz"))), 2)
+
+    def test_calibration_cache_resume(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_cache_resume.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+
+        for calibrate_method in [CalibrationMethod.MinMax, CalibrationMethod.Percentile]:
+            with self.subTest(calibrate_method=calibrate_method), tempfile.TemporaryDirectory() as cache_dir:
+                data_reader = TestDataReader()
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, None, 1)
+                calibrater.collect_data(data_reader)
+                expected = calibrater.compute_data()
+
+                # An interrupted calibration only saved the first two inputs.
+                partial_reader = TestDataReader()
+                partial_reader.input_data_list = data_reader.input_data_list[:2]
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, cache_dir, 1)
+                calibrater.collect_data(partial_reader)
+
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, cache_dir, 1)
+                data_reader.rewind()
+                calibrater.collect_data(data_reader)
+                self.assertEqual(len(calibrater.collected_inputs_digests), data_reader.count)
+                self.assert_same_tensors_data(calibrater.compute_data(), expected)
+
+    def test_calibration_cache_merge(self):
+        test_model_path = Path(self._tmp_model_dir.name).joinpath("./test_model_cache_merge.onnx")
+        self.construct_test_compute_data_model(test_model_path.as_posix())
+
+        for calibrate_method in [CalibrationMethod.MinMax, CalibrationMethod.Entropy, CalibrationMethod.Percentile]:
+            with self.subTest(calibrate_method=calibrate_method), tempfile.TemporaryDirectory() as cache_dir:
+                data_reader = TestDataReader()
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, None)
+                calibrater.collect_data(data_reader)
+                expected = calibrater.compute_data()
+                expected_histograms = calibrater.get_collected_state()
+
+                # Every machine calibrates a part of the data.
+                cache_files = []
+                for i in range(2):
+                    shard_dir = Path(cache_dir).joinpath(f"shard{i}")
+                    shard_reader = TestDataReader()
+                    shard_reader.input_data_list = data_reader.input_data_list[i * 2 : i * 2 + 2]
+                    calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, shard_dir)
+                    calibrater.collect_data(shard_reader)
+                    cache_files.extend(shard_dir.glob("*.npz"))
+                self.assertEqual(len(cache_files), 2)
+
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, Path(cache_dir, "merged"))
+                calibrater.calibration_cache.merge(calibrater, cache_files)
+                self.assertIsNone(calibrater.infer_session)
+                if calibrate_method == CalibrationMethod.MinMax:
+                    self.assert_same_tensors_data(calibrater.compute_data(), expected)
+                else:
+                    # Bins may differ but every value is counted once.
+                    for name, histogram in calibrater.get_collected_state().items():
+                        self.assertEqual(histogram[0].sum(), expected_histograms[name][0].sum())
+                        self.assertEqual(histogram[2], expected_histograms[name][2])
+                        self.assertEqual(histogram[3], expected_histograms[name][3])
+                    self.assertEqual(set(calibrater.compute_data()), set(expected))
+
+                # The merged cache is reused when the whole data is calibrated again.
+                calibrater = self.get_cached_calibrater(test_model_path, calibrate_method, Path(cache_dir, "merged"))
+                data_reader.rewind()
+                calibrater.collect_data(data_reader)
+                self.assertIsNone(calibrater.infer_session)
+
     def test_augment_graph_with_zero_value_dimension(self):
         """TEST_CONFIG_5"""
         #   Conv
@@ -457,5 +686,154 @@ class TestCalibrateMinMaxCalibrator(unittest.TestCase):
             self.assertTrue(output in augmented_model_outputs)
 
 
+class TestHistogramCollector(unittest.TestCase):
+    @staticmethod
+    def reference_entropy_threshold(histogram, num_quantized_bins):
+        # get_entropy_threshold as it was before candidate thresholds were evaluated with array operations
+        hist = histogram[0]
+        hist_edges = histogram[1]
+        num_bins = hist.size
+        zero_bin_index = num_bins // 2
+        num_half_quantized_bin = num_quantized_bins // 2
+
+        dtype = histogram[1].dtype
+        kl_divergence = np.zeros(zero_bin_index - num_half_quantized_bin + 1)
+        thresholds = [(np.array(0, dtype=dtype), np.array(0, dtype=dtype)) for i in range(kl_divergence.size)]
+
+        for i in range(num_half_quantized_bin, zero_bin_index + 1, 1):
+            start_index = zero_bin_index - i
+            end_index = zero_bin_index + i + 1 if (zero_bin_index + i + 1) <= num_bins else num_bins
+
+            thresholds[i - num_half_quantized_bin] = (hist_edges[start_index], hist_edges[end_index])
+
+            sliced_distribution = copy.deepcopy(hist[start_index:end_index])
+
+            # reference distribution p
+            p = sliced_distribution.copy()  # a copy of np array
+            left_outliers_count = sum(hist[:start_index])
+            right_outliers_count = sum(hist[end_index:])
+            p[0] += left_outliers_count
+            p[-1] += right_outliers_count
+
+            # nonzeros[i] incidates whether p[i] is non-zero
+            nonzeros = (p != 0).astype(np.int64)
+
+            # quantize p.size bins into quantized bins (default 128 bins)
+            quantized_bins = np.zeros(num_quantized_bins, dtype=np.int64)
+            num_merged_bins = sliced_distribution.size // num_quantized_bins
+
+            # merge bins into quantized bins
+            for index in range(num_quantized_bins):
+                start = index * num_merged_bins
+                end = start + num_merged_bins
+                quantized_bins[index] = sum(sliced_distribution[start:end])
+            quantized_bins[-1] += sum(sliced_distribution[num_quantized_bins * num_merged_bins :])
+
+            # in order to compare p and q, we need to make length of q equals to length of p
+            # expand quantized bins into p.size bins
+            q = np.zeros(p.size, dtype=np.int64)
+            for index in range(num_quantized_bins):
+                start = index * num_merged_bins
+                end = start + num_merged_bins
+
+                norm = sum(nonzeros[start:end])
+                if norm != 0:
+                    q[start:end] = quantized_bins[index] / norm
+
+            p = smooth_distribution(p)
+            q = smooth_distribution(q)
+            if p is None or q is None:
+                div = np.array(np.inf, dtype=dtype)
+            else:
+                div = np.array(entropy(p, q), dtype=dtype)
+            kl_divergence[i - num_half_quantized_bin] = div
+
+        min_kl_divergence_idx = np.argmin(kl_divergence)
+        optimal_threshold = thresholds[min_kl_divergence_idx]
+        min_value = histogram[2]
+        max_value = histogram[3]
+        if optimal_threshold[0] < min_value:
+            optimal_threshold = (min_value, optimal_threshold[1])
+        if optimal_threshold[1] > max_value:
+            optimal_threshold = (optimal_threshold[0], max_value)
+        return kl_divergence, optimal_threshold
+
+    def test_entropy_threshold(self):
+        rng = np.random.default_rng(0)
+        for num_bins, num_quantized_bins in [(128, 128), (512, 128), (513, 128), (1000, 256)]:
+            for data in [
+                rng.normal(0, 1, 10000),
+                rng.laplace(0, 0.3, 10000),
+                np.maximum(rng.normal(0, 1, 10000), 0),
+                rng.exponential(1, 10000) - 0.2,
+                rng.normal(0, 1, 20),
+            ]:
+                with self.subTest(num_bins=num_bins, num_quantized_bins=num_quantized_bins):
+                    collector = HistogramCollector("entropy", False, num_bins, num_quantized_bins, 99.999, "same")
+                    collector.collect_value({"X": data.astype(np.float32)})
+                    histogram = collector.get_histogram_dict()["X"]
+                    hist = histogram[0]
+
+                    expected_kl, expected = self.reference_entropy_threshold(histogram, num_quantized_bins)
+                    zero_bin_index = hist.size // 2
+                    half_widths = np.arange(num_quantized_bins // 2, zero_bin_index + 1)
+                    kl = collector._kl_divergence(
+                        hist,
+                        zero_bin_index - half_widths,
+                        np.minimum(zero_bin_index + half_widths + 1, hist.size),
+                        num_quantized_bins,
+                        histogram[1].dtype,
+                    )
+                    np.testing.assert_array_equal(expected_kl, kl)
+                    self.assertEqual(expected, collector.get_entropy_threshold(histogram, num_quantized_bins))
+
+    def test_compute_collection_result_num_workers(self):
+        rng = np.random.default_rng(2)
+        name_to_arr = {f"T{i}": rng.normal(0, 1 + i, 1000).astype(np.float32) for i in range(8)}
+        methods = [("entropy", False), ("percentile", True), ("percentile", False), ("distribution", False)]
+        for method, symmetric in methods:
+            expected = None
+            for num_workers, use_processes in [(None, False), (4, False), (2, True)]:
+                with self.subTest(method=method, symmetric=symmetric, num_workers=num_workers, processes=use_processes):
+                    collector = HistogramCollector(
+                        method, symmetric, 512, 128, 99.9, "same", num_workers=num_workers, use_processes=use_processes
+                    )
+                    collector.collect(name_to_arr)
+                    result = TensorsData(CalibrationMethod.MinMax, collector.compute_collection_result())
+                    if expected is None:
+                        expected = result
+                        continue
+                    self.assertEqual(list(expected), list(result))
+                    for name in expected:
+                        self.assertEqual(vars(expected[name]).keys(), vars(result[name]).keys())
+                        for key, value in vars(expected[name]).items():
+                            np.testing.assert_array_equal(value, getattr(result[name], key))
+
+    def test_extend_absolute_bins_rounding(self):
+        collector = HistogramCollector("percentile", True, 128, 128, 99.999, "same")
+        max_value = np.float32(511.82211)
+        collector.collect({"X": np.array([0.5, max_value], dtype=np.float32)})
+        hist_edges = collector.get_histogram_dict()["X"][1]
+        self.assertEqual(hist_edges[-1], max_value)
+
+        # np.arange creates no bin for a maximum a few ulps above the last edge, the maximum is the new last edge.
+        new_max_value = np.nextafter(max_value, np.float32(np.inf))
+        collector.collect({"X": np.array([new_max_value], dtype=np.float32)})
+        hist, hist_edges = collector.get_histogram_dict()["X"][:2]
+        self.assertEqual(hist_edges.size, 130)
+        self.assertEqual(hist_edges[-1], new_max_value)
+        self.assertEqual(hist.sum(), 3)
+        self.assertEqual(hist[-1], 1)
+
+    def test_entropy_threshold_chunks(self):
+        rng = np.random.default_rng(1)
+        collector = HistogramCollector("entropy", False, 1024, 128, 99.999, "same")
+        collector.collect_value({"X": rng.normal(0, 1, 10000).astype(np.float32)})
+        histogram = collector.get_histogram_dict()["X"]
+        expected = collector.get_entropy_threshold(histogram, 128)
+        collector._entropy_chunk_elements = 1000
+        self.assertEqual(expected, collector.get_entropy_threshold(histogram, 128))
+
+
 if __name__ == "__main__":
     unittest.main()
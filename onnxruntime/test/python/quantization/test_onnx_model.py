@@ -5,6 +5,7 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import hashlib
 import tempfile
 import unittest
 from pathlib import Path
@@ -14,6 +15,7 @@ import onnx
 from onnx import TensorProto, helper, numpy_helper
 from op_test_utils import check_op_type_order
 
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, quantize_dynamic, quantize_static
 from onnxruntime.quantization.onnx_model import ONNXModel
 
 
@@ -135,6 +137,63 @@ def construct_model_for_topo_sort_empty_input_output(model_path):
     onnx.save(model, model_path)
 
 
+def construct_model_for_quantization(model_path, num_layers=3, hidden_size=8):
+    # Each layer is
+    #   (hidden) -> MatMul -> Add -> Relu -> MatMul -> Mul -> Add -> (hidden)
+    #      |                                                   ^
+    #      +---------------------------------------------------+
+    # Weights are multiples of 1/4, so that the ranges computed during calibration do not depend on rounding.
+    rng = np.random.default_rng(0)
+    nodes = []
+    initializers = []
+
+    def add_initializer(name, shape):
+        initializers.append(numpy_helper.from_array((rng.integers(-4, 5, shape) / 4).astype(np.float32), name))
+        return name
+
+    hidden = "input"
+    for i in range(num_layers):
+        prefix = f"layer{i}"
+        w1 = add_initializer(f"{prefix}_W1", [hidden_size, hidden_size])
+        b1 = add_initializer(f"{prefix}_B1", [hidden_size])
+        w2 = add_initializer(f"{prefix}_W2", [hidden_size, hidden_size])
+        nodes.extend(
+            [
+                helper.make_node("MatMul", [hidden, w1], [f"{prefix}_MatMul1_O"], f"{prefix}_MatMul1"),
+                helper.make_node("Add", [f"{prefix}_MatMul1_O", b1], [f"{prefix}_Add1_O"], f"{prefix}_Add1"),
+                helper.make_node("Relu", [f"{prefix}_Add1_O"], [f"{prefix}_Relu_O"], f"{prefix}_Relu"),
+                helper.make_node("MatMul", [f"{prefix}_Relu_O", w2], [f"{prefix}_MatMul2_O"], f"{prefix}_MatMul2"),
+                helper.make_node("Mul", [f"{prefix}_MatMul2_O", "half"], [f"{prefix}_Mul_O"], f"{prefix}_Mul"),
+                helper.make_node("Add", [hidden, f"{prefix}_Mul_O"], [f"{prefix}_O"], f"{prefix}_Add2"),
+            ]
+        )
+        hidden = f"{prefix}_O"
+    initializers.append(numpy_helper.from_array(np.array(0.5, dtype=np.float32), "half"))
+    nodes.append(helper.make_node("Identity", [hidden], ["output"], "Output"))
+
+    graph = helper.make_graph(
+        nodes,
+        "onnx_model_quantization_test",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, hidden_size])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, hidden_size])],
+        initializer=initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 7
+    onnx.save(model, model_path)
+
+
+class InputDataReader(CalibrationDataReader):
+    def __init__(self, hidden_size=8, num_samples=4):
+        rng = np.random.default_rng(1)
+        self.samples = iter(
+            [{"input": (rng.integers(-8, 9, (1, hidden_size)) / 4).astype(np.float32)} for _ in range(num_samples)]
+        )
+
+    def get_next(self):
+        return next(self.samples, None)
+
+
 class TestONNXModel(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -168,6 +227,141 @@ class TestONNXModel(unittest.TestCase):
         onnx_model.topological_sort()
         check_op_type_order(self, onnx_model.model, ["Op1", "Op1", "Op2", "Op3"])
 
+    def check_indexes(self, onnx_model):
+        """Check the indexed lookups of onnx_model against scans of its graph"""
+        graph = onnx_model.graph()
+        for tensor in graph.initializer:
+            self.assertIs(onnx_model.get_initializer(tensor.name), tensor)
+        self.assertEqual(onnx_model.get_initializer_name_set(), {tensor.name for tensor in graph.initializer})
+        for graph_input in graph.input:
+            self.assertIs(onnx_model.find_graph_input(graph_input.name), graph_input)
+        for graph_output in graph.output:
+            self.assertIs(onnx_model.find_graph_output(graph_output.name), graph_output)
+
+        input_name_to_nodes = onnx_model.input_name_to_nodes()
+        output_name_to_node = onnx_model.output_name_to_node()
+        tensor_names = {name for node in graph.node for name in [*node.input, *node.output] if name}
+        for name in tensor_names:
+            self.assertCountEqual(
+                [id(node) for node in onnx_model.get_consumers(name)],
+                [id(node) for node in input_name_to_nodes.get(name, [])],
+            )
+            self.assertIs(onnx_model.get_producer(name), output_name_to_node.get(name))
+        for node in graph.node:
+            if node.name:
+                self.assertIs(onnx_model.get_node_by_name(node.name), node)
+
+    def test_indexes(self):
+        test_model_path = str(Path(self._tmp_model_dir.name) / "onnx_model_indexes.onnx")
+        construct_model_for_topo_sort(test_model_path)
+        onnx_model = ONNXModel(onnx.load(test_model_path))
+        self.check_indexes(onnx_model)
+        self.assertIsNone(onnx_model.get_initializer("input"))
+        self.assertTrue(onnx_model.is_graph_input("input"))
+        self.assertFalse(onnx_model.is_graph_input("W1"))
+        self.assertTrue(onnx_model.is_graph_output("output"))
+        self.assertEqual([node.name for node in onnx_model.get_consumers("GRU_O")], ["Conv1", "Conv2"])
+        self.assertEqual(onnx_model.get_producer("Conv1_O").name, "Conv1")
+
+        onnx_model.add_initializer(generate_input_initializer([2], np.float32, "B3"))
+        onnx_model.initializer_extend([generate_input_initializer([2], np.float32, "B4")])
+        onnx_model.remove_initializer(onnx_model.get_initializer("B3"))
+        self.check_indexes(onnx_model)
+        self.assertIsNone(onnx_model.get_initializer("B3"))
+
+        onnx_model.add_node(helper.make_node("Relu", ["Conv2_O"], ["Relu2_O"], name="Relu2"))
+        onnx_model.remove_node(onnx_model.get_producer("Relu_O"))
+        self.check_indexes(onnx_model)
+        self.assertEqual([node.name for node in onnx_model.get_consumers("Conv2_O")], ["Add", "Relu2"])
+        self.assertIsNone(onnx_model.get_producer("Relu_O"))
+        self.assertIsNone(onnx_model.get_node_by_name("Relu"))
+        self.assertEqual(onnx_model.get_node_by_name("Relu2").input, ["Conv2_O"])
+
+        onnx_model.replace_input_of_all_nodes("GRU_O", "GRU_O_renamed")
+        onnx_model.replace_output_of_all_nodes("GRU_O", "GRU_O_renamed")
+        onnx_model.replace_input_of_all_nodes("Relu_O", "Conv1_O")
+        onnx_model.replace_input_of_node(onnx_model.get_producer("output"), "Conv2_O", "Relu2_O")
+        self.check_indexes(onnx_model)
+        self.assertEqual(onnx_model.get_consumers("GRU_O"), [])
+        self.assertEqual(onnx_model.get_producer("GRU_O_renamed").op_type, "GRU")
+        self.assertEqual([node.name for node in onnx_model.get_consumers("Conv2_O")], ["Relu2"])
+
+        onnx_model.graph().node[0].input[0] = "input"
+        onnx_model.reset_indexes()
+        self.check_indexes(onnx_model)
+
+        onnx_model.topological_sort()
+        self.check_indexes(onnx_model)
+
+        # nodes and initializers added to the graph directly are indexed on the next lookup
+        onnx_model.graph().node.extend([helper.make_node("Relu", ["Relu2_O"], ["Relu3_O"], name="Relu3")])
+        onnx_model.graph().initializer.extend([generate_input_initializer([2], np.float32, "B5")])
+        self.check_indexes(onnx_model)
+
+    def test_indexes_after_in_place_renames(self):
+        test_model_path = str(Path(self._tmp_model_dir.name) / "onnx_model_renames.onnx")
+        construct_model_for_topo_sort(test_model_path)
+        onnx_model = ONNXModel(onnx.load(test_model_path))
+        self.check_indexes(onnx_model)
+        conv2 = onnx_model.get_node_by_name("Conv2")
+
+        # Inputs and outputs of nodes renamed with the methods of the model are indexed.
+        onnx_model.set_node_input(conv2, 0, "GRU_O_alt")
+        self.check_indexes(onnx_model)
+        onnx_model.replace_input_of_all_nodes("GRU_O_alt", "GRU_O_new")
+        self.assertEqual(list(conv2.input), ["GRU_O_new", "W2", "B2"])
+        self.assertEqual([node.name for node in onnx_model.get_consumers("GRU_O")], ["Conv1"])
+
+        onnx_model.set_node_output(conv2, 0, "Conv2_O_alt")
+        self.check_indexes(onnx_model)
+        onnx_model.replace_output_of_all_nodes("Conv2_O_alt", "Conv2_O_new")
+        self.assertEqual(list(conv2.output), ["Conv2_O_new"])
+        self.assertIs(onnx_model.get_producer("Conv2_O_new"), conv2)
+        self.assertIsNone(onnx_model.get_producer("Conv2_O"))
+
+        onnx_model.set_node_input(onnx_model.get_node_by_name("Add"), 1, "Conv2_O_new")
+        self.assertEqual([node.name for node in onnx_model.get_consumers("Conv2_O_new")], ["Add"])
+        self.check_indexes(onnx_model)
+
+        # Nodes that are not in the graph are not indexed.
+        relu_copy = helper.make_node("Relu", ["Conv1_O"], ["Relu_O"], name="Relu")
+        onnx_model.set_node_input(relu_copy, 0, "input")
+        self.assertIs(onnx_model.get_producer("Relu_O"), onnx_model.get_node_by_name("Relu"))
+        self.check_indexes(onnx_model)
+
+        # Other changes made in place are indexed after reset_indexes.
+        onnx_model.graph().node[1].input[0] = "GRU_O_alt"
+        onnx_model.get_initializer("W2").name = "W2_alt"
+        onnx_model.reset_indexes()
+        self.check_indexes(onnx_model)
+        self.assertIsNone(onnx_model.get_initializer("W2"))
+        self.assertEqual(onnx_model.get_initializer("W2_alt").name, "W2_alt")
+        onnx_model.replace_input_of_all_nodes("GRU_O_alt", "GRU_O_new")
+        self.assertEqual(onnx_model.graph().node[1].input[0], "GRU_O_new")
+
+    def test_quantized_models_unchanged(self):
+        # Indexing ONNXModel must not change the quantized models. The expected SHA-256 digests are those of the
+        # models quantized by the implementation which looked up initializers and nodes by scanning the graph.
+        expected_digests = {
+            "dynamic": "8b301ae2b30a7da13ed9b24e34db3c9577770b16034ee8b3bfe3540f181c9dec",
+            "static_qdq": "53134b0b6f4108a3c87350a6d75042891f034f82ce9bcc481c238604a2f5f1cb",
+            "static_qoperator": "f36f60e77d29840320d72ea67e2ffaf5afb4fbb49886462f4d9417c1fd98e213",
+        }
+        model_path = str(Path(self._tmp_model_dir.name) / "onnx_model_quantization.onnx")
+        construct_model_for_quantization(model_path)
+
+        quantized_paths = {name: str(Path(self._tmp_model_dir.name) / f"{name}.onnx") for name in expected_digests}
+        quantize_dynamic(model_path, quantized_paths["dynamic"])
+        quantize_static(model_path, quantized_paths["static_qdq"], InputDataReader(), quant_format=QuantFormat.QDQ)
+        quantize_static(
+            model_path, quantized_paths["static_qoperator"], InputDataReader(), quant_format=QuantFormat.QOperator
+        )
+
+        for name, quantized_path in quantized_paths.items():
+            with self.subTest(name=name):
+                digest = hashlib.sha256(Path(quantized_path).read_bytes()).hexdigest()
+                self.assertEqual(digest, expected_digests[name])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -205,6 +205,72 @@ class TestOpMatMul4Bits(unittest.TestCase):
         data_reader = self.input_feeds(1, {"input": [100, 52]})
         self.quant_test(model_fp32_path, data_reader, 32, False)
 
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_num_workers(self):
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_offset.onnx").absolute())
+        self.construct_model_matmul(model_fp32_path, symmetric=False)
+
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        quant_models = []
+        for num_workers in [None, 2]:
+            model = quant_utils.load_model_with_shape_infer(Path(model_fp32_path))
+            quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model, 32, False, num_workers=num_workers)
+            quant.process()
+            quant_models.append(quant.model.model)
+
+        self.assertEqual(quant_models[0].SerializeToString(), quant_models[1].SerializeToString())
+
+    @unittest.skipIf(
+        find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
+    )
+    def test_quantize_matmul_int4_out_of_core(self):
+        model_fp32_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_fp32_external.onnx").absolute())
+        self.construct_model_matmul(model_fp32_path, symmetric=False)
+        onnx.save(
+            onnx.load(model_fp32_path),
+            model_fp32_path,
+            save_as_external_data=True,
+            location="matmul_fp32_external.onnx.data",
+            size_threshold=0,
+        )
+
+        from onnxruntime.quantization import matmul_4bits_quantizer
+
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, 32, False)
+        quant.process()
+        expected_model = quant.model.model
+
+        model_int4_path = str(Path(self._tmp_model_dir.name).joinpath("matmul_int4_out_of_core.onnx").absolute())
+        quant = matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, 32, False)
+        quant.process_out_of_core(model_int4_path)
+
+        model_int4 = onnx.load(model_int4_path, load_external_data=False)
+        external_tensors = [
+            tensor.name
+            for tensor in model_int4.graph.initializer
+            if onnx.external_data_helper.uses_external_data(tensor)
+        ]
+        self.assertEqual(external_tensors, ["linear1.weight_Q4", "linear1.weight_scales"])
+
+        model_int4 = onnx.load(model_int4_path)
+        self.assertEqual(model_int4.graph.node, expected_model.graph.node)
+        self.assertEqual(
+            [tensor.name for tensor in model_int4.graph.initializer],
+            [tensor.name for tensor in expected_model.graph.initializer],
+        )
+        for tensor, expected_tensor in zip(model_int4.graph.initializer, expected_model.graph.initializer):
+            np.testing.assert_array_equal(
+                onnx.numpy_helper.to_array(tensor), onnx.numpy_helper.to_array(expected_tensor)
+            )
+
+        with self.assertRaises(ValueError):
+            matmul_4bits_quantizer.MatMul4BitsQuantizer(model_fp32_path, 32, False).process_out_of_core(
+                model_int4_path, "matmul_fp32_external.onnx.data"
+            )
+
     @unittest.skipIf(
         find_spec("onnxruntime.training"), "Skip because training package doesn't has quantize_matmul_4bits"
     )
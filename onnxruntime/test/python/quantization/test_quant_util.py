@@ -11,9 +11,20 @@ from pathlib import Path
 
 import numpy
 import onnx
+from benchmark_per_channel import make_quantizer, previous_quantize_weight_per_channel, quantize_weight
 from onnx import TensorProto, helper, numpy_helper
+from onnx.reference import ReferenceEvaluator
 
-from onnxruntime.quantization.quant_utils import compute_scale_zp, load_model_with_shape_infer, model_has_infer_metadata
+from onnxruntime.quantization.onnx_quantizer import ONNXQuantizer
+from onnxruntime.quantization.quant_utils import (
+    QuantType,
+    compute_scale_zp,
+    compute_scale_zp_per_channel,
+    get_qmin_qmax_for_qType,
+    load_model_with_shape_infer,
+    model_has_infer_metadata,
+    quantize_nparray,
+)
 
 
 class TestQuantUtil(unittest.TestCase):
@@ -70,6 +81,125 @@ class TestQuantUtil(unittest.TestCase):
             [0, 0.0002 / 65535],
         )
 
+    def test_compute_scale_zp_per_channel(self):
+        rng = numpy.random.default_rng(0)
+        for dtype in [numpy.float32, numpy.float16]:
+            for qtype in [TensorProto.INT8, TensorProto.UINT8, TensorProto.INT16, TensorProto.UINT16]:
+                for min_real_range in [None, 0.01]:
+                    rmin = (rng.standard_normal(32) * 2).astype(dtype)
+                    rmax = (rmin + rng.uniform(0, 4, 32)).astype(dtype)
+                    rmin[:4] = rmax[:4] = 0  # channels of zeros
+                    symmetric = rng.uniform(size=32) < 0.5
+                    reduce_range = rng.uniform(size=32) < 0.5
+                    qranges = [get_qmin_qmax_for_qType(qtype, r, s) for r, s in zip(reduce_range, symmetric)]
+                    qmin = numpy.array([qrange[0] for qrange in qranges])
+                    qmax = numpy.array([qrange[1] for qrange in qranges])
+
+                    zp, scale = compute_scale_zp_per_channel(rmin, rmax, qmin, qmax, symmetric, min_real_range)
+                    self.assertEqual(zp.dtype, qmin.dtype)
+                    for i in range(32):
+                        expected_zp, expected_scale = compute_scale_zp(
+                            rmin[i], rmax[i], qmin[i], qmax[i], symmetric[i], min_real_range
+                        )
+                        self.assertEqual(zp[i], expected_zp)
+                        self.assertEqual(scale[i], expected_scale)
+
+    def test_quantize_weight_per_channel(self):
+        # The vectorized quantize_weight_per_channel must create the same initializers as the previous implementation.
+        rng = numpy.random.default_rng(0)
+        for dtype in [numpy.float32, numpy.float16]:
+            weight = rng.standard_normal((4, 5, 6, 7)).astype(dtype)
+            weight[:, 1] = 0  # channels of zeros along axis 1
+            weight[:, :, 2] = 0.5  # constant channels along axis 2
+            for weight_type in [QuantType.QInt8, QuantType.QUInt8, QuantType.QInt16, QuantType.QUInt16]:
+                for channel_axis in range(weight.ndim):
+                    channel_count = weight.shape[channel_axis]
+                    mixed_overrides = [{} for _ in range(channel_count)]
+                    mixed_overrides[0] = {"scale": 0.02, "zero_point": 3}
+                    mixed_overrides[1] = {"rmin": -1.5, "rmax": 0.5}
+                    mixed_overrides[2] = {"symmetric": True, "reduce_range": True}
+                    mixed_overrides[3] = {"symmetric": False, "reduce_range": False}
+                    quant_type_overrides = [{"quant_type": QuantType.QUInt16} for _ in range(channel_count)]
+                    for weight_symmetric in [False, True]:
+                        for reduce_range in [False, True]:
+                            for min_real_range in [None, 0.01]:
+                                for overrides in [None, mixed_overrides, quant_type_overrides]:
+                                    extra_options = {"WeightSymmetric": weight_symmetric}
+                                    if min_real_range is not None:
+                                        extra_options["MinimumRealRange"] = min_real_range
+                                    if overrides is not None:
+                                        extra_options["TensorQuantOverrides"] = {"W": overrides}
+                                    quantizer = make_quantizer(weight, weight_type, reduce_range, extra_options)
+                                    for reduce_range_arg in [False, True]:
+                                        for keep_float_weight in [False, True]:
+                                            self._check_quantize_weight_per_channel(
+                                                quantizer,
+                                                weight_type.tensor_type,
+                                                channel_axis,
+                                                reduce_range_arg,
+                                                keep_float_weight,
+                                            )
+
+    def _check_quantize_weight_per_channel(self, quantizer, *args):
+        with self.subTest(extra_options=quantizer.extra_options, args=args):
+            expected = quantize_weight(quantizer, previous_quantize_weight_per_channel, *args)
+            initializers = quantize_weight(quantizer, ONNXQuantizer.quantize_weight_per_channel, *args)
+            self.assertEqual(list(initializers), list(expected))
+            for name, initializer in initializers.items():
+                self.assertEqual(initializer.data_type, expected[name].data_type)
+                self.assertEqual(initializer.dims, expected[name].dims)
+                value = numpy_helper.to_array(initializer)
+                expected_value = numpy_helper.to_array(expected[name])
+                self.assertEqual(value.dtype, expected_value.dtype)
+                numpy.testing.assert_array_equal(value, expected_value)
+
+    def test_quantize_nparray_float8(self):
+        # Every exponent and sign, with mantissas around rounding boundaries of float 8 types.
+        mantissas = numpy.array([0, 1, 0x7FFFFF, 0x400000, 0x3FFFFF, 0x200000, 0x100000, 0x80000, 0x7FFFF, 0x180000])
+        bits = (numpy.arange(256, dtype=numpy.uint32)[:, None] << 23 | mantissas.astype(numpy.uint32)).ravel()
+        bits = numpy.concatenate([bits, bits | 0x80000000, [0x7FC00000, 0xFFC00000]]).astype(numpy.uint32)
+        values = bits.view(numpy.float32)
+        values = values[~numpy.isnan(values) | (bits & 0x400000 > 0)]  # Arithmetic makes signaling NaN quiet.
+
+        for qtype in [
+            TensorProto.FLOAT8E4M3FN,
+            TensorProto.FLOAT8E4M3FNUZ,
+            TensorProto.FLOAT8E5M2,
+            TensorProto.FLOAT8E5M2FNUZ,
+        ]:
+            for data, scale in [
+                (values, numpy.array(1.0, dtype=numpy.float32)),
+                (values, numpy.array(0.37, dtype=numpy.float32)),
+                (values.astype(numpy.float16), numpy.array(0.37, dtype=numpy.float16)),
+            ]:
+                model = helper.make_model(
+                    helper.make_graph(
+                        [
+                            helper.make_node(
+                                "Constant", [], ["zero_point"], value=helper.make_tensor("zero_point", qtype, [], [0])
+                            ),
+                            helper.make_node("QuantizeLinear", ["X", "scale", "zero_point"], ["Y"]),
+                        ],
+                        "qu",
+                        [
+                            helper.make_tensor_value_info("X", helper.np_dtype_to_tensor_dtype(data.dtype), None),
+                            helper.make_tensor_value_info("scale", helper.np_dtype_to_tensor_dtype(data.dtype), None),
+                        ],
+                        [helper.make_tensor_value_info("Y", qtype, None)],
+                    )
+                )
+                with numpy.errstate(over="ignore", invalid="ignore"):
+                    expected = ReferenceEvaluator(model).run(None, {"X": data, "scale": scale})[0]
+                    quantized = quantize_nparray(qtype, data, scale, 0)
+                self.assertEqual(quantized.dtype, expected.dtype)
+                expected, quantized = expected.view(numpy.uint8), quantized.view(numpy.uint8)
+                if qtype in (TensorProto.FLOAT8E4M3FNUZ, TensorProto.FLOAT8E5M2FNUZ):
+                    # Some versions of the reference implementation give NaN instead of zero
+                    # for negative values rounded to zero.
+                    is_negative_zero = (quantized == 0) & (expected == 0x80) & (data < 0)
+                    expected = numpy.where(is_negative_zero, 0, expected)
+                numpy.testing.assert_array_equal(quantized, expected)
+
     def test_load_external_model(self):
         input_name = "input"
         output_name = "output"
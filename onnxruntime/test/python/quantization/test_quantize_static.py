@@ -6,16 +6,26 @@
 # --------------------------------------------------------------------------
 
 import tempfile
+import threading
 import unittest
 from importlib.util import find_spec
 from pathlib import Path
+from unittest import mock
 
 import numpy as np
 import onnx
 from onnx import TensorProto, helper
 from op_test_utils import check_model_correctness, generate_random_initializer, input_feeds_neg_one_zero_one
 
-from onnxruntime.quantization import QuantType, StaticQuantConfig, quantize, quantize_static
+from onnxruntime.quantization import (
+    QuantFormat,
+    QuantType,
+    StaticQuantConfig,
+    quantize,
+    quantize_dynamic,
+    quantize_static,
+)
+from onnxruntime.quantization.onnx_quantizer import ONNXQuantizer
 
 
 def construct_test_model(test_model_path, channel_size):
@@ -99,6 +109,64 @@ class TestStaticQuantization(unittest.TestCase):
         check_model_correctness(self, self._model_fp32_path, quant_model_path, data_reader.get_next())
         data_reader.rewind()
 
+    def test_weight_quantization_num_workers(self):
+        data_reader = input_feeds_neg_one_zero_one(10, {"input": [1, self._channel_size, 1, 3]})
+        quantized_weights = []
+
+        def record_thread(quantize_data):
+            def wrapper(quantizer, weight, *args):
+                quantized_weights.append((weight.name, threading.current_thread() is threading.main_thread()))
+                return quantize_data(quantizer, weight, *args)
+
+            return wrapper
+
+        for quant_format in [QuantFormat.QDQ, QuantFormat.QOperator, None]:
+            for per_channel in [False, True]:
+                quant_models = []
+                for num_workers in [None, 4]:
+                    quant_model_path = str(
+                        Path(self._tmp_model_dir.name) / f"quant.{quant_format}.{per_channel}.{num_workers}.onnx"
+                    )
+                    extra_options = {"WeightQuantizationNumWorkers": num_workers}
+                    quantized_weights.clear()
+                    with mock.patch.object(
+                        ONNXQuantizer,
+                        "_quantize_initializer_data",
+                        record_thread(ONNXQuantizer._quantize_initializer_data),
+                    ), mock.patch.object(
+                        ONNXQuantizer,
+                        "_quantize_weight_per_channel_data",
+                        record_thread(ONNXQuantizer._quantize_weight_per_channel_data),
+                    ):
+                        if quant_format is None:
+                            quantize_dynamic(
+                                self._model_fp32_path,
+                                quant_model_path,
+                                per_channel=per_channel,
+                                nodes_to_exclude=["conv3"],
+                                extra_options=extra_options,
+                            )
+                        else:
+                            quantize_static(
+                                self._model_fp32_path,
+                                quant_model_path,
+                                data_reader,
+                                quant_format=quant_format,
+                                per_channel=per_channel,
+                                nodes_to_exclude=["conv3"],
+                                extra_options=extra_options,
+                            )
+                            data_reader.rewind()
+                    quant_models.append(onnx.load(quant_model_path))
+
+                    # Each weight of the quantized nodes is quantized once, by a worker when there are workers.
+                    self.assertEqual(sorted(name for name, _ in quantized_weights), ["W1", "W2"])
+                    on_main_thread = [on_main_thread for _, on_main_thread in quantized_weights]
+                    self.assertEqual(on_main_thread, [num_workers is None] * 2)
+
+                # Weights quantized in parallel give the same model.
+                self.assertEqual(quant_models[0].SerializeToString(), quant_models[1].SerializeToString())
+
     @unittest.skip(
         "Skip failed test in Python Packaging Test Pipeline."
         "During importing neural_compressor, pycocotools throws ValueError: numpy.ndarray size changed"
@@ -188,10 +188,8 @@ class TestTensorQuantOverridesOption(unittest.TestCase):
         self.assertEqual(sig_out_sc.float_data[0], self.default_zp_scales["SIG_OUT"][1])
 
         self.assertEqual(wgt_zp.data_type, self.default_wgt_qtype_per_channel)
-        for index, zp in enumerate(self.default_zp_scales_per_channel["WGT"][0]):
-            self.assertEqual(wgt_zp.int32_data[index], zp)
-        for index, scale in enumerate(self.default_zp_scales_per_channel["WGT"][1]):
-            self.assertEqual(wgt_sc.float_data[index], scale)
+        self.assertEqual(onnx.numpy_helper.to_array(wgt_zp).tolist(), self.default_zp_scales_per_channel["WGT"][0])
+        self.assertEqual(onnx.numpy_helper.to_array(wgt_sc).tolist(), self.default_zp_scales_per_channel["WGT"][1])
 
         self.assertEqual(bias_zp.data_type, self.default_bias_qtype)
 
@@ -357,17 +355,13 @@ class TestTensorQuantOverridesOption(unittest.TestCase):
         )
 
         self.assertEqual(wgt_zp.data_type, self.default_wgt_qtype_per_channel)
-        for index, zp in enumerate(zp_vals):
-            self.assertEqual(wgt_zp.int32_data[index], zp)
-        for index, scale in enumerate(scale_vals):
-            self.assertEqual(wgt_sc.float_data[index], np.float32(scale))
+        self.assertEqual(onnx.numpy_helper.to_array(wgt_zp).tolist(), zp_vals.tolist())
+        self.assertEqual(onnx.numpy_helper.to_array(wgt_sc).tolist(), scale_vals.tolist())
 
         # NOTE: Bias with overrides is treated as a weight.
         self.assertEqual(bias_zp.data_type, self.default_wgt_qtype_per_channel)
-        for index, zp in enumerate(zp_vals):
-            self.assertEqual(bias_zp.int32_data[index], zp)
-        for index, scale in enumerate(scale_vals):
-            self.assertEqual(bias_sc.float_data[index], np.float32(scale))
+        self.assertEqual(onnx.numpy_helper.to_array(bias_zp).tolist(), zp_vals.tolist())
+        self.assertEqual(onnx.numpy_helper.to_array(bias_sc).tolist(), scale_vals.tolist())
 
     def test_qdq_overrides_per_channel2(self):
         """
@@ -412,7 +406,9 @@ class TestTensorQuantOverridesOption(unittest.TestCase):
         )
 
         self.assertEqual(wgt_zp.data_type, quant_type.tensor_type)
-        for index, (zp, scale) in enumerate(zip(wgt_zp.int32_data, wgt_sc.float_data)):
+        wgt_zps, wgt_scs = onnx.numpy_helper.to_array(wgt_zp), onnx.numpy_helper.to_array(wgt_sc)
+        self.assertEqual(len(wgt_zps), len(rmin_vals))
+        for index, (zp, scale) in enumerate(zip(wgt_zps, wgt_scs)):
             wgt_qmin, wgt_qmax = get_qmin_qmax_for_qType(wgt_zp.data_type, reduce_range=reduce_ranges[index])
             expected_zp, expected_scale = compute_scale_zp(
                 np.array(rmin_vals[index], dtype=np.float32),
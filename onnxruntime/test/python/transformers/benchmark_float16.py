@@ -0,0 +1,110 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+
+"""
+Benchmark conversion of float initializers to float16, and compare it with the previous implementation:
+python benchmark_float16.py --num_initializers 32 --initializer_size 4194304 --num_threads 1 4 8
+"""
+
+import argparse
+import copy
+import time
+
+import numpy as np
+from onnx import TensorProto, helper, numpy_helper
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from float16 import convert_float_to_float16, convert_np_to_float16
+else:
+    from onnxruntime.transformers.float16 import convert_float_to_float16, convert_np_to_float16
+
+
+def previous_convert_np_to_float16(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
+    # Implementation before vectorization, excluding its logging.
+    def between(a, b, c):
+        return np.logical_and(a < b, b < c)
+
+    np_array = np.where(between(0, np_array, min_positive_val), min_positive_val, np_array)
+    np_array = np.where(between(-min_positive_val, np_array, 0), -min_positive_val, np_array)
+    np_array = np.where(between(max_finite_val, np_array, float("inf")), max_finite_val, np_array)
+    np_array = np.where(between(float("-inf"), np_array, -max_finite_val), -max_finite_val, np_array)
+    return np.float16(np_array)
+
+
+def previous_npfloat16_to_int(np_list):
+    return [int(bin(_.view("H"))[2:].zfill(16), 2) for _ in np_list]
+
+
+def create_model(num_initializers: int, initializer_size: int):
+    rng = np.random.default_rng(0)
+    initializers = [
+        numpy_helper.from_array(rng.standard_normal(initializer_size).astype(np.float32), f"weight_{i}")
+        for i in range(num_initializers)
+    ]
+    nodes = [helper.make_node("Add", ["input", "weight_0"], ["add_0"], name="add_0")]
+    for i in range(1, num_initializers):
+        nodes.append(helper.make_node("Add", [f"add_{i - 1}", f"weight_{i}"], [f"add_{i}"], name=f"add_{i}"))
+    graph = helper.make_graph(
+        nodes,
+        "adds",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [initializer_size])],
+        [helper.make_tensor_value_info(f"add_{num_initializers - 1}", TensorProto.FLOAT, [initializer_size])],
+        initializers,
+    )
+    return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+
+def measure(function, repeats: int):
+    latency_list = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latency_list.append(time.perf_counter() - start)
+    return min(latency_list)
+
+
+def run_benchmark(args):
+    array = np.random.default_rng(0).standard_normal(args.initializer_size).astype(np.float32)
+    assert np.array_equal(
+        convert_np_to_float16(array).view(np.uint16), previous_convert_np_to_float16(array).view(np.uint16)
+    )
+    previous = measure(lambda: previous_convert_np_to_float16(array), args.repeats)
+    current = measure(lambda: convert_np_to_float16(array), args.repeats)
+    print(f"convert_np_to_float16 of {args.initializer_size} elements:")
+    print(f"\tprevious\t{previous * 1000:.2f} ms")
+    print(f"\tcurrent\t{current * 1000:.2f} ms\t{previous / current:.1f}x")
+
+    float16_list = convert_np_to_float16(array[: args.float_data_size])
+    previous = measure(lambda: previous_npfloat16_to_int(float16_list), args.repeats)
+    current = measure(lambda: float16_list.view(np.uint16).tolist(), args.repeats)
+    print(f"float16 to int32_data of {args.float_data_size} elements:")
+    print(f"\tprevious\t{previous * 1000:.2f} ms")
+    print(f"\tcurrent\t{current * 1000:.2f} ms\t{previous / current:.1f}x")
+
+    model = create_model(args.num_initializers, args.initializer_size)
+    print(f"convert_float_to_float16 of {args.num_initializers} initializers of {args.initializer_size} elements:")
+    for num_threads in args.num_threads:
+        latency = measure(
+            lambda num_threads=num_threads: convert_float_to_float16(
+                copy.deepcopy(model), keep_io_types=True, disable_shape_infer=True, num_threads=num_threads
+            ),
+            args.repeats,
+        )
+        print(f"\tnum_threads={num_threads}\t{latency * 1000:.2f} ms")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_initializers", type=int, default=16)
+    parser.add_argument("--initializer_size", type=int, default=1 << 22)
+    parser.add_argument("--float_data_size", type=int, default=1 << 16)
+    parser.add_argument("--num_threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run_benchmark(parse_arguments())
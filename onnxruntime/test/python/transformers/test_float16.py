@@ -0,0 +1,96 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.  See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import unittest
+
+import numpy as np
+from onnx import TensorProto, helper, numpy_helper
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from float16 import convert_float_to_float16, convert_np_to_float16, convert_tensor_float_to_float16
+else:
+    from onnxruntime.transformers.float16 import (
+        convert_float_to_float16,
+        convert_np_to_float16,
+        convert_tensor_float_to_float16,
+    )
+
+
+def convert_np_to_float16_reference(np_array, min_positive_val=5.96e-08, max_finite_val=65504.0):
+    def between(a, b, c):
+        return np.logical_and(a < b, b < c)
+
+    np_array = np.where(between(0, np_array, min_positive_val), min_positive_val, np_array)
+    np_array = np.where(between(-min_positive_val, np_array, 0), -min_positive_val, np_array)
+    np_array = np.where(between(max_finite_val, np_array, float("inf")), max_finite_val, np_array)
+    np_array = np.where(between(float("-inf"), np_array, -max_finite_val), -max_finite_val, np_array)
+    return np.float16(np_array)
+
+
+class TestFloat16Conversion(unittest.TestCase):
+    def get_test_array(self, dtype=np.float32):
+        special = [0.0, -0.0, 1e-10, -1e-10, 5.96e-08, 1e-5, -1e-5, 1.0, 65504.0, 65520.0, -1e5, 3e38, np.inf, -np.inf]
+        special.append(np.nan)
+        random = np.random.default_rng(0).standard_normal(1000) * np.logspace(-12, 12, 1000)
+        return np.concatenate([np.array(special), random]).astype(dtype)
+
+    def assert_bit_exact(self, actual, expected):
+        self.assertEqual(actual.dtype, np.float16)
+        self.assertEqual(actual.shape, expected.shape)
+        np.testing.assert_array_equal(actual.view(np.uint16), expected.view(np.uint16))
+
+    def test_convert_np_to_float16(self):
+        for dtype in [np.float32, np.float64]:
+            array = self.get_test_array(dtype)
+            for min_positive_val, max_finite_val in [(5.96e-08, 65504.0), (1e-7, 1e4)]:
+                self.assert_bit_exact(
+                    convert_np_to_float16(array, min_positive_val, max_finite_val),
+                    convert_np_to_float16_reference(array, min_positive_val, max_finite_val),
+                )
+
+        array = self.get_test_array().reshape(-1, 5)
+        self.assert_bit_exact(convert_np_to_float16(array), convert_np_to_float16_reference(array))
+        self.assert_bit_exact(convert_np_to_float16(array[:0]), convert_np_to_float16_reference(array[:0]))
+
+    def test_convert_tensor_float_to_float16(self):
+        array = self.get_test_array()
+        expected = convert_np_to_float16_reference(array)
+
+        tensor = convert_tensor_float_to_float16(numpy_helper.from_array(array, "raw"))
+        self.assertEqual(tensor.data_type, TensorProto.FLOAT16)
+        self.assert_bit_exact(numpy_helper.to_array(tensor), expected)
+
+        tensor = convert_tensor_float_to_float16(helper.make_tensor("float_data", TensorProto.FLOAT, [4], array[:4]))
+        self.assertEqual(list(tensor.float_data), [])
+        self.assert_bit_exact(numpy_helper.to_array(tensor), expected[:4])
+
+    def test_convert_initializers_in_threads(self):
+        rng = np.random.default_rng(1)
+        initializers = [
+            numpy_helper.from_array(rng.standard_normal((4, 4)).astype(np.float32), f"weight_{i}") for i in range(8)
+        ]
+        nodes = [helper.make_node("Add", ["input", "weight_0"], ["add_0"], name="add_0")]
+        for i in range(1, 8):
+            nodes.append(helper.make_node("Add", [f"add_{i - 1}", f"weight_{i}"], [f"add_{i}"], name=f"add_{i}"))
+        graph = helper.make_graph(
+            nodes,
+            "adds",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [4, 4])],
+            [helper.make_tensor_value_info("add_7", TensorProto.FLOAT, [4, 4])],
+            initializers,
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+        expected = convert_float_to_float16(model.__deepcopy__(), keep_io_types=True)
+        actual = convert_float_to_float16(model.__deepcopy__(), keep_io_types=True, num_threads=4)
+        self.assertEqual(expected.SerializeToString(), actual.SerializeToString())
+        for initializer in actual.graph.initializer:
+            self.assertEqual(initializer.data_type, TensorProto.FLOAT16)
+
+
+if __name__ == "__main__":
+    unittest.main()
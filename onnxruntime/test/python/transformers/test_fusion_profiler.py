@@ -0,0 +1,91 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.  See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+import unittest
+
+from bert_model_generator import create_bert_attention
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from fusion_options import FusionOptions
+    from fusion_profiler import FusionProfiler, get_active_profiler
+    from optimizer import optimize_by_fusion
+else:
+    from onnxruntime.transformers.fusion_options import FusionOptions
+    from onnxruntime.transformers.fusion_profiler import FusionProfiler, get_active_profiler
+    from onnxruntime.transformers.optimizer import optimize_by_fusion
+
+
+class TestFusionProfiler(unittest.TestCase):
+    def optimize(self):
+        options = FusionOptions("bert")
+        options.use_raw_attention_mask(True)
+        return optimize_by_fusion(create_bert_attention(), optimization_options=options)
+
+    def test_profile(self):
+        with FusionProfiler() as profiler:
+            self.assertIs(get_active_profiler(), profiler)
+            optimizer = self.optimize()
+        self.assertIsNone(get_active_profiler())
+        self.assertEqual(optimizer.get_fused_operator_statistics()["Attention"], 1)
+
+        passes = {record["name"]: record for record in profiler.to_dict()["passes"]}
+        self.assertEqual(passes["optimize"]["depth"], 0)
+        self.assertGreater(passes["optimize"]["nodes_before"], passes["optimize"]["nodes_after"])
+        self.assertIn("topological_sort", passes)
+
+        attention = passes["Attention"]
+        self.assertEqual(attention["depth"], 1)
+        self.assertGreater(attention["nodes_before"], attention["nodes_after"])
+        self.assertGreater(attention["nodes_visited"], 0)
+        self.assertGreaterEqual(attention["matches_attempted"], attention["matches_found"])
+        self.assertGreater(attention["matches_found"], 0)
+        self.assertLessEqual(attention["duration_ms"], passes["optimize"]["duration_ms"])
+        self.assertGreaterEqual(
+            passes["optimize"]["matches_attempted"],
+            sum(record["matches_attempted"] for record in profiler.passes if record["depth"] == 1),
+        )
+
+        call_sites = [s for s in profiler.to_dict()["match_parent_path"] if s["pass"] == "Attention"]
+        self.assertEqual(sum(s["calls"] for s in call_sites), attention["matches_attempted"])
+        self.assertTrue(all(s["call_site"].startswith("fusion_attention.py:") for s in call_sites))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, "profile.json")
+            trace_path = os.path.join(tmp_dir, "trace.json")
+            profiler.save_json(json_path)
+            profiler.save_chrome_trace(trace_path)
+            with open(json_path) as f:
+                self.assertEqual(len(json.load(f)["passes"]), len(profiler.passes))
+            with open(trace_path) as f:
+                events = json.load(f)["traceEvents"]
+
+        complete_events = [event for event in events if event["ph"] == "X"]
+        self.assertEqual(len(complete_events), len(profiler.passes))
+        self.assertIn("Attention", [event["name"] for event in complete_events])
+        self.assertTrue(all(event["dur"] >= 0 for event in complete_events))
+
+    def test_no_profiler(self):
+        self.assertIsNone(get_active_profiler())
+        optimizer = self.optimize()
+        self.assertEqual(optimizer.get_fused_operator_statistics()["Attention"], 1)
+
+    def test_profile_through_package(self):
+        # The optimizer imports fusion_profiler as a top-level module, a profiler from the package has to be seen.
+        from onnxruntime.transformers import fusion_profiler
+
+        with fusion_profiler.FusionProfiler() as profiler:
+            self.assertIs(get_active_profiler(), profiler)
+            self.optimize()
+        self.assertIn("optimize", [record["name"] for record in profiler.passes])
+        self.assertIn("Attention", [record["name"] for record in profiler.passes])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,303 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation.  All rights reserved.
+# Licensed under the MIT License.  See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from parity_utilities import find_transformers_source
+
+if find_transformers_source():
+    from onnx_model import OnnxModel
+else:
+    from onnxruntime.transformers.onnx_model import OnnxModel
+
+
+class TestOnnxModelIndex(unittest.TestCase):
+    def create_model(self):
+        #  (input) -> Relu -> If(then: Relu, else: Identity) -> Sigmoid -> (output)
+        then_branch = helper.make_graph(
+            [helper.make_node("Relu", ["relu_out"], ["then_out"], name="then_relu")],
+            "then_branch",
+            [],
+            [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, [2])],
+            [numpy_helper.from_array(np.ones(2, dtype=np.float32), "then_weight")],
+        )
+        else_branch = helper.make_graph(
+            [helper.make_node("Identity", ["relu_out"], ["else_out"], name="else_identity")],
+            "else_branch",
+            [],
+            [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, [2])],
+        )
+        nodes = [
+            helper.make_node("Relu", ["input"], ["relu_out"], name="relu"),
+            helper.make_node("If", ["cond"], ["if_out"], name="if", then_branch=then_branch, else_branch=else_branch),
+            helper.make_node("Sigmoid", ["if_out"], ["output"], name="sigmoid"),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "main",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [2])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [2])],
+            [
+                numpy_helper.from_array(np.array(True), "cond"),
+                numpy_helper.from_array(np.zeros(2, dtype=np.float32), "weight"),
+            ],
+        )
+        return OnnxModel(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]))
+
+    def node_names(self, nodes):
+        return [node.name for node in nodes]
+
+    def test_lookups(self):
+        model = self.create_model()
+        self.assertEqual(self.node_names(model.get_nodes_by_op_type("Relu")), ["relu", "then_relu"])
+        self.assertEqual(model.get_initializer("then_weight").name, "then_weight")
+        self.assertIsNone(model.get_initializer("missing"))
+
+        then_relu = model.get_nodes_by_op_type("Relu")[1]
+        self.assertEqual(model.get_graph_by_node(then_relu).name, "then_branch")
+        # A copy of a node is found by comparing it with the nodes of the graphs.
+        relu_copy = helper.make_node("Relu", ["input"], ["relu_out"], name="relu")
+        self.assertEqual(model.get_graph_by_node(relu_copy).name, "main")
+
+    def test_index_maintained(self):
+        model = self.create_model()
+        model.get_nodes_by_op_type("Relu")
+
+        model.add_node(helper.make_node("Relu", ["output"], ["output2"], name="relu2"))
+        model.add_node(helper.make_node("Relu", ["relu_out"], ["then_out2"], name="then_relu2"), "then_branch")
+        model.add_initializer(numpy_helper.from_array(np.ones(1, dtype=np.float32), "added"), "else_branch")
+        self.assertEqual(
+            self.node_names(model.get_nodes_by_op_type("Relu")), ["relu", "relu2", "then_relu", "then_relu2"]
+        )
+        self.assertEqual(model.get_initializer("added").name, "added")
+        self.assertEqual(model.get_graph_by_node(model.get_nodes_by_op_type("Relu")[3]).name, "then_branch")
+
+        model.remove_nodes(model.get_nodes_by_op_type("Relu")[1:3])
+        self.assertEqual(self.node_names(model.get_nodes_by_op_type("Relu")), ["relu", "then_relu2"])
+        self.assertEqual(self.node_names(model.graph().node), ["relu", "if", "sigmoid"])
+        self.assertEqual(self.node_names(model.nodes()), self.node_names(OnnxModel(model.model).nodes()))
+
+        model.remove_node(helper.make_node("Sigmoid", ["if_out"], ["output"], name="sigmoid"))
+        self.assertEqual(model.get_nodes_by_op_type("Sigmoid"), [])
+
+    def check_index(self, model):
+        """Compare the index of a model with the one of a new model."""
+        expected = OnnxModel(model.model)
+        for op_type in {node.op_type for node in expected.nodes()}:
+            self.assertEqual(
+                self.node_names(model.get_nodes_by_op_type(op_type)),
+                self.node_names(expected.get_nodes_by_op_type(op_type)),
+            )
+        input_name_to_nodes = model.input_name_to_nodes()
+        self.assertEqual(
+            {name: self.node_names(nodes) for name, nodes in input_name_to_nodes.items()},
+            {name: self.node_names(nodes) for name, nodes in expected.input_name_to_nodes().items()},
+        )
+        output_name_to_node = model.output_name_to_node()
+        self.assertEqual(
+            {name: node.name for name, node in output_name_to_node.items()},
+            {name: node.name for name, node in expected.output_name_to_node().items()},
+        )
+        for node in expected.nodes():
+            self.assertEqual(model.get_graph_by_node(node).name, expected.get_graph_by_node(node).name)
+
+    def test_node_inputs_and_outputs_maintained(self):
+        model = self.create_model()
+        relu, if_node, sigmoid = model.graph().node
+        self.assertEqual(self.node_names(model.get_consumers("relu_out")), ["else_identity", "then_relu"])
+        self.assertEqual(model.get_producer("if_out").name, "if")
+        self.assertEqual(self.node_names(model.get_children(relu)), ["else_identity", "then_relu"])
+        self.assertEqual(model.get_parent(sigmoid, 0), if_node)
+
+        # Change the input of a node in the middle of the graph.
+        model.set_node_input(if_node, 0, "relu_out")
+        self.assertEqual(self.node_names(model.get_consumers("relu_out")), ["if", "else_identity", "then_relu"])
+        self.assertEqual(self.node_names(model.get_children(relu)), ["if", "else_identity", "then_relu"])
+        self.assertEqual(model.get_consumers("cond"), [])
+        self.check_index(model)
+
+        model.replace_input_of_node(sigmoid, "if_out", "relu_out")
+        model.set_node_input(sigmoid, 1, "relu_out")
+        self.assertEqual(
+            self.node_names(model.get_children(relu)), ["if", "sigmoid", "sigmoid", "else_identity", "then_relu"]
+        )
+        self.check_index(model)
+
+        model.replace_output_of_node(relu, "relu_out", "relu_out2")
+        self.assertIsNone(model.get_producer("relu_out"))
+        self.assertEqual(model.get_producer("relu_out2"), relu)
+        self.assertEqual(model.get_parents(sigmoid), [])
+        self.check_index(model)
+
+        model.set_node_output(if_node, 0, "output")
+        model.replace_input_of_all_nodes("relu_out", "relu_out2")
+        self.assertEqual(self.node_names(model.get_children(relu)), ["if", "sigmoid", "sigmoid"])
+        # Nodes of subgraphs are not changed by replace_input_of_all_nodes.
+        self.assertEqual(self.node_names(model.get_consumers("relu_out")), ["else_identity", "then_relu"])
+        self.check_index(model)
+
+        model.replace_output_of_all_nodes("output", "if_out")
+        self.assertEqual(self.node_names(model.get_consumers("if_out")), [])
+        self.assertEqual(self.node_names([model.get_producer("if_out")]), ["sigmoid"])
+        self.check_index(model)
+
+        # The static methods only change the node, the index is rebuilt after invalidate_index.
+        OnnxModel.replace_node_input(sigmoid, "relu_out2", "input")
+        OnnxModel.replace_node_output(sigmoid, "if_out", "output")
+        model.invalidate_index()
+        self.assertEqual(self.node_names(model.get_consumers("input")), ["relu", "sigmoid", "sigmoid"])
+        self.assertEqual(model.get_producer("output"), sigmoid)
+        self.check_index(model)
+
+    def test_node_replaced_in_the_middle(self):
+        model = self.create_model()
+        model.input_name_to_nodes()
+        relu = model.graph().node[0]
+
+        model.remove_node(relu)
+        model.add_node(helper.make_node("Gelu", ["input"], ["relu_out"], name="gelu", domain="com.microsoft"))
+        self.assertEqual(self.node_names(model.get_nodes_by_op_type("Relu")), ["then_relu"])
+        self.assertEqual(model.get_producer("relu_out").name, "gelu")
+        self.check_index(model)
+
+        # A node inserted before the nodes of a subgraph is kept in the order of the graph.
+        model.set_node_input(model.get_nodes_by_op_type("Relu")[0], 0, "then_in")
+        model.add_node(helper.make_node("Relu", ["relu_out"], ["then_in"], name="then_first"), "then_branch")
+        self.assertEqual(self.node_names(model.get_nodes_by_op_type("Relu")), ["then_first", "then_relu"])
+        self.check_index(model)
+
+    def test_graph_modified_directly(self):
+        model = self.create_model()
+        model.get_nodes_by_op_type("Relu")
+        model.get_initializer("weight")
+
+        # Changes without the methods of OnnxModel are seen after invalidate_index.
+        model.graph().node[0].op_type = "Sigmoid"
+        model.graph().node[-1].input[0] = "relu_out"
+        model.graph().initializer[-1].name = "renamed"
+        model.invalidate_index()
+        self.assertEqual(self.node_names(model.get_nodes_by_op_type("Sigmoid")), ["relu", "sigmoid"])
+        self.assertEqual(self.node_names(model.get_consumers("relu_out")), ["sigmoid", "else_identity", "then_relu"])
+        self.assertIsNone(model.get_initializer("weight"))
+        self.assertEqual(model.get_initializer("renamed").name, "renamed")
+        self.check_index(model)
+
+        model.topological_sort()
+        model.prune_graph()
+        self.check_index(model)
+
+    def test_model_replaced(self):
+        model = self.create_model()
+        model.get_nodes_by_op_type("Relu")
+        model.get_initializer("weight")
+
+        # Replacing the ModelProto, like after shape inference, discards the graphs and the index of the previous one.
+        inferred_model = onnx.ModelProto()
+        inferred_model.CopyFrom(model.model)
+        inferred_model.graph.node[0].op_type = "Gelu"
+        inferred_model.graph.initializer[-1].name = "renamed"
+        model.model = inferred_model
+        self.assertEqual(model.graphs()[0], inferred_model.graph)
+        self.assertEqual(self.node_names(model.get_nodes_by_op_type("Relu")), ["then_relu"])
+        self.assertIs(model.get_nodes_by_op_type("Gelu")[0], inferred_model.graph.node[0])
+        self.assertIs(model.get_producer("relu_out"), inferred_model.graph.node[0])
+        self.assertIsNone(model.get_initializer("weight"))
+        self.assertEqual(model.get_initializer("renamed").name, "renamed")
+        self.check_index(model)
+
+
+class TestRemoveDuplicatedInitializer(unittest.TestCase):
+    def create_model(self):
+        #  (input) -> Add(a) -> Add(b) -> Add(c) -> If(then: Add(d), else: Add(e)) -> (output)
+        # where b has same value as a, c has same data but different shape, d has same value as a, and e is a copy
+        # of the initializer f of the then branch.
+        value = np.arange(6, dtype=np.float32)
+        then_branch = helper.make_graph(
+            [
+                helper.make_node("Add", ["add_c", "d"], ["then_add"], name="then_add"),
+                helper.make_node("Add", ["then_add", "f"], ["then_out"], name="then_add_f"),
+            ],
+            "then_branch",
+            [],
+            [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, [6])],
+            [numpy_helper.from_array(value, "d"), numpy_helper.from_array(value + 1, "f")],
+        )
+        else_branch = helper.make_graph(
+            [helper.make_node("Add", ["add_c", "e"], ["else_out"], name="else_add")],
+            "else_branch",
+            [],
+            [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, [6])],
+            [numpy_helper.from_array(value + 1, "e")],
+        )
+        nodes = [
+            helper.make_node("Add", ["input", "a"], ["add_a"], name="add_a"),
+            helper.make_node("Add", ["add_a", "b"], ["add_b"], name="add_b"),
+            helper.make_node("Add", ["add_b", "c"], ["add_c"], name="add_c"),
+            helper.make_node("If", ["cond"], ["output"], name="if", then_branch=then_branch, else_branch=else_branch),
+        ]
+        graph = helper.make_graph(
+            nodes,
+            "main",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [6])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [6])],
+            [
+                numpy_helper.from_array(np.array(True), "cond"),
+                numpy_helper.from_array(value, "a"),
+                numpy_helper.from_array(value, "b"),
+                numpy_helper.from_array(value.reshape(2, 3), "c"),
+            ],
+        )
+        return helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+
+    def initializer_names(self, graph):
+        return [initializer.name for initializer in graph.initializer]
+
+    def verify_model(self, model):
+        main_graph = model.graph()
+        branches = {attr.name: attr.g for attr in main_graph.node[3].attribute}
+        then_branch, else_branch = branches["then_branch"], branches["else_branch"]
+        self.assertEqual(self.initializer_names(main_graph), ["cond", "a", "c"])
+        self.assertEqual(list(main_graph.node[1].input), ["add_a", "a"])
+        self.assertEqual(list(main_graph.node[2].input), ["add_b", "c"])
+        self.assertEqual(self.initializer_names(then_branch), ["f"])
+        self.assertEqual(list(then_branch.node[0].input), ["add_c", "a"])
+        # The initializer of a sibling branch is not visible in else branch.
+        self.assertEqual(self.initializer_names(else_branch), ["e"])
+
+    def test_remove_duplicated_initializer(self):
+        model = OnnxModel(self.create_model())
+        cache = {}
+        model.remove_duplicated_initializer(cache)
+        self.verify_model(model)
+        self.assertEqual(set(cache), {"cond", "a", "b", "c", "d", "e", "f"})
+        self.assertEqual(cache["a"], cache["b"])
+        self.assertTrue(OnnxModel.has_same_value(model.get_initializer("a"), model.get_initializer("a"), cache, cache))
+
+    def test_remove_duplicated_initializer_external_data(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = os.path.join(tmp_dir, "model.onnx")
+            onnx.save_model(
+                self.create_model(),
+                model_path,
+                save_as_external_data=True,
+                all_tensors_to_one_file=True,
+                location="model.data",
+                size_threshold=0,
+            )
+            model = OnnxModel(onnx.load_model(model_path, load_external_data=False))
+            model.remove_duplicated_initializer(base_dir=tmp_dir)
+            self.verify_model(model)
+            # Data is not loaded into the initializers.
+            self.assertFalse(model.get_initializer("a").HasField("raw_data"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,12 +7,34 @@
 
 # For live logging, use the command: pytest -o log_cli=true --log-cli-level=DEBUG
 
+import json
 import os
+import tempfile
 import unittest
 
 import pytest
+from parity_utilities import find_transformers_source
 from test_optimizer import _get_test_model_path
 
+if find_transformers_source():
+    from profile_summary import (
+        ProfileDiff,
+        ProfileSummary,
+        iter_profile_events,
+        load_profile_summary,
+        summarize_profile_events,
+    )
+    from profiler import group_node_results, parse_kernel_results, parse_node_results
+else:
+    from onnxruntime.transformers.profile_summary import (
+        ProfileDiff,
+        ProfileSummary,
+        iter_profile_events,
+        load_profile_summary,
+        summarize_profile_events,
+    )
+    from onnxruntime.transformers.profiler import group_node_results, parse_kernel_results, parse_node_results
+
 
 class TestBertProfiler(unittest.TestCase):
     def setUp(self):
@@ -39,6 +61,171 @@ class TestBertProfiler(unittest.TestCase):
         self.run_profile(f"--model {input_model_path} --batch_size 1 --sequence_length 7 --dummy_inputs default")
 
 
+def _create_profile_events(num_runs):
+    events = [
+        {"cat": "Session", "name": "model_loading_uri", "dur": 10, "args": {}},
+        {"cat": "Kernel", "name": "memcpy", "dur": 3, "args": {"op_name": ""}},
+        {"cat": "Session", "name": "session_initialization", "dur": 20, "args": {}},
+    ]
+    for run in range(num_runs):
+        for node, op_name in [("add", "Add"), ("matmul", "MatMul")]:
+            events.append({"cat": "Node", "name": f"{node}_fence_before", "dur": 0, "args": {"op_name": op_name}})
+            events.append(
+                {
+                    "cat": "Node",
+                    "name": f"{node}_kernel_time",
+                    "dur": 10 + run,
+                    "args": {
+                        "op_name": op_name,
+                        "provider": "CUDAExecutionProvider",
+                        "input_type_shape": [{"float": [2, run % 2 + 1]}],
+                        "output_type_shape": [{"float": [2, run % 2 + 1]}],
+                    },
+                }
+            )
+            events.append(
+                {
+                    "cat": "Kernel",
+                    "name": f"{op_name}_kernel",
+                    "dur": 5 + run,
+                    "args": {"op_name": op_name, "block_x": 128, "grid_x": run + 1},
+                }
+            )
+            events.append({"cat": "Node", "name": f"{node}_fence_after", "dur": 1, "args": {"op_name": op_name}})
+        events.append({"cat": "Session", "name": "model_run", "dur": 100, "args": {}})
+    return events
+
+
+class TestProfileSummary(unittest.TestCase):
+    def setUp(self):
+        self.events = _create_profile_events(num_runs=4)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profile_path = os.path.join(self.temp_dir.name, "profile.json")
+        with open(self.profile_path, "w") as f:
+            f.write("[\n" + ",\n".join(json.dumps(event) for event in self.events) + "\n]\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_iter_profile_events(self):
+        # Small chunks make events span across chunks.
+        self.assertEqual(list(iter_profile_events(self.profile_path, chunk_size=7)), self.events)
+
+        trace_path = os.path.join(self.temp_dir.name, "trace.json")
+        with open(trace_path, "w") as f:
+            json.dump({"displayTimeUnit": "ns", "traceEvents": self.events}, f)
+        self.assertEqual(list(iter_profile_events(trace_path, chunk_size=5)), self.events)
+
+    def test_results_match_profile_events(self):
+        summary = load_profile_summary(self.profile_path)
+        self.assertEqual(summary.metadata["total_runs"], 4)
+        self.assertEqual(parse_kernel_results(summary, 0), parse_kernel_results(self.events, 0))
+        self.assertEqual(parse_node_results(summary, True, 0), parse_node_results(self.events, True, 0))
+        self.assertEqual(group_node_results(summary, False, True), group_node_results(self.events, False, True))
+
+        summary_path = os.path.join(self.temp_dir.name, "summary.npz")
+        summary.save(summary_path)
+        reloaded_summary = load_profile_summary(summary_path)
+        self.assertEqual(reloaded_summary.rows(), summary.rows())
+        self.assertEqual(reloaded_summary.metadata, summary.metadata)
+
+    def test_summarize_model_runs(self):
+        summary = summarize_profile_events(self.events, start_run=1, end_run=3)
+        self.assertEqual(summary.metadata["num_runs"], 2)
+
+        kernel_time = {}
+        for row in summary.rows():
+            if row.cat == "Node" and row.name == "add_kernel_time":
+                kernel_time[row.input_type_shape] = (row.duration, row.count)
+        self.assertEqual(kernel_time, {"float(2x2)": (11, 1), "float(2x1)": (12, 1)})
+
+        # Kernels have the input shape of the node launching them, except before the first node of selected runs.
+        kernel_shapes = {
+            (row.name, row.input_type_shape, row.dimensions) for row in summary.rows() if row.cat == "Kernel"
+        }
+        self.assertIn(("Add_kernel", "float(2x2)", "b128x-1x-1,g2x-1x-1"), kernel_shapes)
+        self.assertIn(("MatMul_kernel", "float(2x1)", "b128x-1x-1,g3x-1x-1"), kernel_shapes)
+
+        self.assertIsInstance(summarize_profile_events(self.events), ProfileSummary)
+        self.assertEqual(len(summarize_profile_events(self.events[:3], start_run=1)), 3)
+
+    def test_profile_diff(self):
+        # In the target, MatMul is two times slower and launches another kernel, add has another input shape instead
+        # of 2x1, and the kernel of Add is three times slower.
+        target_events = json.loads(json.dumps(self.events))
+        for event in target_events:
+            if event["name"] == "matmul_kernel_time":
+                event["dur"] *= 2
+            elif event["name"] == "MatMul_kernel":
+                event["name"] = "Gemm_kernel"
+            elif event["name"] == "add_kernel_time" and event["args"]["input_type_shape"] == [{"float": [2, 1]}]:
+                event["args"]["input_type_shape"] = [{"float": [4, 1]}]
+            elif event["name"] == "Add_kernel":
+                event["dur"] *= 3
+
+        baseline = summarize_profile_events(self.events)
+        diff = ProfileDiff(baseline, summarize_profile_events(target_events), threshold=0.4)
+
+        self.assertEqual(diff.total[1:4], (23.0, 34.5, 11.5))
+        self.assertEqual(
+            [(delta.key, delta.delta, delta.regression) for delta in diff.op_deltas],
+            [("MatMul", 11.5, True), ("Add", 0.0, False)],
+        )
+        self.assertEqual(
+            [(delta.key, delta.target) for delta in diff.node_deltas],
+            [
+                (("matmul", "MatMul", "float(2x2)"), 12.0),
+                (("matmul", "MatMul", "float(2x1)"), 11.0),
+                (("add", "Add", "float(2x2)"), 6.0),
+            ],
+        )
+        self.assertEqual(
+            [(delta.key, delta.baseline, delta.target) for delta in diff.kernel_deltas],
+            [(("Add_kernel", "Add", "float(2x2)"), 3.5, 10.5)],
+        )
+        self.assertEqual(
+            [delta.key for delta in diff.regressions],
+            [
+                "total",
+                "MatMul",
+                ("matmul", "MatMul", "float(2x2)"),
+                ("matmul", "MatMul", "float(2x1)"),
+                ("Add_kernel", "Add", "float(2x2)"),
+            ],
+        )
+        self.assertEqual(
+            diff.added_kernels,
+            [
+                ("Add_kernel", "Add", "float(4x1)"),
+                ("Gemm_kernel", "MatMul", "float(2x1)"),
+                ("Gemm_kernel", "MatMul", "float(2x2)"),
+            ],
+        )
+        self.assertEqual(
+            diff.removed_kernels,
+            [
+                ("Add_kernel", "Add", "float(2x1)"),
+                ("MatMul_kernel", "MatMul", "float(2x1)"),
+                ("MatMul_kernel", "MatMul", "float(2x2)"),
+            ],
+        )
+        self.assertEqual(
+            diff.shape_changes, {("add", "Add"): (["float(2x1)", "float(2x2)"], ["float(2x2)", "float(4x1)"])}
+        )
+        self.assertEqual((diff.added_ops, diff.removed_ops, diff.added_nodes, diff.removed_nodes), ([], [], [], []))
+        self.assertEqual(
+            json.loads(json.dumps(diff.to_dict()))["removed_kernels"][0], ["Add_kernel", "Add", "float(2x1)"]
+        )
+
+        # A larger threshold only reports the regressions of MatMul nodes with both shapes, which are 100% slower, and
+        # of the Add kernel, which is 200% slower.
+        diff = ProfileDiff(baseline, summarize_profile_events(target_events), threshold=0.9)
+        self.assertEqual(len(diff.regressions), 4)
+        self.assertIn("4 regression(s) found.", diff.format()[-1])
+
+        self.assertEqual(ProfileDiff(baseline, baseline).regressions, [])
+
+
 if __name__ == "__main__":
     import sys
 
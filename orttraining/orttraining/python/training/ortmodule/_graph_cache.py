@@ -0,0 +1,260 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+# --------------------------------------------------------------------------
+# _graph_cache.py
+
+import contextlib
+import inspect
+import json
+import os
+import sys
+import tempfile
+from collections import OrderedDict, abc
+from hashlib import md5 as hash_fn
+from logging import Logger
+from typing import Any, Dict, Optional, Tuple
+
+import onnx
+import torch
+
+from onnxruntime.capi import _pybind_state as C
+from onnxruntime.training.utils.torch_io_helper import _TensorStub
+
+# Fields of C.GraphInfo that are saved along with the optimized model.
+_GRAPH_INFO_FIELDS = [
+    "user_input_names",
+    "user_input_grad_names",
+    "initializer_names",
+    "initializer_names_to_train",
+    "initializer_grad_names_to_train",
+    "user_output_names",
+    "output_grad_indices_non_differentiable",
+    "output_grad_indices_require_full_shape",
+    "module_output_indices_requires_save_for_backward",
+    "frontier_node_arg_map",
+    "cached_node_arg_names",
+    "module_output_gradient_name",
+]
+
+# Nodes running torch.autograd.Function, see has_python_op.
+_PYTHON_OP_DOMAIN = "com.microsoft"
+_PYTHON_OP_TYPES = ("PythonOp", "PythonOpGrad")
+
+
+def get_cache_key(*parts) -> str:
+    """Hash the repr of all parts, which must be deterministic across process restarts."""
+    return hash_fn(repr(parts).encode()).hexdigest()
+
+
+def get_module_source_digest(module: torch.nn.Module) -> str:
+    """Hash the source code of all module classes, so that a change of the forward code invalidates the cache."""
+    digest = hash_fn()
+    for module_class in sorted({type(m) for m in module.modules()}, key=lambda c: f"{c.__module__}.{c.__qualname__}"):
+        digest.update(f"{module_class.__module__}.{module_class.__qualname__}".encode())
+        # Source is not available for classes defined in an interactive session, only their names are hashed.
+        with contextlib.suppress(OSError, TypeError):
+            digest.update(inspect.getsource(module_class).encode())
+    return digest.hexdigest()
+
+
+def has_python_op(model: onnx.ModelProto) -> bool:
+    """Whether the model has PythonOp nodes, which can not be cached.
+
+    The export of a PythonOp registers its autograd.Function and constant inputs in the backend, which a cached model
+    would skip, and its input_pointer_scalars attribute holds addresses of objects of the exporting process.
+    """
+    return any(node.domain == _PYTHON_OP_DOMAIN and node.op_type in _PYTHON_OP_TYPES for node in model.graph.node)
+
+
+def graph_info_to_dict(graph_info: C.GraphInfo) -> Dict[str, Any]:
+    return {field: getattr(graph_info, field) for field in _GRAPH_INFO_FIELDS}
+
+
+def graph_info_from_dict(graph_info_dict: Dict[str, Any]) -> C.GraphInfo:
+    graph_info = C.GraphInfo()
+    for field, value in graph_info_dict.items():
+        setattr(graph_info, field, value)
+    return graph_info
+
+
+def _type_to_json(value_type: type) -> Dict[str, str]:
+    return {"module": value_type.__module__, "qualname": value_type.__qualname__}
+
+
+def _type_from_json(type_dict: Dict[str, str]) -> type:
+    # Only types of modules that are already imported are used, loading metadata never imports modules.
+    value_type = sys.modules.get(type_dict["module"])
+    if value_type is None:
+        raise ValueError(f"Module {type_dict['module']} of cached metadata is not imported.")
+    for name in type_dict["qualname"].split("."):
+        value_type = getattr(value_type, name)
+    if not isinstance(value_type, type):
+        raise ValueError(f"{type_dict['module']}.{type_dict['qualname']} of cached metadata is not a type.")
+    return value_type
+
+
+def metadata_to_json(value: Any) -> Any:
+    """Converts metadata (like schemas, dynamic axes and graph info) to values that json can save.
+
+    Lists, strings, numbers and None are saved as they are. _TensorStub, sequences and mappings are saved as objects
+    with their type, so that metadata_from_json restores namedtuples, mapping types and non-string keys.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [metadata_to_json(item) for item in value]
+    if isinstance(value, _TensorStub):
+        return {"tensor_stub": {slot: metadata_to_json(getattr(value, slot)) for slot in _TensorStub.__slots__}}
+    if isinstance(value, abc.Mapping):
+        return {
+            "mapping": _type_to_json(type(value)),
+            "items": [[metadata_to_json(key), metadata_to_json(item)] for key, item in value.items()],
+        }
+    if isinstance(value, abc.Sequence):
+        return {"sequence": _type_to_json(type(value)), "items": [metadata_to_json(item) for item in value]}
+    raise TypeError(f"Type {type(value)} of metadata can not be saved in the graph cache.")
+
+
+def metadata_from_json(value: Any) -> Any:
+    """Restores metadata saved by metadata_to_json."""
+    if isinstance(value, list):
+        return [metadata_from_json(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "tensor_stub" in value:
+        stub = _TensorStub(None)
+        for slot, slot_value in value["tensor_stub"].items():
+            if slot not in _TensorStub.__slots__:
+                raise ValueError(f"Unexpected field {slot} of _TensorStub in cached metadata.")
+            setattr(stub, slot, metadata_from_json(slot_value))
+        return stub
+    if "mapping" in value:
+        mapping_type = _type_from_json(value["mapping"])
+        if not issubclass(mapping_type, abc.Mapping):
+            raise ValueError(f"{mapping_type} of cached metadata is not a mapping.")
+        items = {metadata_from_json(key): metadata_from_json(item) for key, item in value["items"]}
+        # Same as extract_data_and_schema, which builds mappings from keyword arguments.
+        return items if mapping_type is dict else mapping_type(**items)
+    if "sequence" in value:
+        sequence_type = _type_from_json(value["sequence"])
+        if not issubclass(sequence_type, abc.Sequence) or issubclass(sequence_type, str):
+            raise ValueError(f"{sequence_type} of cached metadata is not a sequence.")
+        items = [metadata_from_json(item) for item in value["items"]]
+        try:
+            # namedtuple can be created by passing the list sequence to method _make
+            return sequence_type._make(items)
+        except AttributeError:
+            return sequence_type(items)
+    raise ValueError(f"Unexpected object {sorted(value)} in cached metadata.")
+
+
+class GraphCache:
+    """On-disk cache of ORTModule models, so that a restarted process skips model export and graph building.
+
+    Each entry is an ONNX model `<key>.onnx` with metadata `<key>.json`. Metadata is saved as JSON rather than
+    pickled, so that a shared cache directory can not make the training process run code. Both files are written
+    to a temporary file and renamed, so that processes (like ranks of distributed training) sharing the cache
+    directory never read a partially written entry. Models with PythonOp nodes are not cached, see has_python_op.
+    """
+
+    def __init__(self, cache_dir: str, logger: Logger):
+        self._cache_dir = cache_dir
+        self._logger = logger
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    def _get_paths(self, key: str) -> Tuple[str, str]:
+        return os.path.join(self._cache_dir, f"{key}.onnx"), os.path.join(self._cache_dir, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Tuple[onnx.ModelProto, Dict[str, Any]]]:
+        """Returns the model and metadata saved with the key, or None if there is no such entry."""
+        model_path, metadata_path = self._get_paths(key)
+        # Metadata is written after the model, so the entry is complete when metadata exists.
+        if not os.path.isfile(metadata_path):
+            return None
+
+        try:
+            with open(metadata_path, encoding="utf-8") as f:
+                metadata = metadata_from_json(json.load(f))
+            model = onnx.load(model_path)
+        except Exception as e:
+            self._logger.warning(f"Failed to load cached model {model_path}, it will be rebuilt: {e}")
+            return None
+
+        if has_python_op(model):
+            # Saved by a version which cached models with PythonOp nodes.
+            self._logger.info(f"Cached model {model_path} has PythonOp nodes, it will be rebuilt.")
+            return None
+
+        self._logger.warning(f"Cached model {model_path} is used to save export and initialization time.")
+        return model, metadata
+
+    def save(self, key: str, model: onnx.ModelProto, metadata: Dict[str, Any]):
+        """Saves the model and metadata with the key. Failure to save is logged, and does not stop training."""
+        model_path, metadata_path = self._get_paths(key)
+        if has_python_op(model):
+            self._logger.info(f"Model with PythonOp nodes is not cached to {model_path}.")
+            return
+
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            self._write_atomically(model_path, model.SerializeToString())
+            self._write_atomically(metadata_path, json.dumps(metadata_to_json(metadata)).encode("utf-8"))
+        except Exception as e:
+            self._logger.warning(f"Failed to cache model to {model_path}: {e}")
+            return
+
+        self._logger.info(f"Caching model for future runs to {model_path}.")
+
+    def _write_atomically(self, path: str, data: bytes):
+        fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+
+class SchemaGraphCache:
+    """LRU cache of graph states (like exported model, graph builder and execution agent) keyed by input schema.
+
+    When the input schema changes, the state of the previous schema is put in the cache, and the state of the new
+    schema is taken from the cache if it was built before, so that alternating input schemas do not re-export the
+    model. The capacity counts the current schema, whose state is not in the cache.
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+        self._states: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Takes the state out of the cache, since it becomes the current state."""
+        state = self._states.pop(key, None)
+        if state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return state
+
+    def put(self, key: str, state: Dict[str, Any]):
+        self._states[key] = state
+        self._states.move_to_end(key)
+        while len(self._states) > self._capacity - 1:
+            self._states.popitem(last=False)
+
+    def clear(self):
+        self._states.clear()
@@ -9,7 +9,6 @@ import io
 import logging
 import os
 from abc import ABC, abstractmethod  # noqa: F401
-from hashlib import md5 as hash_fn
 from typing import Dict, List, Optional, Tuple
 
 import onnx
@@ -22,7 +21,7 @@ from onnxruntime.tools.symbolic_shape_infer import SymbolicShapeInference
 from onnxruntime.training.utils import ORTModelInputOutputSchemaType, PTable, onnx_dtype_to_pytorch_dtype
 from onnxruntime.training.utils.hooks import configure_ort_compatible_zero_stage3
 
-from . import _are_deterministic_algorithms_enabled, _io, _logger, _onnx_models, _utils
+from . import _are_deterministic_algorithms_enabled, _graph_cache, _io, _logger, _onnx_models, _utils
 from ._fallback import (
     ORTModuleDeviceException,
     ORTModuleONNXModelException,
@@ -51,6 +50,23 @@ class _RunStateInfo:
 
 
 class GraphExecutionManager(GraphExecutionInterface):
+    # Attributes built for an input schema, which are kept in the schema graph cache.
+    _GRAPH_STATE_ATTRIBUTES = (
+        "_onnx_models",
+        "_input_info",
+        "_module_output_schema",
+        "_output_dynamic_axes",
+        "_graph_builder",
+        "_graph_info",
+        "_graph_initializer_names",
+        "_graph_initializer_names_to_train",
+        "_graph_initializers",
+        "_execution_agent",
+        "_mem_efficient_grad_management_is_enabled",
+        "_export_cache_key",
+        "_graph_builder_cache_key",
+    )
+
     def __init__(
         self,
         module: _FlattenedModule,
@@ -87,10 +103,25 @@ class GraphExecutionManager(GraphExecutionInterface):
         # TrainingAgent or InferenceAgent
         self._execution_agent = None
 
+        # On-disk cache of the exported and optimized models, which is reused across process restarts.
+        self._graph_cache: Optional[_graph_cache.GraphCache] = None
+        if self._runtime_options.ortmodule_cache_dir:
+            self._graph_cache = _graph_cache.GraphCache(self._runtime_options.ortmodule_cache_dir, self._logger)
+        # Keys of the current exported model and the configuration of graph builder in the cache.
+        self._export_cache_key: Optional[str] = None
+        self._graph_builder_cache_key: Optional[str] = None
+        # In-memory cache of graph states of input schemas other than the current one.
+        self._schema_graph_cache = self._create_schema_graph_cache()
+
         self._first_skip_check_warning = True
 
         # Inspector for runtime information, for example input data, memory usage, etc.
-        self._runtime_inspector = RuntimeInspector(self._logger, self._original_module)
+        self._runtime_inspector = RuntimeInspector(
+            self._logger,
+            self._original_module,
+            self._runtime_options.input_density_log_steps,
+            self._runtime_options.input_density_history_file,
+        )
         self._runtime_inspector.memory_ob.enable_memory_stats_by_step(self._runtime_options.print_memory_stat_by_step)
 
         # Tracker for ORTModule model export, session creation overhead.
@@ -107,6 +138,7 @@ class GraphExecutionManager(GraphExecutionInterface):
         # Input and output infos (including schema) for exported model.
         self._input_info: Optional[_InputInfo] = None
         self._module_output_schema: Optional[ORTModelInputOutputSchemaType] = None
+        self._output_dynamic_axes: Dict[str, Dict[int, str]] = {}
 
         # Device where the model is placed.
         self._device: Optional[torch.device] = _utils.get_device_from_module(module)
@@ -151,6 +183,50 @@ class GraphExecutionManager(GraphExecutionInterface):
         # Be noted, we will never enable this feature for inference mode.
         self._mem_efficient_grad_management_is_enabled = False
 
+    def _create_schema_graph_cache(self) -> Optional[_graph_cache.SchemaGraphCache]:
+        if self._runtime_options.schema_graph_cache_size <= 1 or self._runtime_options.enable_zero_stage3_support:
+            return None
+        return _graph_cache.SchemaGraphCache(self._runtime_options.schema_graph_cache_size)
+
+    def _get_graph_state(self) -> Dict:
+        return {name: getattr(self, name) for name in self._GRAPH_STATE_ATTRIBUTES}
+
+    def _set_graph_state(self, graph_state: Dict):
+        for name, value in graph_state.items():
+            setattr(self, name, value)
+
+        # FlattenedModule needs _InputInfo to expand user input from *args to *args + **kwargs
+        self._flattened_module._input_info = self._input_info
+        if self._runtime_inspector.input_density_ob is not None:
+            # Re-initialize the observer with the model of the schema, which may have different inputs.
+            self._runtime_inspector.disable_input_inspector()
+            self._runtime_inspector.enable_input_inspector(
+                self._onnx_models.processed_exported_model, self._graph_info.user_input_names
+            )
+
+    def _switch_schema_graph_state(self, schema: ORTModelInputOutputSchemaType) -> bool:
+        """Puts the graph state of current schema in the schema graph cache, and takes the state of new schema.
+
+        Returns True if the state of new schema is found, otherwise models need to be exported and built.
+        """
+        if self._original_model_has_changed:
+            # Graphs built before the change are out of date.
+            self._schema_graph_cache.clear()
+            return False
+
+        if self._execution_agent is not None:
+            self._schema_graph_cache.put(repr(self._input_info.schema), self._get_graph_state())
+        graph_state = self._schema_graph_cache.get(repr(schema))
+        if graph_state is None:
+            # The models of previous schema are in the cache, so they are not overwritten by the new export.
+            self._onnx_models = _onnx_models.ONNXModels()
+            self._execution_agent = None
+            return False
+
+        self._logger.info("Graphs of the input schema are found in the schema graph cache, model export is skipped.")
+        self._set_graph_state(graph_state)
+        return True
+
     def _get_torch_gpu_allocator_function_addresses(self):
         if self._runtime_options.use_external_gpu_allocator and torch.cuda.is_available():
             # CPP extension to get torch GPU allocator's alloc and free function addresses
@@ -196,6 +272,45 @@ class GraphExecutionManager(GraphExecutionInterface):
 
         self._graph_info = self._graph_builder.get_graph_info()
 
+    def _get_graph_cache_key(self, config: C.TrainingGraphTransformerConfiguration) -> Optional[str]:
+        """Key of the optimized model built by the graph builder with given config, or None if it is not cached."""
+        if self._graph_cache is None or self._graph_builder_cache_key is None:
+            return None
+
+        return _graph_cache.get_cache_key(
+            self._graph_builder_cache_key,
+            config.propagate_cast_ops_config.level,
+            list(config.propagate_cast_ops_config.allow),
+            str(config.propagate_cast_ops_config.strategy),
+            config.enable_compute_optimizer,
+            list(config.sparse_label_input_names),
+            list(config.sparse_embedding_input_names),
+            self._input_info.shape if self._runtime_options.use_static_shape else None,
+        )
+
+    def _load_cached_graph(self, config: C.TrainingGraphTransformerConfiguration) -> bool:
+        """Loads the optimized model and graph info from the graph cache instead of building the graph.
+
+        Returns True if they are loaded.
+        """
+        key = self._get_graph_cache_key(config)
+        cached = self._graph_cache.load(key) if key else None
+        if cached is None:
+            return False
+
+        self._onnx_models.optimized_model, metadata = cached
+        self._graph_info = _graph_cache.graph_info_from_dict(metadata["graph_info"])
+        return True
+
+    def _save_cached_graph(self, config: C.TrainingGraphTransformerConfiguration):
+        key = self._get_graph_cache_key(config)
+        if key:
+            self._graph_cache.save(
+                key,
+                self._onnx_models.optimized_model,
+                {"graph_info": _graph_cache.graph_info_to_dict(self._graph_info)},
+            )
+
     def _get_session_config(self):
         """Creates and returns the session configuration to be used for the ExecutionAgent"""
 
@@ -293,6 +408,17 @@ class GraphExecutionManager(GraphExecutionInterface):
             return False
         self._set_device_from_module(inputs, kwargs)
 
+        if self._schema_graph_cache is not None and self._switch_schema_graph_state(schema):
+            _utils.set_random_states(random_states)
+            return False
+
+        self._export_cache_key = self._get_export_cache_key(schema)
+        # The cache is not read when the original module is changed, since the change might not be in the key.
+        if self._export_cache_key and not self._original_model_has_changed:
+            if self._load_cached_export(self._export_cache_key, schema, inputs, kwargs):
+                _utils.set_random_states(random_states)
+                return True
+
         from onnxruntime.training.utils.hooks._subscriber_manager import no_increase_global_step
 
         with no_increase_global_step():
@@ -309,11 +435,67 @@ class GraphExecutionManager(GraphExecutionInterface):
                 self._onnx_models.exported_model, auto_merge=True, guess_output_rank=True
             )
 
+        # Cache model for future runs
+        if self._export_cache_key:
+            self._graph_cache.save(
+                self._export_cache_key,
+                self._onnx_models.exported_model,
+                {
+                    "output_dynamic_axes": self._output_dynamic_axes,
+                    "module_output_schema": self._module_output_schema,
+                },
+            )
+
         # Restore the recorded random states
         _utils.set_random_states(random_states)
 
         return True
 
+    def _get_export_cache_key(self, input_schema: ORTModelInputOutputSchemaType) -> Optional[str]:
+        """Key of the exported model in the graph cache, or None if the exported model could not be cached."""
+        if self._graph_cache is None:
+            return None
+
+        if self._runtime_options.enable_zero_stage3_support:
+            # The export of ZeRO stage3 model collects parameters in self._zero_stage3_param_map.
+            return None
+
+        return _graph_cache.get_cache_key(
+            str(self._flattened_module),
+            _graph_cache.get_module_source_digest(self._original_module),
+            [(n, list(p.shape), str(p.dtype), p.requires_grad) for n, p in self._flattened_module.named_parameters()],
+            [(n, list(b.shape), str(b.dtype)) for n, b in self._flattened_module.named_buffers()],
+            repr(input_schema),
+            str(self._device),
+            str(self._export_mode),
+            self._export_extra_kwargs,
+            self._runtime_options.onnx_opset_version,
+            self._runtime_options.enable_custom_autograd_function,
+            self._runtime_options.run_symbolic_shape_infer,
+            get_rank(),
+            onnxruntime.__version__,
+            onnx.__version__,
+            torch.__version__,
+        )
+
+    def _load_cached_export(self, key: str, input_schema: ORTModelInputOutputSchemaType, inputs, kwargs) -> bool:
+        """Loads the exported model and output schema from the graph cache instead of exporting the model.
+
+        Returns True if they are loaded.
+        """
+        cached = self._graph_cache.load(key)
+        if cached is None:
+            return False
+
+        self._onnx_models.exported_model, metadata = cached
+        self._input_info = _io.parse_inputs_for_onnx_export(self._module_parameters, None, input_schema, inputs, kwargs)
+        self._output_dynamic_axes = metadata["output_dynamic_axes"]
+        self._module_output_schema = metadata["module_output_schema"]
+        self._input_info.dynamic_axes.update(self._output_dynamic_axes)
+        # FlattenedModule needs _InputInfo to expand user input from *args to *args + **kwargs
+        self._flattened_module._input_info = self._input_info
+        return True
+
     def _get_exported_model(self, input_schema: ORTModelInputOutputSchemaType, *inputs, **kwargs) -> onnx.ModelProto:
         """Exports PyTorch `self._flattened_module` to ONNX for inferencing or training,
           using `*inputs` and `**kwargs` as input
@@ -350,32 +532,18 @@ class GraphExecutionManager(GraphExecutionInterface):
                 )
         (
             output_names,
-            output_dynamic_axes,
+            self._output_dynamic_axes,
             self._module_output_schema,
         ) = _io.parse_outputs_for_onnx_export_and_extract_schema(
             self._original_module, inputs, kwargs, self._logger, self._device, need_deep_copy
         )
-        self._input_info.dynamic_axes.update(output_dynamic_axes)
+        self._input_info.dynamic_axes.update(self._output_dynamic_axes)
 
         # FlattenedModule needs _InputInfo to expand user input from *args to *args + **kwargs
         self._flattened_module._input_info = self._input_info
 
         self._logger.info("Exporting the PyTorch model to ONNX...")
 
-        # Leverage cached model if available
-        cache_dir = self._runtime_options.ortmodule_cache_dir
-        if cache_dir:
-            filename = os.path.join(
-                cache_dir, f"{hash_fn(str(self._flattened_module).encode()).hexdigest()}_{get_rank()}.onnx"
-            )
-            if os.path.exists(cache_dir) and os.path.isfile(filename):
-                self._logger.warning(
-                    f"Cached model detected! Cached model will be used to save export and initialization time."
-                    f"If you want the model to be re-exported then DELETE {filename}."
-                )
-                exported_model = onnx.load(filename)
-                return exported_model
-
         # Export torch.nn.Module to ONNX
         f = io.BytesIO()
 
@@ -456,16 +624,6 @@ class GraphExecutionManager(GraphExecutionInterface):
             # find input info mismatch, will re-initialize the graph builder.
             # self._input_info.require_grad_names.append(STAGE3_PULL_WEIGHT_TRIGGER_NAME)
 
-        # Cache model for future runs
-        if cache_dir:
-            if not os.path.exists(cache_dir):
-                os.makedirs(cache_dir, exist_ok=True)
-            filename = os.path.join(
-                cache_dir, f"{hash_fn(str(self._flattened_module).encode()).hexdigest()}_{get_rank()}.onnx"
-            )
-            self._logger.info(f"Caching model for future runs to {filename}.")
-            onnx.save(exported_model, filename)
-
         return exported_model
 
     def _set_device_from_module(self, inputs, kwargs):
@@ -568,6 +726,20 @@ class GraphExecutionManager(GraphExecutionInterface):
         grad_builder_config.use_memory_efficient_gradient = self._runtime_options.use_memory_efficient_gradient
         self._graph_builder = C.OrtModuleGraphBuilder()
 
+        # The model built by the graph builder depends on the exported model and the configuration.
+        self._graph_builder_cache_key = None
+        if self._export_cache_key:
+            self._graph_builder_cache_key = _graph_cache.get_cache_key(
+                self._export_cache_key,
+                self._mem_efficient_grad_management_is_enabled,
+                list(grad_builder_config.initializer_names),
+                list(grad_builder_config.initializer_names_to_train),
+                list(grad_builder_config.input_names_require_grad),
+                grad_builder_config.build_gradient_graph,
+                grad_builder_config.enable_caching,
+                grad_builder_config.use_memory_efficient_gradient,
+            )
+
         # It is assumed here that the order and names of the inputs and outputs are not modified by the backend in any way
         # and are kept as they appear in the exported onnx model.
         self._graph_builder.initialize(exported_model.SerializeToString(), grad_builder_config)
@@ -606,6 +778,7 @@ class GraphExecutionManager(GraphExecutionInterface):
             "_graph_builder",
             "_graph_info",
             "_execution_agent",
+            "_schema_graph_cache",
             "_torch_alloc",
             "_torch_free",
             "_torch_empty_cache",
@@ -856,6 +1029,29 @@ class GraphExecutionManager(GraphExecutionInterface):
             ],
         )
 
+        _add_record(
+            tbl,
+            [
+                "Schema Graph Cache",
+                self._schema_graph_cache is not None,
+                f"Keep graphs of {self._schema_graph_cache.capacity} input schemas, "
+                f"hits: {self._schema_graph_cache.hits}, misses: {self._schema_graph_cache.misses}"
+                if self._schema_graph_cache is not None
+                else "Enable with env ORTMODULE_SCHEMA_GRAPH_CACHE_SIZE=<number of schemas greater than 1>",
+            ],
+        )
+
+        _add_record(
+            tbl,
+            [
+                "Graph Cache",
+                self._graph_cache is not None,
+                f"Reuse exported and optimized models in {self._runtime_options.ortmodule_cache_dir}"
+                if self._graph_cache is not None
+                else "Enable with env ORTMODULE_CACHE_DIR=<cache dir>",
+            ],
+        )
+
         mode = "training" if self._export_mode == torch.onnx.TrainingMode.TRAINING else "inference"
         mode = f"{_logger.LogColor.UNDERLINE}{mode}{_logger.LogColor.ENDC}"
         stat = f"\n{_logger.LogColor.HEADER}***** ONNX Runtime Training (ORTModule) is accelerating your model *****{_logger.LogColor.ENDC}\n\n"
@@ -172,6 +172,7 @@ class InferenceManager(GraphExecutionManager):
                 self._device,
                 self._runtime_inspector,
                 self._zero_stage3_param_map,
+                return_input_density=False,
             )
 
             user_outputs, _ = InferenceManager.execution_session_run_forward(
@@ -210,8 +211,10 @@ class InferenceManager(GraphExecutionManager):
     def _build_graph(self, graph_transformer_config):
         """Build an inference graph using the module_graph_builder"""
 
-        super()._build_graph(graph_transformer_config)
-        self._onnx_models.optimized_model = onnx.load_model_from_string(self._graph_builder.get_forward_model())
+        if not self._load_cached_graph(graph_transformer_config):
+            super()._build_graph(graph_transformer_config)
+            self._onnx_models.optimized_model = onnx.load_model_from_string(self._graph_builder.get_forward_model())
+            self._save_cached_graph(graph_transformer_config)
         if self._debug_options.save_onnx_models.save:
             self._onnx_models.save_optimized_model(
                 self._debug_options.save_onnx_models.path,
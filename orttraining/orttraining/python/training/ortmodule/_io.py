@@ -169,12 +169,16 @@ def _combine_input_buffers_initializers(
     device: torch.device,
     rt_inspector: RuntimeInspector,
     zero_stage3_offload_param_map: Optional[Dict[str, torch.nn.parameter.Parameter]],
+    return_input_density: bool = True,
 ):
     """Creates forward `*inputs` list from user input and PyTorch initializers
 
     ONNX Runtime forward requires an ordered list of:
         * User input: computed from forward InferenceSession
         * Initializers: computed from original PyTorch model parameters.
+
+    If `return_input_density` is False, the input inspector does not wait for the device, and no sparsity results are
+    returned.
     """
 
     def _expand_inputs(current_input, non_none_inputs, name=""):
@@ -245,7 +249,7 @@ def _combine_input_buffers_initializers(
             if PrimitiveType.is_primitive_type(inp):
                 inp = PrimitiveType.get_tensor(inp, device)
 
-            found, embedding_density, label_density = rt_inspector.inspect_input(name, inp)
+            found, embedding_density, label_density = rt_inspector.inspect_input(name, inp, return_input_density)
             if found:
                 if embedding_density < 100:
                     embed_sparsity_results[name] = embedding_density
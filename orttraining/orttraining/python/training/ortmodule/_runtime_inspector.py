@@ -3,6 +3,11 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
+import atexit
+import json
+import math
+import time
+from collections import deque
 from enum import IntEnum
 from logging import Logger
 from typing import Dict, List, Optional, Tuple, Union
@@ -46,8 +51,16 @@ class RuntimeInspector:
     Runtime inspector for ORTModule.
     """
 
-    def __init__(self, logger: Logger, module: torch.nn.Module):
+    def __init__(
+        self,
+        logger: Logger,
+        module: torch.nn.Module,
+        input_density_log_steps: int = 1,
+        input_density_history_file: Optional[str] = None,
+    ):
         self._logger = logger
+        self._input_density_log_steps = input_density_log_steps
+        self._input_density_history_file = input_density_history_file
 
         self.input_density_ob: Union[InputDensityObserver, None] = None
         self.memory_ob = MemoryObserver(module, self._logger)
@@ -61,18 +74,21 @@ class RuntimeInspector:
 
         """
         if self.input_density_ob is None:
-            self.input_density_ob = InputDensityObserver(self._logger)
+            self.input_density_ob = InputDensityObserver(
+                self._logger, self._input_density_log_steps, self._input_density_history_file
+            )
         else:
             raise RuntimeError("Input density observer is already enabled.")
 
         return self.input_density_ob.initialize(model, user_input_names)
 
-    def inspect_input(self, input_name, input_data) -> Tuple[bool, float, float]:
+    def inspect_input(self, input_name, input_data, return_density: bool = True) -> Tuple[bool, float, float]:
         """Inspect input data and print statistics.
 
         Args:
             input_name: User input name.
             input_data: User input tensor.
+            return_density: Whether to wait for the inspection to return the densities.
 
         Returns:
             found: Whether the input name is found in `_embedding_graph_input_to_padding_idx_map` and
@@ -81,12 +97,14 @@ class RuntimeInspector:
             label_input_density: Density for the inspected label input if found to be True; otherwise, return 100.
         """
         if self.input_density_ob is not None:
-            return self.input_density_ob.inspect_from_input_data(input_name, input_data)
+            return self.input_density_ob.inspect_from_input_data(input_name, input_data, return_density)
 
         return (False, 100, 100)
 
     def disable_input_inspector(self) -> None:
         """Disable input density inspector."""
+        if self.input_density_ob is not None:
+            self.input_density_ob.close()
         self.input_density_ob = None
 
 
@@ -96,23 +114,30 @@ class InputDensityObserver:
     Data observer is used to collect data/compute sparsity information for embedding and label inputs. It needs to be
     firstly initialized with the ONNX model and user input names. Then, it can be used to inspect the input data
     through `inspect_from_input_data()` method given user input name and input tensor. Inspection results will be
-    printed per `log_steps`.
+    printed per `log_steps`, and appended to `history_file` as JSON lines if given. Results not printed yet are
+    printed by `close()`, which is also called at exit.
 
     """
 
-    def __init__(self, logger: Logger, log_steps=1):
+    def __init__(self, logger: Logger, log_steps=1, history_file: Optional[str] = None):
         self._logger = logger
         self._embedding_graph_input_to_padding_idx_map = {}
         self._loss_label_graph_input_to_ignore_idx_map = {}
-        self._stats = []
+        # Inspections whose statistics are not printed yet, in the order of inspection.
+        self._pending_inspections = deque()
         self._is_initialized = False
 
         self._last_step = 0
         self._current_step = 0
         self._log_steps = log_steps
+        self._inspected_names_in_current_step = set()
+        # JSON lines file the printed statistics are appended to, one record per step, input and padding index.
+        self._history_file = history_file
 
         self._tensor_to_node_map = {}
 
+        atexit.register(self.flush)
+
     def initialize(self, model: ModelProto, user_input_names: List[str]) -> None:
         """Initialize data observer from the given ONNX model and user input names.
 
@@ -320,98 +345,155 @@ class InputDensityObserver:
                 [ignore_index, label_preprocess_func]
             )
 
-    def inspect_from_input_data(self, name: str, inp) -> Tuple[bool, float, float]:
+    def inspect_from_input_data(self, name: str, inp, return_density: bool = True) -> Tuple[bool, float, float]:
         """Inspect input data and print statistics.
 
+        Valid tokens are counted on the device of the input, and copied to host without blocking. Statistics of
+        finished copies are printed per `log_steps`, so the inspection does not synchronize with the device unless
+        `return_density` is True.
+
         Args:
             name: User input name.
             inp: User input tensor.
+            return_density: Whether to wait for the valid token counts to return the densities.
         Returns:
             found: Whether the input name is found in `_embedding_graph_input_to_padding_idx_map` and
                 `_loss_label_graph_input_to_ignore_idx_map`.
-            embed_input_density: Density for the inspected embedding input if found to be True; otherwise, return 100.
-            label_input_density: Density for the inspected label input if found to be True; otherwise, return 100.
+            embed_input_density: Density for the inspected embedding input if found to be True and `return_density`
+                is True; otherwise, return 100.
+            label_input_density: Density for the inspected label input if found to be True and `return_density` is
+                True; otherwise, return 100.
         """
         if not self._is_initialized:
             return (False, 100, 100)
 
         try:
-            data = inp.clone()
-            found, embed_input_density, label_input_density = self._inspect_embed_label_input(name, data)
-            if found:
-                self._current_step += 1
+            if not isinstance(inp, torch.Tensor) or (
+                name not in self._embedding_graph_input_to_padding_idx_map
+                and name not in self._loss_label_graph_input_to_ignore_idx_map
+            ):
+                return (False, 100, 100)
 
+            # A step completes when an input is inspected again.
+            if name in self._inspected_names_in_current_step:
+                self._inspected_names_in_current_step.clear()
+                self._current_step += 1
                 if self._current_step - self._last_step >= self._log_steps:
                     self._last_step = self._current_step
                     self._print_embed_label_stats()
+            self._inspected_names_in_current_step.add(name)
 
-            return (found, embed_input_density, label_input_density)
+            return self._inspect_embed_label_input(name, inp, return_density)
         except Exception as e:
             self._logger.warning(f"Failed to inspect input {name} due to {e}", UserWarning)
             return (False, 100, 100)
 
-    def _inspect_embed_label_input(self, name, data):
-        found = False
+    def _inspect_embed_label_input(self, name, data, return_density):
+        # (input type, pad idx, total tokens, shape of valid tokens per batch) for each padding index of the input.
+        entries = []
+        # Valid token count of each entry, followed by its valid tokens per batch if any, all in one tensor.
+        counts = []
+        for padding_idx in self._embedding_graph_input_to_padding_idx_map.get(name, []):
+            valid_mask = data != padding_idx
+            counts.append(torch.count_nonzero(valid_mask).reshape(1))
+            valid_token_per_batch_shape = None
+            if data.dim() > 1:
+                valid_token_per_batch = torch.count_nonzero(valid_mask, dim=1)
+                valid_token_per_batch_shape = tuple(valid_token_per_batch.shape)
+                counts.append(valid_token_per_batch.flatten())
+            entries.append(("EMBED", padding_idx, data.numel(), valid_token_per_batch_shape))
+
+        for ignore_index, preprocess_func in self._loss_label_graph_input_to_ignore_idx_map.get(name, []):
+            data_preprocessed = preprocess_func(data)
+            counts.append(torch.count_nonzero(data_preprocessed != ignore_index).reshape(1))
+            entries.append(("LABEL", ignore_index, data_preprocessed.numel(), None))
+
+        counts = torch.cat(counts)
+        event = None
+        if return_density or not counts.is_cuda:
+            host_counts = counts.cpu()
+        else:
+            host_counts = torch.empty(counts.shape, dtype=counts.dtype, pin_memory=True)
+            host_counts.copy_(counts, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record()
+        self._pending_inspections.append((self._current_step, time.time(), name, entries, host_counts, event))
+
         min_embed_density = 100
         min_label_density = 100
-        if (
-            len(self._embedding_graph_input_to_padding_idx_map) > 0
-            and name in self._embedding_graph_input_to_padding_idx_map
-            and isinstance(data, torch.Tensor)
-        ):
-            for padding_idx in self._embedding_graph_input_to_padding_idx_map[name]:
-                valid_token = torch.count_nonzero(data - padding_idx)
-                valid_token_per_batch = "N/A"
-                if data.dim() > 1:
-                    valid_token_per_batch = str(torch.count_nonzero(data - padding_idx, dim=1).tolist())
-                total_token = data.numel()
-                embed_density = float(valid_token) / float(total_token) * 100
-                if embed_density < 90:
-                    min_embed_density = min(min_embed_density, embed_density)
-                self._stats.append(
-                    [
-                        self._current_step,
-                        "EMBED",
-                        name,
-                        padding_idx,
-                        embed_density,
-                        valid_token,
-                        total_token,
-                        valid_token_per_batch,
-                    ]
-                )
-                found = True
-
-        if (
-            len(self._loss_label_graph_input_to_ignore_idx_map) > 0
-            and name in self._loss_label_graph_input_to_ignore_idx_map
-            and isinstance(data, torch.Tensor)
-        ):
-            for ignore_index, preprocess_func in self._loss_label_graph_input_to_ignore_idx_map[name]:
-                data_preprocessed = preprocess_func(data)
-                valid_token = torch.count_nonzero(data_preprocessed - ignore_index)
-                total_token = data_preprocessed.numel()
-                label_density = float(valid_token) / float(total_token) * 100
-                if label_density < 90:
-                    min_label_density = min(min_label_density, label_density)
-                self._stats.append(
-                    [
-                        self._current_step,
-                        "LABEL",
-                        name,
-                        ignore_index,
-                        label_density,
-                        valid_token,
-                        total_token,
-                        "N/A",
-                    ]
+        if return_density:
+            for record in self._to_records(self._pending_inspections[-1]):
+                if record["density"] >= 90:
+                    continue
+                if record["input_type"] == "EMBED":
+                    min_embed_density = min(min_embed_density, record["density"])
+                else:
+                    min_label_density = min(min_label_density, record["density"])
+
+        return True, min_embed_density, min_label_density
+
+    @staticmethod
+    def _to_records(inspection) -> List[Dict]:
+        step, timestamp, name, entries, host_counts, _ = inspection
+        counts = host_counts.tolist()
+        records = []
+        offset = 0
+        for input_type, padding_idx, total_token, valid_token_per_batch_shape in entries:
+            valid_token = counts[offset]
+            offset += 1
+            valid_token_per_batch = None
+            if valid_token_per_batch_shape is not None:
+                size = math.prod(valid_token_per_batch_shape)
+                valid_token_per_batch = (
+                    torch.tensor(counts[offset : offset + size]).reshape(valid_token_per_batch_shape).tolist()
                 )
-                found = True
+                offset += size
+            records.append(
+                {
+                    "step": step,
+                    "time": timestamp,
+                    "input_type": input_type,
+                    "input_name": name,
+                    "padding_idx": padding_idx,
+                    "density": float(valid_token) / float(total_token) * 100 if total_token else 100.0,
+                    "valid_tokens": valid_token,
+                    "total_tokens": total_token,
+                    "valid_tokens_per_batch": valid_token_per_batch,
+                }
+            )
+        return records
 
-        return found, min_embed_density, min_label_density
+    def _pop_finished_records(self, wait: bool = False) -> List[Dict]:
+        """Pops records of completed steps whose valid token counts are copied to host.
 
-    def _print_embed_label_stats(self):
-        if len(self._stats) > 0:
+        If `wait` is True, pops records of all inspections including the current step, waiting for their copies.
+        """
+        records = []
+        while self._pending_inspections:
+            step, *_, event = self._pending_inspections[0]
+            if wait:
+                if event is not None:
+                    event.synchronize()
+            elif step >= self._current_step or (event is not None and not event.query()):
+                break
+            records.extend(self._to_records(self._pending_inspections.popleft()))
+        return records
+
+    def flush(self) -> None:
+        """Print statistics of all inspections not printed yet, including the last steps."""
+        try:
+            self._print_embed_label_stats(wait=True)
+        except Exception as e:
+            self._logger.warning(f"Failed to print input density statistics due to {e}", UserWarning)
+
+    def close(self) -> None:
+        """Flush the statistics not printed yet, and stop flushing at exit."""
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def _print_embed_label_stats(self, wait: bool = False):
+        records = self._pop_finished_records(wait)
+        if len(records) > 0:
             stat = f">>>Valid token/label density (e.g. valid/total) in passing {self._log_steps} steps:\n"
             stat += "\t| {:<10} | {:<10} | {:<15} | {:<10} | {:<10} | {:<15} | {:<15} | {:<15} |\n".format(
                 "STEP",
@@ -423,22 +505,35 @@ class InputDensityObserver:
                 "TOTAL TOKENS",
                 "VALID TOKENS/BATCH",
             )
-            for (
-                step,
-                input_type,
-                input_name,
-                padding_idx,
-                density,
-                valid_token,
-                total_token,
-                valid_token_per_batch,
-            ) in self._stats:
+            for record in records:
+                valid_token_per_batch = record["valid_tokens_per_batch"]
                 stat += "\t| {:<10} | {:<10} | {:<15} | {:<10} | {:<9.2f}% | {:<15} | {:<15} | {:<15} |\n".format(
-                    step, input_type, input_name, padding_idx, density, valid_token, total_token, valid_token_per_batch
+                    record["step"],
+                    record["input_type"],
+                    record["input_name"],
+                    record["padding_idx"],
+                    record["density"],
+                    record["valid_tokens"],
+                    record["total_tokens"],
+                    "N/A" if valid_token_per_batch is None else str(valid_token_per_batch),
                 )
             stat += "<<<\n"
             self._logger.info(stat)
-            self._stats.clear()
+
+            if self._history_file is not None:
+                with open(self._history_file, "a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record) + "\n")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # CUDA events can not be pickled, pending inspections are dropped.
+        state["_pending_inspections"] = deque()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        atexit.register(self.flush)
 
     def _try_get_node_from_its_output(self, name):
         if name == "" or name not in self._tensor_to_node_map:
@@ -471,6 +566,54 @@ class MemoryOptimizationSummary:
         self.freq = freq
 
 
+class MemoryOptimizationPlan:
+    """A memory optimization plan, which is a cluster id combination that can be enabled with its `config`.
+
+    The memory saving is a symbolic expression of the input dims, evaluated on demand with any dim values. The extra
+    compute is estimated by the number of operators re-executed in backward, which is the operator count of the
+    recomputed subgraphs times their occurrences.
+    """
+
+    def __init__(self, config: str, summary: MemoryOptimizationSummary):
+        self.config = config
+        self.freq = summary.freq
+        self.saving_expr: Optional[Symbol] = summary.simplified_symbolic_saving_expr
+        # Subgraph strings of the plan, like "BiasGelu+" for config "BiasGelu+:1:-1". Plans recomputing the same
+        # subgraph with different strategies are mutually exclusive.
+        self.subgraphs = [cluster.split(":")[0] for cluster in config.split(",") if cluster]
+        self.recompute_op_count = sum(len([op for op in s.split("+") if op]) for s in self.subgraphs) * max(
+            1, self.freq
+        )
+
+    def evaluate_saving(self, symbolic_dim_values: Dict[Symbol, int]) -> float:
+        """Evaluates the memory saving in bytes with the given dim values."""
+        saving = self.saving_expr.evalf(subs=symbolic_dim_values)
+        if not saving.is_number:
+            missing_dims = sorted(map(str, saving.free_symbols))
+            raise ValueError(f"Missing values of dims {missing_dims} to evaluate {self.config}.")
+        return float(saving)
+
+    def conflicts_with(self, other: "MemoryOptimizationPlan") -> bool:
+        return any(subgraph in other.subgraphs for subgraph in self.subgraphs)
+
+    def __repr__(self) -> str:
+        return f"MemoryOptimizationPlan({self.config}, saving={self.saving_expr}, ops={self.recompute_op_count})"
+
+
+class MemoryOptimizationPlanEvaluation:
+    """Estimated memory saving and extra compute of enabling a combination of memory optimization plans."""
+
+    def __init__(self, plans: List[MemoryOptimizationPlan], saving: float):
+        self.plans = plans
+        self.saving = saving
+        self.recompute_op_count = sum(plan.recompute_op_count for plan in plans)
+        # The value of ORTMODULE_MEMORY_OPT_CONFIG to enable the plans.
+        self.config = ",".join(plan.config for plan in plans)
+
+    def __repr__(self) -> str:
+        return f"MemoryOptimizationPlanEvaluation({self.config}, saving={self.saving}, ops={self.recompute_op_count})"
+
+
 class MemoryObserver:
     """Memory inspector across the training lifetime.
 
@@ -592,6 +735,96 @@ class MemoryObserver:
 
             runtime_options.memory_optimizer_config = ",".join(recompute_configs)
 
+    def get_memory_optimization_plans(self) -> List[MemoryOptimizationPlan]:
+        """Returns the plans found by `find_memory_optimization_opportunity`, by descending memory saving."""
+        return [
+            MemoryOptimizationPlan(cluster_id, summary)
+            for cluster_id, summary in self.cluster_id_combination_to_saving_symbolics_map.items()
+        ]
+
+    def _get_symbolic_dim_values(self, symbolic_dim_values: Optional[Dict[str, int]]) -> Dict[Symbol, int]:
+        # Given values override the values collected from the first batch.
+        dim_values = dict(self.symbolic_dim_name_to_value_map)
+        if symbolic_dim_values:
+            dim_values.update({Symbol(name): value for name, value in symbolic_dim_values.items()})
+        return dim_values
+
+    def evaluate_memory_optimization_plans(
+        self,
+        plans: List[Union[MemoryOptimizationPlan, str]],
+        symbolic_dim_values: Optional[Dict[str, int]] = None,
+    ) -> MemoryOptimizationPlanEvaluation:
+        """Evaluates enabling a combination of plans, without rebuilding the session.
+
+        Args:
+            plans: plans, or their configs, to enable together.
+            symbolic_dim_values: dim values to evaluate memory saving with, for example a larger batch size. Dims not
+                given use the values collected from the first batch.
+        """
+        plans_by_config = {plan.config: plan for plan in self.get_memory_optimization_plans()}
+        plans = [plans_by_config[plan] if isinstance(plan, str) else plan for plan in plans]
+        for i, plan in enumerate(plans):
+            for other in plans[i + 1 :]:
+                if plan.conflicts_with(other):
+                    raise ValueError(f"Memory optimization plans {plan.config} and {other.config} are exclusive.")
+
+        dim_values = self._get_symbolic_dim_values(symbolic_dim_values)
+        return MemoryOptimizationPlanEvaluation(plans, sum(plan.evaluate_saving(dim_values) for plan in plans))
+
+    def recommend_memory_optimization_plans(
+        self,
+        required_saving: float,
+        symbolic_dim_values: Optional[Dict[str, int]] = None,
+    ) -> Optional[MemoryOptimizationPlanEvaluation]:
+        """Recommends the plans that save at least `required_saving` bytes with the least extra compute.
+
+        For example, `required_saving` can be the peak memory of a trial run minus the memory budget. Combinations
+        are searched exhaustively for up to 16 plans, and greedily by saving per recomputed operator otherwise.
+
+        Args:
+            required_saving: memory saving in bytes the plans need to reach.
+            symbolic_dim_values: dim values to evaluate memory saving with, see `evaluate_memory_optimization_plans`.
+
+        Returns:
+            The evaluation of the recommended plans, or None if no combination of plans saves enough memory.
+        """
+        dim_values = self._get_symbolic_dim_values(symbolic_dim_values)
+        plans = self.get_memory_optimization_plans()
+        savings = [plan.evaluate_saving(dim_values) for plan in plans]
+
+        def _is_better(selected, best):
+            if best is None:
+                return True
+            ops = sum(plans[i].recompute_op_count for i in selected)
+            best_ops = sum(plans[i].recompute_op_count for i in best)
+            return (ops, -sum(savings[i] for i in selected)) < (best_ops, -sum(savings[i] for i in best))
+
+        best = None
+        if len(plans) <= 16:
+            for mask in range(1 << len(plans)):
+                selected = [i for i in range(len(plans)) if mask >> i & 1]
+                if sum(savings[i] for i in selected) < required_saving or not _is_better(selected, best):
+                    continue
+                if not any(plans[i].conflicts_with(plans[j]) for i in selected for j in selected if i < j):
+                    best = selected
+        else:
+            selected = []
+            for i in sorted(range(len(plans)), key=lambda i: savings[i] / plans[i].recompute_op_count, reverse=True):
+                if sum(savings[j] for j in selected) >= required_saving:
+                    break
+                if not any(plans[i].conflicts_with(plans[j]) for j in selected):
+                    selected.append(i)
+            # Drop plans not needed to reach the required saving, the most expensive first.
+            for i in sorted(selected, key=lambda i: plans[i].recompute_op_count, reverse=True):
+                if sum(savings[j] for j in selected) - savings[i] >= required_saving:
+                    selected.remove(i)
+            if sum(savings[i] for i in selected) >= required_saving:
+                best = selected
+
+        if best is None:
+            return None
+        return MemoryOptimizationPlanEvaluation([plans[i] for i in best], sum(savings[i] for i in best))
+
     def inspect_memory(self, cur_phase: Phase):
         """Inspect memory usage and print statistics.
 
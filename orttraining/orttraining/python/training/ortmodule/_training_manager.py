@@ -31,6 +31,8 @@ class TrainingManager(GraphExecutionManager):
     TrainingManager is responsible for building and running the forward and backward graph of the training model.
     """
 
+    _GRAPH_STATE_ATTRIBUTES = (*GraphExecutionManager._GRAPH_STATE_ATTRIBUTES, "_gradient_map")
+
     def __init__(
         self,
         model: _FlattenedModule,
@@ -334,6 +336,7 @@ class TrainingManager(GraphExecutionManager):
                 self._device,
                 self._runtime_inspector,
                 self._zero_stage3_param_map,
+                return_input_density=False,
             )
 
             outputs = unflatten_user_output(
@@ -371,8 +374,10 @@ class TrainingManager(GraphExecutionManager):
     def _build_graph(self, graph_transformer_config):
         """Build an optimized gradient graph using the module_graph_builder"""
 
-        super()._build_graph(graph_transformer_config)
-        self._onnx_models.optimized_model = onnx.load_model_from_string(self._graph_builder.get_gradient_model())
+        if not self._load_cached_graph(graph_transformer_config):
+            super()._build_graph(graph_transformer_config)
+            self._onnx_models.optimized_model = onnx.load_model_from_string(self._graph_builder.get_gradient_model())
+            self._save_cached_graph(graph_transformer_config)
 
         # Apply registered graph transformers to the optimized model
         device_type = self._device.type
@@ -491,6 +496,14 @@ class TrainingManager(GraphExecutionManager):
                 self._execution_agent._inference_session, True, self._runtime_options.tuning_results_path
             )
 
+    def _set_graph_state(self, graph_state):
+        super()._set_graph_state(graph_state)
+
+        # Gradient accumulation manager caches the graph info of the execution agent.
+        self._gradient_accumulation_manager.initialize(
+            self._runtime_options.enable_grad_acc_optimization, self._flattened_module, self._graph_info
+        )
+
     def _reinitialize_graph_builder(self, input_info: _InputInfo):
         """Return true if the module graph builder was reinitialized"""
 
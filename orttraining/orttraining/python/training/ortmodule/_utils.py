@@ -396,6 +396,7 @@ def reinitialize_graph_execution_manager(graph_execution_manager):
     graph_execution_manager._graph_builder = None
     graph_execution_manager._graph_info = None
     graph_execution_manager._execution_agent = None
+    graph_execution_manager._schema_graph_cache = graph_execution_manager._create_schema_graph_cache()
 
     # Re-define the torch allocator
     graph_execution_manager._get_torch_gpu_allocator_function_addresses()
@@ -284,6 +284,9 @@ class _RuntimeOptions:
 
         # Configuration for dev tools.
         self.print_input_density = False
+        # Number of steps between printing input densities, and the JSON lines file to append them to.
+        self.input_density_log_steps = 1
+        self.input_density_history_file = None
         self.print_memory_stat_by_step = False
 
         # Configuration for fallback.
@@ -302,9 +305,14 @@ class _RuntimeOptions:
         self.max_tuning_duration_ms = 0
         self.tuning_results_path = ""
 
-        # Cache exported model
+        # Cache exported model, and optimized model built by graph builder in this directory, which are reused
+        # across process restarts.
         self.ortmodule_cache_dir = ""
 
+        # Number of input schemas whose exported model, graph builder and execution agent are kept in memory,
+        # so that switching between them does not re-export the model. 1 means only the current schema is kept.
+        self.schema_graph_cache_size = 1
+
         # Experimental features.
         self.enable_zero_stage3_support = False  # Once enabled, cannot be disabled.
 
@@ -352,6 +360,12 @@ class _RuntimeOptions:
         # Configuration for dev tools.
         if "ORTMODULE_PRINT_INPUT_DENSITY" in os.environ:
             self.print_input_density = int(os.getenv("ORTMODULE_PRINT_INPUT_DENSITY")) == 1
+        if "ORTMODULE_INPUT_DENSITY_LOG_STEPS" in os.environ:
+            self.input_density_log_steps = max(1, int(os.getenv("ORTMODULE_INPUT_DENSITY_LOG_STEPS")))
+        if "ORTMODULE_INPUT_DENSITY_HISTORY_FILE" in os.environ:
+            self.input_density_history_file = os.getenv("ORTMODULE_INPUT_DENSITY_HISTORY_FILE")
+            # Writing the history needs the input density observer on.
+            self.print_input_density = True
         if "ORTMODULE_PRINT_MEMORY_STATS" in os.environ:
             self.print_memory_stat_by_step = int(os.getenv("ORTMODULE_PRINT_MEMORY_STATS")) == 1
 
@@ -396,6 +410,9 @@ class _RuntimeOptions:
             self._logger.warning("ORTModule optimization for caching exported model is ON.")
             self.ortmodule_cache_dir = os.getenv("ORTMODULE_CACHE_DIR")
 
+        if "ORTMODULE_SCHEMA_GRAPH_CACHE_SIZE" in os.environ:
+            self.schema_graph_cache_size = max(1, int(os.getenv("ORTMODULE_SCHEMA_GRAPH_CACHE_SIZE")))
+
         # Experimental features.
         if "ORTMODULE_ENABLE_ZERO_STAGE3" in os.environ and int(os.getenv("ORTMODULE_ENABLE_ZERO_STAGE3")) == 1:
             self.enable_zero_stage3_support = True
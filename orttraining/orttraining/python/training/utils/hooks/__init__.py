@@ -9,12 +9,15 @@ import torch
 __all__ = [
     "StatisticsSubscriber",
     "GlobalSubscriberManager",
+    "SamplingPolicy",
     "inspect_activation",
+    "load_statistics_summaries",
     "ZeROOffloadSubscriber",
     "configure_ort_compatible_zero_stage3",
 ]
 
-from ._statistics_subscriber import StatisticsSubscriber, _InspectActivation
+from ._statistics_subscriber import StatisticsSubscriber, _InspectActivation, load_statistics_summaries
+from ._subscriber_base import SamplingPolicy
 from ._subscriber_manager import SubscriberManager
 from ._zero_offload_subscriber import ZeROOffloadSubscriber, configure_ort_compatible_zero_stage3
 
@@ -3,13 +3,18 @@
 # Licensed under the MIT License.
 # --------------------------------------------------------------------------
 
+import atexit
 import os
+import queue
 import shutil
+import threading
+import time
 import warnings
 from io import TextIOWrapper
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import onnx
 import torch
 
@@ -45,36 +50,44 @@ class _InspectActivation(torch.autograd.Function):
 
         Make sure there is a same number of `tensor` type inputs and outputs.
         This is enforced by ORT's PythonOp's schema check.
+
+        The tensor is not copied before it is passed to the subscriber, since the statistics are computed (or queued on
+        the current stream) before this function returns.
         """
         depth = -1
         if module_idx is not None:
             depth = run_ctx.global_states.module_index_to_depth[module_idx]
 
-        input_tensor_copied = None
-        if input_tensor is None or not isinstance(input_tensor, torch.Tensor):
-            input_tensor_copied = input_tensor
-        else:
-            input_tensor_copied = input_tensor.detach().clone()
-
         ctx.current_step = run_ctx.global_states.execution_step
         ctx.name = activation_name
         ctx.id = module_idx
         ctx.depth = depth
         ctx.module_pre_backward = module_pre_backward
+        ctx.sampling_policy = run_ctx.sampling_policy
+        # The sampling policy is applied here unless SubscriberManager's hooks already did, for example, for ORT runs
+        # that call this function from the exported graph, or for `inspect_activation` calls.
+        ctx.sampled = (
+            ctx.sampling_policy is None
+            or run_ctx.applying_hooks
+            or not ctx.sampling_policy.need_skip_tensor(ctx.current_step, module_idx, input_tensor)
+        )
 
-        module_post_forward(input_tensor_copied, depth, activation_name, ctx.current_step)
+        if ctx.sampled:
+            start = time.perf_counter()
+            module_post_forward(input_tensor, depth, activation_name, ctx.current_step)
+            if ctx.sampling_policy is not None and not run_ctx.applying_hooks:
+                ctx.sampling_policy.add_overhead(time.perf_counter() - start)
 
         return input_tensor.detach() if input_tensor is not None else None
 
     @staticmethod
     def backward(ctx, grad_output: torch.Tensor):
-        val = None
-        if grad_output is None or not isinstance(grad_output, torch.Tensor):
-            val = grad_output
-        else:
-            val = grad_output.detach().clone()
-
-        ctx.module_pre_backward(val, ctx.depth, ctx.name, ctx.current_step)
+        # Gradients are inspected only for the activations inspected in the forward pass.
+        if ctx.sampled:
+            start = time.perf_counter()
+            ctx.module_pre_backward(grad_output, ctx.depth, ctx.name, ctx.current_step)
+            if ctx.sampling_policy is not None:
+                ctx.sampling_policy.add_overhead(time.perf_counter() - start)
 
         return (
             None,
@@ -105,11 +118,16 @@ class StatisticsSubscriber(SubscriberBase):
     """
     This subscriber is used to dump the activation statistics into files.
 
-    Each activation will be summarized into 1 or 2 files, depending on whether it is used in the backward pass.
+    With the default "text" output format, each activation will be summarized into 1 or 2 files, depending on whether
+    it is used in the backward pass.
     > In the forward pass, summarize the tensor's statistics and write to a file.
     > In the backward pass, summarize the tensor's gradient statistics and write it into another file.
     So for each run step, there will be many files.
 
+    With the "binary" output format, the statistics are copied to host asynchronously, and a background thread writes
+    them into one columnar file `statistics.npz` per step. This has low enough overhead to be left on for all steps.
+    `load_statistics_summaries` reproduces the text summaries from the file.
+
     Currently, the statistics mainly include:
     > Number of inf/nan values.
     > Common statistics: tensor shape, data type, total element size, min/max/mean/std of the tensor elements.
@@ -128,6 +146,7 @@ class StatisticsSubscriber(SubscriberBase):
         override_output_dir: bool = False,
         run_on_cpu: bool = False,
         bucket_size: int = 1024 * 1024 * 1024 // 2,
+        output_format: str = "text",
     ):
         """
         Steps in [start_step, end_step) will run subscriber actions.
@@ -140,11 +159,15 @@ class StatisticsSubscriber(SubscriberBase):
             run_on_cpu: whether to run the subscriber actions on CPU, this should be the last resort when inserted
                 inspector node affects memory peak causing the original recipe run to fail with OOM.
             bucket_size: the size of the bucket to split the statistic calculation.
+            output_format: "text" to write one text file per activation, or "binary" to write one columnar file per
+                step from a background thread.
         """
         super().__init__(start_step=start_step, end_step=end_step)
         self._output_dir = output_dir
         self._run_on_cpu = run_on_cpu
         self._bucket_size = bucket_size
+        if output_format not in ("text", "binary"):
+            raise ValueError(f"Unsupported output_format {output_format}, expected 'text' or 'binary'.")
         if os.path.exists(self._output_dir):
             if override_output_dir:
                 warnings.warn(f"Output directory {self._output_dir} already exists, overriding it.")
@@ -155,6 +178,13 @@ class StatisticsSubscriber(SubscriberBase):
                     "Set override_output_dir=True for StatisticsSubscriber if this is the intention."
                 )
 
+        self._writer = _StatisticsWriter(self._output_dir) if output_format == "binary" else None
+
+    def flush(self):
+        """Wait until all collected statistics are written. Only needed for the "binary" output format."""
+        if self._writer is not None:
+            self._writer.flush()
+
     def post_forward_tensor_apply_impl(
         self, run_rtx: RuntimeStates, module: torch.nn.Module, tensor_index: int, tensor: torch.Tensor
     ) -> torch.Tensor:
@@ -166,13 +196,15 @@ class StatisticsSubscriber(SubscriberBase):
 
     def module_post_forward_impl(self, activation: torch.Tensor, depth: int, name: str, step: int):
         output_file_path = os.path.join(f"{self._output_dir}", f"step_{step}")
-        return self._summarize_activations(activation, depth, name, output_file_path, True)
+        return self._summarize_activations(activation, depth, name, output_file_path, True, step)
 
     def module_pre_backward_impl(self, activation: torch.Tensor, depth: int, name: str, step: int):
         output_file_path = os.path.join(f"{self._output_dir}", f"step_{step}")
-        return self._summarize_activations(activation, depth, name, output_file_path, False)
+        return self._summarize_activations(activation, depth, name, output_file_path, False, step)
 
-    def _summarize_activations(self, tensor: torch.Tensor, depth: int, name: str, step_folder: str, is_forward: bool):
+    def _summarize_activations(
+        self, tensor: torch.Tensor, depth: int, name: str, step_folder: str, is_forward: bool, step: int
+    ):
         display_name = name + " forward run" if is_forward is True else name + " backward run"
         output_file_name = name + "_forward" if is_forward is True else name + "_backward"
 
@@ -180,6 +212,10 @@ class StatisticsSubscriber(SubscriberBase):
             print(f"{display_name} not a torch tensor, value: {tensor}")
             return
 
+        if self._writer is not None:
+            self._writer.put(step, output_file_name, depth, tensor, self._run_on_cpu, self._bucket_size)
+            return
+
         step_path = Path(step_folder)
         if not step_path.exists():
             step_path.mkdir(parents=True, exist_ok=False)
@@ -193,6 +229,106 @@ class StatisticsSubscriber(SubscriberBase):
             _summarize_tensor(display_name, tensor, f, depth, self._run_on_cpu, self._bucket_size)
 
 
+_SAMPLE_COUNT = 128
+
+
+def _compute_statistics(flatten_array: torch.Tensor, run_on_cpu: bool, bucket_size: int) -> List[torch.Tensor]:
+    """Computes the statistics of a flattened tensor without waiting for the device.
+
+    Returns the 0-dim tensors of nan/inf/negative/positive/zero element counts, min, max, mean and std, on the device
+    of `flatten_array`.
+    """
+    if run_on_cpu:
+        return [
+            torch.isnan(flatten_array).sum(),
+            torch.isinf(flatten_array).sum(),
+            (flatten_array < 0).sum(),
+            (flatten_array > 0).sum(),
+            (flatten_array == 0).sum(),
+            flatten_array.min(),
+            flatten_array.max(),
+            flatten_array.mean(),
+            flatten_array.std(),
+        ]
+
+    # Split the calculation for each bucket, then do another round of calculation on the bucket results.
+    # This can at the best effort reduce the peak memory impact.
+    element_count = flatten_array.numel()
+    bucket_statistics = []
+    for start in range(0, element_count, bucket_size):
+        bucket = flatten_array[start : start + bucket_size]
+        # Only calculate std for float types, otherwise it will throw exception.
+        if bucket.dtype in [torch.float16, torch.float32, torch.float64]:
+            std_value = bucket.std()
+        else:
+            std_value = torch.zeros((), dtype=bucket.dtype, device=bucket.device)
+        bucket_statistics.append(
+            [
+                torch.count_nonzero(torch.isnan(bucket)),
+                torch.count_nonzero(torch.isinf(bucket)),
+                torch.count_nonzero(bucket < 0),
+                torch.count_nonzero(bucket > 0),
+                torch.count_nonzero(bucket == 0),
+                bucket.min(),
+                bucket.max(),
+                bucket.sum(),
+                std_value,
+            ]
+        )
+
+    # Reduction across all buckets
+    columns = [torch.stack(column) for column in zip(*bucket_statistics)]
+    counts = [column.sum() for column in columns[:5]]
+    min_buckets, max_buckets, sum_buckets, std_buckets = columns[5:]
+    sum_buckets = sum_buckets.to(flatten_array.dtype)
+    element_count_per_bucket = torch.full_like(sum_buckets, bucket_size, dtype=torch.int64)
+    element_count_per_bucket[-1] = element_count - (len(bucket_statistics) - 1) * bucket_size
+    mean_value = sum_buckets.sum().to(torch.float64) / element_count
+    # Here we refer to
+    # https://math.stackexchange.com/questions/2971315/how-do-i-combine-standard-deviations-of-two-groups
+    # to calculate the combined standard deviation of all buckets.
+    s = (element_count_per_bucket - 1) * (std_buckets**2) + element_count_per_bucket * (
+        _subtract_float(sum_buckets, mean_value) ** 2
+    )
+    std_value = torch.sqrt(s.sum() / (element_count - 1))
+    return [*counts, min_buckets.min(), max_buckets.max(), mean_value, std_value]
+
+
+def _subtract_float(tensor: torch.Tensor, value: torch.Tensor) -> torch.Tensor:
+    """Subtracts a float64 0-dim tensor the same way as subtracting the Python float it holds.
+
+    A Python float is applied in float32 for reduced precision tensors, and promotes integer tensors to float32.
+    """
+    result_dtype = torch.result_type(tensor, 0.0)
+    compute_dtype = torch.float32 if result_dtype in [torch.float16, torch.bfloat16] else result_dtype
+    return (tensor.to(compute_dtype) - value.to(compute_dtype)).to(result_dtype)
+
+
+def _format_summary(
+    display_name: str,
+    depth: int,
+    tensor_shape: torch.Size,
+    tensor_dtype: torch.dtype,
+    statistics: List[torch.Tensor],
+    samples: torch.Tensor,
+) -> str:
+    num_nan, num_inf, num_neg, num_pos, num_zero, min_value, max_value, mean_value, std_value = statistics
+
+    # This is to try the best effort to align the count of numbers per line for easier comparison in diff views,
+    # though it does not always guarantee to do this way.
+    torch.set_printoptions(precision=6, linewidth=128)
+    return (
+        f"{'>'*max(0, depth) + display_name} shape: {tensor_shape} dtype: {tensor_dtype} "
+        f"size: {torch.Size([tensor_shape.numel()])} \n"
+        f"min: {min_value} max: {max_value}, mean: {mean_value}, "
+        f"std: {std_value} \n"
+        f"nan: {num_nan}, inf: {num_inf}\n"
+        f"samples(top {_SAMPLE_COUNT}): {samples}\n"
+        f"neg: {num_neg}, pos: {num_pos}, zero: {num_zero},\n"
+        f"{'='*16}\n"
+    )
+
+
 def _summarize_tensor(
     display_name: str,
     tensor: torch.Tensor,
@@ -201,85 +337,163 @@ def _summarize_tensor(
     run_on_cpu: bool = False,
     bucket_size: int = 1024 * 1024 * 1024 // 2,
 ):
-    # This is to try the best effort to align the count of numbers per line for easier comparison in diff views,
-    # though it does not always guarantee to do this way.
-    torch.set_printoptions(precision=6, linewidth=128)
-
-    tensor_shape = tensor.shape
-    tensor_dtype = tensor.dtype
-    flatten_array = tensor.flatten().view(-1)
+    flatten_array = tensor.detach().flatten().view(-1)
 
     if run_on_cpu:
         flatten_array = flatten_array.to("cpu")
 
-    if run_on_cpu:
-        num_nan = torch.isnan(flatten_array).sum()
-        num_inf = torch.isinf(flatten_array).sum()
-        num_neg = (flatten_array < 0).sum()
-        num_pos = (flatten_array > 0).sum()
-        num_zero = (flatten_array == 0).sum()
-        min_value = flatten_array.min()
-        max_value = flatten_array.max()
-        mean_value = flatten_array.mean()
-        std_value = flatten_array.std()
-    else:
-        # Split the calculation for each bucket, then do another round of calculation on the bucket results.
-        # This can at the best effort reduce the peak memory impact.
-        element_count = flatten_array.numel()
-        ceil_bucket_count = (element_count + bucket_size - 1) // (bucket_size)
-        nan_buckets = torch.zeros(ceil_bucket_count, dtype=torch.int64, device=flatten_array.device)
-        inf_buckets = torch.zeros(ceil_bucket_count, dtype=torch.int64, device=flatten_array.device)
-        neg_buckets = torch.zeros(ceil_bucket_count, dtype=torch.int64, device=flatten_array.device)
-        pos_buckets = torch.zeros(ceil_bucket_count, dtype=torch.int64, device=flatten_array.device)
-        zero_buckets = torch.zeros(ceil_bucket_count, dtype=torch.int64, device=flatten_array.device)
-        min_buckets = torch.zeros(ceil_bucket_count, dtype=flatten_array.dtype, device=flatten_array.device)
-        max_buckets = torch.zeros(ceil_bucket_count, dtype=flatten_array.dtype, device=flatten_array.device)
-        mean_buckets = torch.zeros(ceil_bucket_count, dtype=flatten_array.dtype, device=flatten_array.device)
-        std_buckets = torch.zeros(ceil_bucket_count, dtype=flatten_array.dtype, device=flatten_array.device)
-
-        # Summary for each bucket
-        element_count_per_bucket = torch.zeros(ceil_bucket_count, dtype=torch.int64, device=flatten_array.device)
-        for i in range(ceil_bucket_count):
-            end = min((i + 1) * bucket_size, element_count)
-            bucket = flatten_array[i * bucket_size : end]
-            element_count_per_bucket[i] = bucket.numel()
-
-            nan_buckets[i] = torch.isnan(bucket).sum()
-            inf_buckets[i] = torch.isinf(bucket).sum()
-            neg_buckets[i] = (bucket < 0).sum()
-            pos_buckets[i] = (bucket > 0).sum()
-            zero_buckets[i] = (bucket == 0).sum()
-            min_buckets[i] = bucket.min()
-            max_buckets[i] = bucket.max()
-            mean_buckets[i] = bucket.sum()
-
-            # Only calculate std for float types, otherwise it will throw exception.
-            if bucket.dtype in [torch.float16, torch.float32, torch.float64]:
-                std_buckets[i] = bucket.std()
-
-        # Reduction across all buckets
-        num_nan = nan_buckets.sum()
-        num_inf = inf_buckets.sum()
-        num_neg = neg_buckets.sum()
-        num_pos = pos_buckets.sum()
-        num_zero = zero_buckets.sum()
-        min_value = min_buckets.min()
-        max_value = max_buckets.max()
-        mean_value = float(mean_buckets.sum()) / float(element_count)
-        # Here we refer to
-        # https://math.stackexchange.com/questions/2971315/how-do-i-combine-standard-deviations-of-two-groups
-        # to calculate the combined standard deviation of all buckets.
-        s = (element_count_per_bucket - 1) * (std_buckets**2) + element_count_per_bucket * (
-            (mean_buckets - mean_value) ** 2
+    statistics = _compute_statistics(flatten_array, run_on_cpu, bucket_size)
+    f.write(_format_summary(display_name, depth, tensor.shape, tensor.dtype, statistics, flatten_array[:_SAMPLE_COUNT]))
+
+
+class _StatisticsWriter:
+    """Writes the statistics of each step into a columnar file from a background thread.
+
+    `put` queues the statistics computation on the current stream and a non-blocking copy to host, so it does not
+    wait for the device. The writer thread waits for the copy, and writes the rows of a step when a later step starts
+    or when `flush` is called.
+    """
+
+    _MAX_PENDING = 4096
+
+    def __init__(self, output_dir: str):
+        self._output_dir = output_dir
+        self._queue = queue.Queue(maxsize=self._MAX_PENDING)
+        self._rows: Dict[int, List[tuple]] = {}
+        self._thread = threading.Thread(target=self._run, name="StatisticsWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def put(self, step: int, name: str, depth: int, tensor: torch.Tensor, run_on_cpu: bool, bucket_size: int):
+        flatten_array = tensor.detach().flatten().view(-1)
+        if run_on_cpu:
+            flatten_array = flatten_array.to("cpu")
+
+        statistics = _compute_statistics(flatten_array, run_on_cpu, bucket_size)
+        # The values keep their own data types, packed as bytes into one buffer to copy to host at once.
+        values = torch.cat(
+            [value.reshape(-1).contiguous().view(torch.uint8) for value in [*statistics, flatten_array[:_SAMPLE_COUNT]]]
+        )
+        event = None
+        if values.is_cuda:
+            host_values = torch.empty(values.shape, dtype=values.dtype, pin_memory=True)
+            host_values.copy_(values, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record()
+        else:
+            host_values = values
+        mean_dtype, std_dtype = statistics[-2].dtype, statistics[-1].dtype
+        self._queue.put(
+            (
+                step,
+                name,
+                depth,
+                str(tensor.dtype),
+                tuple(tensor.shape),
+                str(mean_dtype),
+                str(std_dtype),
+                str(flatten_array.device),
+                host_values,
+                event,
+            )
         )
-        std_value = torch.sqrt(s.sum() / (element_count - 1))
 
-    f.write(
-        f"{'>'*max(0, depth) + display_name} shape: {tensor_shape} dtype: {tensor_dtype} size: {flatten_array.size()} \n"
-        f"min: {min_value} max: {max_value}, mean: {mean_value}, "
-        f"std: {std_value} \n"
-        f"nan: {num_nan}, inf: {num_inf}\n"
-    )
-    f.write(f"samples(top 128): {flatten_array[:128]}\n")
-    f.write(f"neg: {num_neg}, pos: {num_pos}, zero: {num_zero},\n")
-    f.write(f"{'='*16}\n")
+    def flush(self):
+        self._queue.put(None)
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    for step in sorted(self._rows):
+                        self._write_step(step)
+                else:
+                    step, *row, host_values, event = item
+                    if event is not None:
+                        event.synchronize()
+                    # Rows of earlier steps are complete once a later step starts.
+                    for finished_step in sorted(s for s in self._rows if s < step):
+                        self._write_step(finished_step)
+                    self._rows.setdefault(step, []).append((*row, host_values.numpy()))
+            except Exception as e:
+                warnings.warn(f"StatisticsSubscriber failed to write statistics: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_step(self, step: int):
+        rows = self._rows.pop(step)
+        step_path = Path(self._output_dir) / f"step_{step}"
+        step_path.mkdir(parents=True, exist_ok=True)
+        # Rows arriving after their step was written (which is unusual) go to another chunk of the step.
+        chunk = len(list(step_path.glob("statistics*.npz")))
+        names, depths, dtypes, shapes, mean_dtypes, std_dtypes, devices, values = zip(*rows)
+        np.savez(
+            step_path / (f"statistics_{chunk}.npz" if chunk else "statistics.npz"),
+            names=np.array(names),
+            depths=np.array(depths, dtype=np.int64),
+            dtypes=np.array(dtypes),
+            shape_offsets=np.cumsum([0] + [len(shape) for shape in shapes]),
+            shape_dims=np.array([dim for shape in shapes for dim in shape], dtype=np.int64),
+            mean_dtypes=np.array(mean_dtypes),
+            std_dtypes=np.array(std_dtypes),
+            devices=np.array(devices),
+            value_offsets=np.cumsum([0] + [len(v) for v in values]),
+            values=np.concatenate(values),
+        )
+
+
+def _load_device(device: str) -> torch.device:
+    """Returns the device the statistics were computed on if it is available, otherwise CPU."""
+    try:
+        return torch.empty(0, device=device).device
+    except RuntimeError:
+        return torch.device("cpu")
+
+
+def _load_values(values: np.ndarray, dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+    """Reinterprets the bytes of `values` as a tensor of `dtype` on `device`."""
+    return torch.from_numpy(values.copy()).view(dtype).to(device)
+
+
+def load_statistics_summaries(step_dir: str) -> List[Tuple[str, str]]:
+    """Loads the statistics of a step written with the "binary" output format.
+
+    Returns (name, summary) pairs in the order the activations were run, where name is the file name and summary is
+    the file content the "text" output format would write for the activation.
+    """
+    # Chunks are named statistics.npz, statistics_1.npz, statistics_2.npz, ...
+    chunk_paths = sorted(Path(step_dir).glob("statistics*.npz"), key=lambda p: int(p.stem.partition("_")[2] or 0))
+    summaries = []
+    for chunk_path in chunk_paths:
+        with np.load(chunk_path) as data:
+            shape_offsets, value_offsets = data["shape_offsets"], data["value_offsets"]
+            for i, name in enumerate(data["names"].tolist()):
+                tensor_dtype, mean_dtype, std_dtype = (
+                    getattr(torch, data[key][i].split(".")[-1]) for key in ["dtypes", "mean_dtypes", "std_dtypes"]
+                )
+                value_dtypes = [torch.int64] * 5 + [tensor_dtype, tensor_dtype, mean_dtype, std_dtype]
+                device = _load_device(str(data["devices"][i]))
+                values = data["values"][value_offsets[i] : value_offsets[i + 1]]
+                statistics = []
+                offset = 0
+                for value_dtype in value_dtypes:
+                    size = torch.empty((), dtype=value_dtype).element_size()
+                    statistics.append(_load_values(values[offset : offset + size], value_dtype, device).reshape(()))
+                    offset += size
+                samples = _load_values(values[offset:], tensor_dtype, device)
+                if name.endswith("_forward"):
+                    display_name = name[: -len("_forward")] + " forward run"
+                else:
+                    display_name = name[: -len("_backward")] + " backward run"
+                summary = _format_summary(
+                    display_name,
+                    int(data["depths"][i]),
+                    torch.Size(data["shape_dims"][shape_offsets[i] : shape_offsets[i + 1]].tolist()),
+                    tensor_dtype,
+                    statistics,
+                    samples,
+                )
+                summaries.append((name, summary))
+    return summaries
@@ -4,8 +4,9 @@
 # --------------------------------------------------------------------------
 
 
+import random
 import sys
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
 import torch
 
@@ -31,6 +32,94 @@ class RuntimeStates:
 
     def __init__(self):
         self.global_states = RuntimeStates._GlobalStates()
+        # Sampling policy shared by all subscribers of SubscriberManager, None to run subscribers on all tensors.
+        self.sampling_policy: Optional[SamplingPolicy] = None
+        # Whether SubscriberManager's hooks are running, in which case the sampling policy is already applied.
+        self.applying_hooks = False
+
+
+class SamplingPolicy:
+    """
+    Sampling policy applied by SubscriberManager to all its subscribers, to bound the overhead of inspecting tensors,
+    so that subscribers like StatisticsSubscriber can be left on for long runs.
+
+    A tensor is inspected only if all conditions hold:
+    > The step is a multiple of `step_interval`.
+    > The module is in the random subset of modules sampled for the step. The subset is determined by `seed`, the
+      step and the module index, so that it is the same across ranks and across PyTorch and ORT runs.
+    > The module's tensors inspected so far in the step, plus this tensor, are no more than `max_bytes_per_module`.
+    > The wall time spent in subscribers so far in the step is less than `max_overhead_per_step` seconds. This is
+      host time, asynchronous device work queued by the subscribers is not included.
+
+    Tensors inspected by `inspect_activation` outside any nn.Module hook have None as module index.
+    """
+
+    def __init__(
+        self,
+        step_interval: int = 1,
+        module_sample_ratio: float = 1.0,
+        max_bytes_per_module: Optional[int] = None,
+        max_overhead_per_step: Optional[float] = None,
+        seed: int = 0,
+    ):
+        if step_interval < 1:
+            raise ValueError(f"step_interval must be positive, got {step_interval}.")
+        if not 0.0 <= module_sample_ratio <= 1.0:
+            raise ValueError(f"module_sample_ratio must be in [0, 1], got {module_sample_ratio}.")
+
+        self.step_interval = step_interval
+        self.module_sample_ratio = module_sample_ratio
+        self.max_bytes_per_module = max_bytes_per_module
+        self.max_overhead_per_step = max_overhead_per_step
+        self.seed = seed
+
+        # States of the current step.
+        self._step = -1
+        self._module_sampled: Dict[Optional[int], bool] = {}
+        self._module_bytes: Dict[Optional[int], int] = {}
+        self._overhead = 0.0
+
+    def _start_step(self, step: int):
+        # Gradients of a step are inspected after the next step starts, they are counted for the next step.
+        if step > self._step:
+            self._step = step
+            self._module_sampled.clear()
+            self._module_bytes.clear()
+            self._overhead = 0.0
+
+    def need_skip_module(self, step: int, module_index: Optional[int]) -> bool:
+        if step % self.step_interval != 0:
+            return True
+
+        self._start_step(step)
+        if self.max_overhead_per_step is not None and self._overhead >= self.max_overhead_per_step:
+            return True
+
+        if self.module_sample_ratio >= 1.0:
+            return False
+        sampled = self._module_sampled.get(module_index)
+        if sampled is None:
+            sampled = random.Random(f"{self.seed}:{step}:{module_index}").random() < self.module_sample_ratio
+            self._module_sampled[module_index] = sampled
+        return not sampled
+
+    def need_skip_tensor(self, step: int, module_index: Optional[int], tensor: torch.Tensor) -> bool:
+        """Decides whether to skip the tensor, and counts its bytes into the module's budget if not skipped."""
+        if self.need_skip_module(step, module_index):
+            return True
+
+        if self.max_bytes_per_module is None or not isinstance(tensor, torch.Tensor):
+            return False
+        tensor_bytes = tensor.numel() * tensor.element_size()
+        module_bytes = self._module_bytes.get(module_index, 0) + tensor_bytes
+        if module_bytes > self.max_bytes_per_module:
+            return True
+        self._module_bytes[module_index] = module_bytes
+        return False
+
+    def add_overhead(self, seconds: float):
+        """Adds wall time spent in subscribers to the overhead of the current step."""
+        self._overhead += seconds
 
 
 class SubscriberBase:
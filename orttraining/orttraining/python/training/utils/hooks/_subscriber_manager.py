@@ -5,6 +5,7 @@
 
 
 import inspect
+import time
 from contextlib import contextmanager
 from typing import List, Optional, Set, Tuple, Union
 
@@ -13,7 +14,7 @@ import torch
 
 from onnxruntime.training.utils import extract_data_and_schema, unflatten_data_using_schema
 
-from ._subscriber_base import RuntimeStates, SubscriberBase
+from ._subscriber_base import RuntimeStates, SamplingPolicy, SubscriberBase
 
 ORT_NO_INCREASE_GLOBAL_STEP = [False]
 
@@ -100,6 +101,10 @@ class SubscriberManager:
     for the outside-most module, which is the root module. In that hook, _IncrementStep is called, which will
     increase the step by 1 once the post forward hook is called if running without no_increase_global_step().
     `no_increase_global_step` is used to skip the step increment during ONNX model export.
+
+    An optional SamplingPolicy limits the steps, modules and tensors on which subscribers run. It is applied in the
+    nn.Module hooks for PyTorch runs, and by the inspector autograd function for ORT runs, since ORT runs the
+    inspectors exported in the graph instead of the hooks. The policy is not applied during ONNX model export.
     """
 
     def __init__(self):
@@ -107,17 +112,29 @@ class SubscriberManager:
         self._subscribers: Set[SubscriberBase] = set()
         self._pre_forward_hooks = []
         self._post_forward_hooks = []
-
-    def subscribe(self, module: torch.nn.Module, subscribers: List[SubscriberBase]):
+        self._has_input_tensor_actions = False
+
+    def subscribe(
+        self,
+        module: torch.nn.Module,
+        subscribers: List[SubscriberBase],
+        sampling_policy: Optional[SamplingPolicy] = None,
+    ):
         """
         The API is called externally to register hooks that are implicitly defined by subscribers.
         Each time all global states will be cleaned up once called.
+
+        Args:
+            module: the module to register hooks for.
+            subscribers: the subscribers to run in the hooks.
+            sampling_policy: the policy to sample the tensors subscribers run on, None to run on all tensors.
         """
         if not isinstance(module, torch.nn.Module):
             raise ValueError("module must be a torch.nn.Module instance")
 
         self._reset_all_states()
         self._subscribers.clear()
+        self._run_ctx.sampling_policy = sampling_policy
 
         try:
             # Put the import here to avoid the module level dependency on onnxruntime.training.ortmodule
@@ -133,6 +150,10 @@ class SubscriberManager:
                 raise ValueError("subscriber must be a SubscriberBase instance")
             self._subscribers.add(subscriber)
 
+        self._has_input_tensor_actions = any(
+            type(sub).pre_forward_tensor_apply_impl is not SubscriberBase.pre_forward_tensor_apply_impl
+            for sub in self._subscribers
+        )
         self._initialize(module)
 
     def get_subscriber(self, subscriber_type: type) -> SubscriberBase:
@@ -239,6 +260,41 @@ class SubscriberManager:
                 next_module_index[0] += 1
                 self._register_hooks_recursively(child, depth + 1, next_module_index)
 
+        def _sampled_hook(hook):
+            """Skips the hook if the module is not sampled, and counts its time into the overhead of the step."""
+
+            def _hook(module, *args):
+                policy = self._run_ctx.sampling_policy
+                if policy is None:
+                    return hook(module, *args)
+
+                if not ORT_NO_INCREASE_GLOBAL_STEP[0] and policy.need_skip_module(
+                    self._run_ctx.global_states.execution_step,
+                    self._run_ctx.global_states.module_to_module_index[module],
+                ):
+                    # Returning None keeps the module inputs and outputs unchanged.
+                    return None
+
+                start = time.perf_counter()
+                self._run_ctx.applying_hooks = True
+                try:
+                    return hook(module, *args)
+                finally:
+                    self._run_ctx.applying_hooks = False
+                    policy.add_overhead(time.perf_counter() - start)
+
+            return _hook
+
+        def _need_skip_tensors(module, tensors, is_input):
+            policy = self._run_ctx.sampling_policy
+            # Inputs are not counted into the bytes budget if no subscriber has actions on them.
+            if policy is None or ORT_NO_INCREASE_GLOBAL_STEP[0] or (is_input and not self._has_input_tensor_actions):
+                return [False] * len(tensors)
+
+            step = self._run_ctx.global_states.execution_step
+            index = self._run_ctx.global_states.module_to_module_index[module]
+            return [policy.need_skip_tensor(step, index, tensor) for tensor in tensors]
+
         def _pre_forward_module_with_kwargs_hook(module, module_inputs, kwargs):
             # Module level hook
             for sub in self._subscribers:
@@ -248,14 +304,22 @@ class SubscriberManager:
             flatten_positional_input_tensor_list, input_schema = extract_data_and_schema(module_inputs)
             flatten_keyword_input_tensor_list, keyword_input_schema = extract_data_and_schema(kwargs)
 
+            skip_positional = _need_skip_tensors(module, flatten_positional_input_tensor_list, True)
+            skip_keyword = _need_skip_tensors(module, flatten_keyword_input_tensor_list, True)
             for sub in self._subscribers:
                 tensor_list = []
                 for tensor_index, tensor in enumerate(flatten_positional_input_tensor_list):
+                    if skip_positional[tensor_index]:
+                        tensor_list.append(tensor)
+                        continue
                     tensor_list.append(sub.pre_forward_tensor_apply(self._run_ctx, module, tensor_index, tensor))
                 flatten_positional_input_tensor_list = tensor_list
 
                 tensor_list = []
                 for tensor_index, tensor in enumerate(flatten_keyword_input_tensor_list):
+                    if skip_keyword[tensor_index]:
+                        tensor_list.append(tensor)
+                        continue
                     tensor_list.append(sub.pre_forward_tensor_apply(self._run_ctx, module, tensor_index, tensor))
                 flatten_keyword_input_tensor_list = tensor_list
 
@@ -274,9 +338,13 @@ class SubscriberManager:
 
             # Tensor level hook
             flatten_output_tensor_list, output_schema = extract_data_and_schema(module_outputs)
+            skip_output = _need_skip_tensors(module, flatten_output_tensor_list, False)
             for sub in self._subscribers:
                 tensor_list = []
                 for tensor_index, tensor in enumerate(flatten_output_tensor_list):
+                    if skip_output[tensor_index]:
+                        tensor_list.append(tensor)
+                        continue
                     tensor_list.append(sub.post_forward_tensor_apply(self._run_ctx, module, tensor_index, tensor))
                 flatten_output_tensor_list = tensor_list
 
@@ -285,8 +353,8 @@ class SubscriberManager:
         # "with_kwargs" is not available for low versions of PyTorch.
         if "with_kwargs" in inspect.signature(module.register_forward_pre_hook).parameters:
             self._pre_forward_hooks.append(
-                module.register_forward_pre_hook(_pre_forward_module_with_kwargs_hook, with_kwargs=True)
+                module.register_forward_pre_hook(_sampled_hook(_pre_forward_module_with_kwargs_hook), with_kwargs=True)
             )
         else:
-            self._pre_forward_hooks.append(module.register_forward_pre_hook(_pre_forward_module_hook))
-        self._post_forward_hooks.append(module.register_forward_hook(_post_forward_module_hook))
+            self._pre_forward_hooks.append(module.register_forward_pre_hook(_sampled_hook(_pre_forward_module_hook)))
+        self._post_forward_hooks.append(module.register_forward_hook(_sampled_hook(_post_forward_module_hook)))
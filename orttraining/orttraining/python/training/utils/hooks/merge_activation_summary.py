@@ -25,6 +25,8 @@ import os
 import shutil
 from pathlib import Path
 
+from onnxruntime.training.utils.hooks._statistics_subscriber import load_statistics_summaries
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,7 +38,8 @@ def generate_summaries_per_step(args):
     output_path.mkdir(parents=True, exist_ok=False)
 
     # We should use the order.txt generated by PyTorch run, which means, we follow the PyTorch typological order to compare
-    # activation results. Here we assume to get the order.txt from pt_dir/step_0/order.txt
+    # activation results. Here we assume to get the order.txt from pt_dir/step_0/order.txt, or the order of statistics
+    # in pt_dir/step_0 if it is written with the "binary" output format.
     topo_order_file_path = Path(f"{pt_dir}/step_0/order.txt")
 
     src_ort_path = Path(ort_dir)
@@ -51,8 +54,11 @@ def generate_summaries_per_step(args):
             dump_src_path.as_posix(),
             topo_order_file_path.as_posix(),
         )
-        with topo_order_file_path.open(mode="r", encoding="utf-8") as order_file:
-            tensor_name_in_order = order_file.readlines()
+        if topo_order_file_path.exists():
+            with topo_order_file_path.open(mode="r", encoding="utf-8") as order_file:
+                tensor_name_in_order = order_file.readlines()
+        else:
+            tensor_name_in_order = [name for name, _ in load_statistics_summaries(topo_order_file_path.parent)]
 
         if merge_dest_path.exists():
             shutil.rmtree(merge_dest_path.as_posix())
@@ -62,20 +68,30 @@ def generate_summaries_per_step(args):
             if dump_step_path.is_dir():
                 step_name = dump_step_path.name
                 merge_filename_for_sub_dir = merge_dest_path / f"{step_name}_.txt"
+                # Summaries written with the "binary" output format are all in the statistics files of the step.
+                binary_summaries = None
+                if not (dump_step_path / "order.txt").exists():
+                    binary_summaries = dict(load_statistics_summaries(dump_step_path))
                 # Open merge_filename_for_sub_dir in write mode
                 with merge_filename_for_sub_dir.open(mode="w", encoding="utf-8") as outfile:
                     for filename in tensor_name_in_order:
                         filename = filename.rstrip("\n")  # noqa: PLW2901
                         full_filename = dump_step_path / filename
-                        if not full_filename.exists():
+                        if binary_summaries is not None:
+                            summary = binary_summaries.get(filename)
+                        elif full_filename.exists():
+                            with full_filename.open(mode="r", encoding="utf-8") as infile:
+                                summary = infile.read()
+                        else:
+                            summary = None
+
+                        if summary is None:
                             # Be noted that some tensor handled in PyTorch might be missing in ORT graph
                             # (if the activation is not used by others, which is pruned during export)
                             logger.warning("tensor %s not exist", full_filename)
                             continue
 
-                        with full_filename.open(mode="r", encoding="utf-8") as infile:
-                            outfile.write(infile.read())
-
+                        outfile.write(summary)
                         outfile.write("\n")
 
         logger.warning(
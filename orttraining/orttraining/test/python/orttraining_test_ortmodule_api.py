@@ -5,6 +5,8 @@
 import copy
 import inspect
 import itertools
+import json
+import logging
 import math
 import os
 import pickle
@@ -30,7 +32,7 @@ from transformers.modeling_outputs import SequenceClassifierOutput
 
 import onnxruntime.training.ortmodule as ortmodule_module
 from onnxruntime.training.optim import AdamWMode, FusedAdam
-from onnxruntime.training.ortmodule import DebugOptions, LogLevel, ORTModule, _fallback, _io, _utils
+from onnxruntime.training.ortmodule import DebugOptions, LogLevel, ORTModule, _fallback, _graph_cache, _io, _utils
 from onnxruntime.training.ortmodule._custom_gradient_registry import register_gradient
 from onnxruntime.training.ortmodule.options import _SkipCheck
 
@@ -2264,6 +2266,55 @@ def test_changes_input_requires_grad_reinitializes_module_gradient_graph_builder
     del os.environ["ORTMODULE_SKIPCHECK_POLICY"]
 
 
+@pytest.mark.parametrize("device", ["cuda", "cpu"])
+def test_alternating_input_schemas_reuse_cached_graphs(device):
+    os.environ["ORTMODULE_SKIPCHECK_POLICY"] = "SKIP_CHECK_DISABLED"
+
+    class NeuralNetWithBooleanInput(torch.nn.Module):
+        def __init__(self, input_size, num_classes):
+            super().__init__()
+            self.fc = torch.nn.Linear(input_size, num_classes)
+
+        def forward(self, x, apply_relu):
+            out = self.fc(x)
+            return torch.relu(out) if apply_relu else out
+
+    def run_step(model, x, apply_relu):
+        prediction = model(x, apply_relu)
+        loss = prediction.sum()
+        loss.backward()
+        return prediction
+
+    N, D_in, D_out = 32, 784, 10  # noqa: N806
+    pt_model = NeuralNetWithBooleanInput(D_in, D_out).to(device)
+    # The cache is disabled by default.
+    ort_model = ORTModule(copy.deepcopy(pt_model))
+    assert ort_model._torch_module._execution_manager(True)._schema_graph_cache is None
+
+    os.environ["ORTMODULE_SCHEMA_GRAPH_CACHE_SIZE"] = "4"
+    ort_model = ORTModule(copy.deepcopy(pt_model))
+    with unittest.mock.patch("torch.onnx.export", side_effect=torch.onnx.export) as export:
+        for step in range(6):
+            # The value of a boolean input is part of the input schema.
+            apply_relu = step % 2 == 0
+            x = torch.randn(N, D_in, device=device)
+            pt_prediction = run_step(pt_model, x, apply_relu)
+            ort_prediction = run_step(ort_model, x, apply_relu)
+
+            _test_helpers.assert_values_are_close(ort_prediction, pt_prediction)
+            _test_helpers.assert_gradients_match_and_reset_gradient(ort_model, pt_model)
+
+        # The model is exported once for each schema.
+        assert export.call_count == 2
+
+    schema_graph_cache = ort_model._torch_module._execution_manager(True)._schema_graph_cache
+    assert schema_graph_cache.misses == 2
+    assert schema_graph_cache.hits == 4
+
+    del os.environ["ORTMODULE_SCHEMA_GRAPH_CACHE_SIZE"]
+    del os.environ["ORTMODULE_SKIPCHECK_POLICY"]
+
+
 @pytest.mark.parametrize("device", ["cuda"])
 def test_input_requires_grad_backward_creates_input_grad_as_required0(device):
     N, D_in, H, D_out = 32, 784, 500, 10  # noqa: N806
@@ -5773,6 +5824,65 @@ def test_runtime_inspector_label_and_embed_sparsity_detection(embed_is_sparse, l
         assert found_embed_is_sparse
 
 
+def test_runtime_inspector_input_density_history():
+    class NeuralNetEmbeddingCrossEntropyLoss(torch.nn.Module):
+        def __init__(self, num_embeddings, embedding_dim):
+            super().__init__()
+            self.embedding = torch.nn.Embedding(num_embeddings, embedding_dim, padding_idx=1)
+            self.fc1 = torch.nn.Linear(embedding_dim, 3)
+            self.loss_fct = torch.nn.CrossEntropyLoss()
+
+        def forward(self, input, labels):
+            output = self.fc1(self.embedding(input))
+            return self.loss_fct(output.view(-1, 3), labels.view(-1))
+
+    device = "cuda"
+    input = torch.tensor([[0, 2, 3, 4], [2, 3, 1, 1], [1, 1, 1, 1]], device=device)
+    label = torch.tensor([[1, 2, -100, 2], [-100, -100, 2, 1], [-100, 1, 2, -100]], device=device)
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        history_file = os.path.join(temporary_dir, "input_density.jsonl")
+        os.environ["ORTMODULE_INPUT_DENSITY_HISTORY_FILE"] = history_file
+        os.environ["ORTMODULE_INPUT_DENSITY_LOG_STEPS"] = "2"
+
+        ort_model = ORTModule(NeuralNetEmbeddingCrossEntropyLoss(16, 128).to(device))
+        for _ in range(6):
+            loss = ort_model(input, label)
+            loss.backward()
+
+        with open(history_file) as f:
+            records = [json.loads(line) for line in f]
+
+        # Records are written once the counts of a step are copied to host, at least the first steps are written.
+        steps = [record["step"] for record in records]
+        assert steps == sorted(steps)
+        assert {0, 1}.issubset(steps)
+        assert 5 not in steps
+
+        # Closing the observer, as done at exit, writes the records of the last steps, and only once.
+        input_density_ob = ort_model._torch_module._execution_manager(True)._runtime_inspector.input_density_ob
+        input_density_ob.close()
+        input_density_ob.close()
+        with open(history_file) as f:
+            records = [json.loads(line) for line in f]
+
+        del os.environ["ORTMODULE_INPUT_DENSITY_HISTORY_FILE"]
+        del os.environ["ORTMODULE_INPUT_DENSITY_LOG_STEPS"]
+
+    steps = [record["step"] for record in records]
+    assert steps == sorted(steps)
+    assert sorted(set(steps)) == list(range(6))
+    assert all(steps.count(step) == steps.count(0) for step in range(6))
+    for record in records:
+        if record["input_type"] == "EMBED":
+            assert record["input_name"] == "input"
+            assert record["valid_tokens"] == 6
+            assert record["valid_tokens_per_batch"] == [4, 2, 0]
+        else:
+            assert record["input_type"] == "LABEL"
+            assert record["valid_tokens"] == 7
+        assert record["total_tokens"] == 12
+
+
 @pytest.mark.parametrize(
     "test_cases",
     [
@@ -6197,6 +6307,131 @@ def test_cache_exported_model():
         del os.environ["ORTMODULE_CACHE_DIR"]
 
 
+def test_cache_optimized_model():
+    device = "cuda"
+    N, D_in, H, D_out = 32, 128, 500, 10  # noqa: N806
+    pt_model = NeuralNetSinglePositionalArgument(D_in, H, D_out).to(device)
+    x = torch.randn(N, D_in, device=device)
+
+    def run_step(model, x):
+        prediction = model(x)
+        loss = prediction.sum()
+        loss.backward()
+        return prediction
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        os.environ["ORTMODULE_CACHE_DIR"] = temporary_dir
+
+        ort_model = ORTModule(copy.deepcopy(pt_model))
+        ort_prediction = run_step(ort_model, x)
+        # Both the exported model and the gradient graph are cached.
+        assert len([f for f in os.listdir(temporary_dir) if f.endswith(".json")]) == 2
+
+        ort_model_cached = ORTModule(copy.deepcopy(pt_model))
+        with unittest.mock.patch("torch.onnx.export", side_effect=torch.onnx.export) as export:
+            cached_prediction = run_step(ort_model_cached, x)
+            export.assert_not_called()
+        assert len([f for f in os.listdir(temporary_dir) if f.endswith(".json")]) == 2
+
+        _test_helpers.assert_values_are_close(cached_prediction, ort_prediction)
+        _test_helpers.assert_gradients_match_and_reset_gradient(ort_model_cached, ort_model)
+
+        # Model with different parameter shapes is exported again.
+        ort_model_other = ORTModule(NeuralNetSinglePositionalArgument(D_in, H + 1, D_out).to(device))
+        with unittest.mock.patch("torch.onnx.export", side_effect=torch.onnx.export) as export:
+            run_step(ort_model_other, x)
+            export.assert_called()
+
+        del os.environ["ORTMODULE_CACHE_DIR"]
+
+
+_CachedOutput = namedtuple("_CachedOutput", ["loss", "logits"])
+
+
+def test_graph_cache_metadata_is_saved_as_json():
+    from onnxruntime.training.utils.torch_io_helper import _TensorStub
+
+    metadata = {
+        "output_dynamic_axes": {"output-0": {0: "output-0_dim0"}},
+        "module_output_schema": OrderedDict(
+            out=_CachedOutput(
+                _TensorStub(1, name="loss", dtype="torch.float32", shape_dims=0), [_TensorStub(2), 1.5, None]
+            ),
+            extra=("a", True),
+        ),
+    }
+
+    restored = _graph_cache.metadata_from_json(json.loads(json.dumps(_graph_cache.metadata_to_json(metadata))))
+    assert restored == metadata
+    assert type(restored["module_output_schema"]) is OrderedDict
+    assert type(restored["module_output_schema"]["out"]) is _CachedOutput
+    assert type(restored["module_output_schema"]["extra"]) is tuple
+
+    # Types of modules which are not imported are not loaded.
+    saved = _graph_cache.metadata_to_json(OrderedDict(a=1))
+    saved["mapping"]["module"] = "module_which_is_not_imported"
+    with pytest.raises(ValueError):
+        _graph_cache.metadata_from_json(saved)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        graph_cache = _graph_cache.GraphCache(temporary_dir, logging.getLogger(__name__))
+        model = onnx.helper.make_model(onnx.helper.make_graph([], "empty", [], []))
+        graph_cache.save("key", model, metadata)
+        assert sorted(os.listdir(temporary_dir)) == ["key.json", "key.onnx"]
+        assert graph_cache.load("key")[1] == metadata
+
+
+def test_graph_cache_skips_models_with_python_op():
+    python_op = onnx.helper.make_node("PythonOp", ["x"], ["ctx", "y"], domain="com.microsoft", func_name="Function")
+    model = onnx.helper.make_model(onnx.helper.make_graph([python_op], "python_op", [], []))
+    assert _graph_cache.has_python_op(model)
+    assert not _graph_cache.has_python_op(onnx.helper.make_model(onnx.helper.make_graph([], "empty", [], [])))
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        graph_cache = _graph_cache.GraphCache(temporary_dir, logging.getLogger(__name__))
+        graph_cache.save("key", model, {})
+        assert os.listdir(temporary_dir) == []
+
+        # Models with PythonOp nodes cached by a previous version are not loaded.
+        graph_cache.save("key", onnx.helper.make_model(onnx.helper.make_graph([], "empty", [], [])), {})
+        onnx.save(model, os.path.join(temporary_dir, "key.onnx"))
+        assert graph_cache.load("key") is None
+
+
+def test_cache_is_not_used_for_model_with_autograd_function():
+    class ScaleFunction(torch.autograd.Function):
+        @staticmethod
+        def forward(ctx, x):
+            return x * 2
+
+        @staticmethod
+        def backward(ctx, grad_output):
+            return grad_output * 2
+
+    class Net(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.fc = torch.nn.Linear(10, 1)
+
+        def forward(self, x):
+            return self.fc(ScaleFunction.apply(x))
+
+    data = torch.randn(1, 10, requires_grad=True)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        os.environ["ORTMODULE_CACHE_DIR"] = temporary_dir
+
+        # The export registers the autograd.Function in the backend, so models with PythonOp nodes are never cached.
+        for _ in range(2):
+            ort_model = ORTModule(Net())
+            with unittest.mock.patch("torch.onnx.export", side_effect=torch.onnx.export) as export:
+                ort_model(data).sum().backward()
+                export.assert_called()
+            assert os.listdir(temporary_dir) == []
+
+        del os.environ["ORTMODULE_CACHE_DIR"]
+
+
 def test_reciprocal_gradient():
     class ReciprocalModel(torch.nn.Module):
         def __init__(self):
@@ -6480,3 +6715,49 @@ def test_bert_result_with_layerwise_recompute():
     torch.cuda.synchronize()
     if original_val is not None:
         os.environ["ORTMODULE_MEMORY_OPT_LEVEL"] = original_val
+
+
+def test_memory_optimization_plan_explorer():
+    from sympy import Symbol, parse_expr, simplify
+
+    from onnxruntime.training.ortmodule._runtime_inspector import MemoryObserver, MemoryOptimizationSummary
+
+    memory_observer = MemoryObserver(torch.nn.Linear(1, 1), logging.getLogger(__name__))
+    memory_observer.symbolic_dim_name_to_value_map = {Symbol("batch"): 8, Symbol("seq"): 128}
+    plan_stats = {
+        "Reshape+Where+:1:-1": ("128.0*batch*seq**2", 1),
+        "BiasSoftmax+:1:-1": ("128.0*batch*seq*(seq - 1)", 12),
+        "BiasGelu+:1:-1": ("20480.0*batch*(seq - 1)", 12),
+        "Cast+:1:-1": ("64.0*batch*seq*(seq - 1)", 12),
+        "Cast+:2:-1": ("2.0*batch*seq", 1),
+    }
+    for cluster_id, (saving_expr, freq) in plan_stats.items():
+        memory_observer.cluster_id_combination_to_saving_symbolics_map[cluster_id] = MemoryOptimizationSummary(
+            saving_expr, simplify(parse_expr(saving_expr)), None, freq
+        )
+
+    plans = memory_observer.get_memory_optimization_plans()
+    assert [plan.config for plan in plans] == list(plan_stats.keys())
+    assert [plan.recompute_op_count for plan in plans] == [2, 12, 12, 12, 1]
+
+    evaluation = memory_observer.evaluate_memory_optimization_plans(["BiasGelu+:1:-1", "Reshape+Where+:1:-1"])
+    assert evaluation.config == "BiasGelu+:1:-1,Reshape+Where+:1:-1"
+    assert evaluation.saving == 20480.0 * 8 * 127 + 128.0 * 8 * 128**2
+    assert evaluation.recompute_op_count == 14
+
+    # Given dim values override the values of the first batch.
+    evaluation = memory_observer.evaluate_memory_optimization_plans(["BiasGelu+:1:-1"], {"batch": 16})
+    assert evaluation.saving == 20480.0 * 16 * 127
+
+    # Plans recomputing the same subgraph can not be enabled together.
+    with pytest.raises(ValueError):
+        memory_observer.evaluate_memory_optimization_plans(["Cast+:1:-1", "Cast+:2:-1"])
+
+    # The cheapest plan reaching the required saving is recommended.
+    recommendation = memory_observer.recommend_memory_optimization_plans(1e7)
+    assert recommendation.config == "Reshape+Where+:1:-1"
+    # Among combinations with the same extra compute, the one saving more memory is recommended.
+    recommendation = memory_observer.recommend_memory_optimization_plans(3e7)
+    assert recommendation.config == "Reshape+Where+:1:-1,BiasGelu+:1:-1"
+    assert recommendation.recompute_op_count == 14
+    assert memory_observer.recommend_memory_optimization_plans(1e12) is None
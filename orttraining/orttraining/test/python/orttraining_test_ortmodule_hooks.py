@@ -8,7 +8,13 @@ import pytest
 import torch
 
 from onnxruntime.training.ortmodule import ORTModule
-from onnxruntime.training.utils.hooks import GlobalSubscriberManager, StatisticsSubscriber, inspect_activation
+from onnxruntime.training.utils.hooks import (
+    GlobalSubscriberManager,
+    SamplingPolicy,
+    StatisticsSubscriber,
+    inspect_activation,
+    load_statistics_summaries,
+)
 
 
 class NeuralNetSingleOutput(torch.nn.Module):
@@ -200,3 +206,210 @@ def test_statistic_subscriber_user_annotate_intermediate_tensors(device, backend
             step_dir = os.path.join(output_dir_path, f"step_{i}")
             for file in expected_files:
                 assert os.path.exists(os.path.join(step_dir, file))
+
+
+@pytest.mark.parametrize("device", ["cpu", "cuda"])
+@pytest.mark.parametrize("backend", ["torch", "ortmodule"])
+def test_statistic_subscriber_binary_output(device, backend):
+    input_size = 8
+    hidden_size = 16
+    num_classes = 32
+    model = NeuralNetSingleOutput(input_size, hidden_size, num_classes)
+    model.to(device)
+    model.train()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        text_output_dir_path = os.path.join(temporary_dir, f"{backend}_text_out")
+        binary_output_dir_path = os.path.join(temporary_dir, f"{backend}_binary_out")
+        binary_subscriber = StatisticsSubscriber(
+            binary_output_dir_path, override_output_dir=True, output_format="binary"
+        )
+        GlobalSubscriberManager.subscribe(
+            model, [StatisticsSubscriber(text_output_dir_path, override_output_dir=True), binary_subscriber]
+        )
+
+        if backend == "ortmodule":
+            model = ORTModule(model)
+
+        batch_size = 4
+        input1_tensor = torch.randn(batch_size, input_size, device=device)
+        input2_tensor = torch.randn(batch_size, input_size, device=device)
+        for _ in range(5):
+            y = model(input1_tensor, input2_tensor)
+            y.sum().backward()
+
+        binary_subscriber.flush()
+
+        for i in range(5):
+            text_step_dir = os.path.join(text_output_dir_path, f"step_{i}")
+            binary_step_dir = os.path.join(binary_output_dir_path, f"step_{i}")
+            assert os.listdir(binary_step_dir) == ["statistics.npz"]
+
+            # The binary statistics reproduce the text summaries, in the same order.
+            summaries = load_statistics_summaries(binary_step_dir)
+            with open(os.path.join(text_step_dir, "order.txt"), encoding="utf-8") as f:
+                assert [name for name, _ in summaries] == f.read().splitlines()
+            for name, summary in summaries:
+                with open(os.path.join(text_step_dir, name), encoding="utf-8") as f:
+                    assert summary == f.read()
+
+
+_FLOAT_SAMPLES = (
+    "tensor([-1.500000, -1.250000, -1.000000, -0.750000, -0.500000, -0.250000,  0.000000,  0.250000,  0.500000,  "
+    "0.750000,  1.000000,\n         1.250000,  1.500000,  1.750000,  2.000000,  2.250000]"
+)
+
+
+# The expected summaries are the ones written before the binary output format was added.
+@pytest.mark.parametrize(
+    "dtype, run_on_cpu, bucket_size, expected_statistics, expected_samples",
+    [
+        (
+            torch.float32,
+            False,
+            1024,
+            "min: -1.5 max: 2.25, mean: 0.375, std: 5.930149078369141",
+            _FLOAT_SAMPLES + ")",
+        ),
+        (
+            torch.float16,
+            False,
+            6,
+            "min: -1.5 max: 2.25, mean: 0.375, std: 5.5625",
+            _FLOAT_SAMPLES + ", dtype=torch.float16)",
+        ),
+        (
+            torch.float32,
+            True,
+            1024,
+            "min: -1.5 max: 2.25, mean: 0.375, std: 1.190238118171692",
+            _FLOAT_SAMPLES + ")",
+        ),
+        (
+            torch.int64,
+            False,
+            5,
+            "min: -6 max: 9, mean: 1.5, std: 20.800640106201172",
+            "tensor([-6, -5, -4, -3, -2, -1,  0,  1,  2,  3,  4,  5,  6,  7,  8,  9])",
+        ),
+    ],
+)
+def test_statistic_subscriber_summary_format(dtype, run_on_cpu, bucket_size, expected_statistics, expected_samples):
+    tensor = torch.arange(-6, 10).reshape(4, 4)
+    if dtype.is_floating_point:
+        tensor = (tensor / 4).to(dtype)
+    expected_summary = (
+        f">Linear_1_0th_output forward run shape: torch.Size([4, 4]) dtype: {dtype} size: torch.Size([16]) \n"
+        f"{expected_statistics} \n"
+        "nan: 0, inf: 0\n"
+        f"samples(top 128): {expected_samples}\n"
+        "neg: 6, pos: 9, zero: 1,\n"
+        "================\n"
+    )
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        for output_format in ["text", "binary"]:
+            output_dir_path = os.path.join(temporary_dir, output_format)
+            subscriber = StatisticsSubscriber(
+                output_dir_path, run_on_cpu=run_on_cpu, bucket_size=bucket_size, output_format=output_format
+            )
+            subscriber.module_post_forward_impl(tensor, 1, "Linear_1_0th_output", 0)
+            subscriber.flush()
+
+            step_dir = os.path.join(output_dir_path, "step_0")
+            if output_format == "text":
+                with open(os.path.join(step_dir, "Linear_1_0th_output_forward"), encoding="utf-8") as f:
+                    assert f.read() == expected_summary
+            else:
+                assert load_statistics_summaries(step_dir) == [("Linear_1_0th_output_forward", expected_summary)]
+
+
+@pytest.mark.parametrize("run_on_cpu", [False, True])
+def test_statistic_subscriber_expanded_tensor(run_on_cpu):
+    # Gradients like the one of y.sum() are expanded from a scalar, their elements share one memory location.
+    tensor = torch.tensor(1.0).expand(4, 4)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        summaries = {}
+        for output_format in ["text", "binary"]:
+            output_dir_path = os.path.join(temporary_dir, output_format)
+            subscriber = StatisticsSubscriber(output_dir_path, run_on_cpu=run_on_cpu, output_format=output_format)
+            subscriber.module_pre_backward_impl(tensor, 1, "Linear_1_0th_output", 0)
+            subscriber.flush()
+
+            step_dir = os.path.join(output_dir_path, "step_0")
+            if output_format == "text":
+                with open(os.path.join(step_dir, "Linear_1_0th_output_backward"), encoding="utf-8") as f:
+                    summaries[output_format] = f.read()
+            else:
+                [(name, summaries[output_format])] = load_statistics_summaries(step_dir)
+                assert name == "Linear_1_0th_output_backward"
+
+    assert "min: 1.0 max: 1.0, mean: 1.0" in summaries["text"]
+    assert summaries["binary"] == summaries["text"]
+
+
+@pytest.mark.parametrize("device", ["cpu", "cuda"])
+@pytest.mark.parametrize("backend", ["torch", "ortmodule"])
+def test_statistic_subscriber_sampling_policy(device, backend):
+    input_size = 8
+    hidden_size = 16
+    num_classes = 32
+    model = NeuralNetSingleOutput(input_size, hidden_size, num_classes)
+    model.to(device)
+    model.train()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        output_dir_path = os.path.join(temporary_dir, f"{backend}_out")
+        # Outputs of fc1 and relu are 4 * 16 floats (256 bytes), outputs of fc2 and the model are 4 * 32 floats.
+        sampling_policy = SamplingPolicy(step_interval=2, max_bytes_per_module=256)
+        GlobalSubscriberManager.subscribe(
+            model, [StatisticsSubscriber(output_dir_path, override_output_dir=True)], sampling_policy=sampling_policy
+        )
+
+        if backend == "ortmodule":
+            model = ORTModule(model)
+
+        batch_size = 4
+        input1_tensor = torch.randn(batch_size, input_size, device=device)
+        input2_tensor = torch.randn(batch_size, input_size, device=device)
+        for _ in range(5):
+            y = model(input1_tensor, input2_tensor)
+            y.sum().backward()
+
+        assert sorted(os.listdir(output_dir_path)) == ["step_0", "step_2", "step_4"]
+
+        expected_files = [
+            "order.txt",
+            "Linear_1_0th_output_forward",
+            "Linear_1_0th_output_backward",
+            "ReLU_2_0th_output_forward",
+            "ReLU_2_0th_output_backward",
+        ]
+
+        for i in [0, 2, 4]:
+            step_dir = os.path.join(output_dir_path, f"step_{i}")
+            assert sorted(os.listdir(step_dir)) == sorted(expected_files)
+
+
+def test_sampling_policy_module_subset():
+    def sampled_modules(policy, step):
+        return [i for i in range(100) if not policy.need_skip_module(step, i)]
+
+    policy = SamplingPolicy(module_sample_ratio=0.25, seed=1)
+    step_0_modules = sampled_modules(policy, 0)
+    assert 0 < len(step_0_modules) < 50
+    # The subset is determined by the seed and the step.
+    assert sampled_modules(SamplingPolicy(module_sample_ratio=0.25, seed=1), 0) == step_0_modules
+    assert sampled_modules(policy, 1) != step_0_modules
+    assert sampled_modules(SamplingPolicy(module_sample_ratio=0.25, seed=2), 0) != step_0_modules
+
+    assert sampled_modules(SamplingPolicy(module_sample_ratio=0.0), 0) == []
+    assert len(sampled_modules(SamplingPolicy(module_sample_ratio=1.0), 0)) == 100
+
+    # Modules are skipped once the overhead of the step reaches the limit.
+    policy = SamplingPolicy(max_overhead_per_step=0.1)
+    assert not policy.need_skip_module(0, 0)
+    policy.add_overhead(0.1)
+    assert policy.need_skip_module(0, 0)
+    assert not policy.need_skip_module(1, 0)
@@ -5,11 +5,15 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
 import contextlib
 import enum
+import hashlib
+import json
 import os
 import pathlib
 import tempfile
+import time
 
 import onnxruntime as ort
 
@@ -54,6 +58,98 @@ def _create_config_file_path(
     return model_config_path
 
 
+def _create_manifest_file_path(
+    model_path_or_dir: pathlib.Path,
+    output_dir: pathlib.Path | None,
+    optimization_level_str: str,
+    optimization_style: OptimizationStyle,
+):
+    manifest_name = "ort_conversion_manifest{}".format(
+        _optimization_suffix(optimization_level_str, optimization_style, ".json")
+    )
+
+    if model_path_or_dir.is_dir():
+        return (output_dir or model_path_or_dir) / manifest_name
+
+    model_manifest_path = model_path_or_dir.with_suffix(f".{manifest_name}")
+
+    if output_dir is not None:
+        return output_dir / model_manifest_path.name
+
+    return model_manifest_path
+
+
+def _load_manifest(manifest_path: pathlib.Path) -> dict:
+    """Loads the manifest of a previous conversion, or returns an empty one if it does not exist or is invalid."""
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("models"), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+
+    return {"models": {}}
+
+
+def _save_manifest(manifest_path: pathlib.Path, manifest: dict):
+    # write to a temporary file first so an interrupted run never leaves a partial manifest behind
+    temp_manifest_path = manifest_path.with_suffix(".json.tmp")
+    with open(temp_manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_manifest_path, manifest_path)
+
+
+def _hash_file(file_path: pathlib.Path) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def _hash_conversion_options(
+    optimization_level_str: str,
+    optimization_style: OptimizationStyle,
+    custom_op_library: pathlib.Path | None,
+    create_optimized_onnx_model: bool,
+    target_platform: str | None,
+    session_options_config_entries: dict[str, str],
+) -> str:
+    """
+    Hashes everything other than the input model that affects the output of a conversion, including the ORT version.
+    """
+    options = {
+        "onnxruntime_version": ort.__version__,
+        "optimization_level": optimization_level_str,
+        "optimization_style": optimization_style.name,
+        "custom_op_library": _hash_file(custom_op_library) if custom_op_library else None,
+        "create_optimized_onnx_model": create_optimized_onnx_model,
+        "target_platform": target_platform,
+        "session_options_config_entries": session_options_config_entries,
+    }
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()
+
+
+def _is_up_to_date(manifest_entry: dict | None, input_hash: str, options_hash: str, output_dir: pathlib.Path):
+    if manifest_entry is None:
+        return False
+
+    if manifest_entry.get("input_hash") != input_hash or manifest_entry.get("options_hash") != options_hash:
+        return False
+
+    # the outputs may have been deleted or overwritten since the previous conversion
+    for output_key in ("ort_model", "optimized_onnx_model"):
+        relative_output_path = manifest_entry.get(output_key)
+        if relative_output_path is None:
+            continue
+        output_path = output_dir / relative_output_path
+        if not output_path.is_file() or output_path.stat().st_size != manifest_entry.get(f"{output_key}_size"):
+            return False
+
+    return True
+
+
 def _create_session_options(
     optimization_level: ort.GraphOptimizationLevel,
     output_model_path: pathlib.Path,
@@ -73,6 +169,61 @@ def _create_session_options(
     return so
 
 
+def _convert_model(
+    model: pathlib.Path,
+    ort_target_path: pathlib.Path,
+    optimized_target_path: pathlib.Path | None,
+    optimization_level_str: str,
+    optimization_style: OptimizationStyle,
+    custom_op_library: pathlib.Path,
+    target_platform: str,
+    session_options_config_entries: dict[str, str],
+) -> float:
+    """
+    Converts a single model. Runs in a worker process when converting models in parallel, so all arguments are
+    picklable.
+    :return: The conversion time in seconds.
+    """
+    start_time = time.perf_counter()
+
+    optimization_level = get_optimization_level(optimization_level_str)
+    providers = ["CPUExecutionProvider"]
+
+    # if the optimization level is 'all' we manually exclude the NCHWc transformer. It's not applicable to ARM
+    # devices, and creates a device specific model which won't run on all hardware.
+    # If someone really really really wants to run it they could manually create an optimized onnx model first,
+    # or they could comment out this code.
+    optimizer_filter = None
+    if optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_ALL and target_platform != "amd64":
+        optimizer_filter = ["NchwcTransformer"]
+
+    if optimized_target_path is not None:
+        # Create an ONNX file with the same optimization level that will be used for the ORT format file.
+        # This allows the ONNX equivalent of the ORT format model to be easily viewed in Netron.
+        # If runtime optimizations are saved in the ORT format model, there may be some difference in the
+        # graphs at runtime between the ORT format model and this saved ONNX model.
+        so = _create_session_options(
+            optimization_level, optimized_target_path, custom_op_library, session_options_config_entries
+        )
+        if optimization_style == OptimizationStyle.Runtime:
+            # Limit the optimizations to those that can run in a model with runtime optimizations.
+            so.add_session_config_entry("optimization.minimal_build_optimizations", "apply")
+
+        print(f"Saving optimized ONNX model {model} to {optimized_target_path}", flush=True)
+        _ = ort.InferenceSession(str(model), sess_options=so, providers=providers, disabled_optimizers=optimizer_filter)
+
+    # Load ONNX model, optimize, and save to ORT format
+    so = _create_session_options(optimization_level, ort_target_path, custom_op_library, session_options_config_entries)
+    so.add_session_config_entry("session.save_model_format", "ORT")
+    if optimization_style == OptimizationStyle.Runtime:
+        so.add_session_config_entry("optimization.minimal_build_optimizations", "save")
+
+    print(f"Converting optimized ONNX model {model} to ORT format model {ort_target_path}", flush=True)
+    _ = ort.InferenceSession(str(model), sess_options=so, providers=providers, disabled_optimizers=optimizer_filter)
+
+    return time.perf_counter() - start_time
+
+
 def _convert(
     model_path_or_dir: pathlib.Path,
     output_dir: pathlib.Path | None,
@@ -83,12 +234,19 @@ def _convert(
     allow_conversion_failures: bool,
     target_platform: str,
     session_options_config_entries: dict[str, str],
+    manifest_path: pathlib.Path | None = None,
+    incremental: bool = False,
+    jobs: int = 1,
 ) -> list[pathlib.Path]:
+    """
+    Converts the models, using `jobs` worker processes if greater than 1.
+    If `manifest_path` is given, the input hash, conversion time and sizes of each converted model are written to it.
+    If `incremental` is also set, models whose outputs are up to date according to the manifest are not converted
+    again.
+    """
     model_dir = model_path_or_dir if model_path_or_dir.is_dir() else model_path_or_dir.parent
     output_dir = output_dir or model_dir
 
-    optimization_level = get_optimization_level(optimization_level_str)
-
     def is_model_file_to_convert(file_path: pathlib.Path):
         if not path_match_suffix_ignore_case(file_path, ".onnx"):
             return False
@@ -104,73 +262,117 @@ def _convert(
     if len(models) == 0:
         raise ValueError(f"No model files were found in '{model_path_or_dir}'")
 
-    providers = ["CPUExecutionProvider"]
-
-    # if the optimization level is 'all' we manually exclude the NCHWc transformer. It's not applicable to ARM
-    # devices, and creates a device specific model which won't run on all hardware.
-    # If someone really really really wants to run it they could manually create an optimized onnx model first,
-    # or they could comment out this code.
-    optimizer_filter = None
-    if optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_ALL and target_platform != "amd64":
-        optimizer_filter = ["NchwcTransformer"]
+    previous_manifest = _load_manifest(manifest_path) if manifest_path is not None and incremental else {"models": {}}
+    options_hash = _hash_conversion_options(
+        optimization_level_str,
+        optimization_style,
+        custom_op_library,
+        create_optimized_onnx_model,
+        target_platform,
+        session_options_config_entries,
+    )
+    manifest_entries = {}
 
-    converted_models = []
+    ort_target_paths = {}
+    models_to_convert = {}
 
     for model in models:
-        try:
-            relative_model_path = model.relative_to(model_dir)
-
-            (output_dir / relative_model_path).parent.mkdir(parents=True, exist_ok=True)
-
-            ort_target_path = (output_dir / relative_model_path).with_suffix(
-                _optimization_suffix(optimization_level_str, optimization_style, ".ort")
-            )
-
-            if create_optimized_onnx_model:
-                # Create an ONNX file with the same optimization level that will be used for the ORT format file.
-                # This allows the ONNX equivalent of the ORT format model to be easily viewed in Netron.
-                # If runtime optimizations are saved in the ORT format model, there may be some difference in the
-                # graphs at runtime between the ORT format model and this saved ONNX model.
-                optimized_target_path = (output_dir / relative_model_path).with_suffix(
-                    _optimization_suffix(optimization_level_str, optimization_style, ".optimized.onnx")
-                )
-                so = _create_session_options(
-                    optimization_level, optimized_target_path, custom_op_library, session_options_config_entries
-                )
-                if optimization_style == OptimizationStyle.Runtime:
-                    # Limit the optimizations to those that can run in a model with runtime optimizations.
-                    so.add_session_config_entry("optimization.minimal_build_optimizations", "apply")
-
-                print(f"Saving optimized ONNX model {model} to {optimized_target_path}")
-                _ = ort.InferenceSession(
-                    str(model), sess_options=so, providers=providers, disabled_optimizers=optimizer_filter
-                )
+        relative_model_path = model.relative_to(model_dir)
 
-            # Load ONNX model, optimize, and save to ORT format
-            so = _create_session_options(
-                optimization_level, ort_target_path, custom_op_library, session_options_config_entries
-            )
-            so.add_session_config_entry("session.save_model_format", "ORT")
-            if optimization_style == OptimizationStyle.Runtime:
-                so.add_session_config_entry("optimization.minimal_build_optimizations", "save")
+        (output_dir / relative_model_path).parent.mkdir(parents=True, exist_ok=True)
 
-            print(f"Converting optimized ONNX model {model} to ORT format model {ort_target_path}")
-            _ = ort.InferenceSession(
-                str(model), sess_options=so, providers=providers, disabled_optimizers=optimizer_filter
+        ort_target_path = (output_dir / relative_model_path).with_suffix(
+            _optimization_suffix(optimization_level_str, optimization_style, ".ort")
+        )
+        optimized_target_path = None
+        if create_optimized_onnx_model:
+            optimized_target_path = (output_dir / relative_model_path).with_suffix(
+                _optimization_suffix(optimization_level_str, optimization_style, ".optimized.onnx")
             )
 
-            converted_models.append(ort_target_path)
-
-            # orig_size = os.path.getsize(onnx_target_path)
-            # new_size = os.path.getsize(ort_target_path)
-            # print("Serialized {} to {}. Sizes: orig={} new={} diff={} new:old={:.4f}:1.0".format(
-            #     onnx_target_path, ort_target_path, orig_size, new_size, new_size - orig_size, new_size / orig_size))
-        except Exception as e:
-            print(f"Error converting {model}: {e}")
-            if not allow_conversion_failures:
-                raise
+        manifest_key = relative_model_path.as_posix()
+        input_hash = _hash_file(model) if manifest_path is not None else None
+        previous_entry = previous_manifest["models"].get(manifest_key)
+        if incremental and _is_up_to_date(previous_entry, input_hash, options_hash, output_dir):
+            print(f"Skipping {model} as ORT format model {ort_target_path} is up to date")
+            manifest_entries[manifest_key] = previous_entry
+            ort_target_paths[model] = ort_target_path
+            continue
+
+        models_to_convert[model] = (manifest_key, input_hash, ort_target_path, optimized_target_path)
+
+    num_up_to_date_models = len(ort_target_paths)
+
+    def convert_model_args(model: pathlib.Path):
+        _, _, ort_target_path, optimized_target_path = models_to_convert[model]
+        return (
+            model,
+            ort_target_path,
+            optimized_target_path,
+            optimization_level_str,
+            optimization_style,
+            custom_op_library,
+            target_platform,
+            session_options_config_entries,
+        )
 
-    print(f"Converted {len(converted_models)}/{len(models)} models successfully.")
+    def on_model_converted(model: pathlib.Path, conversion_time: float):
+        manifest_key, input_hash, ort_target_path, optimized_target_path = models_to_convert[model]
+        ort_target_paths[model] = ort_target_path
+        manifest_entries[manifest_key] = {
+            "input_hash": input_hash,
+            "options_hash": options_hash,
+            "conversion_time": round(conversion_time, 3),
+            "onnx_model_size": model.stat().st_size,
+            "ort_model": ort_target_path.relative_to(output_dir).as_posix(),
+            "ort_model_size": ort_target_path.stat().st_size,
+            "optimized_onnx_model": (
+                optimized_target_path.relative_to(output_dir).as_posix() if optimized_target_path else None
+            ),
+            "optimized_onnx_model_size": optimized_target_path.stat().st_size if optimized_target_path else None,
+        }
+
+    try:
+        if jobs > 1 and len(models_to_convert) > 1:
+            # InferenceSession creation holds the GIL, so models are converted in worker processes instead of threads.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(models_to_convert))) as executor:
+                futures = {
+                    executor.submit(_convert_model, *convert_model_args(model)): model for model in models_to_convert
+                }
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        model = futures[future]
+                        try:
+                            on_model_converted(model, future.result())
+                        except Exception as e:
+                            print(f"Error converting {model}: {e}")
+                            if not allow_conversion_failures:
+                                raise
+                except BaseException:
+                    # don't start converting the remaining models
+                    for future in futures:
+                        future.cancel()
+                    raise
+        else:
+            for model in models_to_convert:
+                try:
+                    on_model_converted(model, _convert_model(*convert_model_args(model)))
+                except Exception as e:
+                    print(f"Error converting {model}: {e}")
+                    if not allow_conversion_failures:
+                        raise
+    finally:
+        if manifest_path is not None:
+            # record the models converted before any failure so that an incremental run does not convert them again
+            _save_manifest(manifest_path, {"models": {key: manifest_entries[key] for key in sorted(manifest_entries)}})
+
+    # keep the order of the models, which does not depend on the order the worker processes finish in
+    converted_models = [ort_target_paths[model] for model in models if model in ort_target_paths]
+
+    print(
+        f"Converted {len(converted_models)}/{len(models)} models successfully. "
+        f"{num_up_to_date_models} of them were up to date."
+    )
 
     return converted_models
 
@@ -240,6 +442,23 @@ def parse_args():
         help="Whether to proceed after encountering model conversion failures.",
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes to convert models in parallel.",
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip models whose ORT format model is up to date. A model is up to date if neither its content nor the "
+        "conversion options changed since it was converted, according to the manifest written by the previous run. "
+        "The manifest records the conversion time and sizes of each model, and is always written to the output "
+        "directory.",
+    )
+
     parser.add_argument(
         "--target_platform",
         type=str,
@@ -273,7 +492,12 @@ def convert_onnx_models_to_ort(
     save_optimized_onnx_model: bool = False,
     allow_conversion_failures: bool = False,
     enable_type_reduction: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
 ):
+    if jobs < 1:
+        raise ValueError(f"Number of jobs must be at least 1, got {jobs}.")
+
     if output_dir is not None:
         if not output_dir.is_dir():
             output_dir.mkdir(parents=True)
@@ -307,6 +531,18 @@ def convert_onnx_models_to_ort(
             )
         )
 
+        manifest_path = _create_manifest_file_path(
+            model_path_or_dir, output_dir, optimization_level_str, optimization_style
+        )
+        config_file = _create_config_file_path(
+            model_path_or_dir,
+            output_dir,
+            optimization_level_str,
+            optimization_style,
+            enable_type_reduction,
+        )
+        previous_manifest = _load_manifest(manifest_path)
+
         converted_models = _convert(
             model_path_or_dir=model_path_or_dir,
             output_dir=output_dir,
@@ -317,8 +553,16 @@ def convert_onnx_models_to_ort(
             allow_conversion_failures=allow_conversion_failures,
             target_platform=target_platform,
             session_options_config_entries=session_options_config_entries,
+            manifest_path=manifest_path,
+            incremental=incremental,
+            jobs=jobs,
         )
 
+        if incremental and config_file.is_file() and _load_manifest(manifest_path) == previous_manifest:
+            # the set of models and all of their ORT format models are unchanged, so is the config file
+            print(f"Skipping generation of config file {config_file} as all models are up to date")
+            continue
+
         with contextlib.ExitStack() as context_stack:
             if optimization_style == OptimizationStyle.Runtime:
                 # Convert models again without runtime optimizations.
@@ -348,6 +592,7 @@ def convert_onnx_models_to_ort(
                     allow_conversion_failures=allow_conversion_failures,
                     target_platform=target_platform,
                     session_options_config_entries=session_options_config_entries_for_second_conversion,
+                    jobs=jobs,
                 )
 
             print(
@@ -356,14 +601,6 @@ def convert_onnx_models_to_ort(
                 )
             )
 
-            config_file = _create_config_file_path(
-                model_path_or_dir,
-                output_dir,
-                optimization_level_str,
-                optimization_style,
-                enable_type_reduction,
-            )
-
             create_config_from_models(converted_models, config_file, enable_type_reduction)
 
 
@@ -378,4 +615,6 @@ if __name__ == "__main__":
         save_optimized_onnx_model=args.save_optimized_onnx_model,
         allow_conversion_failures=args.allow_conversion_failures,
         enable_type_reduction=args.enable_type_reduction,
+        jobs=args.jobs,
+        incremental=args.incremental,
     )
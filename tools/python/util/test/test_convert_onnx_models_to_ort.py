@@ -0,0 +1,89 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import pathlib
+import tempfile
+import unittest
+
+import onnx
+from onnx import TensorProto, helper
+
+from ..convert_onnx_models_to_ort import OptimizationStyle, convert_onnx_models_to_ort
+
+# example usage from <ort root>/tools/python
+# python -m unittest util/test/test_convert_onnx_models_to_ort.py
+# NOTE: at least on Windows you must use that as the working directory for all the imports to be happy
+
+
+def _save_model(model_path: pathlib.Path, op_type: str):
+    graph = helper.make_graph(
+        [helper.make_node(op_type, ["x"], ["y"])],
+        "graph",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 2])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, [1, 2])],
+    )
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]), str(model_path))
+
+
+class TestConvertOnnxModelsToOrt(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._model_dir = pathlib.Path(self._temp_dir.name) / "models"
+        self._output_dir = pathlib.Path(self._temp_dir.name) / "output"
+        _save_model(self._model_dir / "relu.onnx", "Relu")
+        _save_model(self._model_dir / "sub" / "sigmoid.onnx", "Sigmoid")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _convert(self, **kwargs):
+        convert_onnx_models_to_ort(
+            self._model_dir,
+            output_dir=self._output_dir,
+            optimization_styles=[OptimizationStyle.Fixed],
+            incremental=True,
+            **kwargs,
+        )
+        with open(self._output_dir / "ort_conversion_manifest.json") as f:
+            return json.load(f)["models"]
+
+    def test_parallel_conversion_writes_manifest(self):
+        manifest = self._convert(jobs=2)
+
+        self.assertEqual(set(manifest.keys()), {"relu.onnx", "sub/sigmoid.onnx"})
+        for model, entry in manifest.items():
+            ort_model_path = self._output_dir / entry["ort_model"]
+            self.assertEqual(ort_model_path, (self._output_dir / model).with_suffix(".ort"))
+            self.assertEqual(ort_model_path.stat().st_size, entry["ort_model_size"])
+            self.assertEqual((self._model_dir / model).stat().st_size, entry["onnx_model_size"])
+            self.assertGreaterEqual(entry["conversion_time"], 0)
+
+        config = (self._output_dir / "required_operators.config").read_text()
+        self.assertIn("Relu", config)
+        self.assertIn("Sigmoid", config)
+
+    def test_incremental_conversion(self):
+        manifest = self._convert()
+
+        # nothing changed, so nothing is converted again
+        self.assertEqual(self._convert(), manifest)
+
+        # a changed model is converted again
+        _save_model(self._model_dir / "relu.onnx", "Tanh")
+        updated_manifest = self._convert()
+        self.assertNotEqual(updated_manifest["relu.onnx"]["input_hash"], manifest["relu.onnx"]["input_hash"])
+        self.assertEqual(updated_manifest["sub/sigmoid.onnx"], manifest["sub/sigmoid.onnx"])
+        self.assertIn("Tanh", (self._output_dir / "required_operators.config").read_text())
+
+        # changed options invalidate all models
+        updated_manifest = self._convert(save_optimized_onnx_model=True)
+        for entry in updated_manifest.values():
+            self.assertNotEqual(entry["options_hash"], manifest["sub/sigmoid.onnx"]["options_hash"])
+            self.assertTrue((self._output_dir / entry["optimized_onnx_model"]).is_file())
+
+        # a deleted output is converted again
+        (self._output_dir / "sub" / "sigmoid.ort").unlink()
+        self._convert(save_optimized_onnx_model=True)
+        self.assertTrue((self._output_dir / "sub" / "sigmoid.ort").is_file())